@@ -57,7 +57,13 @@ def get_allowed_bearer():
     return allowed
 
 
-def check_auth(request, password_manager, token_manager):
+def check_auth(request, password_manager, token_manager, auth_cache=None):
+    """
+    Check the Authorization header of a request.
+
+    If an AuthCache is passed, recently verified credentials and tokens are
+    accepted from the cache, and successful checks are added to it.
+    """
     auth_header = request.getHeader('Authorization')
     if auth_header is None:
         return False
@@ -66,17 +72,30 @@ def check_auth(request, password_manager, token_manager):
     if parts[0] == "Basic":
         username, password = get_username_password(parts[1])
         request.user = User(username, "localhost", role="admin")
-        return password_manager.verify_password(username, password)
+        if auth_cache is not None and auth_cache.check_credentials(username, password):
+            return True
+
+        verified = password_manager.verify_password(username, password)
+        if verified and auth_cache is not None:
+            auth_cache.add_credentials(username, password)
+        return verified
     elif parts[0] == "Bearer":
         token = parts[1]
 
         # Chutes use non-expiring random tokens that are generated at container
         # creation. This works well because we do not want to deal with
         # expiration or revocation.
-        allowed_tokens = get_allowed_bearer()
+        if auth_cache is not None:
+            allowed_tokens = auth_cache.get_allowed_bearer()
+        else:
+            allowed_tokens = get_allowed_bearer()
         if token in allowed_tokens:
             return True
 
+        data = None
+        if auth_cache is not None:
+            data = auth_cache.get_token(token)
+
         # Users (through the local portal or pdtools) can acquire expiring
         # JWTs. If the JWT decodes using our secret, then the caller is
         # authenticated.
@@ -85,7 +104,10 @@ def check_auth(request, password_manager, token_manager):
         # allowing user access to the router, etc. In that case we will
         # need to examine the subject, issuer, and audience claims.
         try:
-            data = token_manager.decode(token)
+            if data is None:
+                data = token_manager.decode(token)
+                if auth_cache is not None:
+                    auth_cache.add_token(token, data)
             domain = data.get("domain", "localhost")
             username = data.get("sub", "paradrop")
             role = data.get("role", "user")
@@ -106,7 +128,8 @@ def requires_auth(func):
     """
     @functools.wraps(func)
     def decorated(self, request, *args, **kwargs):
-        if not check_auth(request, self.password_manager, self.token_manager):
+        if not check_auth(request, self.password_manager, self.token_manager,
+                getattr(self, 'auth_cache', None)):
             out.info('HTTP {} {} {} {}'.format(request.getClientIP(),
                 request.method, request.path, 401))
             request.setResponseCode(401)
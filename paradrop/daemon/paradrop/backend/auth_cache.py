@@ -0,0 +1,116 @@
+"""
+Cache results of authentication checks.
+
+Verifying a password runs SHA-512 crypt, which takes milliseconds on small
+devices, and the portal and pdtools send many requests per page.  The cache
+remembers successful credential checks and decoded tokens for a short time
+and keeps the set of chute API tokens up to date as chutes are saved and
+deleted, so that most requests are authenticated with a dictionary lookup.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import smokesignal
+
+from paradrop.base import settings
+from paradrop.core.chute.chute_storage import ChuteStorage
+
+
+class AuthCache(object):
+    def __init__(self, ttl=None):
+        if ttl is None:
+            ttl = settings.AUTH_CACHE_TTL
+        self.ttl = ttl
+
+        # Credentials are stored as salted digests so that passwords are not
+        # kept in memory in plain text.
+        self.salt = os.urandom(16)
+
+        # Map credential digest -> expiration time.
+        self.credentials = {}
+
+        # Map token -> (expiration time, decoded token data).
+        self.tokens = {}
+
+        # Set of chute API tokens, rebuilt on first use after a change.
+        self.bearer_tokens = None
+        self.lock = threading.Lock()
+
+        smokesignal.on('chute_saved', self.invalidate_bearer)
+        smokesignal.on('chute_deleted', self.invalidate_bearer)
+        smokesignal.on('password_changed', self.invalidate_credentials)
+
+    def _digest(self, username, password):
+        data = u"{}:{}".format(username, password).encode('utf-8')
+        return hashlib.sha256(self.salt + data).hexdigest()
+
+    def check_credentials(self, username, password):
+        """
+        Check if the username and password were recently verified.
+        """
+        digest = self._digest(username, password)
+        expires = self.credentials.get(digest, 0)
+        if expires > time.time():
+            return True
+
+        self.credentials.pop(digest, None)
+        return False
+
+    def add_credentials(self, username, password):
+        """
+        Remember that the username and password were verified.
+        """
+        digest = self._digest(username, password)
+        self.credentials[digest] = time.time() + self.ttl
+
+    def get_token(self, token):
+        """
+        Get the decoded data of a recently verified token or None.
+        """
+        entry = self.tokens.get(token, None)
+        if entry is None:
+            return None
+
+        expires, data = entry
+        if expires > time.time():
+            return data
+
+        self.tokens.pop(token, None)
+        return None
+
+    def add_token(self, token, data):
+        """
+        Remember the decoded data of a verified token.
+
+        The entry never outlives the token's own expiration time.
+        """
+        expires = time.time() + self.ttl
+        if 'exp' in data:
+            expires = min(expires, data['exp'])
+        self.tokens[token] = (expires, data)
+
+    def get_allowed_bearer(self):
+        """
+        Return set of allowed bearer tokens.
+        """
+        with self.lock:
+            if self.bearer_tokens is None:
+                allowed = set()
+                for chute in ChuteStorage().getChuteList():
+                    token = chute.getCache('apiToken')
+                    if token is not None:
+                        allowed.add(token)
+                self.bearer_tokens = allowed
+
+            return self.bearer_tokens
+
+    def invalidate_bearer(self, *args, **kwargs):
+        with self.lock:
+            self.bearer_tokens = None
+
+    def invalidate_credentials(self, *args, **kwargs):
+        self.credentials = {}
+        self.tokens = {}
@@ -0,0 +1,380 @@
+"""
+Run several API requests in one round trip.
+
+Rendering a chute detail page takes a handful of sequential calls (chute,
+config, networks, leases, stations, cache), which adds up over high-latency
+links.  The batch endpoint accepts a list of sub-requests, dispatches each of
+them through the regular Klein routing with the caller's Authorization header
+and returns all responses together.
+
+Read-only sub-requests (GET and HEAD) run concurrently.  Any other method
+waits for every earlier sub-request to finish, and later sub-requests wait
+for it, so a batch that changes something and reads it back behaves as if
+the requests were made one by one.
+
+Endpoints for these functions can be found under /api/v1/batch.
+"""
+
+import json
+from io import BytesIO
+
+import six
+from klein import Klein
+from twisted.internet import defer
+from twisted.python.failure import Failure
+from twisted.web import http, server
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from . import cors
+
+try:
+    from urllib.parse import unquote_to_bytes as unquote
+except ImportError:
+    from urllib import unquote
+
+
+BATCH_PATH = "/api/v1/batch"
+
+# Sub-requests must target the HTTP API.  Websockets and the portal cannot
+# be batched.
+ALLOWED_PREFIX = "/api/v1/"
+
+SAFE_METHODS = set(["GET", "HEAD"])
+
+# Headers of the batch request that are not passed on to sub-requests,
+# because they describe the batch itself rather than the caller.
+SKIPPED_HEADERS = set([
+    b"accept-encoding",
+    b"content-length",
+    b"content-type",
+    b"if-modified-since",
+    b"if-none-match",
+    b"if-range",
+    b"range"
+])
+
+# Response headers that are not useful to report for each sub-request.
+HIDDEN_HEADERS = set([
+    "access-control-allow-headers",
+    "access-control-allow-methods",
+    "access-control-allow-origin",
+    "access-control-max-age",
+    "content-length"
+])
+
+
+def to_bytes(value):
+    if isinstance(value, six.text_type):
+        return value.encode("utf-8")
+    return value
+
+
+def to_text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+class BatchSubRequest(server.Request):
+    """
+    Request object for one part of a batch.
+
+    The sub-request shares the channel of the batch request, so that
+    authentication, client address and host name are the same, but the
+    response is collected in memory instead of being written to the
+    connection.  The `done` Deferred fires with the request once the handler
+    finishes the response.
+    """
+    def __init__(self, parent, method, path, body=None, headers=None):
+        server.Request.__init__(self, parent.channel, False)
+
+        self.parent = parent
+        self.site = parent.site
+        self.clientproto = parent.clientproto
+        self.user = getattr(parent, 'user', None)
+
+        self.method = to_bytes(method.upper())
+        self.uri = to_bytes(path)
+        path, _, query = self.uri.partition(b"?")
+        self.path = path
+        self.args = http.parse_qs(query, 1)
+        self.prepath = []
+        self.postpath = list(map(unquote, path[1:].split(b"/")))
+
+        for name, values in parent.requestHeaders.getAllRawHeaders():
+            if name.lower() not in SKIPPED_HEADERS:
+                self.requestHeaders.setRawHeaders(name, values)
+
+        if headers is not None:
+            for name, value in six.iteritems(headers):
+                self.requestHeaders.setRawHeaders(to_bytes(name),
+                        [to_bytes(value)])
+
+        if body is None:
+            data = b""
+        elif isinstance(body, (six.text_type, bytes)):
+            data = to_bytes(body)
+        else:
+            data = json.dumps(body).encode("utf-8")
+            if not self.requestHeaders.hasHeader(b"content-type"):
+                self.requestHeaders.setRawHeaders(b"content-type",
+                        [b"application/json"])
+
+        self.requestHeaders.setRawHeaders(b"content-length",
+                [str(len(data)).encode("ascii")])
+        self.content = BytesIO(data)
+
+        self.chunks = []
+        self.done = defer.Deferred()
+
+    def write(self, data):
+        if not self.finished:
+            self.chunks.append(to_bytes(data))
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = 1
+
+        notifications = self.notifications
+        self.notifications = []
+        for d in notifications:
+            d.callback(None)
+
+        self.done.callback(self)
+
+    def processingFailed(self, reason):
+        out.warn("Error in batch request to {}: {}\n".format(
+            to_text(self.uri), reason.getErrorMessage()))
+        self.setResponseCode(500)
+        self.setHeader('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'error': reason.getErrorMessage()
+        }))
+        self.finish()
+        return reason
+
+    def get_result(self):
+        """
+        Describe the response as a dictionary for the batch result.
+        """
+        headers = {}
+        for name, values in self.responseHeaders.getAllRawHeaders():
+            name = to_text(name).lower()
+            if name not in HIDDEN_HEADERS:
+                headers[name] = to_text(values[-1])
+
+        data = b"".join(self.chunks)
+        if headers.get("content-type", "").startswith("application/json"):
+            try:
+                body = json.loads(data.decode("utf-8"))
+            except ValueError:
+                body = to_text(data)
+        else:
+            body = to_text(data)
+
+        return {
+            'status': self.code,
+            'headers': headers,
+            'body': body
+        }
+
+
+def error_result(status, message):
+    return {
+        'status': status,
+        'headers': {
+            'content-type': 'application/json'
+        },
+        'body': {
+            'error': message
+        }
+    }
+
+
+def check_item(item):
+    """
+    Return an error message if a sub-request is not valid, otherwise None.
+    """
+    if not isinstance(item, dict):
+        return "Each request must be an object."
+
+    path = item.get('path', None)
+    if not isinstance(path, six.string_types):
+        return "Request is missing the path."
+    if not path.startswith(ALLOWED_PREFIX):
+        return "Only paths under {} can be batched.".format(ALLOWED_PREFIX)
+    if path.startswith(BATCH_PATH):
+        return "Batch requests cannot be nested."
+
+    method = item.get('method', 'GET')
+    if not isinstance(method, six.string_types):
+        return "Request method must be a string."
+
+    return None
+
+
+def run_request(resource, parent, item):
+    """
+    Dispatch one sub-request and return a Deferred that fires with its result.
+    """
+    request = BatchSubRequest(parent, item.get('method', 'GET'), item['path'],
+            body=item.get('body', None), headers=item.get('headers', None))
+
+    try:
+        request.render(resource)
+    except Exception:
+        request.processingFailed(Failure())
+
+    d = request.done
+    d.addCallback(lambda req: req.get_result())
+    return d
+
+
+def run_batch(resource, parent, items):
+    """
+    Run a list of sub-requests against a resource.
+
+    Returns a Deferred that fires with the list of results in the same order
+    as the requests.
+    """
+    results = [None] * len(items)
+
+    # Deferreds that the next request must wait for and read-only requests
+    # started since the last request that may change state.
+    barrier = []
+    group = []
+
+    def store(result, index):
+        results[index] = result
+
+    def failed(failure, item):
+        out.warn("Batch request to {} failed: {}\n".format(item.get('path'),
+            failure.getErrorMessage()))
+        return error_result(500, failure.getErrorMessage())
+
+    for index, item in enumerate(items):
+        message = check_item(item)
+        if message is not None:
+            results[index] = error_result(400, message)
+            continue
+
+        safe = item.get('method', 'GET').upper() in SAFE_METHODS
+        if safe:
+            wait_for = barrier
+        else:
+            wait_for = barrier + group
+
+        d = defer.DeferredList(wait_for)
+        d.addCallback(lambda ignored, item=item: run_request(resource, parent, item))
+        d.addErrback(failed, item)
+        d.addCallback(store, index)
+
+        if safe:
+            group.append(d)
+        else:
+            barrier = [d]
+            group = []
+
+    d = defer.DeferredList(barrier + group)
+    d.addCallback(lambda ignored: results)
+    return d
+
+
+class BatchApi(object):
+    routes = Klein()
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    @routes.route('/', methods=['POST'])
+    def post_batch(self, request):
+        """
+        Run several API requests and return all of the responses.
+
+        The request body is a list of objects with the fields method
+        (default GET), path, and optionally body and headers.  Sub-requests
+        are made with the Authorization header of the batch request.  The
+        response is a list with the status, headers and body of each
+        sub-request in the same order.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           POST /api/v1/batch/
+           Content-Type: application/json
+
+           [
+             {
+               "method": "GET",
+               "path": "/api/v1/chutes/hello-world"
+             },
+             {
+               "method": "GET",
+               "path": "/api/v1/chutes/hello-world/networks"
+             }
+           ]
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           [
+             {
+               "status": 200,
+               "headers": {
+                 "content-type": "application/json"
+               },
+               "body": {
+                 "name": "hello-world",
+                 "state": "running",
+                 ...
+               }
+             },
+             {
+               "status": 200,
+               "headers": {
+                 "content-type": "application/json"
+               },
+               "body": [
+                 {
+                   "interface": "wlan0",
+                   "name": "wifi",
+                   "type": "wifi"
+                 }
+               ]
+             }
+           ]
+        """
+        cors.config_cors(request)
+        request.setHeader('Content-Type', 'application/json')
+
+        try:
+            items = json.loads(request.content.read())
+        except ValueError:
+            items = None
+
+        if isinstance(items, dict):
+            items = items.get('requests', None)
+
+        if not isinstance(items, list):
+            request.setResponseCode(400)
+            return json.dumps({
+                'error': 'Request body must be a list of requests.'
+            })
+
+        if len(items) > settings.BATCH_MAX_REQUESTS:
+            request.setResponseCode(400)
+            return json.dumps({
+                'error': 'A batch may contain at most {} requests.'.format(
+                    settings.BATCH_MAX_REQUESTS)
+            })
+
+        d = run_batch(self.resource, request, items)
+        d.addCallback(json.dumps)
+        return d
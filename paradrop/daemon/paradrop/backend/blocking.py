@@ -0,0 +1,154 @@
+"""
+Run blocking API handlers outside of the reactor thread.
+
+Handlers that call Docker, run subprocesses or walk the filesystem would
+otherwise stall every other HTTP request, websocket and the WAMP session
+while they run.  Decorating a handler with @blocking runs it on a dedicated,
+size-limited thread pool and returns a Deferred to Klein.
+
+Each decorated route also has its own concurrency limit, so that a slow
+endpoint cannot occupy the whole pool, and a timeout, after which the client
+receives 503 Service Unavailable.  A request that times out while waiting for
+a free slot is dropped without running the handler.
+
+Usage::
+
+    @routes.route('/', methods=['GET'])
+    @blocking(limit=2, timeout=20)
+    def get_things(self, request):
+        ...
+"""
+
+import functools
+import json
+import time
+
+from twisted.internet import defer, reactor
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.failure import Failure
+from twisted.python.threadpool import ThreadPool
+
+from paradrop.base.output import out
+from paradrop.base import settings
+
+from . import cors
+
+
+thread_pool = None
+
+
+def get_thread_pool():
+    """
+    Get the thread pool used for blocking handlers, starting it if needed.
+    """
+    global thread_pool
+    if thread_pool is None:
+        thread_pool = ThreadPool(minthreads=0,
+                maxthreads=settings.API_THREAD_POOL_SIZE, name="api")
+        thread_pool.start()
+        reactor.addSystemEventTrigger('during', 'shutdown', thread_pool.stop)
+    return thread_pool
+
+
+class BlockingHandlers(object):
+    """
+    Keep statistics about blocking handlers by route.
+
+    The statistics are stored in a class variable so that they can be
+    included in telemetry reports.
+    """
+    statistics = dict()
+
+    @classmethod
+    def get_route_statistics(cls, route):
+        stats = cls.statistics.get(route, None)
+        if stats is None:
+            stats = {
+                'calls': 0,
+                'active': 0,
+                'queued': 0,
+                'errors': 0,
+                'timeouts': 0,
+                'total_time': 0.0,
+                'max_time': 0.0
+            }
+            cls.statistics[route] = stats
+        return stats
+
+
+def timeout_response(request):
+    cors.config_cors(request)
+    request.setResponseCode(503)
+    request.setHeader('Content-Type', 'application/json')
+    return json.dumps({
+        'error': 'The request timed out, please try again later.'
+    })
+
+
+def blocking(limit=None, timeout=None):
+    """
+    Decorator for handlers that should run on the blocking thread pool.
+
+    limit: maximum number of concurrent calls of the handler, defaults to
+    API_ROUTE_CONCURRENCY.
+    timeout: time in seconds before the client receives an error, defaults to
+    API_ROUTE_TIMEOUT.
+    """
+    if limit is None:
+        limit = settings.API_ROUTE_CONCURRENCY
+
+    def decorator(func):
+        route = "{}.{}".format(func.__module__.split(".")[-1], func.__name__)
+        semaphore = defer.DeferredSemaphore(limit)
+
+        @functools.wraps(func)
+        def decorated(self, request, *args, **kwargs):
+            stats = BlockingHandlers.get_route_statistics(route)
+            stats['calls'] += 1
+            stats['queued'] += 1
+            start = time.time()
+
+            result = defer.Deferred()
+            seconds = settings.API_ROUTE_TIMEOUT if timeout is None else timeout
+
+            def on_timeout():
+                stats['timeouts'] += 1
+                out.warn("Request to {} timed out after {} seconds\n".format(
+                    route, seconds))
+                result.callback(timeout_response(request))
+
+            timer = reactor.callLater(seconds, on_timeout)
+
+            def finish(value):
+                elapsed = time.time() - start
+                stats['active'] -= 1
+                stats['total_time'] += elapsed
+                stats['max_time'] = max(stats['max_time'], elapsed)
+                if isinstance(value, Failure):
+                    stats['errors'] += 1
+
+                if timer.active():
+                    timer.cancel()
+                    result.callback(value)
+                elif isinstance(value, Failure):
+                    out.warn("Error in {} after timeout: {}\n".format(
+                        route, value.getErrorMessage()))
+
+            def run():
+                stats['queued'] -= 1
+                if not timer.active():
+                    # The client already received the timeout response.
+                    return None
+
+                stats['active'] += 1
+                d = deferToThreadPool(reactor, get_thread_pool(), func, self,
+                        request, *args, **kwargs)
+                d.addBoth(finish)
+                return d
+
+            semaphore.run(run)
+            return result
+
+        return decorated
+
+    return decorator
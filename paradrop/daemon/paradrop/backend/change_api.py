@@ -4,6 +4,7 @@ from klein import Klein
 
 from paradrop.base import pdutils
 from . import cors
+from .list_query import ListQuery, bad_request
 
 
 class ChangeApi(object):
@@ -17,6 +18,10 @@ class ChangeApi(object):
         """
         Get list of active and queued changes.
 
+        Supports the limit, cursor, fields and sort parameters of
+        paradrop.backend.list_query and filters on
+        updateClass, updateType, name and status.
+
         Note: we use the term "change" even though, internally, the objects are
         referred to as "updates". The word "update" has become so overloaded it
         causes much confusion. A "change" is an atomic and self-contained
@@ -26,6 +31,12 @@ class ChangeApi(object):
         cors.config_cors(request)
         request.setHeader('Content-Type', 'application/json')
 
+        try:
+            query = ListQuery(request, 'id', filters=['updateClass',
+                'updateType', 'name', 'status'])
+        except ValueError as error:
+            return bad_request(request, error)
+
         changes = []
 
         def dump_update(update, status):
@@ -46,7 +57,7 @@ class ChangeApi(object):
         for update in self.update_manager.updateQueue:
             changes.append(dump_update(update, 'queued'))
 
-        return json.dumps(changes)
+        return json.dumps(query.apply(changes, request))
 
     @routes.route('/', methods=['POST'])
     def create_change(self, request):
@@ -6,7 +6,6 @@ Endpoints for these functions can be found under /api/v1/chutes.
 
 import json
 import os
-import re
 import subprocess
 import tarfile
 import tempfile
@@ -21,10 +20,16 @@ from paradrop.base.output import out
 from paradrop.core.chute.chute_storage import ChuteStorage
 from paradrop.core.config import resource
 from paradrop.core.container.chutecontainer import ChuteContainer
+from paradrop.core.container.metrics import ContainerMetricsSampler
 from paradrop.lib.utils import pdosq
 
 from . import cors
 from . import hostapd_control
+from .blocking import blocking
+from .lease_index import LeaseIndex
+from .list_query import ListQuery, bad_request
+from .response_cache import cached_response
+from .station_table import StationTable
 
 
 class ChuteCacheEncoder(json.JSONEncoder):
@@ -125,10 +130,16 @@ class ChuteApi(object):
         self.update_manager = update_manager
 
     @routes.route('/', methods=['GET'])
+    @cached_response
+    @blocking()
     def get_chutes(self, request):
         """
         List installed chutes.
 
+        Supports the limit, cursor, fields and sort parameters of
+        paradrop.backend.list_query and filters on
+        name, owner, state and version.
+
         **Example request**:
 
         .. sourcecode:: http
@@ -159,35 +170,46 @@ class ChuteApi(object):
         cors.config_cors(request)
         request.setHeader('Content-Type', 'application/json')
 
+        try:
+            query = ListQuery(request, 'name',
+                    filters=['name', 'owner', 'state', 'version'])
+        except ValueError as error:
+            return bad_request(request, error)
+
         chuteStorage = ChuteStorage()
         chutes = chuteStorage.getChuteList()
-        allocation = resource.computeResourceAllocation(chutes)
+
+        # Computing the allocation and inspecting every container is the
+        # expensive part, so skip it if services were not requested.
+        if query.wants('services'):
+            allocation = resource.computeResourceAllocation(chutes)
 
         result = []
         for chute in chutes:
-            service_info = {}
-            for service in chute.get_services():
-                container_name = service.get_container_name()
-                container = ChuteContainer(container_name)
-
-                service_info[service.name] = {
-                    'allocation': allocation.get(container_name, None),
-                    'state': container.getStatus()
-                }
-
             chute_info = {
                 'name': chute.name,
                 'owner': chute.get_owner(),
                 'state': chute.state,
-                'services': service_info,
                 'version': getattr(chute, 'version', None),
                 'environment': getattr(chute, 'environment', None),
                 'resources': getattr(chute, 'resources', None)
             }
 
+            if query.wants('services'):
+                service_info = {}
+                for service in chute.get_services():
+                    container_name = service.get_container_name()
+                    container = ChuteContainer(container_name)
+
+                    service_info[service.name] = {
+                        'allocation': allocation.get(container_name, None),
+                        'state': container.getStatus()
+                    }
+                chute_info['services'] = service_info
+
             result.append(chute_info)
 
-        return json.dumps(result, cls=ChuteEncoder)
+        return json.dumps(query.apply(result, request), cls=ChuteEncoder)
 
     @routes.route('/', methods=['POST'])
     def create_chute(self, request):
@@ -239,6 +261,8 @@ class ChuteApi(object):
         return json.dumps(result)
 
     @routes.route('/<chute>', methods=['GET'])
+    @cached_response
+    @blocking()
     def get_chute(self, request, chute):
         """
         Get information about an installed chute.
@@ -496,6 +520,70 @@ class ChuteApi(object):
             request.setResponseCode(404)
             return "{}"
 
+    @routes.route('/<chute>/metrics', methods=['GET'])
+    def get_chute_metrics(self, request, chute):
+        """
+        Get recent resource usage samples for the chute's services.
+
+        Samples are taken periodically from the cgroup accounting files of
+        each service container and are listed oldest first.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1/chutes/hello-world/metrics
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+             "main": [
+               {
+                 "time": 1511808778.2,
+                 "state": "running",
+                 "cpu_usage_ns": 1734521880,
+                 "cpu_percent": 0.8,
+                 "memory_usage": 24035328,
+                 "memory_limit": 268435456,
+                 "pids": 3,
+                 "blkio_read_bytes": 1048576,
+                 "blkio_write_bytes": 4096,
+                 "network": {
+                   "eth0": {
+                     "bytes_recv": 5322,
+                     "bytes_sent": 1604,
+                     "packets_recv": 48,
+                     "packets_sent": 18
+                   }
+                 }
+               }
+             ]
+           }
+        """
+        cors.config_cors(request)
+        request.setHeader('Content-Type', 'application/json')
+
+        try:
+            chute_obj = ChuteStorage.chuteList[chute]
+        except KeyError:
+            request.setResponseCode(404)
+            return "{}"
+
+        if not chute_access_allowed(request, chute_obj):
+            return permission_denied(request)
+
+        result = {}
+        for service in chute_obj.get_services():
+            result[service.name] = ContainerMetricsSampler.get_samples(
+                    service.get_container_name())
+
+        return json.dumps(result)
+
     @routes.route('/<chute>/config', methods=['GET'])
     def get_chute_config(self, request, chute):
         """
@@ -616,6 +704,7 @@ class ChuteApi(object):
         return json.dumps(result)
 
     @routes.route('/<chute>/networks', methods=['GET'])
+    @cached_response
     def get_networks(self, request, chute):
         """
         Get list of networks configured for the chute.
@@ -718,8 +807,14 @@ class ChuteApi(object):
         """
         Get current list of DHCP leases for chute network.
 
+        Supports the limit, cursor, fields and sort parameters of
+        paradrop.backend.list_query and filters on
+        mac_addr, ip_addr and hostname.
+
         Returns a list of DHCP lease records with the following fields:
 
+        as_of
+          time the lease file was last updated (seconds since Unix epoch)
         expires
           lease expiration time (seconds since Unix epoch)
         mac_addr
@@ -746,8 +841,9 @@ class ChuteApi(object):
 
            [
              {
+               "as_of": 1511806276,
                "client_id": "01:5c:59:48:7d:b9:e6",
-               "expires": "1511816276",
+               "expires": 1511816276,
                "ip_addr": "192.168.128.64",
                "mac_addr": "5c:59:48:7d:b9:e6",
                "hostname": "paradrops-iPod"
@@ -766,27 +862,24 @@ class ChuteApi(object):
             request.setResponseCode(404)
             return "[]"
 
+        try:
+            query = ListQuery(request, 'mac_addr',
+                    filters=['mac_addr', 'ip_addr', 'hostname'])
+        except ValueError as error:
+            return bad_request(request, error)
+
         leasefile = 'dnsmasq-{}.leases'.format(network)
         path = os.path.join(externalSystemDir, leasefile)
 
-        # The format of the dnsmasq leases file is one entry per line with
-        # space-separated fields.
-        keys = ['expires', 'mac_addr', 'ip_addr', 'hostname', 'client_id']
-
-        try:
-            leases = []
-            with open(path, 'r') as source:
-                for line in source:
-                    parts = line.strip().split()
-                    leases.append(dict(zip(keys, parts)))
-            return json.dumps(leases)
-
-        except IOError:
+        leases = LeaseIndex.get_file_leases(path)
+        if leases is None:
             # During chute uninstallation, there is a small window where the
             # chute still exists but the leases file has been removed.
             request.setResponseCode(404)
             return "[]"
 
+        return json.dumps(query.apply(leases, request))
+
     @routes.route('/<chute>/networks/<network>/ssid', methods=['GET'])
     def get_ssid(self, request, chute, network):
         """
@@ -957,6 +1050,13 @@ class ChuteApi(object):
         """
         Get detailed information about connected wireless stations.
 
+        Supports the limit, cursor, fields and sort parameters of
+        paradrop.backend.list_query and filters on
+        mac_addr, authenticated, associated and authorized.
+
+        The statistics are read from hostapd every few seconds
+        (STATION_TABLE_INTERVAL), so they may be slightly out of date.
+
         **Example request**:
 
         .. sourcecode:: http
@@ -972,24 +1072,21 @@ class ChuteApi(object):
 
            [
              {
-               "rx_packets": "230",
-               "tdls_peer": "no",
-               "authenticated": "yes",
-               "rx_bytes": "12511",
-               "tx_bitrate": "1.0 MBit/s",
-               "tx_retries": "0",
-               "signal": "-45 [-49, -48] dBm",
-               "authorized": "yes",
-               "rx_bitrate": "65.0 MBit/s MCS 7",
-               "mfp": "no",
-               "tx_failed": "0",
-               "inactive_time": "4688 ms",
                "mac_addr": "5c:59:48:7d:b9:e6",
-               "tx_bytes": "34176",
-               "wmm_wme": "yes",
-               "preamble": "short",
-               "tx_packets": "88",
-               "signal_avg": "-44 [-48, -47] dBm"
+               "aid": 1,
+               "flags": ["AUTH", "ASSOC", "AUTHORIZED", "SHORT_PREAMBLE", "WMM", "HT"],
+               "authenticated": true,
+               "associated": true,
+               "authorized": true,
+               "connected_time": 351,
+               "inactive_time": 4688,
+               "rx_packets": 230,
+               "tx_packets": 88,
+               "rx_bytes": 12511,
+               "tx_bytes": 34176,
+               "rx_bitrate": 65.0,
+               "tx_bitrate": 1.0,
+               "signal": -45
              }
            ]
         """
@@ -1011,29 +1108,14 @@ class ChuteApi(object):
                 ifname = iface['externalIntf']
                 break
 
-        cmd = ['iw', 'dev', ifname, 'station', 'dump']
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-        stations = []
-        current = {}
-
-        for line in proc.stdout:
-            line = line.strip()
-
-            match = re.match("Station\s+(\S+)\s+.*", line)
-            if match is not None:
-                current = {
-                    'mac_addr': match.group(1)
-                }
-                stations.append(current)
-                continue
-
-            match = re.match("(.*):\s+(.*)", line)
-            if match is not None:
-                key = match.group(1).lower().replace(' ', '_').replace('/', '_')
-                current[key] = match.group(2)
+        try:
+            query = ListQuery(request, 'mac_addr', filters=['mac_addr',
+                'authenticated', 'associated', 'authorized'])
+        except ValueError as error:
+            return bad_request(request, error)
 
-        return json.dumps(stations)
+        stations = StationTable.get_stations(ifname)
+        return json.dumps(query.apply(stations, request))
 
     @routes.route('/<chute>/networks/<network>/stations/<mac>', methods=['GET'])
     def get_station(self, request, chute, network, mac):
@@ -1054,24 +1136,21 @@ class ChuteApi(object):
            Content-Type: application/json
 
            {
-             "rx_packets": "230",
-             "tdls_peer": "no",
-             "authenticated": "yes",
-             "rx_bytes": "12511",
-             "tx_bitrate": "1.0 MBit/s",
-             "tx_retries": "0",
-             "signal": "-45 [-49, -48] dBm",
-             "authorized": "yes",
-             "rx_bitrate": "65.0 MBit/s MCS 7",
-             "mfp": "no",
-             "tx_failed": "0",
-             "inactive_time": "4688 ms",
              "mac_addr": "5c:59:48:7d:b9:e6",
-             "tx_bytes": "34176",
-             "wmm_wme": "yes",
-             "preamble": "short",
-             "tx_packets": "88",
-             "signal_avg": "-44 [-48, -47] dBm"
+             "aid": 1,
+             "flags": ["AUTH", "ASSOC", "AUTHORIZED", "SHORT_PREAMBLE", "WMM", "HT"],
+             "authenticated": true,
+             "associated": true,
+             "authorized": true,
+             "connected_time": 351,
+             "inactive_time": 4688,
+             "rx_packets": 230,
+             "tx_packets": 88,
+             "rx_bytes": 12511,
+             "tx_bytes": 34176,
+             "rx_bitrate": 65.0,
+             "tx_bitrate": 1.0,
+             "signal": -45
            }
         """
         cors.config_cors(request)
@@ -1092,27 +1171,15 @@ class ChuteApi(object):
                 ifname = iface['externalIntf']
                 break
 
-        cmd = ['iw', 'dev', ifname, 'station', 'get', mac]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-        station = {}
-
-        for line in proc.stdout:
-            line = line.strip()
-
-            match = re.match("Station\s+(\S+)\s+.*", line)
-            if match is not None:
-                station['mac_addr'] = match.group(1)
-                continue
-
-            match = re.match("(.*):\s+(.*)", line)
-            if match is not None:
-                key = match.group(1).lower().replace(' ', '_').replace('/', '_')
-                station[key] = match.group(2)
+        station = StationTable.get_station(ifname, mac)
+        if station is None:
+            request.setResponseCode(404)
+            return "{}"
 
         return json.dumps(station)
 
     @routes.route('/<chute>/networks/<network>/stations/<mac>', methods=['DELETE'])
+    @blocking()
     def delete_station(self, request, chute, network, mac):
         cors.config_cors(request)
         request.setHeader('Content-Type', 'application/json')
@@ -1140,6 +1207,7 @@ class ChuteApi(object):
             line = line.strip()
             messages.append(line)
 
+        StationTable.remove_station(ifname, mac)
         return json.dumps(messages)
 
     @routes.route('/<chute>/networks/<network>/hostapd_control/ws', branch=True, methods=['GET'])
@@ -0,0 +1,131 @@
+"""
+Compression for API responses and websocket messages.
+
+JSON responses at or above a size threshold are sent with gzip
+Content-Encoding to clients that accept it.  The decision is made when the
+response body is first written, so small responses, error messages and
+non-JSON content pass through untouched.
+
+Websocket factories can enable permessage-deflate.  The server does not keep
+the compression context between messages and uses a reduced window and
+memory level, which bounds the memory used per connection and keeps the CPU
+cost acceptable on low-end boards.
+"""
+
+import re
+import zlib
+
+from autobahn.websocket.compress import (PerMessageDeflateOffer,
+        PerMessageDeflateOfferAccept)
+from twisted.web import iweb
+from twisted.web.resource import EncodingResourceWrapper
+from zope.interface import implementer
+
+from paradrop.base import settings
+
+
+GZIP_CHECK = re.compile(br"(:?^|[\s,])gzip(:?$|[\s,])")
+
+COMPRESSIBLE_TYPES = [b"application/json"]
+
+
+@implementer(iweb._IRequestEncoder)
+class ThresholdGzipEncoder(object):
+    """
+    Encoder that compresses the response only if it is large enough.
+
+    Klein writes the body returned by a handler in one piece, so the first
+    chunk is a good indication of the response size.
+    """
+    def __init__(self, request, threshold, level):
+        self.request = request
+        self.threshold = threshold
+        self.level = level
+        self.compressor = None
+        self.decided = False
+
+    def should_compress(self, data):
+        if len(data) < self.threshold:
+            return False
+
+        headers = self.request.responseHeaders
+        if headers.hasHeader(b"Content-Encoding"):
+            return False
+
+        ctype = headers.getRawHeaders(b"Content-Type", default=[b""])[0]
+        if not isinstance(ctype, bytes):
+            ctype = ctype.encode("ascii")
+        return any(ctype.startswith(t) for t in COMPRESSIBLE_TYPES)
+
+    def encode(self, data):
+        if not self.decided:
+            self.decided = True
+            if self.should_compress(data):
+                headers = self.request.responseHeaders
+                headers.setRawHeaders(b"Content-Encoding", [b"gzip"])
+                headers.addRawHeader(b"Vary", b"Accept-Encoding")
+                headers.removeHeader(b"Content-Length")
+                self.compressor = zlib.compressobj(self.level,
+                        zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+        if self.compressor is None:
+            return data
+        else:
+            return self.compressor.compress(data)
+
+    def finish(self):
+        if self.compressor is None:
+            return b""
+        else:
+            return self.compressor.flush()
+
+
+@implementer(iweb._IRequestEncoderFactory)
+class JsonGzipEncoderFactory(object):
+    def __init__(self, threshold=None, level=None):
+        if threshold is None:
+            threshold = settings.HTTP_COMPRESS_MIN_SIZE
+        if level is None:
+            level = settings.HTTP_COMPRESS_LEVEL
+        self.threshold = threshold
+        self.level = level
+
+    def encoderForRequest(self, request):
+        accept = b",".join(request.requestHeaders.getRawHeaders(
+            b"Accept-Encoding", []))
+        if GZIP_CHECK.search(accept):
+            return ThresholdGzipEncoder(request, self.threshold, self.level)
+        return None
+
+
+def compress_resource(resource):
+    """
+    Wrap a resource so that its large JSON responses are compressed.
+    """
+    return EncodingResourceWrapper(resource, [JsonGzipEncoderFactory()])
+
+
+def accept_deflate(offers):
+    """
+    Accept the first permessage-deflate offer from a client.
+    """
+    for offer in offers:
+        if not isinstance(offer, PerMessageDeflateOffer):
+            continue
+
+        # We may only choose a window at or below what the client requested.
+        window_bits = settings.WS_DEFLATE_WINDOW_BITS
+        if offer.request_max_window_bits != 0:
+            window_bits = min(window_bits, offer.request_max_window_bits)
+
+        return PerMessageDeflateOfferAccept(offer, False, 0, True,
+                window_bits, settings.WS_DEFLATE_MEM_LEVEL)
+
+    return None
+
+
+def enable_deflate(factory):
+    """
+    Enable permessage-deflate for connections made by a websocket factory.
+    """
+    factory.setProtocolOptions(perMessageCompressionAccept=accept_deflate)
@@ -22,6 +22,7 @@ from paradrop.lib.misc import ssh_keys
 from paradrop.lib.misc.governor import GovernorClient
 
 from . import cors
+from .response_cache import cached_response
 
 
 class ConfigApi(object):
@@ -96,6 +97,7 @@ class ConfigApi(object):
         return json.dumps(result)
 
     @routes.route('/hostconfig', methods=['GET'])
+    @cached_response
     def get_hostconfig(self, request):
         """
         Get the device's current host configuration.
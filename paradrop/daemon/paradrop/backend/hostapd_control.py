@@ -1,9 +1,12 @@
+import collections
+import errno
 import json
 import os
 
 from autobahn.twisted.websocket import WebSocketServerFactory
 from twisted.internet import interfaces, reactor
 from twisted.internet.defer import Deferred
+from twisted.internet.error import ConnectionDone
 from twisted.internet.protocol import ConnectedDatagramProtocol
 from zope.interface import implementer
 
@@ -71,6 +74,13 @@ class HostapdControlProtocol(ConnectedDatagramProtocol):
         if self.command is not None:
             self.transport.write(self.command)
 
+    def stopProtocol(self):
+        self.connected = False
+        remove_socket_file(self.bindAddress())
+
+    def connectionFailed(self, failure):
+        remove_socket_file(self.bindAddress())
+
     def bindAddress(self):
         """
         Choose a path for the client side of the UNIX socket.
@@ -148,6 +158,93 @@ class SingleItemConsumer(object):
         self.producer.stopProducing()
 
 
+class HostapdControlClient(ConnectedDatagramProtocol):
+    """
+    Connection to a hostapd control interface for a series of commands.
+
+    Unlike execute, which binds a new socket for every command, the client
+    keeps one socket open, so that periodic polling does not create a new
+    socket file each time.  Replies are matched to commands in order.  If
+    a request is cancelled (e.g. after a timeout), the connection is closed
+    because later replies could no longer be matched.
+    """
+    counter = 0
+
+    def __init__(self):
+        self.connected = False
+        self.closed = False
+        self.unsent = []
+        self.pending = collections.deque()
+
+        self.instance = HostapdControlClient.counter
+        HostapdControlClient.counter += 1
+
+    def bindAddress(self):
+        return "/tmp/hostapd-{}-client-{}.sock".format(os.getpid(), self.instance)
+
+    def request(self, command):
+        """
+        Send a command and return a Deferred that fires with the reply.
+        """
+        deferred = Deferred(canceller=lambda d: self.close())
+        if self.closed:
+            deferred.errback(ConnectionDone("Control connection closed"))
+            return deferred
+
+        self.pending.append(deferred)
+        if self.connected:
+            self.transport.write(command)
+        else:
+            self.unsent.append(command)
+        return deferred
+
+    def close(self):
+        if self.connected:
+            self.transport.loseConnection()
+        else:
+            self.stopProtocol()
+
+    def datagramReceived(self, datagram):
+        if self.pending:
+            self.pending.popleft().callback(datagram)
+
+    def startProtocol(self):
+        self.connected = True
+        unsent = self.unsent
+        self.unsent = []
+        for command in unsent:
+            self.transport.write(command)
+
+    def stopProtocol(self):
+        if self.closed:
+            return
+        self.connected = False
+        self.closed = True
+        remove_socket_file(self.bindAddress())
+
+        pending = self.pending
+        self.pending = collections.deque()
+        for deferred in pending:
+            if not deferred.called:
+                deferred.errback(ConnectionDone("Control connection closed"))
+
+    def connectionFailed(self, failure):
+        self.stopProtocol()
+
+    def connectionRefused(self):
+        # hostapd went away, e.g. the interface was removed.
+        self.close()
+
+
+def connect(address):
+    """
+    Open a control connection for several commands.
+    """
+    client = HostapdControlClient()
+    reactor.connectUNIXDatagram(address, client, bindAddress=client.bindAddress())
+    return client
+
+
 class HostapdControlWSFactory(WebSocketServerFactory):
     def __init__(self, control_interface):
         WebSocketServerFactory.__init__(self)
@@ -170,11 +267,25 @@ class HostapdControlWSFactory(WebSocketServerFactory):
         return ws
 
 
-def execute(address, command):
-    deferred = Deferred()
+def remove_socket_file(path):
+    """
+    Remove the client side of a UNIX datagram socket, which Twisted leaves
+    behind when the port is closed.
+    """
+    try:
+        os.unlink(path)
+    except OSError as error:
+        if error.errno != errno.ENOENT:
+            raise
+
+
+def execute(address, command, emit_json=True):
+    # Close the socket if the caller gives up waiting for the reply.
+    deferred = Deferred(canceller=lambda d: protocol.stopProducing())
     consumer = SingleItemConsumer(deferred)
 
-    protocol = HostapdControlProtocol(consumer, command=command)
+    protocol = HostapdControlProtocol(consumer, command=command,
+            emit_json=emit_json)
     consumer.registerProducer(protocol, True)
 
     reactor.connectUNIXDatagram(address, protocol, bindAddress=protocol.bindAddress())
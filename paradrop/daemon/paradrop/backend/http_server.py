@@ -5,12 +5,13 @@ The HTTP server to serve local portal and provide RESTful APIs
 import os
 import pkg_resources
 from twisted.web.server import Site
-from twisted.web.static import File
 from twisted.internet import reactor
+from twisted.internet.threads import deferToThread
 from twisted.internet.endpoints import serverFromString
 from klein import Klein
 from autobahn.twisted.resource import WebSocketResource
 
+from paradrop.base.output import out
 from paradrop.core.chute.chute_storage import ChuteStorage
 from paradrop.core.system.system_status import SystemStatus
 
@@ -18,19 +19,25 @@ from .airshark_api import AirsharkApi
 from .airshark_ws import AirsharkSpectrumFactory, AirsharkAnalyzerFactory
 from .audio_api import AudioApi
 from .auth import requires_auth, AuthApi
+from .auth_cache import AuthCache
+from .batch_api import BatchApi
 from .change_api import ChangeApi
 from .change_ws import ChangeStreamFactory
 from .chute_api import ChuteApi
 from .chute_log_ws import ChuteLogWsFactory
+from .compression import compress_resource, enable_deflate
 from .config_api import ConfigApi
 from .information_api import InformationApi
+from .lease_ws import LeaseWsFactory
+from .log_api import LogApi
 from .log_sockjs import LogSockJSFactory
 from .network_api import NetworkApi
-from .paradrop_log_ws import ParadropLogWsFactory
+from .paradrop_log_ws import ParadropLogPublisher, ParadropLogWsFactory
 from .password_api import PasswordApi
 from .password_manager import PasswordManager
 from .snapd_resource import SnapdResource
-from .status_sockjs import StatusSockJSFactory
+from .static_resource import PortalFile, precompress_directory
+from .status_sockjs import StatusPublisher, StatusSockJSFactory
 from .token_manager import TokenManager
 
 
@@ -41,8 +48,11 @@ class HttpServer(object):
         self.update_manager = update_manager
         self.update_fetcher = update_fetcher
         self.system_status = SystemStatus()
+        self.status_publisher = StatusPublisher(self.system_status)
+        self.paradrop_log_publisher = ParadropLogPublisher()
         self.password_manager = PasswordManager()
         self.token_manager = TokenManager()
+        self.auth_cache = AuthCache()
         self.airshark_manager = airshark_manager
 
         if portal_dir:
@@ -52,6 +62,14 @@ class HttpServer(object):
         else:
             self.portal_dir = pkg_resources.resource_filename('paradrop', 'static')
 
+        # Compressed variants of the portal files are built in the
+        # background.  Until they are ready, the files are sent uncompressed.
+        self.portal_variants = {}
+        d = deferToThread(precompress_directory, self.portal_dir)
+        d.addCallback(self.portal_variants.update)
+        d.addErrback(lambda failure: out.warn(
+            "Error compressing portal files: {}\n".format(failure.getErrorMessage())))
+
 
     @app.route('/api/v1/audio', branch=True)
     def api_audio(self, request):
@@ -66,25 +84,38 @@ class HttpServer(object):
     @app.route('/api/v1/info', branch=True)
     @requires_auth
     def api_information(self, request):
-        return InformationApi().routes.resource()
+        return compress_resource(InformationApi().routes.resource())
+
+
+    @app.route('/api/v1/batch', branch=True)
+    @requires_auth
+    def api_batch(self, request):
+        return compress_resource(BatchApi(self.app.resource()).routes.resource())
 
 
     @app.route('/api/v1/changes/', branch=True)
     @requires_auth
     def api_changes(self, request):
-        return ChangeApi(self.update_manager).routes.resource()
+        return compress_resource(ChangeApi(self.update_manager).routes.resource())
 
 
     @app.route('/api/v1/config', branch=True)
     @requires_auth
     def api_configuration(self, request):
-        return ConfigApi(self.update_manager, self.update_fetcher).routes.resource()
+        return compress_resource(ConfigApi(self.update_manager,
+                self.update_fetcher).routes.resource())
 
 
     @app.route('/api/v1/chutes/', branch=True)
     @requires_auth
     def api_chute(self, request):
-        return ChuteApi(self.update_manager).routes.resource()
+        return compress_resource(ChuteApi(self.update_manager).routes.resource())
+
+
+    @app.route('/api/v1/logs', branch=True)
+    @requires_auth
+    def api_logs(self, request):
+        return compress_resource(LogApi().routes.resource())
 
 
     @app.route('/api/v1/password', branch=True)
@@ -102,7 +133,7 @@ class HttpServer(object):
     @app.route('/api/v1/network', branch=True)
     @requires_auth
     def api_network(self, request):
-        return NetworkApi().routes.resource()
+        return compress_resource(NetworkApi().routes.resource())
 
 
     @app.route('/snapd/', branch=True)
@@ -130,6 +161,7 @@ class HttpServer(object):
         chute = ChuteStorage.get_chute(name)
         factory = LogSockJSFactory(chute)
         factory.setProtocolOptions(autoPingInterval=5, autoPingTimeout=2)
+        enable_deflate(factory)
         return WebSocketResource(factory)
 
 
@@ -137,8 +169,10 @@ class HttpServer(object):
     @requires_auth
     def status(self, request):
         #cors.config_cors(request)
-        factory = StatusSockJSFactory(self.system_status)
+        factory = StatusSockJSFactory(self.system_status,
+                self.status_publisher)
         factory.setProtocolOptions(autoPingInterval=5, autoPingTimeout=2)
+        enable_deflate(factory)
         return WebSocketResource(factory)
 
 
@@ -149,6 +183,7 @@ class HttpServer(object):
         chute = ChuteStorage.get_chute(name)
         factory = ChuteLogWsFactory(chute)
         factory.setProtocolOptions(autoPingInterval=10, autoPingTimeout=5)
+        enable_deflate(factory)
         return WebSocketResource(factory)
 
 
@@ -173,8 +208,17 @@ class HttpServer(object):
     @requires_auth
     def paradrop_logs(self, request):
         #cors.config_cors(request)
-        factory = ParadropLogWsFactory()
+        factory = ParadropLogWsFactory(self.paradrop_log_publisher)
+        factory.setProtocolOptions(autoPingInterval=10, autoPingTimeout=5)
+        enable_deflate(factory)
+        return WebSocketResource(factory)
+
+    @app.route('/ws/leases', branch=True)
+    @requires_auth
+    def leases(self, request):
+        factory = LeaseWsFactory()
         factory.setProtocolOptions(autoPingInterval=10, autoPingTimeout=5)
+        enable_deflate(factory)
         return WebSocketResource(factory)
 
     @app.route('/ws/changes/<int:change_id>/stream', branch=True)
@@ -184,6 +228,7 @@ class HttpServer(object):
         if change is not None:
             factory = ChangeStreamFactory(change)
             factory.setProtocolOptions(autoPingInterval=10, autoPingTimeout=5)
+            enable_deflate(factory)
             return WebSocketResource(factory)
         else:
             request.setResponseCode(404)
@@ -193,7 +238,7 @@ class HttpServer(object):
     @app.route('/', branch=True)
     @requires_auth
     def home(self, request):
-        return File(self.portal_dir)
+        return PortalFile(self.portal_dir, variants=self.portal_variants)
 
 
 def setup_http_server(http_server, host, port):
@@ -215,6 +260,8 @@ def annotate_routes(router, prefix):
 
 
 annotate_routes(AudioApi.routes, "/api/v1/audio")
+annotate_routes(BatchApi.routes, "/api/v1/batch")
 annotate_routes(ChuteApi.routes, "/api/v1/chutes")
 annotate_routes(ConfigApi.routes, "/api/v1/config")
 annotate_routes(InformationApi.routes, "/api/v1/info")
+annotate_routes(LogApi.routes, "/api/v1/logs")
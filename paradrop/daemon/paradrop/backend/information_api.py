@@ -12,46 +12,21 @@ from klein import Klein
 
 from paradrop.base import constants
 from paradrop.core.config.devices import detectSystemDevices
+from paradrop.core.system.reactor_lag import ReactorLagMonitor
 from paradrop.core.system.system_info import getOSVersion, getPackageVersion
 from paradrop.core.agent.reporting import TelemetryReportBuilder
 from paradrop.lib.utils import pdos
 from . import cors
+from .blocking import BlockingHandlers, blocking
+from .response_cache import cached_response
 
 
 class InformationApi(object):
     routes = Klein()
 
-    def __init__(self):
-        self.vendor = pdos.read_sys_file('/sys/devices/virtual/dmi/id/sys_vendor')
-        self.board = pdos.read_sys_file('/sys/devices/virtual/dmi/id/product_name', default='') \
-                     + ' ' + pdos.read_sys_file('/sys/devices/virtual/dmi/id/product_version', default='')
-        self.cpu = platform.processor()
-        self.memory = virtual_memory().total
-
-        self.wifi = []
-        devices = detectSystemDevices()
-        for wifiDev in devices['wifi']:
-            # Skip unusual devices that are missing the id field.
-            if 'id' not in wifiDev:
-                continue
-
-            self.wifi.append({
-                'id': wifiDev['id'],
-                'macAddr': wifiDev['mac'],
-                'vendorId': wifiDev['vendor'],
-                'deviceId': wifiDev['device'],
-                'slot': wifiDev['slot']
-            })
-
-        self.biosVendor = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_vendor')
-        self.biosVersion = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_version')
-        self.biosDate = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_date')
-        self.osVersion = getOSVersion()
-        self.kernelVersion = platform.system() + '-' + platform.release()
-        self.pdVersion = getPackageVersion('paradrop')
-        self.uptime = int(float(pdos.read_sys_file('/proc/uptime', default='0').split()[0]))
-
     @routes.route('/hardware', methods=['GET'])
+    @cached_response
+    @blocking()
     def hardware_info(self, request):
         """
         Get information about the hardware platform.
@@ -94,15 +69,33 @@ class InformationApi(object):
         """
         cors.config_cors(request)
         request.setHeader('Content-Type', 'application/json')
+
+        wifi = []
+        devices = detectSystemDevices()
+        for wifiDev in devices['wifi']:
+            # Skip unusual devices that are missing the id field.
+            if 'id' not in wifiDev:
+                continue
+
+            wifi.append({
+                'id': wifiDev['id'],
+                'macAddr': wifiDev['mac'],
+                'vendorId': wifiDev['vendor'],
+                'deviceId': wifiDev['device'],
+                'slot': wifiDev['slot']
+            })
+
         data = dict()
-        data['vendor'] = self.vendor
-        data['board'] = self.board
-        data['cpu'] = self.cpu
-        data['memory'] = self.memory
-        data['wifi'] = self.wifi
+        data['vendor'] = pdos.read_sys_file('/sys/devices/virtual/dmi/id/sys_vendor')
+        data['board'] = pdos.read_sys_file('/sys/devices/virtual/dmi/id/product_name', default='') \
+                        + ' ' + pdos.read_sys_file('/sys/devices/virtual/dmi/id/product_version', default='')
+        data['cpu'] = platform.processor()
+        data['memory'] = virtual_memory().total
+        data['wifi'] = wifi
         return json.dumps(data)
 
     @routes.route('/software', methods=['GET'])
+    @blocking()
     def software_info(self, request):
         """
         Get information about the operating system.
@@ -136,13 +129,13 @@ class InformationApi(object):
         cors.config_cors(request)
         request.setHeader('Content-Type', 'application/json')
         data = dict()
-        data['biosVendor'] = self.biosVendor
-        data['biosVersion'] = self.biosVersion
-        data['biosDate'] = self.biosDate
-        data['kernelVersion'] = self.kernelVersion
-        data['osVersion'] = self.osVersion
-        data['pdVersion'] = self.pdVersion
-        data['uptime'] = self.uptime
+        data['biosVendor'] = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_vendor')
+        data['biosVersion'] = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_version')
+        data['biosDate'] = pdos.read_sys_file('/sys/devices/virtual/dmi/id/bios_date')
+        data['kernelVersion'] = platform.system() + '-' + platform.release()
+        data['osVersion'] = getOSVersion()
+        data['pdVersion'] = getPackageVersion('paradrop')
+        data['uptime'] = int(float(pdos.read_sys_file('/proc/uptime', default='0').split()[0]))
         return json.dumps(data)
 
     @routes.route('/environment', methods=['GET'])
@@ -231,6 +224,7 @@ class InformationApi(object):
         return json.dumps(features)
 
     @routes.route('/telemetry', methods=['GET'])
+    @blocking()
     def get_telemetry(self, request):
         """
         Get a telemetry report.
@@ -244,3 +238,55 @@ class InformationApi(object):
         builder = TelemetryReportBuilder()
         report = builder.prepare()
         return json.dumps(report)
+
+    @routes.route('/performance', methods=['GET'])
+    def get_performance(self, request):
+        """
+        Get performance statistics of the HTTP server.
+
+        reactor_lag reports the delay in seconds of a periodic timer, which
+        grows when work blocks the reactor thread.  blocking_handlers reports
+        call counts, timeouts and run times of the handlers that run on the
+        blocking thread pool.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1/info/performance
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+             "reactor_lag": {
+               "last": 0.0012,
+               "mean": 0.0021,
+               "max": 0.3104,
+               "samples": 3600,
+               "slow_samples": 2
+             },
+             "blocking_handlers": {
+               "chute_api.get_chutes": {
+                 "calls": 120,
+                 "active": 0,
+                 "queued": 0,
+                 "errors": 0,
+                 "timeouts": 0,
+                 "total_time": 14.2,
+                 "max_time": 0.41
+               }
+             }
+           }
+        """
+        cors.config_cors(request)
+        request.setHeader('Content-Type', 'application/json')
+        result = {
+            'reactor_lag': ReactorLagMonitor.statistics,
+            'blocking_handlers': BlockingHandlers.statistics
+        }
+        return json.dumps(result)
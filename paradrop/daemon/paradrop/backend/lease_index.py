@@ -0,0 +1,277 @@
+"""
+Keep an index of the DHCP leases handed out by dnsmasq.
+
+The network and chute lease endpoints used to walk the runtime directory and
+parse every lease file on each request.  The index watches the lease files
+with inotify, or polls their modification times where inotify is not
+available, and only parses files that changed.  It keeps the leases of each
+file and a map of MAC address to the most recent lease across all files.
+
+Whenever a lease appears, changes or disappears, the index emits a
+"lease_changed" event through smokesignal with a dictionary containing the
+action ("added", "updated" or "removed") and the lease, so that websockets
+can push updates instead of clients polling.
+"""
+
+import fnmatch
+import os
+
+import smokesignal
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+from twisted.python.filepath import FilePath
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.lib.utils import parsing
+
+try:
+    from twisted.internet import inotify
+except ImportError:
+    inotify = None
+
+
+LEASE_FILE_PATTERN = "dnsmasq-*.leases"
+
+
+def read_leases(path):
+    """
+    Read leases from a dnsmasq leases file.
+
+    Returns a list of leases, each a dictionary containing the following fields.
+    as_of: Time that lease information was last updated (seconds since Unix epoch).
+    expires: DHCP expiration time (seconds since Unix epoch).
+    mac_addr: MAC address of the device.
+    ip_addr: IP address assigned to the device.
+    hostname: Device hostname if reported.
+    client_id: A client-specified identifier, which varies between devices.
+    """
+    # The format of the dnsmasq leases file is one entry per line with
+    # space-separated fields.
+    keys = ['expires', 'mac_addr', 'ip_addr', 'hostname', 'client_id']
+
+    leases = []
+
+    # Get mtime of the leases file, which gives a sense of the age.
+    as_of = os.path.getmtime(path)
+
+    with open(path, "r") as source:
+        for line in source:
+            parts = line.strip().split()
+            entry = dict(zip(keys, parts))
+            entry['as_of'] = as_of
+            entry['expires'] = parsing.str_to_numeric(entry['expires'])
+
+            # Note: I considered filtering out expired leases based on the
+            # expiration time, but apparently dnsmasq leaves old expiration
+            # times in this file even for active devices.
+            leases.append(entry)
+
+    return leases
+
+
+def update_lease(leases, entry):
+    """
+    Update a dictionary of DHCP leases with a new entry.
+
+    The dictionary should be indexed by MAC address. The new entry will be
+    added to the dictionary unless it would replace an entry for the same MAC
+    address from a more recent lease file.
+    """
+    mac_addr = entry['mac_addr']
+    if mac_addr in leases:
+        existing = leases[mac_addr]
+
+        if existing['as_of'] >= entry['as_of']:
+            return existing
+
+    leases[mac_addr] = entry
+    return entry
+
+
+def is_lease_file(path):
+    return fnmatch.fnmatch(os.path.basename(path), LEASE_FILE_PATTERN)
+
+
+def lease_differs(old, new):
+    for key in ['ip_addr', 'hostname', 'client_id', 'expires']:
+        if old.get(key) != new.get(key):
+            return True
+    return False
+
+
+class LeaseIndex(object):
+    """
+    Maintain the lease index for all lease files under the runtime directory.
+
+    The index is stored in class variables so that the HTTP API can read it
+    without a reference to the running service.
+    """
+    # Map lease file path -> {'mtime': ..., 'leases': [...]}.
+    files = dict()
+
+    # Map MAC address -> most recent lease.
+    leases = dict()
+
+    def __init__(self, root=None):
+        if root is None:
+            root = settings.RUNTIME_HOME_DIR
+        self.root = root
+        self.notifier = None
+        self.looping_call = None
+
+        # Files with pending notifications, read after the debounce delay.
+        self.pending = set()
+        self.pending_call = None
+
+    def start(self):
+        self.scan()
+
+        if inotify is not None and os.path.isdir(self.root):
+            try:
+                self.notifier = inotify.INotify()
+                self.notifier.startReading()
+                # dnsmasq keeps the lease file open and rewrites it in
+                # place, so IN_MODIFY is the event for most lease changes.
+                mask = inotify.IN_MODIFY | inotify.IN_CREATE | \
+                    inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | \
+                    inotify.IN_DELETE | inotify.IN_MOVED_FROM
+                self.notifier.watch(FilePath(self.root), mask=mask,
+                        autoAdd=True, callbacks=[self.on_notify],
+                        recursive=True)
+                return
+            except Exception as error:
+                out.warn("Cannot watch lease files, falling back to polling: "
+                         "{}\n".format(error))
+                self.notifier = None
+
+        if settings.LEASE_INDEX_POLL_INTERVAL > 0:
+            self.looping_call = LoopingCall(self.scan)
+            self.looping_call.start(settings.LEASE_INDEX_POLL_INTERVAL, now=False)
+
+    def stop(self):
+        if self.notifier is not None:
+            self.notifier.loseConnection()
+            self.notifier = None
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+        if self.pending_call is not None and self.pending_call.active():
+            self.pending_call.cancel()
+        self.pending_call = None
+
+    def on_notify(self, ignored, filepath, mask):
+        """
+        Note a change to a lease file and read it after a short delay, so
+        that a rewrite that causes several events is read once.
+        """
+        if is_lease_file(filepath.path):
+            self.pending.add(filepath.path)
+            if self.pending_call is None:
+                self.pending_call = reactor.callLater(
+                        settings.LEASE_INDEX_DEBOUNCE_DELAY, self.read_pending)
+
+    def read_pending(self):
+        self.pending_call = None
+        pending = self.pending
+        self.pending = set()
+
+        # The file changed, even if its modification time looks the same
+        # (it has a resolution of one second on some file systems).
+        for path in pending:
+            LeaseIndex.update_file(path, force=True)
+
+    def scan(self):
+        """
+        Find lease files and parse the ones that changed since the last scan.
+        """
+        found = set()
+        for root, dirs, files in os.walk(self.root):
+            for fname in fnmatch.filter(files, LEASE_FILE_PATTERN):
+                path = os.path.join(root, fname)
+                found.add(path)
+                LeaseIndex.update_file(path)
+
+        for path in list(LeaseIndex.files.keys()):
+            if path not in found:
+                LeaseIndex.update_file(path)
+
+    @classmethod
+    def update_file(cls, path, force=False):
+        """
+        Parse a lease file if it changed, or always with force=True, and
+        update the index.
+
+        Removes the file from the index if it no longer exists.  Returns the
+        leases in the file or None if it does not exist.
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+
+        current = cls.files.get(path, None)
+        if mtime is None:
+            if current is not None:
+                del cls.files[path]
+                cls.rebuild()
+            return None
+
+        if not force and current is not None and current['mtime'] == mtime:
+            return current['leases']
+
+        try:
+            leases = read_leases(path)
+        except (IOError, OSError):
+            return None
+        except Exception as error:
+            out.warn("Error reading lease file {}: {}\n".format(path, error))
+            return None
+
+        cls.files[path] = {
+            'mtime': mtime,
+            'leases': leases
+        }
+        cls.rebuild()
+        return leases
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuild the MAC address map and emit events for changed leases.
+        """
+        merged = {}
+        for info in cls.files.values():
+            for entry in info['leases']:
+                update_lease(merged, entry)
+
+        previous = cls.leases
+        cls.leases = merged
+
+        for mac, lease in merged.items():
+            old = previous.get(mac, None)
+            if old is None:
+                smokesignal.emit('lease_changed', {'action': 'added', 'lease': lease})
+            elif lease_differs(old, lease):
+                smokesignal.emit('lease_changed', {'action': 'updated', 'lease': lease})
+
+        for mac, lease in previous.items():
+            if mac not in merged:
+                smokesignal.emit('lease_changed', {'action': 'removed', 'lease': lease})
+
+    @classmethod
+    def get_devices(cls):
+        """
+        Get the most recent lease of every known device.
+        """
+        return list(cls.leases.values())
+
+    @classmethod
+    def get_file_leases(cls, path):
+        """
+        Get the leases in a file or None if the file does not exist.
+
+        The file is parsed again only if it changed since it was indexed.
+        """
+        return cls.update_file(path)
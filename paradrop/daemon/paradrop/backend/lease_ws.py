@@ -0,0 +1,54 @@
+import json
+
+from autobahn.twisted.websocket import WebSocketServerProtocol
+from autobahn.twisted.websocket import WebSocketServerFactory
+import smokesignal
+
+from paradrop.base.output import out
+
+
+class LeaseWsProtocol(WebSocketServerProtocol):
+    def __init__(self, factory):
+        WebSocketServerProtocol.__init__(self)
+        self.factory = factory
+
+    def onOpen(self):
+        out.info('ws /leases connected')
+        self.factory.addLeaseObserver(self)
+
+    def onLeaseChanged(self, message):
+        self.sendMessage(message)
+
+    def onClose(self, wasClean, code, reason):
+        out.info('ws /leases disconnected: {}'.format(reason))
+        self.factory.removeLeaseObserver(self)
+
+
+class LeaseWsFactory(WebSocketServerFactory):
+    """
+    Push DHCP lease events ("added", "updated", "removed") to clients.
+    """
+    def __init__(self, *args, **kwargs):
+        WebSocketServerFactory.__init__(self, *args, **kwargs)
+        self.observers = []
+
+    def buildProtocol(self, addr):
+        return LeaseWsProtocol(self)
+
+    def addLeaseObserver(self, observer):
+        if (self.observers.count(observer) == 0):
+            self.observers.append(observer)
+            if len(self.observers) == 1:
+                smokesignal.on('lease_changed', self.onLeaseChanged)
+
+    def removeLeaseObserver(self, observer):
+        if (self.observers.count(observer) == 1):
+            self.observers.remove(observer)
+            if len(self.observers) == 0:
+                smokesignal.disconnect(self.onLeaseChanged)
+
+    def onLeaseChanged(self, event):
+        # Encode once for all observers.
+        message = json.dumps(event).encode('utf-8')
+        for observer in self.observers:
+            observer.onLeaseChanged(message)
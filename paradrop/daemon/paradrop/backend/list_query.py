@@ -0,0 +1,214 @@
+"""
+Common query parameters for endpoints that return lists.
+
+The following parameters are supported by list endpoints:
+
+limit
+  maximum number of items to return
+cursor
+  opaque value from the X-Next-Cursor header of the previous page
+fields
+  comma-separated list of fields to include in each item
+sort
+  field to sort by, with a leading "-" for descending order; items without
+  the field come last in either order; paginated lists are sorted by the key
+  of the endpoint by default
+<field>=<value>
+  only return items with the given value, for the fields that an endpoint
+  allows; repeat the parameter to match any of several values
+
+Without any parameters, endpoints return the whole list as before.  The total
+number of matching items is returned in the X-Total-Count header, and
+X-Next-Cursor is set when more items remain.
+
+Handlers use `wants` to skip expensive work, such as inspecting containers,
+for fields that were not requested.
+"""
+
+import base64
+import json
+import numbers
+
+import six
+
+from paradrop.base import settings
+
+
+def to_text(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    return value
+
+
+def sort_key(value):
+    """
+    Make a sort key that orders values of different types consistently.
+    """
+    if value is None:
+        return (3, "")
+    elif isinstance(value, (bool, numbers.Number)):
+        return (0, value)
+    elif isinstance(value, six.string_types):
+        return (1, value)
+    else:
+        return (2, json.dumps(value, sort_keys=True))
+
+
+def filter_value(value):
+    """
+    Convert a field value to the string form used in query parameters.
+    """
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    elif value is None:
+        return ""
+    else:
+        return six.text_type(value)
+
+
+def encode_cursor(values):
+    data = json.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        values = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class ListQuery(object):
+    """
+    Parse and apply the list parameters of a request.
+
+    key: field that uniquely identifies an item, used to break ties when
+    sorting and to make cursors stable while the list changes.
+    filters: fields that may be used as filter parameters.
+
+    Raises ValueError if a parameter is invalid.
+    """
+    def __init__(self, request, key, filters=None):
+        self.key = key
+        self.limit = None
+        self.cursor = None
+        self.fields = None
+        self.sort = None
+        self.descending = False
+        self.filters = {}
+
+        allowed = set(filters or [])
+
+        for name, values in six.iteritems(request.args):
+            name = to_text(name)
+            values = [to_text(v) for v in values]
+
+            if name == 'limit':
+                try:
+                    self.limit = int(values[0])
+                except ValueError:
+                    raise ValueError("limit must be an integer")
+                if self.limit < 1:
+                    raise ValueError("limit must be positive")
+                self.limit = min(self.limit, settings.API_LIST_MAX_LIMIT)
+            elif name == 'cursor':
+                self.cursor = decode_cursor(values[0])
+            elif name == 'fields':
+                self.fields = set()
+                for value in values:
+                    self.fields.update(f for f in value.split(',') if f)
+            elif name == 'sort':
+                sort = values[0]
+                if sort.startswith('-'):
+                    self.descending = True
+                    sort = sort[1:]
+                if sort:
+                    self.sort = sort
+            elif name in allowed:
+                self.filters[name] = set(values)
+
+    def wants(self, field):
+        """
+        Check whether a field is needed for the response.
+        """
+        if self.fields is None:
+            return True
+        return (field in self.fields or field == self.sort or
+                field == self.key or field in self.filters)
+
+    def matches(self, item):
+        for name, values in six.iteritems(self.filters):
+            if filter_value(item.get(name, None)) not in values:
+                return False
+        return True
+
+    def sort_field(self):
+        return self.key if self.sort is None else self.sort
+
+    def position(self, value, key):
+        """
+        Make the sort key of an item from its sort field and key values.
+
+        Missing values come last in both directions, so the flag that
+        separates them is inverted for the reversed, descending sort.
+        """
+        missing = (value is None) != self.descending
+        return (missing, sort_key(value), sort_key(key))
+
+    def item_key(self, item):
+        return self.position(item.get(self.sort_field(), None),
+                item.get(self.key, None))
+
+    def apply(self, items, request=None):
+        """
+        Filter, sort, paginate and project a list of dictionaries.
+
+        If a request is passed, the X-Total-Count and X-Next-Cursor headers
+        are set on it.
+        """
+        items = [item for item in items if self.matches(item)]
+        total = len(items)
+
+        # Keep the original order unless the client asked for sorting or
+        # pagination, which needs a stable order.
+        if self.sort is not None or self.limit is not None or \
+                self.cursor is not None:
+            items.sort(key=self.item_key, reverse=self.descending)
+
+        if self.cursor is not None:
+            position = self.position(self.cursor[0], self.cursor[1])
+            if self.descending:
+                items = [item for item in items if self.item_key(item) < position]
+            else:
+                items = [item for item in items if self.item_key(item) > position]
+
+        next_cursor = None
+        if self.limit is not None and len(items) > self.limit:
+            items = items[:self.limit]
+            last = items[-1]
+            next_cursor = encode_cursor([last.get(self.sort_field(), None),
+                last.get(self.key, None)])
+
+        if self.fields is not None:
+            items = [self.project(item) for item in items]
+
+        if request is not None:
+            request.setHeader('X-Total-Count', str(total))
+            if next_cursor is not None:
+                request.setHeader('X-Next-Cursor', next_cursor)
+
+        return items
+
+    def project(self, item):
+        return dict((k, v) for k, v in six.iteritems(item) if k in self.fields)
+
+
+def bad_request(request, error):
+    request.setResponseCode(400)
+    return json.dumps({
+        'error': str(error)
+    })
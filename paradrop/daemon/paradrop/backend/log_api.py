@@ -0,0 +1,245 @@
+"""
+Read the logs of the Paradrop daemon.
+
+Logs are read from the log files with paradrop.base.output.getLogsSince,
+which streams the records and uses the index of each log segment to skip
+older ones, so requesting the latest page does not read the whole history.
+
+Repeated messages are limited by paradrop.base.ratelimit, and the limits
+can be inspected at /api/v1/logs/rate-limits.
+
+Endpoints for these functions can be found under /api/v1/logs.
+"""
+
+import json
+
+from klein import Klein
+
+from paradrop.base import output, settings
+from paradrop.base.output import out
+from . import cors
+from .blocking import blocking
+from .list_query import bad_request, decode_cursor, encode_cursor, to_text
+
+
+DEFAULT_LIMIT = 100
+
+
+def get_arg(request, name, default=None):
+    values = request.args.get(name.encode('ascii'), request.args.get(name, None))
+    if not values:
+        return default
+    return to_text(values[0])
+
+
+def record_matches(record, level=None, module=None, contains=None):
+    """
+    Check whether a log record passes the level, module and text filters.
+
+    level: minimum level value.
+    module: module name (e.g. "update_manager") or package and module prefix
+    (e.g. "backend" or "core.update_manager").
+    contains: text that must appear in the message.
+    """
+    if level is not None and record.get('type', 0) < level:
+        return False
+
+    if module is not None:
+        name = "{}.{}".format(record.get('package'), record.get('module'))
+        if module not in (name, record.get('module')) and \
+                not name.startswith(module + '.'):
+            return False
+
+    if contains is not None and contains not in to_text(record.get('message', '')):
+        return False
+
+    return True
+
+
+class LogQuery(object):
+    """
+    Parse the parameters of a log request.
+
+    Raises ValueError if a parameter is invalid.
+    """
+    def __init__(self, request):
+        try:
+            self.since = float(get_arg(request, 'since', 0))
+        except ValueError:
+            raise ValueError("since must be a number")
+
+        try:
+            self.limit = int(get_arg(request, 'limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if self.limit < 1:
+            raise ValueError("limit must be positive")
+        self.limit = min(self.limit, settings.API_LIST_MAX_LIMIT)
+
+        # The cursor holds the timestamp of the last record returned and the
+        # number of returned records with that timestamp, which are skipped
+        # on the next page.
+        self.skip = 0
+        cursor = get_arg(request, 'cursor')
+        if cursor is not None:
+            since, skip = decode_cursor(cursor)
+            try:
+                self.since = float(since)
+                self.skip = int(skip)
+            except (TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+
+        self.level = None
+        level = get_arg(request, 'level')
+        if level is not None:
+            try:
+                self.level = output.levelValue(level)
+            except (KeyError, ValueError):
+                raise ValueError("Unknown level {}".format(level))
+
+        self.module = get_arg(request, 'module')
+        self.inclusive = (cursor is not None)
+
+    def matches(self, record):
+        return record_matches(record, level=self.level, module=self.module)
+
+    def read(self, records):
+        """
+        Select one page of records.
+
+        Returns the records and the cursor for the next page, or None if
+        there are no more records.
+        """
+        page = []
+        skipped = 0
+        more = False
+
+        for record in records:
+            if not self.matches(record):
+                continue
+
+            timestamp = record.get('timestamp', 0)
+            if skipped < self.skip and timestamp == self.since:
+                skipped += 1
+                continue
+
+            if len(page) == self.limit:
+                more = True
+                break
+            page.append(record)
+
+        if not more:
+            return page, None
+
+        last = page[-1]['timestamp']
+        count = sum(1 for record in page if record['timestamp'] == last)
+        if last == self.since:
+            count += skipped
+        return page, encode_cursor([last, count])
+
+
+class LogApi(object):
+    routes = Klein()
+
+    @routes.route('/', methods=['GET'])
+    @blocking()
+    def get_logs(self, request):
+        """
+        Get messages from the daemon log, oldest first.
+
+        The parameters are since (timestamp, only return messages written
+        after this time), limit (default 100), cursor (from the X-Next-Cursor
+        header of the previous page), level (minimum level, e.g. "warn") and
+        module (module name such as "update_manager", or package and module
+        prefix such as "backend" or "core.update_manager").
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1/logs/?since=1514329200&level=warn&limit=2
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+           X-Next-Cursor: WzE1MTQzMjkyNTYuMSwgMV0=
+
+           [
+             {
+               "message": "Chute hello-world is not running",
+               "type": 5,
+               "extra": {},
+               "package": "core",
+               "module": "restart",
+               "timestamp": 1514329211.2,
+               "pdid": "UNSET",
+               "line": 64
+             },
+             ...
+           ]
+        """
+        cors.config_cors(request)
+        request.setHeader('Content-Type', 'application/json')
+
+        try:
+            query = LogQuery(request)
+        except ValueError as error:
+            return bad_request(request, error)
+
+        records = out.getLogsSince(query.since, inclusive=query.inclusive)
+        page, cursor = query.read(records)
+        if cursor is not None:
+            request.setHeader('X-Next-Cursor', cursor)
+
+        return json.dumps(page)
+
+    @routes.route('/rate-limits', methods=['GET'])
+    def get_rate_limits(self, request):
+        """
+        Get the limits on repeated log messages and the messages that are
+        currently being suppressed.
+
+        Messages from the same line with the same text, ignoring numbers,
+        are logged at most burst times in each window of seconds. The rest
+        are counted and replaced by a single "Message repeated N times"
+        summary when the window ends.
+
+        **Example request**:
+
+        .. sourcecode:: http
+
+           GET /api/v1/logs/rate-limits
+
+        **Example response**:
+
+        .. sourcecode:: http
+
+           HTTP/1.1 200 OK
+           Content-Type: application/json
+
+           {
+             "limits": {
+               "INFO": {"burst": 20, "window": 60.0},
+               "WARN": {"burst": 20, "window": 60.0},
+               "ERR": {"burst": 20, "window": 60.0}
+             },
+             "suppressed": 142,
+             "suppressing": [
+               {
+                 "module": "paradrop.core.restart",
+                 "line": 64,
+                 "template": "Chute %s is not running",
+                 "level": "WARN",
+                 "count": 57,
+                 "suppressed": 37,
+                 "since": 1514329211.2
+               }
+             ]
+           }
+        """
+        cors.config_cors(request)
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps(out.getRateLimitStats())
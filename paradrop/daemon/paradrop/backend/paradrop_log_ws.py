@@ -1,46 +1,200 @@
+"""
+Stream the daemon log to websocket clients.
+
+Each message is sent as the text of the log record.  A client may narrow
+the stream by sending a filter as a JSON object, for example:
+
+    {"level": "warn", "module": "backend", "contains": "chute"}
+
+where level is the minimum level, module is a module name or package and
+module prefix, and contains is text that must appear in the message.  An
+empty object removes the filter.
+
+Log records are not sent from the logging call.  They are added to a
+bounded queue for each client, which is drained by the reactor while the
+connection is able to take more data.  When a client falls behind, the
+oldest queued messages are dropped and the client is told how many were
+lost.
+"""
+
+import collections
+import json
+
+import six
+
 from autobahn.twisted.websocket import WebSocketServerProtocol
 from autobahn.twisted.websocket import WebSocketServerFactory
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
 import smokesignal
 
+from paradrop.base import output, settings
 from paradrop.base.output import out
+from .log_api import record_matches
+
+
+def encode_message(message):
+    if isinstance(message, bytes):
+        return message
+    return message.encode('utf-8')
+
+
+class ParadropLogPublisher(object):
+    """
+    Deliver log records to subscribed clients.
 
+    The publisher is shared by all connections, so that a record is encoded
+    once no matter how many clients receive it.
+    """
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, client):
+        if client not in self.subscribers:
+            self.subscribers.append(client)
+            if len(self.subscribers) == 1:
+                smokesignal.on(output.LOG_SIGNAL, self.onParadropLog)
+
+    def unsubscribe(self, client):
+        if client in self.subscribers:
+            self.subscribers.remove(client)
+            if len(self.subscribers) == 0:
+                smokesignal.disconnect(self.onParadropLog)
+
+    def onParadropLog(self, logDict):
+        message = None
+        for client in list(self.subscribers):
+            # This runs inside every logging call, so an error here must not
+            # reach the caller, and it cannot be logged either.
+            try:
+                if client.matches(logDict):
+                    if message is None:
+                        message = encode_message(logDict['message'])
+                    client.enqueue(message)
+            except Exception:
+                pass
+
+
+@implementer(IPushProducer)
 class ParadropLogWsProtocol(WebSocketServerProtocol):
     def __init__(self, factory):
         WebSocketServerProtocol.__init__(self)
         self.factory = factory
 
+        self.filters = {}
+
+        # Messages waiting to be sent.  Log records may arrive from any
+        # thread, and deque appends and pops are thread-safe.
+        self.queue = collections.deque()
+        self.paused = False
+        self.flush_scheduled = False
+
+        # Total number of dropped messages and the number not yet reported
+        # to the client.
+        self.dropped = 0
+        self.unreported = 0
+
     def onOpen(self):
         out.info('ws /paradrop_logs connected')
+
+        # Twisted Web may still be registered as the producer of the
+        # transport that it handed over to us.
+        if getattr(self.transport, 'producer', None) is not None:
+            self.transport.unregisterProducer()
+        self.transport.registerProducer(self, True)
+
         self.factory.addParadropLogObserver(self)
 
-    def onParadropLog(self, logDict):
-        self.sendMessage(logDict['message'])
+    def onMessage(self, payload, isBinary):
+        try:
+            request = json.loads(payload.decode('utf-8'))
+        except ValueError:
+            return
+        if not isinstance(request, dict):
+            return
+
+        # Filters are applied on the logging path, so anything that is not
+        # of the expected type is rejected here.
+        filters = {}
+        try:
+            if request.get('level') is not None:
+                filters['level'] = output.levelValue(request['level'])
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return
+        for key in ['module', 'contains']:
+            value = request.get(key)
+            if value is None or value == '':
+                continue
+            if not isinstance(value, six.string_types):
+                return
+            filters[key] = value
+        self.filters = filters
+
+    def matches(self, logDict):
+        return record_matches(logDict, **self.filters)
+
+    def enqueue(self, message):
+        if len(self.queue) >= settings.LOG_WS_QUEUE_SIZE:
+            try:
+                self.queue.popleft()
+                self.dropped += 1
+                self.unreported += 1
+            except IndexError:
+                pass
+
+        self.queue.append(message)
+
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            reactor.callFromThread(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+
+        if self.paused:
+            return
+
+        if self.unreported > 0:
+            notice = "{} log messages were dropped because the connection " \
+                     "is too slow".format(self.unreported)
+            self.unreported = 0
+            self.sendMessage(notice.encode('utf-8'))
+
+        while self.queue and not self.paused:
+            self.sendMessage(self.queue.popleft())
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        self.paused = True
+        self.queue.clear()
 
     def onClose(self, wasClean, code, reason):
-        out.info('ws /paradrop_logs disconnected: {}'.format(reason))
         self.factory.removeParadropLogObserver(self)
+        out.info('ws /paradrop_logs disconnected: {}'.format(reason))
+        if self.dropped > 0:
+            out.info('ws /paradrop_logs dropped {} messages'.format(self.dropped))
 
 
 class ParadropLogWsFactory(WebSocketServerFactory):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, publisher=None, *args, **kwargs):
         WebSocketServerFactory.__init__(self, *args, **kwargs)
-        self.observers = []
+
+        if publisher is None:
+            publisher = ParadropLogPublisher()
+        self.publisher = publisher
 
     def buildProtocol(self, addr):
         return ParadropLogWsProtocol(self)
 
     def addParadropLogObserver(self, observer):
-        if (self.observers.count(observer) == 0):
-            self.observers.append(observer)
-            if len(self.observers) == 1:
-                smokesignal.on('logs', self.onParadropLog)
+        self.publisher.subscribe(observer)
 
     def removeParadropLogObserver(self, observer):
-        if (self.observers.count(observer) == 1):
-            self.observers.remove(observer)
-            if len(self.observers) == 0:
-                smokesignal.disconnect(self.onParadropLog)
-
-    def onParadropLog(self, logDict):
-        for observer in self.observers:
-            observer.onParadropLog(logDict)
+        self.publisher.unsubscribe(observer)
@@ -2,6 +2,8 @@ import os
 import crypt
 import random
 
+import smokesignal
+
 from paradrop.base import settings
 from paradrop.lib.utils import pdos
 
@@ -38,6 +40,9 @@ class PasswordManager(object):
 
         pdos.write(self.password_file, file_content)
 
+        # Let anyone caching verified credentials know that they are stale.
+        smokesignal.emit('password_changed')
+
     def _generate_salt(self):
         # The salt can be generated with crypt.mksalt() on Python 3
         CHARACTERS = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
@@ -0,0 +1,266 @@
+"""
+Cache responses of read-only API endpoints.
+
+The portal polls the chute list, chute details and host configuration every
+few seconds, and building those responses queries Docker for the state of
+every container.  The cache keeps the last response body of those endpoints
+together with an ETag and Last-Modified time.  Repeated requests are answered
+from the cache, and clients that send If-None-Match or If-Modified-Since
+receive 304 Not Modified without any handler work.
+
+Entries are dropped whenever chute storage changes, the host configuration is
+saved, a container changes state or a DHCP lease changes.  The configured TTL
+bounds the staleness of data that changes without an event, e.g. allocations
+computed from hardware state.
+
+The Last-Modified time of a response is the time its body last changed.  It is
+remembered across invalidations and expiry, so that a client is told about
+new content even when it arrives after a TTL refresh.
+"""
+
+import collections
+import functools
+import hashlib
+import threading
+import time
+
+import smokesignal
+import six
+
+from twisted.internet import defer
+from twisted.web import http
+
+from paradrop.base import settings
+
+from . import cors
+
+
+# Events that invalidate all cached responses.
+INVALIDATING_EVENTS = [
+    'chute_saved',
+    'chute_deleted',
+    'hostconfig_saved',
+    'container_state_changed',
+    'lease_changed'
+]
+
+# Response headers that are stored with the body, e.g. the pagination
+# headers set by list_query.
+CACHED_HEADERS = [
+    'X-Total-Count',
+    'X-Next-Cursor'
+]
+
+
+class ResponseCache(object):
+    def __init__(self, ttl=None, max_versions=None):
+        if ttl is None:
+            ttl = settings.RESPONSE_CACHE_TTL
+        if max_versions is None:
+            max_versions = settings.RESPONSE_CACHE_MAX_VERSIONS
+        self.ttl = ttl
+        self.max_versions = max_versions
+
+        # Map key -> response entry.
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        # Map key -> (etag, last_modified) of the last response body, which
+        # outlives the entry so that Last-Modified only advances when the
+        # body changes.  Least recently stored keys are forgotten first.
+        self.versions = collections.OrderedDict()
+
+        for event in INVALIDATING_EVENTS:
+            smokesignal.on(event, self.invalidate)
+
+    def get(self, key):
+        """
+        Get a cached response entry or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is None:
+                return None
+
+            if entry['expires'] > time.time():
+                return entry
+
+            del self.entries[key]
+            return None
+
+    def put(self, key, body, content_type, headers=None):
+        """
+        Store a response body and return the new entry.
+
+        headers: dictionary of other response headers to send with the body.
+        """
+        if isinstance(body, six.text_type):
+            body = body.encode('utf-8')
+
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        now = time.time()
+
+        with self.lock:
+            version = self.versions.pop(key, None)
+            if version is not None and version[0] == etag:
+                last_modified = version[1]
+            else:
+                last_modified = now
+
+            self.versions[key] = (etag, last_modified)
+            while len(self.versions) > self.max_versions:
+                self.versions.popitem(last=False)
+
+            entry = {
+                'body': body,
+                'content_type': content_type,
+                'headers': headers or {},
+                'etag': etag,
+                'last_modified': last_modified,
+                'expires': now + self.ttl
+            }
+            self.entries[key] = entry
+            return entry
+
+    def invalidate(self, *args, **kwargs):
+        with self.lock:
+            self.entries = {}
+
+
+response_cache = None
+
+
+def get_response_cache():
+    """
+    Get the response cache shared by all API instances.
+    """
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache()
+    return response_cache
+
+
+def get_cache_key(request):
+    """
+    Make the cache key for a request.
+
+    Owners and admins see the same responses.  Other users may be denied
+    access to some chutes, so their responses are cached per user.
+    """
+    user = getattr(request, 'user', None)
+    if user is None:
+        return (request.uri, None, None)
+    elif user.role in ["owner", "admin"]:
+        return (request.uri, user.role, None)
+    else:
+        return (request.uri, user.role, user.name)
+
+
+def etag_matches(header, etag):
+    """
+    Check an If-None-Match header value against an ETag.
+
+    Uses the weak comparison that RFC 7232 prescribes for If-None-Match.
+    """
+    if isinstance(header, bytes):
+        header = header.decode('ascii', 'replace')
+
+    header = header.strip()
+    if header == '*':
+        return True
+
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+
+    return False
+
+
+def is_not_modified(request, entry):
+    """
+    Evaluate the conditional request headers against a cache entry.
+
+    If-Modified-Since is ignored when the request has If-None-Match
+    (RFC 7232, section 6).
+    """
+    if_none_match = request.getHeader('If-None-Match')
+    if if_none_match is not None:
+        return etag_matches(if_none_match, entry['etag'])
+
+    if_modified_since = request.getHeader('If-Modified-Since')
+    if if_modified_since is not None:
+        if isinstance(if_modified_since, six.text_type):
+            if_modified_since = if_modified_since.encode('ascii', 'replace')
+        try:
+            since = http.stringToDatetime(if_modified_since)
+        except (IndexError, KeyError, TypeError, ValueError):
+            return False
+        return int(entry['last_modified']) <= since
+
+    return False
+
+
+def send_cached(request, entry):
+    """
+    Answer a request from a cache entry.
+
+    Returns an empty body with status 304 if the client already has the
+    current version.
+    """
+    cors.config_cors(request)
+    request.setHeader('Content-Type', entry['content_type'])
+    for name, value in six.iteritems(entry.get('headers', {})):
+        request.setHeader(name, value)
+    request.setHeader('ETag', entry['etag'])
+    request.setHeader('Last-Modified',
+            http.datetimeToString(entry['last_modified']))
+
+    if is_not_modified(request, entry):
+        request.setResponseCode(http.NOT_MODIFIED)
+        return b""
+
+    return entry['body']
+
+
+def cached_response(func):
+    """
+    Decorator that caches the response of a GET handler.
+
+    Only successful responses are cached.  The decorator should be placed
+    below the route decorator.
+    """
+    @functools.wraps(func)
+    def decorated(self, request, *args, **kwargs):
+        cache = get_response_cache()
+        key = get_cache_key(request)
+
+        entry = cache.get(key)
+        if entry is not None:
+            return send_cached(request, entry)
+
+        def store(body):
+            if request.code != http.OK or not isinstance(body, (bytes, six.text_type)):
+                return body
+
+            content_type = request.responseHeaders.getRawHeaders(
+                    'Content-Type', default=['application/json'])[0]
+
+            headers = {}
+            for name in CACHED_HEADERS:
+                values = request.responseHeaders.getRawHeaders(name)
+                if values:
+                    headers[name] = values[-1]
+
+            entry = cache.put(key, body, content_type, headers=headers)
+            return send_cached(request, entry)
+
+        result = func(self, request, *args, **kwargs)
+        if isinstance(result, defer.Deferred):
+            return result.addCallback(store)
+        else:
+            return store(result)
+
+    return decorated
@@ -0,0 +1,250 @@
+"""
+Serve the portal with compression and long-lived caching.
+
+The portal bundle is large, mostly JavaScript, and its file names contain a
+content hash, so a given file never changes.  At startup we build gzip (and
+brotli, if the module is installed) variants of the compressible files, and
+the resource below serves the best variant the client accepts.  Variants that
+were already built next to the original files, e.g. at snap build time, are
+used as they are.
+
+Hashed assets are sent with an immutable Cache-Control header so that
+browsers do not request them again.  Other files, such as index.html, must be
+revalidated.  Range requests are handled by twisted's File resource for both
+the original and the compressed files.
+"""
+
+import gzip
+import io
+import os
+import re
+
+from twisted.web.static import File, getTypeAndEncoding
+
+from paradrop.base.output import out
+from paradrop.base import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Image and font formats that are already compressed are left out.
+COMPRESSIBLE_EXTENSIONS = set([
+    ".css", ".eot", ".html", ".js", ".json", ".map", ".svg", ".ttf", ".txt"
+])
+
+# Files smaller than this are not worth compressing.
+COMPRESS_MIN_SIZE = 1024
+
+# Matches file names with a content hash, e.g. app-27896e7b8aabcfde5b72.js.
+HASHED_NAME = re.compile(r"[-.][0-9a-f]{16,}\.[a-z0-9]+$")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def compress_gzip(data):
+    buf = io.BytesIO()
+    # Fixed mtime so that the output only depends on the input.
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0) as output:
+        output.write(data)
+    return buf.getvalue()
+
+
+def compress_brotli(data):
+    return brotli.compress(data)
+
+
+def get_encoders():
+    """
+    Get the available encoders as a list of (encoding, extension, function).
+
+    The list is ordered by preference.
+    """
+    encoders = []
+    if brotli is not None:
+        encoders.append(("br", ".br", compress_brotli))
+    encoders.append(("gzip", ".gz", compress_gzip))
+    return encoders
+
+
+def is_up_to_date(path, source):
+    return os.path.isfile(path) and \
+        os.path.getmtime(path) >= os.path.getmtime(source)
+
+
+def precompress_directory(source_dir, cache_dir=None):
+    """
+    Build compressed variants of the files in a directory.
+
+    Variants are written under cache_dir, which mirrors the layout of
+    source_dir, because source_dir may be read-only.  Returns a dictionary
+    that maps the absolute path of each original file to a dictionary of
+    encoding -> variant path.
+    """
+    if cache_dir is None:
+        cache_dir = settings.PORTAL_CACHE_DIR
+
+    source_dir = os.path.abspath(source_dir)
+    encoders = get_encoders()
+
+    variants = {}
+    for root, dirs, files in os.walk(source_dir):
+        for fname in files:
+            ext = os.path.splitext(fname)[1].lower()
+            if ext not in COMPRESSIBLE_EXTENSIONS:
+                continue
+
+            path = os.path.join(root, fname)
+            size = os.path.getsize(path)
+            if size < COMPRESS_MIN_SIZE:
+                continue
+
+            relpath = os.path.relpath(path, source_dir)
+            available = {}
+            for encoding, suffix, compress in encoders:
+                prebuilt = path + suffix
+                if is_up_to_date(prebuilt, path):
+                    available[encoding] = prebuilt
+                    continue
+
+                target = os.path.join(cache_dir, relpath + suffix)
+                if not is_up_to_date(target, path):
+                    try:
+                        with open(path, "rb") as source:
+                            data = compress(source.read())
+                    except Exception as error:
+                        out.warn("Error compressing {}: {}\n".format(path, error))
+                        continue
+
+                    # Skip variants that do not save anything.
+                    if len(data) >= size:
+                        continue
+
+                    target_dir = os.path.dirname(target)
+                    if not os.path.isdir(target_dir):
+                        os.makedirs(target_dir)
+                    with open(target, "wb") as output:
+                        output.write(data)
+
+                    # Give the variant the modification time of the
+                    # original so that Last-Modified does not depend on the
+                    # encoding.
+                    mtime = os.path.getmtime(path)
+                    os.utime(target, (mtime, mtime))
+
+                available[encoding] = target
+
+            if len(available) > 0:
+                variants[path] = available
+
+    return variants
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into a dictionary of encoding -> q value.
+    """
+    accepted = {}
+    if not header:
+        return accepted
+
+    for item in header.split(","):
+        parts = item.strip().split(";")
+        encoding = parts[0].strip().lower()
+        if not encoding:
+            continue
+
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[encoding] = q
+
+    return accepted
+
+
+def select_encoding(header, available):
+    """
+    Choose the preferred encoding that is both available and accepted.
+
+    Returns None if the original file should be sent.
+    """
+    accepted = parse_accept_encoding(header)
+    best = None
+    best_q = 0.0
+    for encoding, _, _ in get_encoders():
+        if encoding not in available:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best = encoding
+            best_q = q
+    return best
+
+
+def get_cache_control(path):
+    if HASHED_NAME.search(os.path.basename(path)):
+        return IMMUTABLE_CACHE_CONTROL
+    else:
+        return REVALIDATE_CACHE_CONTROL
+
+
+class PortalFile(File):
+    """
+    Static file resource that serves precompressed variants.
+
+    variants should be the dictionary returned by precompress_directory.  It
+    is shared with child resources and may be filled in after the resource
+    was created.
+    """
+    def __init__(self, path, defaultType="text/html", ignoredExts=(),
+                 registry=None, allowExt=0, variants=None):
+        File.__init__(self, path, defaultType, ignoredExts, registry, allowExt)
+        if variants is None:
+            variants = {}
+        self.variants = variants
+
+    def createSimilarFile(self, path):
+        f = File.createSimilarFile(self, path)
+        f.variants = self.variants
+        return f
+
+    def render_GET(self, request):
+        self.restat(False)
+        if not self.isfile():
+            return File.render_GET(self, request)
+
+        request.setHeader("Cache-Control", get_cache_control(self.path))
+
+        available = self.variants.get(os.path.abspath(self.path), None)
+        if not available:
+            return File.render_GET(self, request)
+
+        # Caches must not send a compressed response to a client that did
+        # not ask for it.
+        request.setHeader("Vary", "Accept-Encoding")
+
+        header = request.getHeader("Accept-Encoding")
+        if isinstance(header, bytes):
+            header = header.decode("ascii", "ignore")
+        encoding = select_encoding(header, available)
+        if encoding is None:
+            return File.render_GET(self, request)
+
+        if self.type is None:
+            self.type, self.encoding = getTypeAndEncoding(self.basename(),
+                    self.contentTypes, self.contentEncodings, self.defaultType)
+
+        variant = File(available[encoding])
+        variant.type = self.type
+        variant.encoding = encoding
+        return variant.render_GET(request)
+
+    render_HEAD = render_GET
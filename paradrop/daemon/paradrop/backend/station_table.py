@@ -0,0 +1,257 @@
+"""
+Keep a table of the wireless stations connected to chute access points.
+
+The station endpoints used to run "iw station dump" and parse its output on
+every request, and the portal polls them every few seconds for each network.
+Instead, a single timer walks the station list of every chute access point
+through the hostapd control interface (STA-FIRST / STA-NEXT) and stores the
+parsed statistics in a dictionary keyed by (interface, MAC address), which
+the endpoints read directly.
+"""
+
+import os
+import time
+
+from twisted.internet import defer, reactor
+from twisted.internet.task import LoopingCall
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.core.chute.chute_storage import ChuteStorage
+
+from . import hostapd_control
+
+
+def parse_rate(value):
+    """
+    Convert a hostapd rate (units of 100 kbps, e.g. "650 mcs 7") to Mbit/s.
+    """
+    return int(value.split()[0]) / 10.0
+
+
+def parse_flags(value):
+    """
+    Convert hostapd flags (e.g. "[AUTH][ASSOC][AUTHORIZED]") to a list.
+    """
+    return [flag for flag in value.strip("[]").split("][") if flag]
+
+
+# Map hostapd field name to the name we report and a parsing function.  Names
+# follow the output of "iw station dump", which earlier versions returned.
+STATION_FIELDS = {
+    'aid': ('aid', int),
+    'connected_time': ('connected_time', int),
+    'flags': ('flags', parse_flags),
+    'inactive_msec': ('inactive_time', int),
+    'rx_bytes': ('rx_bytes', int),
+    'rx_packets': ('rx_packets', int),
+    'rx_rate_info': ('rx_bitrate', parse_rate),
+    'signal': ('signal', int),
+    'tx_bytes': ('tx_bytes', int),
+    'tx_packets': ('tx_packets', int),
+    'tx_rate_info': ('tx_bitrate', parse_rate),
+    'tx_retry_count': ('tx_retries', int),
+    'tx_retry_failed': ('tx_failed', int)
+}
+
+
+def parse_station(text):
+    """
+    Parse the reply to a STA-FIRST or STA-NEXT command.
+
+    The first line is the MAC address of the station, and the remaining lines
+    are key=value pairs.  Returns None if the reply does not describe a
+    station, which is the case after the last station.
+    """
+    lines = text.strip().splitlines()
+    if len(lines) == 0 or "=" in lines[0] or lines[0].startswith("FAIL"):
+        return None
+
+    station = {
+        'mac_addr': lines[0].strip().lower()
+    }
+
+    for line in lines[1:]:
+        key, sep, value = line.partition("=")
+        if not sep:
+            continue
+
+        name, parse = STATION_FIELDS.get(key, (key, None))
+        if parse is None:
+            station[name] = value
+            continue
+
+        try:
+            station[name] = parse(value)
+        except (ValueError, IndexError):
+            station[name] = value
+
+    flags = station.get('flags', [])
+    if isinstance(flags, list):
+        station['authenticated'] = "AUTH" in flags
+        station['associated'] = "ASSOC" in flags
+        station['authorized'] = "AUTHORIZED" in flags
+
+    return station
+
+
+def with_timeout(deferred, seconds):
+    """
+    Fail a Deferred if it does not fire within the given time.
+    """
+    timer = reactor.callLater(seconds, deferred.cancel)
+
+    def cancel_timer(result):
+        if timer.active():
+            timer.cancel()
+        return result
+
+    return deferred.addBoth(cancel_timer)
+
+
+def get_access_points():
+    """
+    List the host interfaces of all chute access points.
+    """
+    interfaces = []
+    for chute in ChuteStorage().getChuteList():
+        for iface in chute.getCache('networkInterfaces') or []:
+            if not iface.get('type', '').startswith('wifi'):
+                continue
+            if iface.get('mode', 'ap') != 'ap':
+                continue
+            interfaces.append(iface['externalIntf'])
+    return interfaces
+
+
+class StationTable(object):
+    """
+    Periodically refresh the statistics of connected stations.
+
+    The table is stored in a class variable so that the HTTP API can read it
+    without a reference to the running service.
+    """
+    stations = dict()
+
+    # Map interface name -> time of the last successful refresh.
+    updated = dict()
+
+    # Interfaces with more stations than STATION_TABLE_MAX_STATIONS, whose
+    # entries are incomplete.
+    truncated = set()
+
+    def __init__(self):
+        self.looping_call = None
+
+        # Map interface name -> control connection, kept open between
+        # refreshes.
+        self.clients = dict()
+
+    def start(self):
+        if settings.STATION_TABLE_INTERVAL > 0:
+            self.looping_call = LoopingCall(self.run)
+            self.looping_call.start(settings.STATION_TABLE_INTERVAL)
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+        for ifname in list(self.clients.keys()):
+            self.close_client(ifname)
+
+    def get_client(self, ifname):
+        client = self.clients.get(ifname, None)
+        if client is None or client.closed:
+            address = os.path.join(settings.PDCONFD_WRITE_DIR, "hostapd", ifname)
+            client = hostapd_control.connect(address)
+            self.clients[ifname] = client
+        return client
+
+    def close_client(self, ifname):
+        client = self.clients.pop(ifname, None)
+        if client is not None:
+            client.close()
+
+    @defer.inlineCallbacks
+    def run(self):
+        interfaces = get_access_points()
+        for ifname in interfaces:
+            try:
+                yield self.refresh_interface(ifname)
+            except Exception as error:
+                # Start over with a new connection next time.
+                self.close_client(ifname)
+                out.warn("Error reading stations of {}: {}\n".format(ifname, error))
+
+        # Drop the entries of interfaces that no longer exist.
+        for ifname in list(StationTable.updated.keys()):
+            if ifname not in interfaces:
+                StationTable.replace_interface(ifname, [])
+                StationTable.truncated.discard(ifname)
+                del StationTable.updated[ifname]
+        for ifname in list(self.clients.keys()):
+            if ifname not in interfaces:
+                self.close_client(ifname)
+
+    @defer.inlineCallbacks
+    def refresh_interface(self, ifname):
+        client = self.get_client(ifname)
+
+        stations = []
+        truncated = False
+        command = "STA-FIRST"
+        while True:
+            d = client.request(command)
+            reply = yield with_timeout(d, settings.STATION_TABLE_TIMEOUT)
+
+            station = parse_station(reply)
+            if station is None:
+                break
+
+            if len(stations) >= settings.STATION_TABLE_MAX_STATIONS:
+                truncated = True
+                break
+
+            stations.append(station)
+            command = "STA-NEXT {}".format(station['mac_addr'])
+
+        if truncated and ifname not in StationTable.truncated:
+            out.warn("Station table for {} is limited to {} stations\n".format(
+                ifname, settings.STATION_TABLE_MAX_STATIONS))
+            StationTable.truncated.add(ifname)
+        elif not truncated:
+            StationTable.truncated.discard(ifname)
+
+        StationTable.replace_interface(ifname, stations)
+        StationTable.updated[ifname] = time.time()
+
+    @classmethod
+    def replace_interface(cls, ifname, stations):
+        """
+        Replace all entries for an interface.
+        """
+        for key in list(cls.stations.keys()):
+            if key[0] == ifname:
+                del cls.stations[key]
+
+        for station in stations:
+            cls.stations[(ifname, station['mac_addr'])] = station
+
+    @classmethod
+    def get_stations(cls, ifname):
+        """
+        Get the stations connected to an interface, sorted by MAC address.
+        """
+        keys = sorted(key for key in cls.stations.keys() if key[0] == ifname)
+        return [cls.stations[key] for key in keys]
+
+    @classmethod
+    def get_station(cls, ifname, mac):
+        """
+        Get a station or None.
+        """
+        return cls.stations.get((ifname, mac.lower()), None)
+
+    @classmethod
+    def remove_station(cls, ifname, mac):
+        cls.stations.pop((ifname, mac.lower()), None)
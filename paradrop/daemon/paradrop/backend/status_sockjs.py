@@ -1,9 +1,123 @@
+"""
+Stream system status (CPU load, memory, disks, network) to websocket clients.
+
+Clients can poll by sending "refresh", which replies with the full status,
+or send "subscribe" to receive status frames pushed by a single sampler that
+is shared by all connections.  The sampler only runs while at least one
+client is subscribed.  The first pushed frame contains the full status and
+later frames contain only the changes as a JSON merge patch:
+
+    {"seq": 1, "time": 1514329200.0, "status": {...}}
+    {"seq": 2, "time": 1514329202.0, "delta": {"cpu_load": [12, 3], ...}}
+
+A client may ask for a slower rate with "subscribe <seconds>".  Pushing is
+opt-in because the portal expects every message to be a full status.
+"""
+
+import copy
 import json
+import time
 
 from autobahn.twisted.websocket import WebSocketServerProtocol
 from autobahn.twisted.websocket import WebSocketServerFactory
+from twisted.internet.task import LoopingCall
 
 from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.lib.utils import datastruct
+
+
+class StatusPublisher(object):
+    """
+    Sample system status periodically and push it to subscribed clients.
+    """
+    # Tolerance in seconds for timer jitter when checking client rate limits.
+    SLACK = 0.1
+
+    def __init__(self, system_status):
+        self.system_status = system_status
+        self.subscribers = []
+        self.looping_call = None
+
+        # Recent samples by sequence number, kept so that a client that was
+        # skipped by its rate limit can receive the changes since the last
+        # sample it saw.
+        self.samples = {}
+        self.seq = 0
+
+    def subscribe(self, client):
+        if client not in self.subscribers:
+            self.subscribers.append(client)
+
+        if self.looping_call is None:
+            self.looping_call = LoopingCall(self.publish)
+            self.looping_call.start(settings.STATUS_PUSH_INTERVAL)
+        elif self.seq in self.samples:
+            # Send the latest sample now rather than at the next interval.
+            self.send_frame(client, time.time(), {})
+
+    def unsubscribe(self, client):
+        if client in self.subscribers:
+            self.subscribers.remove(client)
+
+        if len(self.subscribers) == 0 and self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+            self.samples = {}
+
+    def publish(self):
+        status = self.system_status.getStatus()
+
+        # SystemStatus updates its dictionaries in place, so keep a copy to
+        # compute the changes against later.
+        self.seq += 1
+        self.samples[self.seq] = {
+            'time': self.system_status.timestamp,
+            'status': copy.deepcopy(status)
+        }
+
+        now = time.time()
+        messages = {}
+        for client in list(self.subscribers):
+            self.send_frame(client, now, messages)
+
+        # Drop samples that no client needs anymore.
+        needed = set(client.last_seq for client in self.subscribers)
+        needed.add(self.seq)
+        for seq in list(self.samples.keys()):
+            if seq not in needed:
+                del self.samples[seq]
+
+    def send_frame(self, client, now, messages):
+        """
+        Send the latest sample to a client if its rate limit allows.
+
+        messages caches the encoded frames by the sequence number of the last
+        sample each client received, so that clients in the same state share
+        the work.
+        """
+        if client.last_seq == self.seq:
+            return
+        if now - client.last_push < client.interval - self.SLACK:
+            return
+
+        base = client.last_seq
+        if base not in messages:
+            latest = self.samples[self.seq]
+            frame = {
+                'seq': self.seq,
+                'time': latest['time']
+            }
+            if base in self.samples:
+                frame['delta'] = datastruct.makeMergePatch(
+                        self.samples[base]['status'], latest['status'])
+            else:
+                frame['status'] = latest['status']
+            messages[base] = json.dumps(frame).encode('utf-8')
+
+        client.sendMessage(messages[base])
+        client.last_seq = self.seq
+        client.last_push = now
 
 
 class StatusSockJSProtocol(WebSocketServerProtocol):
@@ -11,22 +125,60 @@ class StatusSockJSProtocol(WebSocketServerProtocol):
         WebSocketServerProtocol.__init__(self)
         self.factory = factory
 
+        # State used by the publisher.
+        self.interval = settings.STATUS_PUSH_INTERVAL
+        self.last_seq = None
+        self.last_push = 0
+
+        self.last_refresh = 0
+
     def onOpen(self):
         out.info('sockjs /status connected')
 
     def onMessage(self, data, isBinary):
-        if (data == 'refresh'):
-            status = self.factory.system_status.getStatus()
-            self.sendMessage(json.dumps(status))
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        parts = data.split()
+        if len(parts) == 0:
+            return
+
+        if parts[0] == 'refresh':
+            self.refresh()
+        elif parts[0] == 'subscribe':
+            self.interval = settings.STATUS_PUSH_INTERVAL
+            if len(parts) > 1:
+                try:
+                    self.interval = max(self.interval, float(parts[1]))
+                except ValueError:
+                    pass
+            self.factory.publisher.subscribe(self)
+        elif parts[0] == 'unsubscribe':
+            self.factory.publisher.unsubscribe(self)
+            self.last_seq = None
+
+    def refresh(self):
+        # Clients that poll too quickly get one reply per minimum interval.
+        now = time.time()
+        if now - self.last_refresh < settings.STATUS_REFRESH_MIN_INTERVAL:
+            return
+        self.last_refresh = now
+
+        status = self.factory.system_status.getStatus()
+        self.sendMessage(json.dumps(status).encode('utf-8'))
 
     def onClose(self, wasClean, code, reason):
         out.info('sockjs /status disconnected')
+        self.factory.publisher.unsubscribe(self)
 
 
 class StatusSockJSFactory(WebSocketServerFactory):
-    def __init__(self, system_status):
+    def __init__(self, system_status, publisher=None):
         WebSocketServerFactory.__init__(self)
         self.system_status = system_status
 
+        if publisher is None:
+            publisher = StatusPublisher(system_status)
+        self.publisher = publisher
+
     def buildProtocol(self, addr):
         return StatusSockJSProtocol(self)
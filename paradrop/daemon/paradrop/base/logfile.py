@@ -0,0 +1,514 @@
+'''
+Log file with buffered writes, rotation by date and size, compression of
+rotated segments and a limit on the total size of the log directory.
+
+The current segment is always named after the log (e.g. "log").  When the
+date changes or the segment grows beyond maxFileSize, it is renamed to
+"<name>.<YYYY_MM_DD>.<n>", where the date is the day the segment was
+written and n counts the segments of that day, and compressed to
+"<name>.<YYYY_MM_DD>.<n>.gz" by a background thread.  After each
+compression, the oldest rotated segments are deleted until the rotated
+segments use no more than maxTotalSize bytes.
+
+Each segment has a sidecar index, "<segment>.idx" without the ".gz"
+suffix, holding the first and last timestamp in the segment and the
+timestamps of records at sparse byte offsets (about every indexInterval
+bytes of uncompressed data).  readLogs uses the indexes to skip segments
+that are too old and to seek close to the first wanted record, so that
+reading recent logs does not parse the whole history.
+'''
+
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+
+# Defaults for the options of LogFile, used unless overridden by settings.
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_FILE_SIZE = 1024 * 1024
+DEFAULT_MAX_TOTAL_SIZE = 16 * 1024 * 1024
+DEFAULT_INDEX_INTERVAL = 64 * 1024
+
+DATE_FORMAT = '%Y_%m_%d'
+COMPRESSED_SUFFIX = '.gz'
+INDEX_SUFFIX = '.idx'
+
+
+def parseSegmentName(name, filename):
+    '''
+    Parse the name of a rotated segment and return a (date, n, compressed)
+    tuple, or None if the file is not a rotated segment of the log.
+
+    Segments written by the old daily log file ("<name>.<date>") have n=0.
+    '''
+    if not filename.startswith(name + '.'):
+        return None
+
+    parts = filename[len(name) + 1:].split('.')
+
+    compressed = (parts[-1] == COMPRESSED_SUFFIX[1:])
+    if compressed:
+        parts = parts[:-1]
+
+    if len(parts) == 1:
+        parts.append('0')
+    if len(parts) != 2:
+        return None
+
+    try:
+        time.strptime(parts[0], DATE_FORMAT)
+        n = int(parts[1])
+    except ValueError:
+        return None
+
+    return parts[0], n, compressed
+
+
+def listSegments(directory, name):
+    '''
+    List rotated segments of a log, oldest first, as (filename, date, n,
+    compressed) tuples.
+    '''
+    segments = []
+    for filename in os.listdir(directory):
+        parsed = parseSegmentName(name, filename)
+        if parsed is not None:
+            segments.append((filename, ) + parsed)
+
+    # Dates sort correctly as strings because of the fixed width format.
+    segments.sort(key=lambda s: (s[1], s[2]))
+    return segments
+
+
+def indexPath(directory, filename):
+    '''
+    Get the path of the index of a segment.
+    '''
+    if filename.endswith(COMPRESSED_SUFFIX):
+        filename = filename[:-len(COMPRESSED_SUFFIX)]
+    return os.path.join(directory, filename + INDEX_SUFFIX)
+
+
+def openSegment(path):
+    if path.endswith(COMPRESSED_SUFFIX):
+        return gzip.open(path, 'rb')
+    else:
+        return open(path, 'rb')
+
+
+class SegmentIndex(object):
+    '''
+    Timestamp range and sparse offsets of the records in one segment.
+
+    Records are indexed in the order they were written, which is close to,
+    but not strictly, timestamp order, so first and last are the smallest
+    and largest timestamps rather than those of the first and last records.
+    '''
+
+    def __init__(self, interval=DEFAULT_INDEX_INTERVAL):
+        self.interval = interval
+        self.first = None
+        self.last = None
+        self.size = 0
+        self.offsets = []
+
+    def add(self, timestamp, length):
+        '''
+        Add a record of the given length in bytes at the end of the segment.
+        '''
+        if timestamp is not None:
+            if self.first is None or timestamp < self.first:
+                self.first = timestamp
+            if self.last is None or timestamp > self.last:
+                self.last = timestamp
+
+            if not self.offsets or self.size - self.offsets[-1][1] >= self.interval:
+                self.offsets.append([timestamp, self.size])
+
+        self.size += length
+
+    def seekOffset(self, start):
+        '''
+        Get the offset from which to read to find all records at or after
+        the start time.
+        '''
+        offset = 0
+        for timestamp, position in self.offsets:
+            if timestamp >= start:
+                break
+            offset = position
+        return offset
+
+    def copy(self):
+        other = SegmentIndex(self.interval)
+        other.first = self.first
+        other.last = self.last
+        other.size = self.size
+        other.offsets = [list(x) for x in self.offsets]
+        return other
+
+    def save(self, path):
+        data = {
+            'first': self.first,
+            'last': self.last,
+            'size': self.size,
+            'offsets': self.offsets
+        }
+
+        temp = path + '.tmp'
+        with open(temp, 'w') as output:
+            json.dump(data, output)
+        os.rename(temp, path)
+
+    @classmethod
+    def load(cls, path, interval=DEFAULT_INDEX_INTERVAL):
+        '''
+        Load an index from a file, or return None if it is missing or
+        invalid.
+        '''
+        try:
+            with open(path, 'r') as source:
+                data = json.load(source)
+            index = cls(interval)
+            index.first = data['first']
+            index.last = data['last']
+            index.size = data['size']
+            index.offsets = data['offsets']
+            return index
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+
+    @classmethod
+    def build(cls, path, interval=DEFAULT_INDEX_INTERVAL):
+        '''
+        Build the index of a segment by reading all of its records.
+        '''
+        index = cls(interval)
+        with openSegment(path) as source:
+            for line in source:
+                index.add(parseTimestamp(line), len(line))
+        return index
+
+
+def parseTimestamp(line):
+    try:
+        return json.loads(line.decode('utf-8'))['timestamp']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def loadIndex(directory, filename, interval=DEFAULT_INDEX_INTERVAL):
+    '''
+    Load the index of a rotated segment, building and saving it if needed.
+    '''
+    path = indexPath(directory, filename)
+    index = SegmentIndex.load(path, interval)
+    if index is None:
+        index = SegmentIndex.build(os.path.join(directory, filename), interval)
+        try:
+            index.save(path)
+        except (IOError, OSError):
+            pass
+    return index
+
+
+def readSegment(path, index, start):
+    '''
+    Yield the records of a segment with timestamps at or after start.
+    '''
+    with openSegment(path) as source:
+        source.seek(index.seekOffset(start))
+        for line in source:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # Skip a line that is being written or was cut short.
+                continue
+            if record.get('timestamp', 0) >= start:
+                yield record
+
+
+def readLogs(directory, name, start, currentIndex=None, purge=False):
+    '''
+    Yield the records of a log with timestamps at or after start, oldest
+    segment first.
+
+    currentIndex may be passed for the current segment, which is indexed by
+    the writer, to avoid reading it to build an index.  If purge is set,
+    rotated segments are deleted after they have been read.
+    '''
+    for segment in listSegments(directory, name):
+        filename = segment[0]
+        path = os.path.join(directory, filename)
+
+        # The segment may have been compressed since the directory was listed.
+        if not segment[3] and not os.path.exists(path):
+            filename += COMPRESSED_SUFFIX
+            path += COMPRESSED_SUFFIX
+
+        try:
+            index = loadIndex(directory, filename)
+            if index.last is not None and index.last >= start:
+                for record in readSegment(path, index, start):
+                    yield record
+        except (IOError, OSError):
+            # The segment was compressed or removed in the background.
+            continue
+
+        if purge:
+            for x in [path, indexPath(directory, filename)]:
+                try:
+                    os.remove(x)
+                except OSError:
+                    pass
+
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        return
+
+    index = currentIndex
+    if index is None:
+        index = SegmentIndex.build(path)
+    if index.last is not None and index.last >= start:
+        for record in readSegment(path, index, start):
+            yield record
+
+
+class Compressor(threading.Thread):
+    '''
+    Compress rotated segments and enforce the retention limit, off the
+    writing thread so that logging does not stall during compression.
+    '''
+
+    def __init__(self, directory, name, maxTotalSize):
+        threading.Thread.__init__(self)
+        self.directory = directory
+        self.logName = name
+        self.maxTotalSize = maxTotalSize
+        self.queue = queue.Queue()
+
+        self.setDaemon(True)
+
+    def run(self):
+        while True:
+            filename = self.queue.get(block=True)
+
+            try:
+                if filename is not None:
+                    self.compress(filename)
+                self.enforceRetention()
+            except Exception:
+                pass
+
+            self.queue.task_done()
+
+    def compress(self, filename):
+        path = os.path.join(self.directory, filename)
+        target = path + COMPRESSED_SUFFIX
+        temp = target + '.tmp'
+
+        with open(path, 'rb') as source:
+            with gzip.open(temp, 'wb') as dest:
+                shutil.copyfileobj(source, dest)
+
+        # Rename before removing the source, so that an interruption leaves
+        # at worst both copies of the segment.
+        os.rename(temp, target)
+        os.remove(path)
+
+    def enforceRetention(self):
+        '''
+        Delete the oldest rotated segments until the total size is within
+        the limit.
+        '''
+        segments = []
+        total = 0
+        for segment in listSegments(self.directory, self.logName):
+            path = os.path.join(self.directory, segment[0])
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            segments.append((path, size))
+            total += size
+
+        for path, size in segments:
+            if total <= self.maxTotalSize:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+            try:
+                os.remove(indexPath(self.directory, os.path.basename(path)))
+            except OSError:
+                pass
+
+
+class LogFile(object):
+    '''
+    Buffered, rotating log file.
+
+    Records passed to write are buffered in memory and written with one call
+    when the buffer holds bufferSize bytes, or by flushIfDue once
+    flushInterval seconds have passed since the oldest of them was
+    buffered.
+    '''
+
+    def __init__(self, name, directory, bufferSize=DEFAULT_BUFFER_SIZE,
+            flushInterval=DEFAULT_FLUSH_INTERVAL,
+            maxFileSize=DEFAULT_MAX_FILE_SIZE,
+            maxTotalSize=DEFAULT_MAX_TOTAL_SIZE,
+            indexInterval=DEFAULT_INDEX_INTERVAL):
+        self.name = name
+        self.directory = directory
+        self.path = os.path.join(directory, name)
+        self.indexPath = indexPath(directory, name)
+
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.maxFileSize = maxFileSize
+        self.indexInterval = indexInterval
+
+        self.buffer = []
+        self.buffered = 0
+        self.bufferedSince = None
+
+        # The writer thread flushes on its own schedule, while close is
+        # called from the thread that ends logging.
+        self.lock = threading.Lock()
+
+        self.compressor = Compressor(directory, name, maxTotalSize)
+        self.compressor.start()
+
+        # Finish compressing segments that were rotated before a restart.
+        for segment in listSegments(directory, name):
+            if not segment[3]:
+                self.compressor.queue.put(segment[0])
+
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, 'ab')
+        self.size = self.file.tell()
+
+        # The index of the current segment is kept in memory and saved when
+        # the segment is rotated or closed.  Rebuild it if the segment was
+        # written to after the index was saved.
+        self.index = SegmentIndex.load(self.indexPath, self.indexInterval)
+        if self.index is None or self.index.size != self.size:
+            self.index = SegmentIndex.build(self.path, self.indexInterval)
+
+        if self.size > 0:
+            self.date = time.strftime(DATE_FORMAT,
+                    time.localtime(os.path.getmtime(self.path)))
+        else:
+            self.date = time.strftime(DATE_FORMAT)
+
+    def write(self, records):
+        '''
+        Buffer a list of (timestamp, line) records, where each line is bytes
+        including the line terminator.
+        '''
+        with self.lock:
+            if not self.buffer:
+                self.bufferedSince = time.time()
+
+            for record in records:
+                self.buffer.append(record)
+                self.buffered += len(record[1])
+
+            if self.buffered >= self.bufferSize:
+                self.writeBuffer()
+
+    def flushIfDue(self):
+        '''
+        Flush the buffer if it has been held for flushInterval seconds.
+
+        Returns the number of seconds until the next flush is due, or None if
+        the buffer is empty.
+        '''
+        with self.lock:
+            if not self.buffer:
+                return None
+
+            remaining = self.bufferedSince + self.flushInterval - time.time()
+            if remaining <= 0:
+                self.writeBuffer()
+                return None
+
+            return remaining
+
+    def flush(self):
+        with self.lock:
+            self.writeBuffer()
+
+    def writeBuffer(self):
+        if self.shouldRotate():
+            self.rotate()
+
+        if self.buffer:
+            for timestamp, line in self.buffer:
+                self.index.add(timestamp, len(line))
+
+            data = b''.join(line for timestamp, line in self.buffer)
+            self.buffer = []
+            self.buffered = 0
+
+            self.file.write(data)
+            self.size += len(data)
+
+        self.file.flush()
+
+    def getIndex(self):
+        '''
+        Flush the buffer and return a copy of the index of the current
+        segment, for reading the log from another thread.
+        '''
+        with self.lock:
+            self.writeBuffer()
+            return self.index.copy()
+
+    def shouldRotate(self):
+        if self.size == 0:
+            return False
+        if self.size + self.buffered > self.maxFileSize:
+            return True
+        return time.strftime(DATE_FORMAT) != self.date
+
+    def rotate(self):
+        self.file.close()
+
+        n = 1
+        for segment in listSegments(self.directory, self.name):
+            if segment[1] == self.date:
+                n = max(n, segment[2] + 1)
+
+        filename = "{}.{}.{}".format(self.name, self.date, n)
+        self.index.save(indexPath(self.directory, filename))
+        os.rename(self.path, os.path.join(self.directory, filename))
+        self.compressor.queue.put(filename)
+
+        try:
+            os.remove(self.indexPath)
+        except OSError:
+            pass
+
+        self.open()
+
+    def close(self):
+        '''
+        Write out buffered lines and close the file.  Compression of rotated
+        segments continues in the background.
+        '''
+        with self.lock:
+            self.writeBuffer()
+            self.file.close()
+            self.index.save(self.indexPath)
@@ -56,7 +56,17 @@ class NexusBase(object):
         # initialize output. If filepath is set, logs to file.
         # If stealStdio is set intercepts all stderr and stdout and interprets it internally
         # If printToConsole is set (defaults True) all final output is rendered to stdout
-        output.out.startLogging(filePath=settings.LOG_DIR, stealStdio=stealStdio, printToConsole=printToConsole)
+        # LOG_LEVEL and LOG_MODULE_LEVELS drop messages before any work is done on them
+        output.out.startLogging(filePath=settings.LOG_DIR, stealStdio=stealStdio, printToConsole=printToConsole,
+                                level=settings.LOG_LEVEL, moduleLevels=settings.LOG_MODULE_LEVELS,
+                                rateLimits=settings.LOG_RATE_LIMITS,
+                                fileOptions={
+                                    'batchSize': settings.LOG_WRITE_BATCH_SIZE,
+                                    'bufferSize': settings.LOG_BUFFER_SIZE,
+                                    'flushInterval': settings.LOG_FLUSH_INTERVAL,
+                                    'maxFileSize': settings.LOG_MAX_FILE_SIZE,
+                                    'maxTotalSize': settings.LOG_MAX_TOTAL_SIZE
+                                })
 
         # register onStop for the shutdown call
         reactor.addSystemEventTrigger('before', 'shutdown', self.onStop)
@@ -12,7 +12,6 @@ keep this file in
 
 import colorama
 import json
-import os
 import queue
 import sys
 import threading
@@ -23,18 +22,23 @@ import six
 import smokesignal
 
 from enum import Enum
-from twisted.python.logfile import DailyLogFile
 from twisted.python import log
 
-from . import pdutils
+from . import logfile, pdutils, ratelimit
 
 
 # colorama package does colors but doesn't do style, so keeping this for now
 BOLD = '\033[1m'
 LOG_NAME = 'log'
 
+# Maximum number of messages taken from the queue at once by the file writer.
+DEFAULT_BATCH_SIZE = 256
+
 Level = Enum('Level', 'HEADER, VERBOSE, INFO, PERF, WARN, ERR, SECURITY, FATAL, USAGE')
 
+# Name of the smokesignal event that carries every log dict.
+LOG_SIGNAL = 'logs'
+
 # Represents formatting information for the specified log type
 LOG_TYPES = {
     Level.HEADER: {'name': Level.HEADER.value, 'glyph': '==', 'color': colorama.Fore.BLUE},
@@ -76,6 +80,39 @@ def silentLogPrefix(stepsUp):
     return package, module, line
 
 
+def levelValue(level):
+    '''
+    Convert a level given as a Level, a name such as "info", or a number to
+    the number used for threshold comparisons.
+    '''
+    if isinstance(level, Level):
+        return level.value
+    elif isinstance(level, six.string_types):
+        return Level[level.upper()].value
+    else:
+        return int(level)
+
+
+def parseModuleLevels(spec):
+    '''
+    Parse per-module thresholds from a string such as
+    "paradrop.core.plan:INFO,paradrop.backend:WARN" and return a dict that
+    maps module names to level values.
+    '''
+    levels = {}
+    if not spec:
+        return levels
+
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, level = item.rsplit(':', 1)
+        levels[name.strip()] = levelValue(level.strip())
+
+    return levels
+
+
 def parseLogPrefix(tb):
     '''
     Takes a traceback returned by 'extract_tb' and returns the package, module,
@@ -96,33 +133,57 @@ class PrintLogThread(threading.Thread):
     Receives information when its placed on the passed queue.
     Called from one location: Output.handlePrint.
 
+    Messages are taken from the queue in batches of up to batchSize and
+    handed to a buffered LogFile (see logfile.py), which writes them out when
+    its buffer fills or its flush interval expires, so that a burst of
+    messages costs a few writes rather than one per message.
+
     Does not close the file: this happens in Output.endLogging. This
     simplifies the operation of this class, since it only has to concern
     itself with the queue.
 
-    The path must exist before DailyLog runs for the first time.
+    The path must exist before the log file is opened for the first time.
     '''
 
-    def __init__(self, path, queue, name):
+    def __init__(self, path, queue, name, batchSize=DEFAULT_BATCH_SIZE, **fileOptions):
         threading.Thread.__init__(self)
         self.queue = queue
-        self.writer = DailyLogFile(name, path)
+        self.batchSize = batchSize
+        self.writer = logfile.LogFile(name, path, **fileOptions)
 
         # Don't want this to float around if the rest of the system goes down
         self.setDaemon(True)
 
     def run(self):
         while True:
-            result = self.queue.get(block=True)
+            # Wake up in time to flush messages that are waiting in the buffer.
+            try:
+                result = self.queue.get(block=True, timeout=self.writer.flushIfDue())
+            except queue.Empty:
+                continue
+
+            batch = [result]
+            while len(batch) < self.batchSize:
+                try:
+                    batch.append(self.queue.get(block=False))
+                except queue.Empty:
+                    break
+
+            records = []
+            for result in batch:
+                try:
+                    line = json.dumps(result).encode('utf-8') + b'\n'
+                    records.append((result.get('timestamp', None), line))
+                except:
+                    pass
 
             try:
-                writable = json.dumps(result)
-                self.writer.write(writable + '\n')
-                self.writer.flush()
+                self.writer.write(records)
             except:
                 pass
 
-            self.queue.task_done()
+            for result in batch:
+                self.queue.task_done()
 
 
 class OutputRedirect(object):
@@ -209,22 +270,30 @@ class BaseOutput(object):
 
         self.type = logType
 
-    def __call__(self, args, logPrefixLevel=3, **extra):
+    def __call__(self, args, *formatArgs, **extra):
         '''
         Called as an attribute on out. This method takes the passed params and builds a log dict,
         returning it.
 
+        Extra positional arguments are substituted into the message with the % operator,
+        which only happens if the message passes the level thresholds, e.g.
+            out.verbose('Calling %s\n', func)
+
         Subclasses can customize args to include whatever they'd like, adding content
         under the key 'extras.' The remaining keys should stay in place.
         '''
         package, module, line = silentLogPrefix(3)
 
+        message = str(args)
+        if formatArgs:
+            message = message % formatArgs
+
         # String newlines
-        if args[-1] == '\n':
-            args = args.strip()
+        if message[-1:] == '\n':
+            message = message.strip()
 
         ret = { \
-            'message': str(args), \
+            'message': message, \
             'type': self.type['name'], \
             'extra': extra, \
             'package': package, \
@@ -421,6 +490,18 @@ class Output(object):
         self.stealStdio(False)
         self.logToConsole(True)
 
+        # Level thresholds are checked by the output streams before any work is done.
+        # minLevel is the lowest threshold of any module, so that most calls can be
+        # rejected with a single comparison.
+        self.__dict__['level'] = Level.HEADER.value
+        self.__dict__['moduleLevels'] = {}
+        self.__dict__['moduleLevelCache'] = {}
+        self.__dict__['minLevel'] = Level.HEADER.value
+
+        # Repeats of the same message beyond the limit of its level are counted
+        # instead of logged (see ratelimit.py).
+        self.__dict__['rateLimiter'] = ratelimit.RateLimiter()
+
         # Setattr wraps the output objects in a
         # decorator that allows this class to intercept their output, This dict holds the
         # original objects.
@@ -437,7 +518,37 @@ class Output(object):
         pass
 
     def __setattr__(self, name, val):
+        value = val.type['name']
+        attrs = self.__dict__
+
         def inner(*args, **kwargs):
+            # Fast path: reject messages below the thresholds before building the
+            # log dict or inspecting the stack.
+            if value < attrs['minLevel']:
+                return None
+            if attrs['moduleLevels'] and \
+                    value < self.moduleLevel(sys._getframe(1).f_globals.get('__name__')):
+                return None
+
+            # Nothing would be done with the message if no sink wants it.
+            if not (attrs['printLogs'] or attrs.get('queue') is not None or
+                    smokesignal.receivers.get(LOG_SIGNAL)):
+                return None
+
+            limiter = attrs['rateLimiter']
+            if limiter.limits:
+                now = time.time()
+                allowed = True
+                if value in limiter.limits and args:
+                    frame = sys._getframe(1)
+                    template = ratelimit.messageTemplate(args[0], formatted=(len(args) == 1))
+                    key = (frame.f_globals.get('__name__'), frame.f_lineno, template)
+                    allowed = limiter.allow(key, value, now)
+
+                self.logRepeats(limiter.expired(now))
+                if not allowed:
+                    return None
+
             result = val(*args, **kwargs)
             self.handlePrint(result)
             return result
@@ -452,7 +563,8 @@ class Output(object):
     def __repr__(self):
         return "REPR"
 
-    def startLogging(self, filePath=None, stealStdio=False, printToConsole=True):
+    def startLogging(self, filePath=None, stealStdio=False, printToConsole=True,
+            level=None, moduleLevels=None, fileOptions=None, rateLimits=None):
         '''
         Begin logging. The output class is ready to go out of the box, but in order
         to prevent mere imports from stealing stdio or console logging to vanish
@@ -467,15 +579,40 @@ class Output(object):
         :param printToConsole: output the results of all logging to the console. This
             is primarily a performance consideration when running in production
         :type printToConsole: bool.
+        :param level: if provided, drop messages below this level (see setLevel)
+        :type level: str.
+        :param moduleLevels: if provided, thresholds for individual modules, either
+            a dict or a string like "paradrop.core.plan:INFO,paradrop.backend:WARN"
+        :type moduleLevels: dict or str.
+        :param fileOptions: buffering, rotation and retention options for the log
+            file (see PrintLogThread and logfile.LogFile)
+        :type fileOptions: dict.
+        :param rateLimits: limits on repeated messages by level, e.g.
+            "INFO:20/60,WARN:20/60" (see setRateLimit)
+        :type rateLimits: str.
 
         '''
 
+        if level is not None:
+            self.setLevel(level)
+
+        if moduleLevels:
+            if isinstance(moduleLevels, six.string_types):
+                moduleLevels = parseModuleLevels(moduleLevels)
+            for module, moduleLevel in six.iteritems(moduleLevels):
+                self.setLevel(moduleLevel, module=module)
+
+        if rateLimits:
+            for value, limit in six.iteritems(ratelimit.parseRateLimits(rateLimits, levelValue)):
+                self.setRateLimit(value, limit[0], limit[1])
+
         # Initialize printer thread
         self.__dict__['logpath'] = None
 
         if filePath is not None:
             self.__dict__['queue'] = queue.Queue()
-            self.__dict__['printer'] = PrintLogThread(filePath, self.queue, LOG_NAME)
+            self.__dict__['printer'] = PrintLogThread(filePath, self.queue, LOG_NAME,
+                                                      **(fileOptions or {}))
             self.__dict__['logpath'] = filePath
             self.printer.start()
 
@@ -520,15 +657,14 @@ class Output(object):
         if self.queue is not None:
             self.queue.put(logDict)
 
-        res = self.messageToString(logDict)
-
         # Write out the human-readable version to out if needed (but always print out
         # exceptions for testing purposes)
         if self.printLogs or logDict['type'] == 'ERR':
-            self.redirectOut.trueWrite(res)
+            self.redirectOut.trueWrite(self.messageToString(logDict))
 
         # Broadcast the log to interested parties
-        smokesignal.emit('logs', logDict)
+        if smokesignal.receivers.get(LOG_SIGNAL):
+            smokesignal.emit(LOG_SIGNAL, logDict)
 
     def messageToString(self, message):
         '''
@@ -544,22 +680,25 @@ class Output(object):
         outputObject = self.outputMappings[level.name.lower()]
         return outputObject.formatOutput(message)
 
-    def getLogsSince(self, target, purge=False):
+    def getLogsSince(self, target, purge=False, inclusive=False):
         '''
-        Reads all logs and returns their contents. The current log file is not touched.
+        Reads the logs written after the given time and yields them, oldest first.
         Removes old log files if 'purge' is set (though this is a topic for debate...)
 
         The server will be most interested in this call, but it needs to register for
         new logs first, else there's a good chance to see duplicates.
 
-        NOTE: don't open all log files, check to open only the ones that might be relevant.
-        This is certainly a bug and can cause memory issues.
+        Records are read lazily. The index of each log segment (see logfile.py) is used
+        to skip segments that are older than the target and to seek close to the first
+        matching record, so only the relevant part of the logs is parsed.
 
         :param target: seconds since the GMT epoch. Method returns logs that have timestamps later than this.
         :type target: float.
         :param purge: deletes the old log files (except today's) if set
         :type purge: bool.
-        :returns: a list of dictionaries containing log information. Not ordered.
+        :param inclusive: also return logs with timestamps equal to the target
+        :type inclusive: bool.
+        :returns: a generator of dictionaries containing log information.
         '''
 
         if not self.logpath:
@@ -568,32 +707,16 @@ class Output(object):
                      'Call startLogging with a directory first! ')
             return
 
-        ret = []
-
-        for f in os.listdir(self.logpath):
-            path = self.logpath + '/' + f
-
-            # the current log file is treated differently (no date, no delete)
-            if f != LOG_NAME:
-                t = time.strptime(f.split('.')[1], '%Y_%m_%d')
-
-                # dont load those with times earlier than target
-                if t >= target:
-                    with open(path, 'r') as x:
-                        ret += [json.loads(y) for y in x.readlines()]
+        # Buffered messages are written out so that they can be read back.
+        currentIndex = None
+        if self.printer is not None:
+            currentIndex = self.printer.writer.getIndex()
 
-                # delete all files except log once read
-                if purge:
-                    os.remove(path)
-
-            # current log file is always loaded
-            else:
-                with open(path, 'r') as f:
-                    ret += [json.loads(y) for y in f.readlines()]
-
-        ret = filter(lambda x: x['timestamp'] > target, ret)
-
-        return ret
+        records = logfile.readLogs(self.logpath, LOG_NAME, target,
+                                   currentIndex=currentIndex, purge=purge)
+        for record in records:
+            if inclusive or record.get('timestamp', 0) > target:
+                yield record
 
 
     ###############################################################################
@@ -615,6 +738,108 @@ class Output(object):
     def logToConsole(self, newStatus):
         self.__dict__['printLogs'] = newStatus
 
+    def setLevel(self, level, module=None):
+        '''
+        Drop messages below the given level, either for all modules or for the
+        given module and its submodules. A module threshold overrides the
+        global threshold in both directions.
+
+        :param level: a Level, a level name such as "info", or None to remove a
+            module threshold
+        :param module: dotted module name, e.g. "paradrop.core.plan"
+        :type module: str.
+        '''
+        if module is None:
+            self.__dict__['level'] = levelValue(level)
+        elif level is None:
+            self.moduleLevels.pop(module, None)
+        else:
+            self.moduleLevels[module] = levelValue(level)
+
+        self.moduleLevelCache.clear()
+        self.__dict__['minLevel'] = min([self.level] + list(self.moduleLevels.values()))
+
+    def setRateLimit(self, level, burst, window=60):
+        '''
+        Log at most burst messages with the same module, line and template in
+        each window of the given number of seconds, and a summary of the rest.
+
+        :param level: a Level or a level name such as "warn"
+        :param burst: number of messages to log per window, or None to remove
+            the limit
+        :type burst: int.
+        :param window: length of the window in seconds
+        :type window: float.
+        '''
+        self.rateLimiter.setLimit(levelValue(level), burst, window)
+
+    def getRateLimitStats(self):
+        '''
+        Return the rate limits by level name, the total number of suppressed
+        messages and the messages that are currently being suppressed.
+        '''
+        stats = self.rateLimiter.getStats()
+
+        limits = {}
+        for value, limit in six.iteritems(stats['limits']):
+            limits[Level(value).name] = {'burst': limit[0], 'window': limit[1]}
+        stats['limits'] = limits
+
+        for item in stats['suppressing']:
+            item['level'] = Level(item['level']).name
+
+        return stats
+
+    def logRepeats(self, entries):
+        '''
+        Log summaries of messages that were suppressed by the rate limiter.
+        '''
+        for entry in entries:
+            module, line, template = entry.key
+            parts = (module or 'unknown').split('.')
+
+            self.handlePrint({
+                'message': 'Message repeated {} times in the last {:g} seconds: {}'.format(
+                    entry.suppressed, entry.window, template.strip()),
+                'type': entry.level,
+                'extra': {'suppressed': entry.suppressed},
+                'package': parts[-2] if len(parts) > 1 else 'unknown',
+                'module': parts[-1],
+                'timestamp': time.time(),
+                'pdid': 'UNSET',
+                'line': line
+            })
+
+    def moduleLevel(self, module):
+        '''
+        Return the threshold that applies to a module, which is set by the most
+        specific matching entry in moduleLevels.
+        '''
+        cache = self.moduleLevelCache
+        if module in cache:
+            return cache[module]
+
+        level = self.level
+        name = module
+        while name:
+            if name in self.moduleLevels:
+                level = self.moduleLevels[name]
+                break
+            name = name.rpartition('.')[0]
+
+        cache[module] = level
+        return level
+
+    def isEnabledFor(self, level, module=None):
+        '''
+        Check whether messages at the given level would be logged, for example
+        to skip building an expensive message.
+        '''
+        value = levelValue(level)
+        if module is None or not self.moduleLevels:
+            return value >= self.level
+        return value >= self.moduleLevel(module)
+
 
 out = Output(
     header=BaseOutput(LOG_TYPES[Level.HEADER]),
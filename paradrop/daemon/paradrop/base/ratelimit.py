@@ -0,0 +1,177 @@
+'''
+Suppression of repeated log messages.
+
+Failure loops tend to log the same message over and over.  RateLimiter
+counts messages by (module, line, template), where the template is the
+message before formatting, or the message with numbers masked if it was
+formatted by the caller.  Within each window of a level's limit, the first
+burst messages with the same key are logged and the rest are counted.
+When the window ends, a summary such as "Message repeated 42 times in the
+last 60 seconds" is logged in their place.
+
+Expired windows are checked when messages are logged, so a summary may be
+delayed until the next message of any kind.
+'''
+
+import re
+import threading
+
+import six
+
+
+# Minimum time in seconds between scans for expired windows.
+SWEEP_INTERVAL = 1.0
+
+NUMBER_RE = re.compile(r'\d+')
+
+
+def messageTemplate(message, formatted=True):
+    '''
+    Get the template of a message for use in the key of a rate limit.
+
+    Numbers are masked in messages that were formatted by the caller, so
+    that "retry 1" and "retry 2" count as the same message.
+    '''
+    if isinstance(message, dict):
+        # Twisted log events
+        message = message.get('message', '')
+    if not isinstance(message, six.string_types):
+        message = str(message)
+    if formatted:
+        message = NUMBER_RE.sub('#', message)
+    return message
+
+
+def parseRateLimits(spec, levelValue):
+    '''
+    Parse limits from a string such as "INFO:20/60,WARN:10/60", meaning that
+    at most 20 INFO messages with the same key are logged in 60 seconds.
+
+    Returns a dict that maps level values to (burst, window) tuples.
+    '''
+    limits = {}
+    if not spec:
+        return limits
+
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        level, limit = item.split(':', 1)
+        burst, window = limit.split('/', 1)
+        limits[levelValue(level.strip())] = (int(burst), float(window))
+
+    return limits
+
+
+class RateLimitEntry(object):
+    def __init__(self, key, level, start, window):
+        self.key = key
+        self.level = level
+        self.start = start
+        self.window = window
+        self.count = 0
+        self.suppressed = 0
+
+
+class RateLimiter(object):
+    '''
+    Count messages by key and decide which of them to log.
+
+    Thread-safe, since messages are logged from any thread.
+    '''
+
+    def __init__(self):
+        self.limits = {}
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        # Entries whose window ended with suppressed messages, waiting for
+        # their summaries to be logged.
+        self.pending = []
+        self.nextSweep = 0
+
+        self.totalSuppressed = 0
+
+    def setLimit(self, level, burst, window):
+        '''
+        Set the limit for a level, given as a level value.  A burst of None
+        removes the limit.
+        '''
+        with self.lock:
+            if burst is None:
+                self.limits.pop(level, None)
+            else:
+                self.limits[level] = (burst, window)
+
+    def allow(self, key, level, now):
+        '''
+        Count a message and return whether it should be logged.
+        '''
+        limit = self.limits.get(level)
+        if limit is None:
+            return True
+        burst, window = limit
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or now - entry.start >= window:
+                if entry is not None and entry.suppressed > 0:
+                    self.pending.append(entry)
+                entry = RateLimitEntry(key, level, now, window)
+                self.entries[key] = entry
+
+            entry.count += 1
+            if entry.count <= burst:
+                return True
+
+            entry.suppressed += 1
+            self.totalSuppressed += 1
+            return False
+
+    def expired(self, now):
+        '''
+        Return the entries that need a summary, oldest first, and forget
+        entries whose window has ended.
+        '''
+        if not self.pending and now < self.nextSweep:
+            return []
+
+        with self.lock:
+            result = self.pending
+            self.pending = []
+
+            if now >= self.nextSweep:
+                self.nextSweep = now + SWEEP_INTERVAL
+                for key, entry in list(self.entries.items()):
+                    if now - entry.start >= entry.window:
+                        del self.entries[key]
+                        if entry.suppressed > 0:
+                            result.append(entry)
+
+        return result
+
+    def getStats(self):
+        '''
+        Describe the limits and the messages that are being suppressed.
+        '''
+        with self.lock:
+            suppressing = []
+            for entry in self.entries.values():
+                if entry.suppressed > 0:
+                    module, line, template = entry.key
+                    suppressing.append({
+                        'module': module,
+                        'line': line,
+                        'template': template,
+                        'level': entry.level,
+                        'count': entry.count,
+                        'suppressed': entry.suppressed,
+                        'since': entry.start
+                    })
+
+            return {
+                'limits': dict(self.limits),
+                'suppressed': self.totalSuppressed,
+                'suppressing': suppressing
+            }
@@ -48,6 +48,8 @@ CONFIG_FILE = CONFIG_HOME_DIR + 'config'
 # pdserver
 #
 PDSERVER = "https://paradrop.org"
+# Maximum number of requests in progress at once, which is also the number
+# of curl handles in the pool of CurlRequestDriver.
 PDSERVER_MAX_CONCURRENT_REQUESTS = 2
 WAMP_ROUTER = "wss://paradrop.org/ws"
 
@@ -185,6 +187,174 @@ DEFAULT_WIRELESS_KEY = None
 
 GOVERNOR_INTERFACE = "/var/run/governor.socket"
 
+# Disk usage thresholds, as a fraction of HOST_DATA_PARTITION, for the image
+# and volume garbage collector.  Collection starts when usage rises above the
+# high-water mark and stops removing images once usage falls below the
+# low-water mark.  GC_INTERVAL is the time in seconds between checks; set it
+# to 0 to disable the garbage collector.
+GC_HIGH_WATER_MARK = 0.85
+GC_LOW_WATER_MARK = 0.75
+GC_INTERVAL = 600
+
+# File used to record when each chute image was last used.
+GC_IMAGE_USAGE_FILE = CONFIG_HOME_DIR + "image-usage"
+
+# Rolling updates: time in seconds to wait for the new container to respond on
+# its web port, and time to let connections to the old container drain after
+# haproxy has been switched to the new one.
+ROLLING_UPDATE_READY_TIMEOUT = 30
+ROLLING_UPDATE_DRAIN_TIME = 5
+
+# Interval in seconds between container resource usage samples and the number
+# of samples kept for each container.  Set the interval to 0 to disable the
+# sampler.
+CONTAINER_METRICS_INTERVAL = 10
+CONTAINER_METRICS_BUFFER_SIZE = 60
+
+# Time in seconds that successful password checks and decoded access tokens
+# are cached by the HTTP server.
+AUTH_CACHE_TTL = 30
+
+# Maximum time in seconds that responses of read-only API endpoints are
+# cached.  Cached responses are also dropped when chutes, the host
+# configuration, container states or DHCP leases change.
+RESPONSE_CACHE_TTL = 10
+
+# Number of responses whose ETag and Last-Modified time are remembered after
+# their cache entry is dropped, so that Last-Modified only changes when the
+# response body changes.
+RESPONSE_CACHE_MAX_VERSIONS = 1000
+
+# Directory for compressed copies of the portal files, which are built when
+# the HTTP server starts.
+PORTAL_CACHE_DIR = RUNTIME_HOME_DIR + 'portal-cache/'
+
+# JSON responses of at least this many bytes are gzip-compressed for clients
+# that accept it.  Level 6 gives most of the size reduction of level 9 at a
+# fraction of the CPU time.
+HTTP_COMPRESS_MIN_SIZE = 1400
+HTTP_COMPRESS_LEVEL = 6
+
+# Window size (log2) and memory level used by the server side of websocket
+# permessage-deflate.  Smaller values use less memory per connection at the
+# cost of a lower compression ratio.
+WS_DEFLATE_WINDOW_BITS = 11
+WS_DEFLATE_MEM_LEVEL = 4
+
+# Size of the thread pool that runs blocking API handlers, and the default
+# limit on concurrent calls and the timeout in seconds for each handler.
+API_THREAD_POOL_SIZE = 4
+API_ROUTE_CONCURRENCY = 2
+API_ROUTE_TIMEOUT = 30
+
+# Maximum number of sub-requests in one call to the batch endpoint.
+BATCH_MAX_REQUESTS = 20
+
+# Largest page size that list endpoints return for the limit parameter.
+API_LIST_MAX_LIMIT = 1000
+
+# Interval in seconds for sampling system status while websocket clients are
+# subscribed, and the minimum time between replies to a client that polls
+# with "refresh".
+STATUS_PUSH_INTERVAL = 2
+STATUS_REFRESH_MIN_INTERVAL = 0.5
+
+# Interval in seconds for measuring the reactor lag.
+REACTOR_LAG_INTERVAL = 1
+
+# Interval in seconds for refreshing the table of stations connected to chute
+# access points, the timeout in seconds for each hostapd query and the
+# maximum number of stations read per interface.  The maximum is only a
+# safeguard against a misbehaving hostapd, far above the number of stations
+# hostapd accepts, and a warning is logged when it is reached.
+STATION_TABLE_INTERVAL = 5
+STATION_TABLE_TIMEOUT = 2
+STATION_TABLE_MAX_STATIONS = 16384
+
+# Interval in seconds for checking the DHCP lease files for changes.  Only used
+# when inotify is not available.
+LEASE_INDEX_POLL_INTERVAL = 5
+
+# Delay in seconds before reading a lease file after inotify reports a change,
+# so that the events from one rewrite of the file cause one read.
+LEASE_INDEX_DEBOUNCE_DELAY = 0.5
+
+# Log messages below LOG_LEVEL (HEADER, VERBOSE, INFO, PERF, WARN, ERR,
+# SECURITY, FATAL, USAGE) are dropped before any formatting happens.
+# LOG_MODULE_LEVELS overrides the level for modules and their submodules,
+# e.g. "paradrop.core.plan:INFO,paradrop.backend:WARN".
+LOG_LEVEL = "HEADER"
+LOG_MODULE_LEVELS = ""
+
+# Limits on repeated log messages as LEVEL:burst/seconds.  At most burst
+# messages from the same line with the same text (ignoring numbers) are
+# logged in each period, followed by a "Message repeated N times" summary.
+# Levels that are not listed are not limited.
+LOG_RATE_LIMITS = "INFO:20/60,WARN:20/60,ERR:20/60"
+
+# The log file writer takes up to LOG_WRITE_BATCH_SIZE messages from its queue
+# at once and buffers up to LOG_BUFFER_SIZE bytes for at most
+# LOG_FLUSH_INTERVAL seconds before writing.  The current log file is rotated
+# daily or when it exceeds LOG_MAX_FILE_SIZE bytes, and rotated files are
+# compressed and deleted, oldest first, beyond LOG_MAX_TOTAL_SIZE bytes.
+LOG_WRITE_BATCH_SIZE = 256
+LOG_BUFFER_SIZE = 65536
+LOG_FLUSH_INTERVAL = 1.0
+LOG_MAX_FILE_SIZE = 1048576
+LOG_MAX_TOTAL_SIZE = 16777216
+
+# Number of messages queued for each client of the daemon log websocket.
+# When a client falls further behind, the oldest messages are dropped.
+LOG_WS_QUEUE_SIZE = 1000
+
+# Send state reports as JSON patches against the last report that the
+# controller acknowledged.  A full report is sent when there is no such
+# report, when the controller rejects the base version and at least once
+# every STATE_REPORT_FULL_INTERVAL seconds.  Bytes sent are counted per day
+# for the last STATE_REPORT_STATS_DAYS days.
+STATE_REPORT_DELTAS = True
+STATE_REPORT_FULL_INTERVAL = 86400
+STATE_REPORT_STATS_DAYS = 7
+
+# Node and chute metrics are sampled every TELEMETRY_SAMPLE_INTERVAL seconds
+# into a fixed-size store with the tiers in TELEMETRY_TIERS, given as
+# resolution:rows (by default 10 minutes at 1 second, 1 day at 1 minute and
+# 1 week at 15 minutes).  TELEMETRY_STORE_FILE keeps the store in a
+# memory-mapped file so that it survives restarts of the daemon; set it to
+# None to keep the store in memory.  Sampling only runs while telemetry is
+# enabled in the host configuration.  Set the interval to 0 to disable it.
+TELEMETRY_SAMPLE_INTERVAL = 0.5
+TELEMETRY_TIERS = "1:600,60:1440,900:672"
+TELEMETRY_MAX_SERIES = 64
+TELEMETRY_STORE_FILE = "/var/run/paradrop/telemetry"
+
+# When telemetry is enabled, rows at TELEMETRY_UPLOAD_RESOLUTION are sent to
+# the controller every TELEMETRY_UPLOAD_INTERVAL seconds as gzip-compressed
+# batches of at most TELEMETRY_UPLOAD_MAX_ROWS rows.  Rows that could not be
+# sent are included in later batches.
+TELEMETRY_UPLOAD_INTERVAL = 300
+TELEMETRY_UPLOAD_RESOLUTION = 60
+TELEMETRY_UPLOAD_MAX_ROWS = 240
+
+# When enabled, request bodies to pdserver of at least
+# PDSERVER_COMPRESS_MIN_SIZE bytes are sent compressed with gzip.  Only enable
+# it for a controller that accepts compressed bodies; if it answers with 400
+# or 415, requests are sent uncompressed from then on.  Responses are always
+# requested compressed.
+PDSERVER_COMPRESS_REQUESTS = False
+PDSERVER_COMPRESS_MIN_SIZE = 1024
+
+# State reports and update progress messages go through a queue that is
+# saved in OUTBOX_FILE, so that they are delivered after connectivity to the
+# controller or the daemon is restored.  Beyond OUTBOX_MAX_MESSAGES, the
+# oldest messages are dropped.  Progress messages of an update are sent in
+# batches of up to OUTBOX_BATCH_SIZE, and failed deliveries are retried
+# with a delay that doubles up to OUTBOX_MAX_RETRY_DELAY seconds.
+OUTBOX_FILE = CONFIG_HOME_DIR + "outbox"
+OUTBOX_MAX_MESSAGES = 1000
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_RETRY_DELAY = 300
+
 ###############################################################################
 # Helper functions
 ###############################################################################
@@ -284,6 +454,7 @@ def updatePaths(configHomeDir, runtimeHomeDir="/var/run/paradrop"):
     mod.CONFIG_HOME_DIR = configHomeDir
     mod.RUNTIME_HOME_DIR = runtimeHomeDir
     mod.FC_CHUTESTORAGE_FILE = os.path.join(mod.CONFIG_HOME_DIR, "chutes")
+    mod.GC_IMAGE_USAGE_FILE = os.path.join(mod.CONFIG_HOME_DIR, "image-usage")
     mod.EXTERNAL_DATA_DIR = os.path.join(mod.CONFIG_HOME_DIR, "chute-data/{chute}/")
     mod.EXTERNAL_SYSTEM_DIR = os.path.join(runtimeHomeDir, "system", "{chute}")
     mod.LOG_DIR = os.path.join(mod.CONFIG_HOME_DIR, "logs/")
@@ -295,6 +466,9 @@ def updatePaths(configHomeDir, runtimeHomeDir="/var/run/paradrop"):
     mod.UCI_CONFIG_DIR = os.path.join(mod.CONFIG_HOME_DIR, "uci/config.d/")
     mod.UCI_BACKUP_DIR = os.path.join(mod.CONFIG_HOME_DIR, "uci/config-backup.d/")
     mod.PDCONFD_WRITE_DIR = os.path.join(mod.RUNTIME_HOME_DIR, 'pdconfd')
+    mod.PORTAL_CACHE_DIR = os.path.join(mod.RUNTIME_HOME_DIR, 'portal-cache')
+    mod.TELEMETRY_STORE_FILE = os.path.join(mod.RUNTIME_HOME_DIR, 'telemetry')
+    mod.OUTBOX_FILE = os.path.join(mod.CONFIG_HOME_DIR, "outbox")
 
 
 def loadSettings(mode="local", slist=[]):
@@ -1,18 +1,25 @@
 from __future__ import print_function
+import collections
+import gzip
 import json
 import pycurl
 import re
 import six
+import time
 import urllib
 
 import twisted
-from twisted.internet import reactor, threads
-from twisted.internet.defer import Deferred, DeferredLock, DeferredSemaphore
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, DeferredSemaphore
+from twisted.internet.interfaces import IReadDescriptor, IWriteDescriptor
 from twisted.internet.protocol import Protocol
-from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool
+from twisted.web.client import Agent, ContentDecoderAgent, FileBodyProducer, \
+        GzipDecoder, HTTPConnectionPool
 from twisted.web.http_headers import Headers
+from zope.interface import implementer
 
 from paradrop.base import nexus, settings
+from paradrop.base.output import out
 
 
 class JSONReceiver(Protocol):
@@ -40,7 +47,7 @@ class JSONReceiver(Protocol):
         """
         self.response = response
         self.finished = finished
-        self.data = ""
+        self.data = b""
 
     def dataReceived(self, data):
         """
@@ -64,6 +71,18 @@ class JSONReceiver(Protocol):
             raise Exception(reason.getErrorMessage())
 
 
+def gzipCompress(data):
+    """
+    Compress a request body with gzip.
+    """
+    if isinstance(data, six.text_type):
+        data = data.encode('utf-8')
+    buf = six.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as output:
+        output.write(data)
+    return buf.getvalue()
+
+
 def urlEncodeParams(data):
     """
     Return data URL-encoded.
@@ -127,32 +146,219 @@ class HTTPRequestDriver(object):
         self.headers[key] = value
 
 
-class CurlRequestDriver(HTTPRequestDriver):
-    # Shared curl handle.
-    # May have problems due to issue #411.
-    # https://github.com/pycurl/pycurl/issues/411
-    curl = pycurl.Curl()
+@implementer(IReadDescriptor, IWriteDescriptor)
+class CurlSocket(object):
+    """
+    Reactor descriptor for a socket of the curl multi handle.
+
+    The reactor reports the socket as readable or writable and we let curl
+    do the actual reading and writing.
+    """
+    def __init__(self, client, fd):
+        self.client = client
+        self.fd = fd
+
+    def fileno(self):
+        return self.fd
+
+    def doRead(self):
+        self.client.socketAction(self.fd, pycurl.CSELECT_IN)
+
+    def doWrite(self):
+        self.client.socketAction(self.fd, pycurl.CSELECT_OUT)
+
+    def connectionLost(self, reason):
+        # The reactor stopped watching the socket after an error or hangup
+        # (e.g. connection refused), so curl has to hear about it here.
+        self.client.sockets.pop(self.fd, None)
+        self.client.socketAction(self.fd, pycurl.CSELECT_ERR)
+
+    def logPrefix(self):
+        return "CurlSocket"
 
-    # Lock for the access to curl.
-    lock = DeferredLock()
 
-    code_pattern = re.compile("(HTTP\S*)\s+(\d+)\s+(.*)")
+class CurlMultiClient(object):
+    """
+    Run curl transfers on the reactor with a curl multi handle.
+
+    Transfers use a pool of at most maxHandles easy handles, and transfers
+    beyond that wait for a handle to become free.  Connections are kept
+    alive in the connection cache of the multi handle, so consecutive
+    requests to pdserver reuse them regardless of which easy handle they
+    get.
+
+    Instead of blocking in curl.perform in a thread, the sockets that curl
+    wants to watch are added to the reactor, and curl is told when they are
+    ready or when its timer expires.
+    """
+    def __init__(self, maxHandles):
+        self.maxHandles = maxHandles
+
+        self.multi = pycurl.CurlMulti()
+        self.multi.setopt(pycurl.M_SOCKETFUNCTION, self.onSocket)
+        self.multi.setopt(pycurl.M_TIMERFUNCTION, self.onTimer)
+
+        # Easy handles that are not in use and the number created so far.
+        self.idle = []
+        self.handles = 0
+
+        # Transfers in progress (curl -> Deferred) and waiting for a handle.
+        self.active = {}
+        self.waiting = collections.deque()
+
+        self.sockets = {}
+        self.timer = None
+
+    def perform(self, configure):
+        """
+        Make a transfer once a handle is available.
+
+        configure is called with the handle to set up the transfer.  Returns
+        a Deferred that fires with None when the transfer completes or fails
+        with pycurl.error.
+        """
+        d = Deferred()
+        self.waiting.append((configure, d))
+        self.startWaiting()
+        return d
+
+    def getHandle(self):
+        if self.idle:
+            return self.idle.pop()
+        if self.handles < self.maxHandles:
+            self.handles += 1
+            return pycurl.Curl()
+        return None
+
+    def startWaiting(self):
+        while self.waiting:
+            curl = self.getHandle()
+            if curl is None:
+                break
+
+            configure, d = self.waiting.popleft()
+            try:
+                configure(curl)
+            except Exception as error:
+                curl.reset()
+                self.idle.append(curl)
+                d.errback(error)
+                continue
+
+            self.active[curl] = d
+            self.multi.add_handle(curl)
+
+    def socketAction(self, fd, flags):
+        while True:
+            ret, running = self.multi.socket_action(fd, flags)
+            if ret != pycurl.E_CALL_MULTI_PERFORM:
+                break
+        self.checkFinished()
+
+    def checkFinished(self):
+        """
+        Complete the transfers that curl reports as done.
+        """
+        finished = []
+        while True:
+            queued, succeeded, failed = self.multi.info_read()
+            for curl in succeeded:
+                finished.append((curl, None))
+            for curl, errno, message in failed:
+                finished.append((curl, pycurl.error(errno, message)))
+            if queued == 0:
+                break
+
+        for curl, error in finished:
+            self.multi.remove_handle(curl)
+            d = self.active.pop(curl)
+
+            # Reset clears the callbacks and the references they hold.
+            curl.reset()
+            self.idle.append(curl)
+
+            if error is None:
+                d.callback(None)
+            else:
+                d.errback(error)
+
+        self.startWaiting()
+
+    def onSocket(self, event, fd, multi, data):
+        """
+        internal: curl wants a socket watched for different events.
+        """
+        if event == pycurl.POLL_REMOVE:
+            self.removeSocket(fd)
+            return
+
+        sock = self.sockets.get(fd)
+        if sock is None:
+            sock = CurlSocket(self, fd)
+            self.sockets[fd] = sock
+
+        if event & pycurl.POLL_IN:
+            reactor.addReader(sock)
+        else:
+            reactor.removeReader(sock)
+
+        if event & pycurl.POLL_OUT:
+            reactor.addWriter(sock)
+        else:
+            reactor.removeWriter(sock)
+
+    def removeSocket(self, fd):
+        sock = self.sockets.pop(fd, None)
+        if sock is not None:
+            reactor.removeReader(sock)
+            reactor.removeWriter(sock)
+
+    def onTimer(self, timeout):
+        """
+        internal: curl wants to be called after timeout milliseconds, or
+        not at all if timeout is negative.
+        """
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+
+        # Curl may not be called again from inside its callback, so even a
+        # zero timeout goes through the reactor.
+        if timeout >= 0:
+            self.timer = reactor.callLater(timeout / 1000.0, self.onTimeout)
+
+    def onTimeout(self):
+        self.timer = None
+        self.socketAction(pycurl.SOCKET_TIMEOUT, 0)
+
+
+class CurlRequestDriver(HTTPRequestDriver):
+    # Shared multi handle and pool of easy handles, created on first use.
+    client = None
+
+    code_pattern = re.compile("(HTTP\S*)\s+(\d+)\s*(.*)")
     header_pattern = re.compile("(\S+): (.*)")
 
     def __init__(self):
         super(CurlRequestDriver, self).__init__()
 
         # Buffer for receiving response.
-        self.buffer = six.StringIO()
+        self.buffer = six.BytesIO()
 
         # Fill in response object.
         self.response = HTTPResponse()
 
+    @classmethod
+    def getClient(cls):
+        if cls.client is None:
+            cls.client = CurlMultiClient(settings.PDSERVER_MAX_CONCURRENT_REQUESTS)
+        return cls.client
+
     def receive(self, ignore):
         """
         Receive response from curl and convert it to a response object.
         """
-        data = self.buffer.getvalue()
+        data = self.buffer.getvalue().decode('utf-8', 'replace')
 
         response = self.response
 
@@ -172,10 +378,14 @@ class CurlRequestDriver(HTTPRequestDriver):
         return response
 
     def receiveHeaders(self, header_line):
+        if isinstance(header_line, bytes):
+            header_line = header_line.decode('iso-8859-1')
         header_line = header_line.strip()
 
         match = CurlRequestDriver.code_pattern.match(header_line)
         if match is not None:
+            # Start over for each response, e.g. after 100 Continue.
+            self.response.headers = dict()
             self.response.version = match.group(1)
             self.response.code = int(match.group(2))
             self.response.phrase = match.group(3)
@@ -187,16 +397,16 @@ class CurlRequestDriver(HTTPRequestDriver):
             self.response.headers[key] = match.group(2)
 
     def request(self, method, url, body=None):
-        def makeRequest(ignored):
-            curl = CurlRequestDriver.curl
-            curl.reset()
-
+        def configure(curl):
             curl.setopt(pycurl.URL, url)
             curl.setopt(pycurl.HEADERFUNCTION, self.receiveHeaders)
             curl.setopt(pycurl.WRITEFUNCTION, self.buffer.write)
 
             curl.setopt(pycurl.CUSTOMREQUEST, method)
 
+            # Ask for a compressed response, which curl decompresses.
+            curl.setopt(pycurl.ENCODING, 'gzip')
+
             if body is not None:
                 curl.setopt(pycurl.POSTFIELDS, body)
 
@@ -205,23 +415,8 @@ class CurlRequestDriver(HTTPRequestDriver):
                 headers.append("{}: {}".format(key, value))
             curl.setopt(pycurl.HTTPHEADER, headers)
 
-            d = threads.deferToThread(curl.perform)
-            d.addCallback(self.receive)
-            return d
-
-        def releaseLock(result):
-            CurlRequestDriver.lock.release()
-
-            # Forward the result to the next handler.
-            return result
-
-        d = CurlRequestDriver.lock.acquire()
-
-        # Make the request once we acquire the semaphore.
-        d.addCallback(makeRequest)
-
-        # Release the semaphore regardless of how the request goes.
-        d.addBoth(releaseLock)
+        d = CurlRequestDriver.getClient().perform(configure)
+        d.addCallback(self.receive)
         return d
 
 
@@ -250,13 +445,19 @@ class TwistedRequestDriver(HTTPRequestDriver):
         def makeRequest(ignored):
             bodyProducer = None
             if body is not None:
-                bodyProducer = FileBodyProducer(six.StringIO(body))
+                data = body
+                if isinstance(data, six.text_type):
+                    data = data.encode('utf-8')
+                bodyProducer = FileBodyProducer(six.BytesIO(data))
 
             headers = {}
             for key, value in six.iteritems(self.headers):
                 headers[key] = [value]
 
-            agent = Agent(reactor, pool=TwistedRequestDriver.pool)
+            # Ask for a compressed response and decompress it on arrival.
+            agent = ContentDecoderAgent(
+                    Agent(reactor, pool=TwistedRequestDriver.pool),
+                    [(b'gzip', GzipDecoder)])
             d = agent.request(method, url, Headers(headers), bodyProducer)
             d.addCallback(self.receive)
             return d
@@ -277,6 +478,101 @@ class TwistedRequestDriver(HTTPRequestDriver):
         return d
 
 
+class RequestMetrics(object):
+    """
+    Latency and retry counts of requests to pdserver by endpoint.
+
+    Endpoints are the method and path template of the request, e.g.
+    "POST /api/routers/{router_id}/states", with ids in the path replaced by
+    "{id}".  The metrics are kept in class variables and included in
+    telemetry reports.
+    """
+    endpoints = {}
+
+    # Latencies of the most recent requests to each endpoint, for the
+    # percentiles.
+    recent = {}
+    RECENT_SIZE = 100
+
+    ID_PATTERN = re.compile("/(?:\d+|[0-9a-fA-F]{12,})(?=/|$)")
+
+    @classmethod
+    def endpointName(cls, method, path):
+        path = path.split('?', 1)[0]
+        if not path.startswith('/'):
+            path = '/' + path
+        return "{} {}".format(method, cls.ID_PATTERN.sub('/{id}', path))
+
+    @classmethod
+    def getEndpoint(cls, name):
+        endpoint = cls.endpoints.get(name)
+        if endpoint is None:
+            endpoint = {
+                'requests': 0,
+                'failures': 0,
+                'errors': 0,
+                'retries': 0,
+                'auth_retries': 0,
+                'bytes_sent': 0,
+                'bytes_uncompressed': 0,
+                'total_time': 0.0,
+                'max_time': 0.0,
+                'last_time': None,
+                'last_code': None
+            }
+            cls.endpoints[name] = endpoint
+            cls.recent[name] = collections.deque(maxlen=cls.RECENT_SIZE)
+        return endpoint
+
+    @classmethod
+    def record(cls, name, latency, code=None, sent=0, uncompressed=0):
+        """
+        Record a completed request.  A code of None means that no response
+        was received.
+        """
+        endpoint = cls.getEndpoint(name)
+        endpoint['requests'] += 1
+        if code is None:
+            endpoint['failures'] += 1
+        elif not (200 <= code < 300):
+            endpoint['errors'] += 1
+        endpoint['bytes_sent'] += sent
+        endpoint['bytes_uncompressed'] += uncompressed
+        endpoint['total_time'] += latency
+        endpoint['max_time'] = max(endpoint['max_time'], latency)
+        endpoint['last_time'] = latency
+        endpoint['last_code'] = code
+        cls.recent[name].append(latency)
+
+    @classmethod
+    def recordRetry(cls, name, auth=False):
+        endpoint = cls.getEndpoint(name)
+        if auth:
+            endpoint['auth_retries'] += 1
+        else:
+            endpoint['retries'] += 1
+
+    @classmethod
+    def getStatistics(cls):
+        result = {}
+        for name, endpoint in six.iteritems(cls.endpoints):
+            stats = endpoint.copy()
+            if endpoint['requests'] > 0:
+                stats['mean_time'] = endpoint['total_time'] / endpoint['requests']
+            else:
+                stats['mean_time'] = None
+
+            recent = sorted(cls.recent[name])
+            for label, fraction in [('p50_time', 0.5), ('p95_time', 0.95)]:
+                if recent:
+                    stats[label] = recent[min(int(fraction * len(recent)), len(recent) - 1)]
+                else:
+                    stats[label] = None
+
+            result[name] = stats
+        return result
+
+
 class PDServerRequest(object):
     """
     Make an HTTP request to pdserver.
@@ -292,6 +588,13 @@ class PDServerRequest(object):
     PDServerRequest objects are not reusable; create a new one for each
     request.
 
+    Request bodies are sent compressed with gzip if compress is True, or
+    if compress is None (the default) and PDSERVER_COMPRESS_REQUESTS is
+    enabled and the body is at least PDSERVER_COMPRESS_MIN_SIZE bytes.  If
+    pdserver answers a compressed request with 400 or 415, the request is
+    sent again uncompressed and compression stays off from then on.
+    Latency and retries are recorded in RequestMetrics.
+
     URL String Substitutions:
     router_id -> router id
 
@@ -304,12 +607,21 @@ class PDServerRequest(object):
     # requests.
     token = None
 
-    def __init__(self, path, driver=TwistedRequestDriver, headers={}, setAuthHeader=True):
+    # Set when pdserver rejected a compressed request body.
+    compressionRejected = False
+
+    # Responses to a compressed request that may mean that pdserver does not
+    # accept compressed bodies.
+    COMPRESSION_REJECTED_CODES = set([400, 415])
+
+    def __init__(self, path, driver=TwistedRequestDriver, headers={}, setAuthHeader=True,
+            compress=None):
         self.path = path
         self.driver = driver
         self.headers = headers
         self.setAuthHeader = setAuthHeader
-        self.transportRetries = 0
+        self.compress = compress
+        self.compressed = False
 
         url = nexus.core.info.pdserver
         if not path.startswith('/'):
@@ -320,6 +632,24 @@ class PDServerRequest(object):
         self.url = url.format(router_id=nexus.core.info.pdid)
 
         self.body = None
+        self.method = None
+
+    def getEndpoint(self):
+        return RequestMetrics.endpointName(self.method, self.path)
+
+    def shouldCompress(self, body):
+        if PDServerRequest.compressionRejected:
+            return False
+        if self.compress is not None:
+            return self.compress
+        return settings.PDSERVER_COMPRESS_REQUESTS and \
+                len(body) >= settings.PDSERVER_COMPRESS_MIN_SIZE
+
+    def recordRetry(self):
+        """
+        Count a retry of this request by the caller, e.g. after a failure.
+        """
+        RequestMetrics.recordRetry(self.getEndpoint())
 
     def get(self, **query):
         self.method = 'GET'
@@ -363,13 +693,52 @@ class PDServerRequest(object):
             driver.setHeader('Authorization', auth)
         for key, value in six.iteritems(self.headers):
             driver.setHeader(key, value)
-        return driver.request(self.method, self.url, self.body)
+
+        body = self.body
+        uncompressed = 0
+        self.compressed = False
+        if body is not None:
+            uncompressed = len(body)
+            if self.shouldCompress(body):
+                body = gzipCompress(body)
+                driver.setHeader('Content-Encoding', 'gzip')
+                self.compressed = True
+
+        endpoint = self.getEndpoint()
+        sent = len(body) if body is not None else 0
+        start = time.time()
+
+        def recordResponse(response):
+            RequestMetrics.record(endpoint, time.time() - start,
+                    code=response.code, sent=sent, uncompressed=uncompressed)
+            return response
+
+        def recordFailure(failure):
+            RequestMetrics.record(endpoint, time.time() - start,
+                    sent=sent, uncompressed=uncompressed)
+            return failure
+
+        d = driver.request(self.method, self.url, body)
+        d.addCallbacks(recordResponse, recordFailure)
+        return d
 
     def receiveResponse(self, response):
         """
         Intercept the response object, and if it's a 401 authenticate and retry.
+
+        A compressed request that pdserver rejects is retried uncompressed.
         """
-        if response.code == 401 and self.setAuthHeader:
+        if self.compressed and \
+                response.code in PDServerRequest.COMPRESSION_REJECTED_CODES:
+            out.info('{} to {} returned code {}, sending requests uncompressed\n'.format(
+                self.method, self.url, response.code))
+            PDServerRequest.compressionRejected = True
+            RequestMetrics.recordRetry(self.getEndpoint())
+            d = self.request()
+            d.addCallback(self.receiveResponse)
+            return d
+
+        elif response.code == 401 and self.setAuthHeader:
             # 401 (Unauthorized) may mean our token is no longer valid.
             # Request a new token and then retry the request.
             #
@@ -377,6 +746,7 @@ class PDServerRequest(object):
             # returns a 401 code, meaning the id/password is invalid, it should
             # not go down this code path again (prevented by check against
             # self.setAuthHeader above).
+            RequestMetrics.recordRetry(self.getEndpoint(), auth=True)
             authRequest = PDServerRequest('/auth/router', driver=self.driver,
                     setAuthHeader=False)
             d = authRequest.post(id=nexus.core.info.pdid,
@@ -0,0 +1,451 @@
+"""
+Durable queue for messages to the controller.
+
+Messages that the node wants the controller to receive eventually (state
+reports, update progress, etc.) are put in the OutboundQueue instead of
+being sent directly.  The queue is saved to a file, so that messages that
+could not be delivered survive a restart of the daemon, and sends them when
+the controller can be reached.
+
+Each message has a kind and a key.  Depending on the kind, messages with the
+same key are either coalesced, meaning that a new message replaces the one
+that is waiting (e.g. only the newest state report matters), or batched,
+meaning that the waiting messages are delivered together in one request
+(e.g. the progress messages of an update).
+
+A kind may also be registered to be delivered after other kinds: its
+messages wait while an earlier message with the same key and one of those
+kinds is queued (e.g. the progress messages of an update wait for the
+notice that the update has started).
+
+Kinds are registered with a handler that delivers a list of messages and
+returns a Deferred that fires with True if they are done (delivered or
+permanently rejected) or False if they should be tried again later.  When a
+delivery fails, the queue stops and tries again after an increasing delay.
+"""
+
+import json
+import os
+import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+from twisted.python import threadable
+
+from paradrop.base import nexus, settings
+from paradrop.base.output import out
+from paradrop.core.agent.http import PDServerRequest
+
+
+class MessageKind(object):
+    def __init__(self, name, handler, coalesce=False, batchSize=1, after=()):
+        self.name = name
+        self.handler = handler
+        self.coalesce = coalesce
+        self.batchSize = batchSize
+        self.after = set(after)
+
+
+# Registered kinds by name.
+kinds = {}
+
+
+def registerKind(name, handler, coalesce=False, batchSize=1, after=()):
+    """
+    Register a kind of message.
+
+    handler: function that takes a list of message data and returns True,
+    False or a Deferred that fires with either.
+    coalesce: a new message replaces the waiting message with the same key.
+    batchSize: maximum number of messages with the same key that are passed
+    to the handler at once.
+    after: names of kinds whose earlier messages with the same key must be
+    delivered first.
+    """
+    kinds[name] = MessageKind(name, handler, coalesce=coalesce,
+            batchSize=batchSize, after=after)
+
+
+def isPermanentFailure(code):
+    """
+    Check whether a response code means that there is no point in sending
+    the same message again.
+    """
+    return code is not None and 400 <= code < 500 and \
+            code not in [401, 403, 408, 429]
+
+
+class OutboundQueue(object):
+    """
+    Persistent queue of messages to the controller.
+
+    Messages with the same kind and key are delivered in order, one request
+    at a time.  Messages with different keys are delivered concurrently, up
+    to maxConcurrent requests.
+
+    The queue is meant to be used from the reactor thread, but put may be
+    called from any thread.
+    """
+    def __init__(self, path=None, maxMessages=1000, maxConcurrent=2,
+            maxRetryDelay=300):
+        self.path = path
+        self.maxMessages = maxMessages
+        self.maxConcurrent = maxConcurrent
+        self.maxRetryDelay = maxRetryDelay
+
+        self.messages = []
+        self.nextId = 1
+
+        # Ids of the messages that are being sent and the (kind, key) pairs
+        # that they belong to.
+        self.sending = set()
+        self.sendingKeys = set()
+
+        self.draining = False
+        self.failed = False
+        self.waiters = []
+
+        self.retryDelay = 1
+        self.retryCall = None
+        self.saveCall = None
+
+        self.statistics = {
+            'queued': 0,
+            'delivered': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'requests': 0,
+            'failures': 0
+        }
+
+        self.load()
+
+    def load(self):
+        if self.path is None or not os.path.isfile(self.path):
+            return
+
+        try:
+            with open(self.path, 'r') as source:
+                data = json.load(source)
+            self.messages = data.get('messages', [])
+            self.nextId = data.get('next_id', 1)
+        except (IOError, ValueError) as error:
+            out.warn("Cannot read outbound queue {}: {}".format(self.path, error))
+            self.messages = []
+
+        if self.messages:
+            out.info("Loaded {} outbound messages".format(len(self.messages)))
+
+    def save(self):
+        self.saveCall = None
+        if self.path is None:
+            return
+
+        data = {
+            'next_id': self.nextId,
+            'messages': self.messages
+        }
+
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as output:
+                json.dump(data, output)
+                output.flush()
+                os.fsync(output.fileno())
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as error:
+            out.warn("Cannot write outbound queue {}: {}".format(self.path, error))
+
+    def scheduleSave(self):
+        """
+        Save the queue soon, so that a burst of changes is written once.
+        """
+        if self.saveCall is None:
+            self.saveCall = reactor.callLater(0, self.save)
+
+    def put(self, kind, data, key=None):
+        """
+        Add a message to the queue and start delivering it.
+        """
+        if not threadable.isInIOThread():
+            reactor.callFromThread(self.put, kind, data, key=key)
+            return
+
+        if kinds[kind].coalesce:
+            self.removeWaiting(kind, key)
+
+        self.messages.append({
+            'id': self.nextId,
+            'kind': kind,
+            'key': key,
+            'time': time.time(),
+            'data': data
+        })
+        self.nextId += 1
+        self.statistics['queued'] += 1
+
+        # Make room by dropping the oldest messages that are not being sent.
+        excess = len(self.messages) - self.maxMessages
+        if excess > 0:
+            dropped = [m for m in self.messages if m['id'] not in self.sending][:excess]
+            self.removeMessages(dropped)
+            self.statistics['dropped'] += len(dropped)
+            out.warn("Outbound queue is full, dropped {} messages".format(len(dropped)))
+
+        self.scheduleSave()
+
+        # While waiting to retry, new messages wait as well.
+        if self.retryCall is None:
+            self.drain()
+
+    def removeWaiting(self, kind, key):
+        superseded = [m for m in self.messages if m['kind'] == kind and
+                m['key'] == key and m['id'] not in self.sending]
+        self.removeMessages(superseded)
+        self.statistics['coalesced'] += len(superseded)
+
+    def removeMessages(self, messages):
+        ids = set(m['id'] for m in messages)
+        self.messages = [m for m in self.messages if m['id'] not in ids]
+
+    def nextGroup(self):
+        """
+        Get the next messages to deliver together, or None if there are no
+        messages that can be delivered now.
+        """
+        group = None
+
+        # (kind, key) pairs of the messages before the current one, which
+        # includes messages that are being sent.
+        earlier = set()
+
+        for message in self.messages:
+            groupKey = (message['kind'], message['key'])
+            if group is None:
+                kind = kinds.get(message['kind'])
+                if kind is None or groupKey in self.sendingKeys or \
+                        self.mustWait(kind, message['key'], earlier):
+                    # Handler not registered (yet), messages with the same
+                    # key being sent or earlier messages that must be
+                    # delivered first, so leave the message.
+                    earlier.add(groupKey)
+                    continue
+                group = [message]
+                first = groupKey
+            elif groupKey == first:
+                group.append(message)
+            elif message['kind'] in kind.after and message['key'] == first[1]:
+                # Later messages of the group have to wait for this one.
+                break
+
+            if len(group) >= kind.batchSize:
+                break
+
+        return group
+
+    def mustWait(self, kind, key, earlier):
+        for other in kind.after:
+            if (other, key) in earlier:
+                return True
+        return False
+
+    def drain(self):
+        """
+        Deliver the waiting messages.
+
+        Returns a Deferred that fires when the queue is empty or delivery
+        has failed and will be tried again later.
+        """
+        d = Deferred()
+        self.waiters.append(d)
+
+        if not self.draining:
+            if self.retryCall is not None and self.retryCall.active():
+                self.retryCall.cancel()
+            self.retryCall = None
+
+            self.draining = True
+            self.failed = False
+            self.startSends()
+
+        return d
+
+    def waitForDrain(self):
+        """
+        Get a Deferred that fires when the queue has tried to deliver the
+        waiting messages.
+
+        Unlike drain, this does not cut short the delay before a retry.  If
+        the queue is waiting to retry, the Deferred fires after that attempt.
+        """
+        if not self.draining and self.retryCall is None:
+            return succeed(None)
+
+        d = Deferred()
+        self.waiters.append(d)
+        return d
+
+    def startSends(self):
+        # Without an identity, nothing can be sent.
+        canSend = nexus.core is not None and nexus.core.provisioned()
+
+        while canSend and self.draining and not self.failed and \
+                len(self.sendingKeys) < self.maxConcurrent:
+            group = self.nextGroup()
+            if group is None:
+                break
+
+            groupKey = (group[0]['kind'], group[0]['key'])
+            self.sendingKeys.add(groupKey)
+            self.sending.update(m['id'] for m in group)
+            self.statistics['requests'] += 1
+
+            handler = kinds[group[0]['kind']].handler
+            d = maybeDeferred(handler, [m['data'] for m in group])
+            d.addErrback(self.handleError, groupKey)
+            d.addCallback(self.finishSend, group, groupKey)
+
+        # A handler that finished immediately may have ended the drain
+        # already.
+        if self.draining and len(self.sendingKeys) == 0:
+            self.finishDrain()
+
+    def handleError(self, failure, groupKey):
+        out.warn("Delivery of {} messages failed: {}".format(groupKey[0],
+            failure.getErrorMessage()))
+        return False
+
+    def finishSend(self, done, group, groupKey):
+        self.sendingKeys.discard(groupKey)
+        self.sending.difference_update(m['id'] for m in group)
+
+        if done:
+            self.removeMessages(group)
+            self.statistics['delivered'] += len(group)
+            self.retryDelay = 1
+            self.scheduleSave()
+        else:
+            self.statistics['failures'] += 1
+            self.failed = True
+
+        self.startSends()
+
+    def finishDrain(self):
+        self.draining = False
+
+        if self.failed and len(self.messages) > 0:
+            self.retryCall = reactor.callLater(self.retryDelay, self.drain)
+            self.retryDelay = min(self.retryDelay * 2, self.maxRetryDelay)
+
+        waiters = self.waiters
+        self.waiters = []
+        for d in waiters:
+            d.callback(None)
+
+    def getStatistics(self):
+        stats = self.statistics.copy()
+        stats['pending'] = len(self.messages)
+        stats['pending_by_kind'] = {}
+        for message in self.messages:
+            kind = message['kind']
+            stats['pending_by_kind'][kind] = stats['pending_by_kind'].get(kind, 0) + 1
+        if self.messages:
+            stats['oldest'] = self.messages[0]['time']
+        else:
+            stats['oldest'] = None
+        stats['retrying'] = self.retryCall is not None
+        return stats
+
+
+outbound_queue = None
+
+
+def getOutboundQueue():
+    """
+    Get the queue shared by all senders of controller messages.
+    """
+    global outbound_queue
+    if outbound_queue is None:
+        outbound_queue = OutboundQueue(path=settings.OUTBOX_FILE,
+                maxMessages=settings.OUTBOX_MAX_MESSAGES,
+                maxConcurrent=settings.PDSERVER_MAX_CONCURRENT_REQUESTS,
+                maxRetryDelay=settings.OUTBOX_MAX_RETRY_DELAY)
+    return outbound_queue
+
+
+def checkResponse(request, response):
+    """
+    Decide whether a request is done from the response code.
+    """
+    if response.success:
+        return True
+    out.warn('{} to {} returned code {}'.format(request.method,
+        request.url, response.code))
+    if isPermanentFailure(response.code):
+        return True
+    request.recordRetry()
+    return False
+
+
+# Older controllers only accept one message per request.
+updateMessageBatches = True
+
+
+def sendUpdateMessages(messages):
+    """
+    Deliver progress messages of one update in one request.
+
+    A batch is posted as {"messages": [...]}.  If the controller does not
+    accept that, messages are posted one at a time from then on.
+    """
+    update_id = messages[0]['update_id']
+    path = '/api/routers/{{router_id}}/updates/{}/messages'.format(update_id)
+    items = [{'time': m['time'], 'message': m['message']} for m in messages]
+
+    if len(items) > 1 and not updateMessageBatches:
+        d = succeed(True)
+        for item in items:
+            d.addCallback(sendUpdateMessage, path, item)
+        return d
+
+    request = PDServerRequest(path)
+    if len(items) == 1:
+        d = request.post(**items[0])
+    else:
+        d = request.post(messages=items)
+
+    def cbresponse(response):
+        global updateMessageBatches
+        if len(items) > 1 and response.code in [400, 404, 405, 422]:
+            out.info('{} to {} returned code {}, sending messages separately'.format(
+                request.method, request.url, response.code))
+            updateMessageBatches = False
+            return sendUpdateMessages(messages)
+        return checkResponse(request, response)
+
+    d.addCallback(cbresponse)
+    return d
+
+
+def sendUpdateMessage(done, path, item):
+    # Stop at the first message that fails, so that the rest stay in order.
+    if not done:
+        return False
+
+    request = PDServerRequest(path)
+    d = request.post(**item)
+    d.addCallback(lambda response: checkResponse(request, response))
+    return d
+
+
+def sendUpdateStarted(messages):
+    update_id = messages[0]['update_id']
+    request = PDServerRequest('/api/routers/{router_id}/updates/' + str(update_id))
+    d = request.patch({'op': 'replace', 'path': '/started', 'value': True})
+    d.addCallback(lambda response: checkResponse(request, response))
+    return d
+
+
+registerKind('update_message', sendUpdateMessages,
+        batchSize=settings.OUTBOX_BATCH_SIZE, after=['update_started'])
+registerKind('update_started', sendUpdateStarted, coalesce=True)
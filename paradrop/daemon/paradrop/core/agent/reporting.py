@@ -8,16 +8,25 @@ import json
 import os
 import time
 
+import jsonpatch
+import six
 from twisted.internet import reactor
+from twisted.internet.defer import DeferredLock
 
 from paradrop.base.output import out
 from paradrop.base import nexus, settings
 from paradrop.core.chute.chute_storage import ChuteStorage
 from paradrop.core.config import devices, hostconfig, resource, zerotier
 from paradrop.core.container.chutecontainer import ChuteContainer
-from paradrop.core.agent.http import PDServerRequest
+from paradrop.core.container.garbage_collector import GarbageCollector
+from paradrop.core.container.metrics import ContainerMetricsSampler
+from paradrop.core.agent.http import PDServerRequest, RequestMetrics
+from paradrop.core.agent.outbox import getOutboundQueue, isPermanentFailure, \
+        registerKind
 from paradrop.core.system import system_info
+from paradrop.core.system.reactor_lag import ReactorLagMonitor
 from paradrop.core.system.system_status import SystemStatus
+from paradrop.core.system.telemetry import TelemetrySampler
 from paradrop.lib.misc.governor import GovernorClient
 
 
@@ -121,24 +130,35 @@ class TelemetryReportBuilder(object):
             'chutes': [],
             'network': [],
             'system': SystemStatus.getSystemInfo(),
+            'gc': GarbageCollector.statistics.copy(),
+            'reactor_lag': ReactorLagMonitor.statistics.copy(),
+            'state_reports': StateReportTracker.getStatistics(),
+            'controller_requests': RequestMetrics.getStatistics(),
+            'outbox': getOutboundQueue().getStatistics(),
             'time': time.time()
         }
 
         for chute in chutes:
-            container = ChuteContainer(chute.name)
+            # Resource usage comes from the container metrics sampler, which
+            # covers all processes in each service container.
+            services = {}
+            for service in chute.get_services():
+                services[service.name] = ContainerMetricsSampler.get_latest(
+                        service.get_container_name())
+
+            latest = services.get(chute.get_default_service().name, None)
+            if latest is None:
+                state = "missing"
+            else:
+                state = latest['state']
 
             chute_info = {
                 'name': chute.name,
-                'state': container.getStatus(),
+                'state': state,
+                'services': services,
                 'network': []
             }
 
-            try:
-                pid = container.getPID()
-                chute_info['process'] = SystemStatus.getProcessInfo(pid)
-            except Exception:
-                chute_info['process'] = None
-
             interfaces = chute.getCache('networkInterfaces')
             for iface in interfaces:
                 ifname = iface['externalIntf']
@@ -173,6 +193,14 @@ class ReportSender(object):
         if self.retryDelay > self.maxRetryDelay:
             self.retryDelay = self.maxRetryDelay
 
+    def retry(self, report, request=None):
+        if self.max_retries is None or self.retries < self.max_retries:
+            if request is not None:
+                request.recordRetry()
+            reactor.callLater(self.retryDelay, self.send, report)
+            self.retries += 1
+            self.increaseDelay()
+
     def send(self, report):
         request = PDServerRequest('/api/routers/{router_id}/' + self.model)
         d = request.post(**report)
@@ -182,10 +210,7 @@ class ReportSender(object):
             if not response.success:
                 out.warn('{} to {} returned code {}'.format(request.method,
                     request.url, response.code))
-                if self.max_retries is None or self.retries < self.max_retries:
-                    reactor.callLater(self.retryDelay, self.send, report)
-                    self.retries += 1
-                    self.increaseDelay()
+                self.retry(report, request)
                 nexus.core.jwt_valid = False
             else:
                 nexus.core.jwt_valid = True
@@ -193,10 +218,7 @@ class ReportSender(object):
         # Check for connection failures and retry.
         def cberror(ignored):
             out.warn('{} to {} failed'.format(request.method, request.url))
-            if self.max_retries is None or self.retries < self.max_retries:
-                reactor.callLater(self.retryDelay, self.send, report)
-                self.retries += 1
-                self.increaseDelay()
+            self.retry(report, request)
             nexus.core.jwt_valid = False
 
         d.addCallback(cbresponse)
@@ -204,7 +226,310 @@ class ReportSender(object):
         return d
 
 
-class NodeIdentitySender(ReportSender):
+class StateReportTracker(object):
+    """
+    Remember the last state report that the controller acknowledged.
+
+    The acknowledged report and its version are kept in class variables, so
+    that each report can be sent as a patch against the previous one.  The
+    statistics are included in telemetry reports.
+    """
+    acknowledged = None
+    version = 0
+    lastFullReport = 0
+
+    # Time until which the controller is assumed not to support patches.
+    deltasUnsupportedUntil = 0
+
+    statistics = {
+        'version': 0,
+        'full_reports': 0,
+        'delta_reports': 0,
+        'rejected_deltas': 0,
+        'full_bytes': 0,
+        'delta_bytes': 0,
+        'bytes_per_day': {}
+    }
+
+    @classmethod
+    def makeDelta(cls, document):
+        """
+        Return JSON patch operations that turn the acknowledged report into
+        the given one, or None if a full report should be sent.
+
+        The operations start with a test of the version that the patch is
+        based on, so that the controller rejects it if its copy differs.
+        """
+        if not settings.STATE_REPORT_DELTAS or cls.acknowledged is None:
+            return None
+        if time.time() < cls.deltasUnsupportedUntil:
+            return None
+        if time.time() - cls.lastFullReport >= settings.STATE_REPORT_FULL_INTERVAL:
+            return None
+
+        ops = [
+            {'op': 'test', 'path': '/version', 'value': cls.version},
+            {'op': 'replace', 'path': '/version', 'value': cls.version + 1}
+        ]
+        ops.extend(jsonpatch.make_patch(cls.acknowledged, document).patch)
+        return ops
+
+    @classmethod
+    def acknowledge(cls, document, version, full):
+        cls.acknowledged = document
+        cls.version = version
+        cls.statistics['version'] = version
+        if full:
+            cls.lastFullReport = time.time()
+
+    @classmethod
+    def reject(cls, unsupported=False):
+        """
+        Forget the acknowledged report after the controller rejected a patch.
+
+        If the controller does not support patches at all, only full reports
+        are sent until the next full report would be due anyway.
+        """
+        cls.acknowledged = None
+        cls.statistics['rejected_deltas'] += 1
+        if unsupported:
+            cls.deltasUnsupportedUntil = time.time() + \
+                    settings.STATE_REPORT_FULL_INTERVAL
+
+    @classmethod
+    def recordSent(cls, kind, length):
+        """
+        Count a report of the given kind ("full" or "delta") and its size.
+        """
+        stats = cls.statistics
+        stats[kind + '_reports'] += 1
+        stats[kind + '_bytes'] += length
+
+        days = stats['bytes_per_day']
+        today = time.strftime('%Y-%m-%d')
+        days[today] = days.get(today, 0) + length
+        for day in sorted(days)[:-settings.STATE_REPORT_STATS_DAYS]:
+            del days[day]
+
+    @classmethod
+    def getStatistics(cls):
+        stats = cls.statistics.copy()
+        stats['bytes_per_day'] = stats['bytes_per_day'].copy()
+        return stats
+
+
+class StateReportSender(object):
+    """
+    Send state reports as patches against the last acknowledged report.
+
+    A full report is posted when there is nothing to patch, when the patch
+    would be larger than the report or when the controller rejects the
+    patch.  Reports are sent one at a time so that each patch is based on
+    the result of the previous one.
+
+    The Deferred returned by send fires with True if the report is done and
+    False if it should be sent again later.  Retries are left to the
+    outbound queue, which replaces a report that is waiting for a retry
+    with a newer one.
+    """
+    # Responses to a patch that call for a full report: the base version does
+    # not match (409, 412), the patch does not apply (422) or the controller
+    # does not accept patches (400, 404, 405).
+    REJECTED_CODES = set([400, 404, 405, 409, 412, 422])
+
+    # Responses that mean the controller does not accept patches at all.
+    UNSUPPORTED_CODES = set([404, 405])
+
+    lock = DeferredLock()
+
+    def send(self, report):
+        return StateReportSender.lock.run(self.sendReport, report)
+
+    def sendReport(self, report):
+        # Round trip through JSON so that the stored report compares equal to
+        # the next one (e.g. tuples become lists).
+        document = json.loads(json.dumps(report))
+
+        ops = StateReportTracker.makeDelta(document)
+        if ops is not None and len(json.dumps(ops)) < len(json.dumps(document)):
+            return self.sendDelta(document, ops)
+        else:
+            return self.sendFull(document)
+
+    def sendFull(self, document):
+        version = StateReportTracker.version + 1
+
+        request = PDServerRequest('/api/routers/{router_id}/states')
+        d = request.post(version=version, **document)
+        StateReportTracker.recordSent('full', len(request.body))
+
+        def cbresponse(response):
+            if not response.success:
+                out.warn('{} to {} returned code {}'.format(request.method,
+                    request.url, response.code))
+                nexus.core.jwt_valid = False
+                if isPermanentFailure(response.code):
+                    return True
+                request.recordRetry()
+                return False
+            else:
+                StateReportTracker.acknowledge(document, version, True)
+                nexus.core.jwt_valid = True
+                return True
+
+        def cberror(ignored):
+            out.warn('{} to {} failed'.format(request.method, request.url))
+            nexus.core.jwt_valid = False
+            request.recordRetry()
+            return False
+
+        d.addCallback(cbresponse)
+        d.addErrback(cberror)
+        return d
+
+    def sendDelta(self, document, ops):
+        version = StateReportTracker.version + 1
+
+        request = PDServerRequest('/api/routers/{router_id}/states')
+        d = request.patch(*ops)
+        StateReportTracker.recordSent('delta', len(request.body))
+
+        def cbresponse(response):
+            if response.success:
+                StateReportTracker.acknowledge(document, version, False)
+                nexus.core.jwt_valid = True
+                return True
+            elif response.code in StateReportSender.REJECTED_CODES:
+                out.info('{} to {} returned code {}, sending full report'.format(
+                    request.method, request.url, response.code))
+                StateReportTracker.reject(unsupported=response.code in
+                        StateReportSender.UNSUPPORTED_CODES)
+                return self.sendFull(document)
+            else:
+                out.warn('{} to {} returned code {}'.format(request.method,
+                    request.url, response.code))
+                nexus.core.jwt_valid = False
+                request.recordRetry()
+                return False
+
+        def cberror(ignored):
+            out.warn('{} to {} failed'.format(request.method, request.url))
+            nexus.core.jwt_valid = False
+            request.recordRetry()
+            return False
+
+        d.addCallback(cbresponse)
+        d.addErrback(cberror)
+        return d
+
+
+class TelemetryUploader(object):
+    """
+    Send the telemetry store to the controller in compressed batches.
+
+    The end of the last row that the controller accepted is kept as a mark
+    in the store.  Rows after the mark come from the upload tier, or from a
+    coarser tier when the upload tier no longer goes back that far, so that
+    gaps from lost connectivity are filled in once the controller can be
+    reached again.  Batches are sent until the backlog is gone.
+    """
+    MARK = 'uploaded'
+
+    # Only one upload at a time, across all uploaders.
+    uploading = False
+
+    def __init__(self, store):
+        self.store = store
+
+    def selectTier(self, since):
+        """
+        Get the finest tier that is not finer than the upload resolution and
+        still has rows from the given time.
+        """
+        tiers = [t for t in self.store.tiers
+                 if t.resolution >= settings.TELEMETRY_UPLOAD_RESOLUTION]
+        if len(tiers) == 0:
+            tiers = self.store.tiers[-1:]
+
+        if since is not None:
+            for tier in tiers:
+                oldest = tier.oldest()
+                if oldest is not None and oldest <= since:
+                    return tier
+
+            # Even the coarsest tier does not go back that far.
+            return tiers[-1]
+
+        return tiers[0]
+
+    def prepareBatch(self):
+        """
+        Get the next batch, the new mark and whether there are more rows
+        after it.  Returns (None, None, False) if there is nothing to send.
+        """
+        since = self.store.getMark(TelemetryUploader.MARK)
+        tier = self.selectTier(since)
+
+        limit = settings.TELEMETRY_UPLOAD_MAX_ROWS
+        data = self.store.query(tier.resolution, since=since, limit=limit)
+        if len(data['time']) == 0:
+            return None, None, False
+
+        # Leave out series without any values and round off the rest, which
+        # helps the compression.
+        series = {}
+        for name, columns in six.iteritems(data['series']):
+            if not any(v is not None for v in columns['max']):
+                continue
+            series[name] = dict(
+                (key, [None if v is None else round(v, 3) for v in values])
+                for key, values in six.iteritems(columns))
+
+        batch = {
+            'resolution': tier.resolution,
+            'time': data['time'],
+            'series': series
+        }
+        end = data['time'][-1] + tier.resolution
+        return batch, end, len(data['time']) >= limit
+
+    def upload(self):
+        if TelemetryUploader.uploading:
+            return None
+
+        batch, end, more = self.prepareBatch()
+        if batch is None:
+            return None
+
+        TelemetryUploader.uploading = True
+
+        request = PDServerRequest('/api/routers/{router_id}/telemetry/batches',
+                compress=True)
+        d = request.post(**batch)
+
+        def cbresponse(response):
+            TelemetryUploader.uploading = False
+            if response.success:
+                self.store.setMark(TelemetryUploader.MARK, end)
+                if more:
+                    return self.upload()
+            else:
+                out.warn('{} to {} returned code {}'.format(request.method,
+                    request.url, response.code))
+
+        def cberror(ignored):
+            TelemetryUploader.uploading = False
+            out.warn('{} to {} failed'.format(request.method, request.url))
+
+        d.addCallback(cbresponse)
+        d.addErrback(cberror)
+        return d
+
+
+class NodeIdentitySender(object):
+    """
+    Send the node's public key.  Retries are left to the outbound queue.
+    """
     def send(self, report):
         request = PDServerRequest('/api/routers/{router_id}')
         d = request.patch(*report)
@@ -214,22 +539,21 @@ class NodeIdentitySender(ReportSender):
             if not response.success:
                 out.warn('{} to {} returned code {}'.format(request.method,
                     request.url, response.code))
-                if self.max_retries is None or self.retries < self.max_retries:
-                    reactor.callLater(self.retryDelay, self.send, report)
-                    self.retries += 1
-                    self.increaseDelay()
                 nexus.core.jwt_valid = False
+                if isPermanentFailure(response.code):
+                    return True
+                request.recordRetry()
+                return False
             else:
                 nexus.core.jwt_valid = True
+                return True
 
         # Check for connection failures and retry.
         def cberror(ignored):
             out.warn('{} to {} failed'.format(request.method, request.url))
-            if self.max_retries is None or self.retries < self.max_retries:
-                reactor.callLater(self.retryDelay, self.send, report)
-                self.retries += 1
-                self.increaseDelay()
             nexus.core.jwt_valid = False
+            request.recordRetry()
+            return False
 
         d.addCallback(cbresponse)
         d.addErrback(cberror)
@@ -244,16 +568,37 @@ def sendNodeIdentity():
     report = [
         {"op": "add", "path": "/ssh_public_key", "value": public_key}
     ]
-    sender = NodeIdentitySender()
-    return sender.send(report)
+    queue = getOutboundQueue()
+    queue.put('node_identity', report, key='node')
+    return queue.waitForDrain()
 
 
 def sendStateReport():
+    """
+    Queue a report of the current state, replacing one that has not been
+    sent yet.
+
+    Returns a Deferred that fires when the queue has tried to send it.
+    """
     builder = StateReportBuilder()
     report = builder.prepare()
 
-    sender = ReportSender()
-    return sender.send(report)
+    queue = getOutboundQueue()
+    queue.put('state_report', report, key='state')
+    return queue.waitForDrain()
+
+
+def deliverStateReports(reports):
+    # Coalescing leaves only the newest report.
+    return StateReportSender().send(reports[-1])
+
+
+def deliverNodeIdentity(reports):
+    return NodeIdentitySender().send(reports[-1])
+
+
+registerKind('state_report', deliverStateReports, coalesce=True)
+registerKind('node_identity', deliverNodeIdentity, coalesce=True)
 
 
 def sendTelemetryReport():
@@ -269,3 +614,12 @@ def sendTelemetryReport():
 
     sender = ReportSender(model="telemetry", max_retries=0)
     return sender.send(report)
+
+
+def sendTelemetryBatch():
+    # Rows stay in the store until they can be sent.
+    if not nexus.core.provisioned() or TelemetrySampler.store is None:
+        return None
+
+    uploader = TelemetryUploader(TelemetrySampler.store)
+    return uploader.upload()
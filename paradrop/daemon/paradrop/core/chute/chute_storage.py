@@ -6,6 +6,8 @@ from __future__ import print_function
 
 import sys
 
+import smokesignal
+
 from paradrop.base import settings
 from paradrop.lib.utils.pd_storage import PDStorage
 
@@ -20,6 +22,9 @@ class ChuteStorage(PDStorage):
         This class holds onto the list of Chutes on this AP.
 
         It implements the PDStorage class which allows us to save the chuteList to disk transparently
+
+        The smokesignal events "chute_saved" and "chute_deleted" are emitted
+        with the chute name whenever the list changes.
     """
     # Class variable of chute list so all instances see the same thing
     chuteList = dict()
@@ -53,10 +58,12 @@ class ChuteStorage(PDStorage):
     def deleteChute(self, ch):
         """Deletes a chute from the chute storage. Can be sent the chute object, or the chute name."""
         if (isinstance(ch, Chute)):
-            del ChuteStorage.chuteList[ch.name]
+            name = ch.name
         else:
-            del ChuteStorage.chuteList[ch]
+            name = ch
+        del ChuteStorage.chuteList[name]
         self.saveToDisk()
+        smokesignal.emit('chute_deleted', name)
 
     def saveChute(self, ch):
         """
@@ -73,10 +80,14 @@ class ChuteStorage(PDStorage):
             ChuteStorage.chuteList[ch.name] = ch
 
         self.saveToDisk()
+        smokesignal.emit('chute_saved', ch.name)
 
     def clearChuteStorage(self):
+        names = list(ChuteStorage.chuteList.keys())
         ChuteStorage.chuteList.clear()
         self.saveToDisk()
+        for name in names:
+            smokesignal.emit('chute_deleted', name)
 
     #
     # Functions we override to implement PDStorage Properly
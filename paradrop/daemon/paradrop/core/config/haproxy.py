@@ -9,7 +9,18 @@ from paradrop.core.chute.chute_storage import ChuteStorage
 from paradrop.core.container.chutecontainer import ChuteContainer
 
 
-def generateConfigSections():
+def generateConfigSections(backend_overrides=None):
+    """
+    Generate the haproxy configuration sections.
+
+    backend_overrides may map chute names to an "address:port" string to use
+    as the chute's backend server instead of the address of its running
+    container.  This is used to switch traffic to a replacement container
+    during a rolling update.
+    """
+    if backend_overrides is None:
+        backend_overrides = {}
+
     sections = []
 
     sections.append({
@@ -103,19 +114,21 @@ def generateConfigSections():
                 binding['HostPort'], chute.name))
 
         # Add a server at the chute's IP address.
+        address = backend_overrides.get(chute.name, None)
+        if address is None:
+            address = "{}:{}".format(container.getIP(), port)
         sections.append({
             "header": "backend {}".format(chute.name),
             "lines": [
-                "server {} {}:{} maxconn 256".format(chute.name,
-                    container.getIP(), port)
+                "server {} {} maxconn 256".format(chute.name, address)
             ]
         })
 
     return sections
 
 
-def writeConfigFile(output):
-    sections = generateConfigSections()
+def writeConfigFile(output, backend_overrides=None):
+    sections = generateConfigSections(backend_overrides)
     for section in sections:
         output.write(section['header'] + "\n")
         for line in section['lines']:
@@ -127,11 +140,21 @@ def reconfigureProxy(update):
     """
     Reconfigure haproxy with forwarding and redirect rules.
     """
+    reloadProxy()
+
+
+def reloadProxy(backend_overrides=None):
+    """
+    Write the haproxy configuration and start a new haproxy process.
+
+    The old process is told to finish serving its existing connections and
+    exit, so requests in flight are not interrupted.
+    """
     confFile = os.path.join(settings.RUNTIME_HOME_DIR, "haproxy.conf")
     pidFile = os.path.join(settings.TMP_DIR, "haproxy.pid")
 
     with open(confFile, "w") as output:
-        writeConfigFile(output)
+        writeConfigFile(output, backend_overrides)
 
     cmd = ["haproxy", "-f", confFile, "-p", pidFile]
 
@@ -15,6 +15,7 @@ settings.
 
 import ipaddress
 import jsonpatch
+import smokesignal
 import yaml
 
 from paradrop.base import settings
@@ -86,6 +87,8 @@ def save(config, path=None):
     with open(path, 'w') as output:
         output.write(yaml.safe_dump(config, default_flow_style=False))
 
+    smokesignal.emit('hostconfig_saved')
+
 
 def load(path=None):
     """
@@ -1,8 +1,21 @@
+from docker.utils import parse_bytes
+
 from paradrop.core.chute.chute_storage import ChuteStorage
 from paradrop.lib.misc import resopt
 
 
 def computeResourceAllocation(chutes):
+    """
+    Compute the resources assigned to each running service container.
+
+    CPU shares are divided among the services according to their
+    "cpu-fraction" requests.  The "memory", "pids", and "blkio-weight"
+    requests are passed through as limits if the service specifies them.
+    Memory may be given as a number of bytes or as a string such as "256m".
+
+    Returns a dictionary mapping container name to resource settings.
+    """
+    services = []
     service_names = []
     service_cpu_fractions = []
     allocation = {}
@@ -11,6 +24,7 @@ def computeResourceAllocation(chutes):
             continue
 
         for service in chute.get_services():
+            services.append(service)
             service_names.append(service.get_container_name())
 
             cpu_fraction = service.requests.get('cpu-fraction', None)
@@ -35,6 +49,14 @@ def computeResourceAllocation(chutes):
             'cpu_shares': cpu_shares
         }
 
+        requests = services[i].requests
+        if requests.get('memory', None) is not None:
+            allocation[name]['memory'] = parse_bytes(requests['memory'])
+        if requests.get('pids', None) is not None:
+            allocation[name]['pids'] = int(requests['pids'])
+        if requests.get('blkio-weight', None) is not None:
+            allocation[name]['blkio_weight'] = int(requests['blkio-weight'])
+
     return allocation
 
 
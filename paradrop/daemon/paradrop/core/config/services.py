@@ -1,28 +1,52 @@
 """
 Configure optional additional services such as telemetry.
 """
+from paradrop.base import settings
 from paradrop.core.agent import reporting
+from paradrop.core.system.telemetry import TelemetrySampler
 from paradrop.lib.utils import datastruct
 
 from twisted.internet.task import LoopingCall
 
 
 telemetry_looping_call = None
+telemetry_batch_looping_call = None
+telemetry_sampler = None
 
 
 def configure_telemetry(update):
     global telemetry_looping_call
+    global telemetry_batch_looping_call
+    global telemetry_sampler
 
     hostConfig = update.cache_get('hostConfig')
 
     enabled = datastruct.getValue(hostConfig, 'telemetry.enabled', False)
     interval = datastruct.getValue(hostConfig, 'telemetry.interval', 60)
 
-    # Cancel the old looping call.
+    # Cancel the old looping calls.
     if telemetry_looping_call is not None:
         telemetry_looping_call.stop()
         telemetry_looping_call = None
+    if telemetry_batch_looping_call is not None:
+        telemetry_batch_looping_call.stop()
+        telemetry_batch_looping_call = None
+
+    # The sampler fills the store that the batches are read from, so it only
+    # runs while telemetry is enabled.
+    if enabled and telemetry_sampler is None:
+        telemetry_sampler = TelemetrySampler()
+        telemetry_sampler.start()
+    elif not enabled and telemetry_sampler is not None:
+        telemetry_sampler.stop()
+        telemetry_sampler = None
 
     if enabled and interval > 0:
         telemetry_looping_call = LoopingCall(reporting.sendTelemetryReport)
         telemetry_looping_call.start(interval, now=False)
+
+    # The history from the telemetry store is sent in batches.
+    if enabled and settings.TELEMETRY_UPLOAD_INTERVAL > 0:
+        telemetry_batch_looping_call = LoopingCall(reporting.sendTelemetryBatch)
+        telemetry_batch_looping_call.start(settings.TELEMETRY_UPLOAD_INTERVAL,
+                now=False)
@@ -16,6 +16,7 @@ import subprocess
 import time
 
 import six
+import smokesignal
 
 from twisted.internet.threads import deferToThread
 
@@ -26,6 +27,8 @@ from paradrop.core.config.devices import resetWirelessDevice
 
 from .chutecontainer import ChuteContainer
 from .dockerfile import Dockerfile
+from .garbage_collector import ImageUsageStorage
+from . import resource_controller
 
 
 DOCKER_CONF = """
@@ -175,6 +178,7 @@ def remove_image(update, service):
         client = docker.DockerClient(base_url="unix://var/run/docker.sock",
                 version='auto')
         client.images.remove(image=image_name)
+        ImageUsageStorage().forget(image_name)
     except Exception as error:
         out.warn("Error removing image: {}".format(error))
 
@@ -225,6 +229,9 @@ def start_container(update, service):
     except Exception as e:
         raise e
 
+    ImageUsageStorage().record_use(service)
+    smokesignal.emit('container_state_changed', container_name)
+
     try:
         network = client.networks.get(update.new.name)
         network.connect(container_name, aliases=[service.name])
@@ -252,6 +259,8 @@ def remove_container(update, service):
     except Exception as error:
         out.warn("Error removing container: {}".format(error))
 
+    smokesignal.emit('container_state_changed', container_name)
+
 
 def _build_image(update, service, client, inline, **buildArgs):
     """
@@ -354,6 +363,7 @@ def stopChute(update):
     c = docker.DockerClient(base_url='unix://var/run/docker.sock', version='auto')
     container = c.containers.get(update.name)
     container.stop()
+    smokesignal.emit('container_state_changed', update.name)
 
 
 def restartChute(update):
@@ -368,6 +378,7 @@ def restartChute(update):
     c = docker.DockerClient(base_url='unix://var/run/docker.sock', version='auto')
     container = c.containers.get(update.name)
     container.start()
+    smokesignal.emit('container_state_changed', update.name)
 
 
 def getBridgeGateway():
@@ -718,44 +729,26 @@ def prepare_environment(update, service):
     return env
 
 
-def _setResourceAllocation(allocation):
-    client = docker.DockerClient(base_url="unix://var/run/docker.sock", version='auto')
-    for container_name, resources in six.iteritems(allocation):
-        out.info("Update chute {} set cpu_shares={}\n".format(
-            container_name, resources['cpu_shares']))
-        container = client.containers.get(container_name)
-        container.update(cpu_shares=resources['cpu_shares'])
-
-        # Using class id 1:1 for prioritized, 1:3 for best effort.
-        # Prioritization is implemented in confd/qos.py.  Class-ID is
-        # represented in hexadecimal.
-        # Reference: https://www.kernel.org/doc/Documentation/cgroup-v1/net_cls.txt
-        if resources.get('prioritize_traffic', False):
-            classid = "0x10001"
-        else:
-            classid = "0x10003"
-
-        container = ChuteContainer(container_name)
-        try:
-            container_id = container.getID()
-            fname = "/sys/fs/cgroup/net_cls/docker/{}/net_cls.classid".format(container_id)
-            with open(fname, "w") as output:
-                output.write(classid)
-        except Exception as error:
-            out.warn("Error setting traffic class: {}\n".format(error))
-
-
 def setResourceAllocation(update):
     """
     Adjust compute resources assigned to chute containers.
+
+    The changes are applied to the running containers in place.  The
+    settings that were changed, with their values before and after, are
+    saved in the update cache as "resourceAllocationChanges".
     """
     allocation = update.cache_get('newResourceAllocation')
-    _setResourceAllocation(allocation)
+    changes = resource_controller.apply_allocation(allocation)
+    update.cache_set('resourceAllocationChanges', changes)
+
+    for container_name, change in six.iteritems(changes):
+        update.progress("Changed resources of {} from {} to {}".format(
+            container_name, change['before'], change['after']))
 
 
 def revertResourceAllocation(update):
     allocation = update.cache_get('oldResourceAllocation')
-    _setResourceAllocation(allocation)
+    resource_controller.apply_allocation(allocation)
 
 
 def removeAllContainers(update):
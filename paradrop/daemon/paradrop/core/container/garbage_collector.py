@@ -0,0 +1,322 @@
+"""
+Reclaim disk space used by old chute images and stale chute data.
+
+Images from every chute version that has been installed, dangling build
+layers, and data directories of chutes that are no longer installed slowly
+fill the data partition.  The garbage collector records when each chute image
+was last used so that, once disk usage crosses a high-water mark, it can
+remove the least recently used images while keeping the current and previous
+version of every installed chute available for rollback.
+"""
+
+import os
+import shutil
+import time
+
+import docker
+import psutil
+import six
+
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.core.chute.chute_storage import ChuteStorage
+from paradrop.lib.utils.pd_storage import PDStorage
+
+
+# Only Docker volumes with this label are pruned, so that volumes that do not
+# belong to Paradrop are left alone.  Chute data itself lives in
+# bind-mounted directories, which remove_orphaned_volumes takes care of.
+VOLUME_LABEL = "paradrop.chute"
+
+
+class ImageUsageStorage(PDStorage):
+    """
+    Persistent record of the chute images that have been used on this node.
+
+    The records map image name to a dictionary with the chute name, service
+    name, chute version, and the last time a container was started from the
+    image.
+    """
+    # Class variable so that all instances see the same records.
+    usage = dict()
+
+    def __init__(self, filename=None):
+        if filename is None:
+            filename = settings.GC_IMAGE_USAGE_FILE
+
+        PDStorage.__init__(self, filename, 0)
+
+        if len(ImageUsageStorage.usage) == 0:
+            self.loadFromDisk()
+
+    def setAttr(self, attr):
+        ImageUsageStorage.usage = attr
+
+    def getAttr(self):
+        return ImageUsageStorage.usage
+
+    def attrSaveable(self):
+        return isinstance(ImageUsageStorage.usage, dict)
+
+    def record_use(self, service):
+        """
+        Record that a container was started from the service's image.
+        """
+        chute = service.get_chute()
+        ImageUsageStorage.usage[service.get_image_name()] = {
+            'chute': chute.name,
+            'service': service.name,
+            'version': chute.version,
+            'last_used': time.time()
+        }
+        self.saveToDisk()
+
+    def forget(self, image_name):
+        """
+        Remove the record for an image that no longer exists.
+        """
+        if ImageUsageStorage.usage.pop(image_name, None) is not None:
+            self.saveToDisk()
+
+
+def get_protected_images(chutes, usage, busy=()):
+    """
+    Find the images that must not be removed.
+
+    These are the images used by the installed version of each chute service
+    and the most recently used image from an older version of the same
+    service, which we keep so that the chute can be rolled back.  All images
+    of chutes named in busy, which have updates in progress, are kept too.
+
+    Returns a set of image names.
+    """
+    protected = set()
+    for image_name, record in six.iteritems(usage):
+        if record['chute'] in busy:
+            protected.add(image_name)
+
+    installed = set()
+    for chute in chutes:
+        installed.add(chute.name)
+        for service in chute.get_services():
+            protected.add(service.get_image_name())
+
+    previous = {}
+    for image_name, record in six.iteritems(usage):
+        if image_name in protected or record['chute'] not in installed:
+            continue
+
+        key = (record['chute'], record['service'])
+        if key not in previous or record['last_used'] > previous[key][1]:
+            previous[key] = (image_name, record['last_used'])
+
+    protected.update(image_name for image_name, _ in previous.values())
+    return protected
+
+
+def get_eviction_candidates(chutes, usage, busy=()):
+    """
+    List the images that may be removed, least recently used first.
+    """
+    protected = get_protected_images(chutes, usage, busy)
+    candidates = [(record['last_used'], image_name) for image_name, record
+                  in six.iteritems(usage) if image_name not in protected]
+    candidates.sort()
+    return [image_name for _, image_name in candidates]
+
+
+def get_directory_size(path):
+    """
+    Compute the total size in bytes of the files under a directory.
+    """
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            try:
+                total += os.lstat(os.path.join(root, fname)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class GarbageCollector(object):
+    """
+    Periodically check disk usage and reclaim space when it runs low.
+
+    Collection runs in a worker thread and is skipped while updates are in
+    progress, because an update may be building an image or preparing the
+    data directory of a chute that has not been saved yet.  Updates may
+    start while a collection is running, so the collector checks again
+    before removing anything and leaves the images and data of those chutes
+    alone.
+    """
+    # Class variable so that the telemetry report can read the statistics
+    # without a reference to the running collector.
+    statistics = {
+        'reclaimed_bytes': 0,
+        'images_removed': 0,
+        'volumes_removed': 0,
+        'last_run': None,
+        'last_reclaimed_bytes': 0
+    }
+
+    def __init__(self, update_manager=None):
+        self.update_manager = update_manager
+        self.looping_call = None
+
+    def start(self):
+        if settings.GC_INTERVAL > 0:
+            self.looping_call = LoopingCall(self.run)
+            self.looping_call.start(settings.GC_INTERVAL, now=False)
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+
+    def get_busy_chutes(self):
+        """
+        Get the names of chutes with updates that are running or queued.
+
+        Returns None if no updates are in progress.
+        """
+        if self.update_manager is None:
+            return None
+
+        with self.update_manager.updateLock:
+            updates = list(self.update_manager.updateQueue)
+        updates.extend(list(self.update_manager.active_changes.values()))
+
+        if len(updates) == 0:
+            return None
+        return set(getattr(update, 'name', None) for update in updates)
+
+    def run(self):
+        """
+        Start a collection in a worker thread unless updates are in progress.
+        """
+        if self.get_busy_chutes() is not None:
+            return None
+
+        return deferToThread(self.collect)
+
+    def get_disk_usage(self):
+        """
+        Get the fraction of the data partition that is in use.
+        """
+        return psutil.disk_usage(settings.HOST_DATA_PARTITION).percent / 100.0
+
+    def collect(self, force=False):
+        """
+        Reclaim disk space if usage is above the high-water mark.
+
+        Dangling image layers, unused Docker volumes, and data directories of
+        chutes that are no longer installed go first.  Chute images are then
+        removed in least recently used order until usage falls below the
+        low-water mark.
+
+        Returns the number of bytes reclaimed.
+        """
+        if not force and self.get_disk_usage() < settings.GC_HIGH_WATER_MARK:
+            return 0
+
+        out.info("Disk usage above {:.0%}, collecting garbage\n".format(
+            settings.GC_HIGH_WATER_MARK))
+
+        reclaimed = 0
+        try:
+            client = docker.DockerClient(base_url="unix://var/run/docker.sock",
+                    version='auto')
+
+            result = client.images.prune(filters={'dangling': True})
+            reclaimed += result.get('SpaceReclaimed') or 0
+
+            result = client.volumes.prune(filters={'label': VOLUME_LABEL})
+            reclaimed += result.get('SpaceReclaimed') or 0
+
+            reclaimed += self.remove_orphaned_volumes()
+
+            chutes = ChuteStorage().getChuteList()
+            storage = ImageUsageStorage()
+            busy = self.get_busy_chutes() or ()
+            for image_name in get_eviction_candidates(chutes, storage.getAttr(), busy):
+                if self.get_disk_usage() < settings.GC_LOW_WATER_MARK:
+                    break
+
+                # An update that started since may need the image.
+                busy = self.get_busy_chutes()
+                record = storage.getAttr().get(image_name, {})
+                if busy is not None and record.get('chute') in busy:
+                    continue
+
+                reclaimed += self.remove_image(client, storage, image_name)
+        except Exception as error:
+            out.warn("Error collecting garbage: {}\n".format(error))
+
+        stats = GarbageCollector.statistics
+        stats['reclaimed_bytes'] += reclaimed
+        stats['last_reclaimed_bytes'] = reclaimed
+        stats['last_run'] = time.time()
+
+        out.info("Garbage collection reclaimed {} bytes\n".format(reclaimed))
+        return reclaimed
+
+    def remove_image(self, client, storage, image_name):
+        """
+        Remove an image and return its size in bytes.
+        """
+        try:
+            image = client.images.get(image_name)
+            size = image.attrs.get('Size', 0)
+            client.images.remove(image=image_name)
+        except docker.errors.ImageNotFound:
+            storage.forget(image_name)
+            return 0
+        except Exception as error:
+            # Most likely the image is still used by a container.
+            out.warn("Error removing image {}: {}\n".format(image_name, error))
+            return 0
+
+        out.info("Removed image {}\n".format(image_name))
+        storage.forget(image_name)
+        GarbageCollector.statistics['images_removed'] += 1
+        return size
+
+    def remove_orphaned_volumes(self):
+        """
+        Remove data directories of chutes that are no longer installed.
+
+        Returns the number of bytes reclaimed.
+        """
+        parent = os.path.normpath(settings.EXTERNAL_DATA_DIR.format(chute=""))
+        if not os.path.isdir(parent):
+            return 0
+
+        installed = set(chute.name for chute in ChuteStorage().getChuteList())
+
+        reclaimed = 0
+        for name in os.listdir(parent):
+            path = os.path.join(parent, name)
+            if name in installed or not os.path.isdir(path):
+                continue
+
+            # A chute that is being installed is not in storage yet.
+            busy = self.get_busy_chutes()
+            if busy is not None and name in busy:
+                continue
+
+            size = get_directory_size(path)
+            try:
+                shutil.rmtree(path)
+            except Exception as error:
+                out.warn("Error removing {}: {}\n".format(path, error))
+                continue
+
+            out.info("Removed orphaned chute data {}\n".format(path))
+            GarbageCollector.statistics['volumes_removed'] += 1
+            reclaimed += size
+
+        return reclaimed
@@ -0,0 +1,291 @@
+"""
+Sample resource usage of chute containers.
+
+The sampler reads the cgroup accounting files (cpu, memory, pids, blkio) and
+the network counters of every running chute container in one pass and keeps
+the samples in a fixed-size ring buffer per container.  A single Docker call
+lists the containers; everything else comes from the filesystem, so
+sampling is much cheaper than inspecting each container and walking its
+processes.
+"""
+
+import collections
+import os
+import time
+
+import docker
+import smokesignal
+
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.core.chute.chute_storage import ChuteStorage
+
+from .resource_controller import find_cgroup_dir
+
+
+def read_int_file(path):
+    """
+    Read a file containing a single integer.
+
+    Returns None if the file does not exist or does not contain a number,
+    e.g. "max" in cgroup v2 limit files.
+    """
+    try:
+        with open(path, "r") as source:
+            return int(source.read().strip())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def read_keyed_file(path):
+    """
+    Read a file with "key value" lines, such as cpu.stat.
+    """
+    values = {}
+    try:
+        with open(path, "r") as source:
+            for line in source:
+                parts = line.split()
+                if len(parts) == 2:
+                    values[parts[0]] = int(parts[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return values
+
+
+def read_blkio_bytes(cgroup_dir, unified):
+    """
+    Read the total bytes read and written by a container.
+
+    Returns a tuple (read_bytes, write_bytes).
+    """
+    read_bytes = 0
+    write_bytes = 0
+
+    try:
+        if unified:
+            # Lines look like "8:0 rbytes=1 wbytes=2 rios=3 wios=4 ...".
+            with open(os.path.join(cgroup_dir, "io.stat"), "r") as source:
+                for line in source:
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key == "rbytes":
+                            read_bytes += int(value)
+                        elif key == "wbytes":
+                            write_bytes += int(value)
+        else:
+            # Lines look like "8:0 Read 1234".
+            path = os.path.join(cgroup_dir, "blkio.throttle.io_service_bytes")
+            with open(path, "r") as source:
+                for line in source:
+                    parts = line.split()
+                    if len(parts) != 3:
+                        continue
+                    if parts[1] == "Read":
+                        read_bytes += int(parts[2])
+                    elif parts[1] == "Write":
+                        write_bytes += int(parts[2])
+    except (IOError, OSError, ValueError):
+        pass
+
+    return (read_bytes, write_bytes)
+
+
+def read_network_counters(pid):
+    """
+    Read the interface counters in the network namespace of a process.
+
+    These are the counters of the container side of the veth pair and any
+    other interfaces that were moved into the container.
+    """
+    interfaces = {}
+    try:
+        with open("/proc/{}/net/dev".format(pid), "r") as source:
+            # Skip the two header lines.
+            for line in source.readlines()[2:]:
+                name, _, data = line.partition(":")
+                name = name.strip()
+                fields = data.split()
+                if name == "lo" or len(fields) < 16:
+                    continue
+                interfaces[name] = {
+                    'bytes_recv': int(fields[0]),
+                    'packets_recv': int(fields[1]),
+                    'bytes_sent': int(fields[8]),
+                    'packets_sent': int(fields[9])
+                }
+    except (IOError, OSError, ValueError):
+        pass
+    return interfaces
+
+
+def get_first_pid(cgroup_dir):
+    try:
+        with open(os.path.join(cgroup_dir, "cgroup.procs"), "r") as source:
+            for line in source:
+                return int(line)
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def read_container_sample(container_id):
+    """
+    Read the current resource usage of a container from its cgroup files.
+    """
+    sample = {
+        'time': time.time()
+    }
+
+    cpu_dir = find_cgroup_dir("cpuacct", container_id)
+    unified = cpu_dir is not None and \
+        not os.path.exists(os.path.join(cpu_dir, "cpuacct.usage"))
+
+    if unified:
+        memory_dir = pids_dir = blkio_dir = cpu_dir
+        usage_usec = read_keyed_file(os.path.join(cpu_dir, "cpu.stat")).get("usage_usec", None)
+        sample['cpu_usage_ns'] = None if usage_usec is None else usage_usec * 1000
+        sample['memory_usage'] = read_int_file(os.path.join(memory_dir, "memory.current"))
+        sample['memory_limit'] = read_int_file(os.path.join(memory_dir, "memory.max"))
+    else:
+        memory_dir = find_cgroup_dir("memory", container_id)
+        pids_dir = find_cgroup_dir("pids", container_id)
+        blkio_dir = find_cgroup_dir("blkio", container_id)
+        sample['cpu_usage_ns'] = None if cpu_dir is None else \
+            read_int_file(os.path.join(cpu_dir, "cpuacct.usage"))
+        if memory_dir is not None:
+            sample['memory_usage'] = read_int_file(os.path.join(memory_dir, "memory.usage_in_bytes"))
+            sample['memory_limit'] = read_int_file(os.path.join(memory_dir, "memory.limit_in_bytes"))
+
+    if pids_dir is not None:
+        sample['pids'] = read_int_file(os.path.join(pids_dir, "pids.current"))
+
+    if blkio_dir is not None:
+        read_bytes, write_bytes = read_blkio_bytes(blkio_dir, unified)
+        sample['blkio_read_bytes'] = read_bytes
+        sample['blkio_write_bytes'] = write_bytes
+
+    pid = None
+    if memory_dir is not None:
+        pid = get_first_pid(memory_dir)
+    sample['network'] = {} if pid is None else read_network_counters(pid)
+
+    return sample
+
+
+class ContainerMetricsSampler(object):
+    """
+    Periodically sample resource usage of all chute containers.
+
+    The ring buffers are stored in a class variable so that the HTTP API and
+    the telemetry report can read them without a reference to the running
+    sampler.
+    """
+    buffers = dict()
+
+    def __init__(self):
+        self.looping_call = None
+
+    def start(self):
+        if settings.CONTAINER_METRICS_INTERVAL > 0:
+            self.looping_call = LoopingCall(self.run)
+            self.looping_call.start(settings.CONTAINER_METRICS_INTERVAL)
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+
+    def run(self):
+        return deferToThread(self.sample)
+
+    def sample(self):
+        """
+        Take one sample of every chute container.
+
+        Only the state is recorded for containers that are not running.
+        """
+        names = set()
+        for chute in ChuteStorage().getChuteList():
+            for service in chute.get_services():
+                names.add(service.get_container_name())
+
+        try:
+            client = docker.APIClient(base_url="unix://var/run/docker.sock",
+                    version='auto')
+            containers = client.containers(all=True)
+        except Exception as error:
+            out.warn("Error listing containers: {}\n".format(error))
+            return
+
+        seen = set()
+        for info in containers:
+            # Docker reports names with a leading slash.
+            name = info['Names'][0].lstrip('/')
+            if name not in names:
+                continue
+
+            state = info.get('State', None)
+            if state == 'running':
+                sample = read_container_sample(info['Id'])
+            else:
+                sample = {'time': time.time()}
+            sample['state'] = state
+
+            # Containers can also stop on their own, e.g. when the main
+            # process exits.
+            latest = ContainerMetricsSampler.get_latest(name)
+            if latest is not None and latest.get('state') != state:
+                smokesignal.emit('container_state_changed', name)
+
+            self.add_sample(name, sample)
+            seen.add(name)
+
+        # Drop the buffers of containers that no longer exist.
+        for name in list(ContainerMetricsSampler.buffers.keys()):
+            if name not in seen:
+                del ContainerMetricsSampler.buffers[name]
+
+    def add_sample(self, name, sample):
+        """
+        Add a sample to the container's ring buffer.
+
+        Computes the CPU utilization since the previous sample as a percentage
+        of one core.
+        """
+        buf = ContainerMetricsSampler.buffers.get(name, None)
+        if buf is None:
+            buf = collections.deque(maxlen=settings.CONTAINER_METRICS_BUFFER_SIZE)
+            ContainerMetricsSampler.buffers[name] = buf
+
+        sample['cpu_percent'] = None
+        if len(buf) > 0:
+            prev = buf[-1]
+            elapsed = sample['time'] - prev['time']
+            if elapsed > 0 and sample.get('cpu_usage_ns') is not None and \
+                    prev.get('cpu_usage_ns') is not None:
+                used = sample['cpu_usage_ns'] - prev['cpu_usage_ns']
+                sample['cpu_percent'] = 100.0 * used / (elapsed * 1e9)
+
+        buf.append(sample)
+
+    @classmethod
+    def get_samples(cls, name):
+        """
+        Get the buffered samples for a container, oldest first.
+        """
+        return list(cls.buffers.get(name, []))
+
+    @classmethod
+    def get_latest(cls, name):
+        """
+        Get the most recent sample for a container or None.
+        """
+        buf = cls.buffers.get(name, None)
+        if buf:
+            return buf[-1]
+        else:
+            return None
@@ -0,0 +1,198 @@
+"""
+Apply resource allocations to running containers.
+
+Changes are made in place through the Docker update API and, for settings
+that the API does not expose, by writing the container's cgroup files, so
+that reallocation does not require restarting any containers.
+
+A setting that is missing from an allocation is reset to Docker's default,
+so that a limit is lifted when a chute no longer requests it.
+"""
+
+import os
+
+import docker
+import six
+
+from paradrop.base.output import out
+
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# Map allocation keys to the Docker update parameter, the field of the
+# container's HostConfig that reports the current value and the value that
+# applies when nothing is set (-1 meaning unlimited).
+DOCKER_RESOURCES = [
+    ('cpu_shares', 'cpu_shares', 'CpuShares', 1024),
+    ('memory', 'mem_limit', 'Memory', -1),
+    ('blkio_weight', 'blkio_weight', 'BlkioWeight', 500)
+]
+
+
+def effective_value(value, default):
+    """
+    Get the value that is in effect for a setting, where None or a value of
+    zero or less means the default.
+    """
+    if value is None or value <= 0:
+        return default
+    return value
+
+
+def find_cgroup_dir(controller, container_id):
+    """
+    Find the cgroup directory of a container for a given controller.
+
+    Handles the cgroup v1 layout, where each controller has its own
+    hierarchy, and the unified cgroup v2 layout with either the cgroupfs or
+    the systemd cgroup driver.  Returns None if the directory was not found.
+    """
+    candidates = [
+        os.path.join(CGROUP_ROOT, controller, "docker", container_id),
+        os.path.join(CGROUP_ROOT, "system.slice",
+                     "docker-{}.scope".format(container_id)),
+        os.path.join(CGROUP_ROOT, "docker", container_id)
+    ]
+    for path in candidates:
+        if os.path.isdir(path):
+            return path
+    return None
+
+
+def write_cgroup_file(controller, container_id, fname, value):
+    path = find_cgroup_dir(controller, container_id)
+    if path is None:
+        raise Exception("cgroup {} not found for container {}".format(
+            controller, container_id))
+
+    with open(os.path.join(path, fname), "w") as output:
+        output.write(str(value))
+
+
+def read_cgroup_file(controller, container_id, fname):
+    path = find_cgroup_dir(controller, container_id)
+    if path is None:
+        raise Exception("cgroup {} not found for container {}".format(
+            controller, container_id))
+
+    with open(os.path.join(path, fname), "r") as source:
+        return source.read().strip()
+
+
+def get_pids_limit(container):
+    """
+    Read the pids limit of a container.
+
+    The limit is written to the cgroup directly, so the HostConfig only
+    reports the value the container was created with.  Returns None if the
+    container has no limit.
+    """
+    try:
+        value = read_cgroup_file("pids", container.id, "pids.max")
+    except Exception:
+        host_config = container.attrs.get('HostConfig', {})
+        value = host_config.get('PidsLimit', None)
+        if value is not None and value <= 0:
+            value = None
+        return value
+
+    if value == "max":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def get_current_allocation(container):
+    """
+    Read the resources currently assigned to a container.
+    """
+    host_config = container.attrs.get('HostConfig', {})
+
+    current = {}
+    for key, _, field, default in DOCKER_RESOURCES:
+        value = host_config.get(field, None)
+        if effective_value(value, default) == default:
+            value = None
+        current[key] = value
+
+    current['pids'] = get_pids_limit(container)
+    return current
+
+
+def apply_allocation(allocation):
+    """
+    Update the resources of running containers to match an allocation.
+
+    Only settings that differ from the container's current configuration are
+    changed.  Settings that are missing from the allocation are reset to the
+    default, which is recorded as None.  Returns a dictionary that maps
+    container name to the "before" and "after" values of the settings that
+    were changed.
+    """
+    client = docker.DockerClient(base_url="unix://var/run/docker.sock", version='auto')
+
+    changes = {}
+    for container_name, resources in six.iteritems(allocation):
+        try:
+            container = client.containers.get(container_name)
+        except docker.errors.NotFound:
+            continue
+
+        current = get_current_allocation(container)
+
+        before = {}
+        after = {}
+        params = {}
+        for key, param, _, default in DOCKER_RESOURCES:
+            value = resources.get(key, None)
+            target = effective_value(value, default)
+            if target != effective_value(current[key], default):
+                params[param] = target
+                before[key] = current[key]
+                after[key] = value
+
+        # Chutes do not get swap beyond their memory limit.  memory+swap is
+        # set together with memory because the kernel requires that it is
+        # never below the memory limit.
+        if 'mem_limit' in params:
+            params['memswap_limit'] = params['mem_limit']
+
+        if len(params) > 0:
+            out.info("Update container {} set {}\n".format(container_name, params))
+            container.update(**params)
+
+        # Docker does not support changing the pids limit of a running
+        # container, so we write it to the cgroup directly.
+        pids = resources.get('pids', None)
+        if pids != current['pids']:
+            try:
+                write_cgroup_file("pids", container.id, "pids.max",
+                        "max" if pids is None else pids)
+                before['pids'] = current['pids']
+                after['pids'] = pids
+            except Exception as error:
+                out.warn("Error setting pids limit: {}\n".format(error))
+
+        # Using class id 1:1 for prioritized, 1:3 for best effort.
+        # Prioritization is implemented in confd/qos.py.  Class-ID is
+        # represented in hexadecimal.
+        # Reference: https://www.kernel.org/doc/Documentation/cgroup-v1/net_cls.txt
+        if resources.get('prioritize_traffic', False):
+            classid = "0x10001"
+        else:
+            classid = "0x10003"
+
+        try:
+            write_cgroup_file("net_cls", container.id, "net_cls.classid", classid)
+        except Exception as error:
+            out.warn("Error setting traffic class: {}\n".format(error))
+
+        if len(after) > 0:
+            changes[container_name] = {
+                'before': before,
+                'after': after
+            }
+
+    return changes
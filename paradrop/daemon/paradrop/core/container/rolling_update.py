@@ -0,0 +1,168 @@
+"""
+Replace the web service of a chute without interrupting traffic.
+
+With the default update strategy, the old container is stopped before the
+new one is started, so the chute is unreachable through haproxy while the new
+container starts and the application warms up.  Chutes that set
+"update_strategy: rolling" in their web configuration are instead updated by
+starting the new container alongside the old one, waiting until it responds
+on the web port, pointing the haproxy backend at it, and only then stopping
+the old container.
+"""
+
+import time
+
+import docker
+import requests
+import six
+import smokesignal
+
+from paradrop.base.output import out
+from paradrop.base import settings
+from paradrop.core.config import haproxy
+
+from . import dockerapi
+from .garbage_collector import ImageUsageStorage
+
+
+def use_rolling_update(update):
+    """
+    Check whether the chute's web service should be updated in place.
+
+    Rolling updates require that the same service provides the web port in
+    both versions and that the service does not bind fixed host ports, which
+    the old and new containers could not hold at the same time.
+    """
+    if update.updateType != "update" or update.old is None:
+        return False
+
+    if not (update.old.isRunning() and update.new.isRunning()):
+        return False
+
+    if update.new.web.get("update_strategy", "recreate") != "rolling":
+        return False
+
+    port, service = update.new.get_web_port_and_service()
+    old_port, old_service = update.old.get_web_port_and_service()
+    if service is None or old_service is None or service.name != old_service.name:
+        return False
+
+    if service.requests.get('network-mode', 'bridge') == 'host':
+        return False
+
+    if len(service.requests.get('port-bindings', {})) > 0:
+        return False
+
+    return True
+
+
+def get_staging_name(service):
+    """
+    Get the name used for the new container while the old one is running.
+    """
+    return "{}.next".format(service.get_container_name())
+
+
+def wait_until_ready(address, port, timeout=None):
+    """
+    Poll the web port until the server responds or the timeout expires.
+
+    Any response other than a server error counts as ready.
+    """
+    if timeout is None:
+        timeout = settings.ROLLING_UPDATE_READY_TIMEOUT
+
+    url = "http://{}:{}/".format(address, port)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            response = requests.get(url, timeout=1, allow_redirects=False)
+            if response.status_code < 500:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+
+    return False
+
+
+def _remove_container(client, name):
+    try:
+        container = client.containers.get(name)
+        container.remove(force=True)
+    except docker.errors.NotFound:
+        pass
+
+
+def _start_staging_container(update, service, client):
+    """
+    Start the new version of the service under a temporary name.
+
+    Host port bindings are left for Docker to assign because the old
+    container still holds the inherited ones.
+    """
+    staging_name = get_staging_name(service)
+    _remove_container(client, staging_name)
+
+    host_config = dockerapi.build_host_config(update, service)
+    if host_config.get('ports'):
+        host_config['ports'] = dict((key, None) for key in
+                six.iterkeys(host_config['ports']))
+
+    environment = dockerapi.prepare_environment(update, service)
+
+    container = client.containers.run(detach=True,
+            image=service.get_image_name(), name=staging_name,
+            environment=environment, **host_config)
+
+    try:
+        network = client.networks.get(update.new.name)
+        network.connect(staging_name, aliases=[service.name])
+    except docker.errors.NotFound:
+        out.warn("Bridge network {} not found; connectivity between containers is limited.".format(update.new.name))
+
+    container.reload()
+    return container
+
+
+def replace_container(update, service):
+    """
+    Replace the running web service container with a new version.
+
+    If the new container fails to start or does not become ready in time, the
+    old container is stopped and the new one is started in its place, which
+    is the behavior of the default update strategy.
+    """
+    client = docker.DockerClient(base_url="unix://var/run/docker.sock",
+            version='auto')
+
+    container_name = service.get_container_name()
+    port, _ = update.new.get_web_port_and_service()
+
+    try:
+        staging = _start_staging_container(update, service, client)
+        address = staging.attrs['NetworkSettings']['IPAddress']
+        ready = wait_until_ready(address, port)
+    except Exception as error:
+        out.warn("Error starting {}: {}\n".format(get_staging_name(service), error))
+        ready = False
+
+    if not ready:
+        update.progress("{} did not become ready, stopping the old version "
+                        "before starting the new one".format(container_name))
+        _remove_container(client, get_staging_name(service))
+        dockerapi.remove_container(update, service)
+        dockerapi.start_container(update, service)
+        return
+
+    # Point haproxy at the new container.  The old haproxy process finishes
+    # serving its existing connections, which we give some time to drain
+    # before stopping the old container.
+    update.progress("Switching {} traffic to the new version".format(container_name))
+    haproxy.reloadProxy({update.new.name: "{}:{}".format(address, port)})
+    time.sleep(settings.ROLLING_UPDATE_DRAIN_TIME)
+
+    dockerapi.remove_container(update, service)
+    staging.rename(container_name)
+    ImageUsageStorage().record_use(service)
+    smokesignal.emit('container_state_changed', container_name)
@@ -77,7 +77,7 @@ def executePlans(update):
 
         # We are in a try-except block so if func isn't callable that will catch it
         try:
-            out.verbose('Calling %s\n' % (func))
+            out.verbose('Calling %s\n', func)
             update.progress("Calling {}".format(func.__name__))
             #
             # Call the function from the execution plan
@@ -102,7 +102,7 @@ def executePlans(update):
             # If the function returned a Deferred, we will drop out of the
             # execution pipeline and resume later.
             if isinstance(skipme, Deferred):
-                out.verbose('Function {} returned a Deferred'.format(func))
+                out.verbose('Function %s returned a Deferred', func)
                 return skipme
 
             # These functions can return individual functions to skip, or a
@@ -142,7 +142,7 @@ def abortPlans(update):
 
         # We are in a try-except block so if func isn't callable that will catch it
         try:
-            out.verbose('Calling {}\n'.format(func))
+            out.verbose('Calling %s\n', func)
             update.progress('Calling {}'.format(func.__name__))
 
             func(*((update, ) + args))
@@ -24,7 +24,7 @@ CONFIG_CHANGING_TYPES = set([
 
 
 def generatePlans(update):
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     # Detect system devices and set up basic configuration for them (WAN
     # interface, wireless devices).  These steps do not need to be reverted on
@@ -17,7 +17,7 @@ def generatePlans(update):
     Returns:
         True: abort the plan generation process
     """
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     update.plans.addPlans(plangraph.ENFORCE_ACCESS_RIGHTS,
                           (security.enforce_access_rights, ))
@@ -88,7 +88,7 @@ STATE_NET_STOP                  = 84
 STATE_CREATE_BRIDGE             = 85
 STATE_CALL_STOP                 = 86
 STATE_CALL_START                = 87
-STATE_CALL_FREEZE               = 88
+STATE_CALL_REPLACE              = 88
 STATE_CALL_CLEANUP              = 89
 STATE_FILES_START               = 90
 STATE_NET_START                 = 91
@@ -16,7 +16,7 @@ def generatePlans(update):
         Returns:
             True: abort the plan generation process
     """
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     update.plans.addPlans(plangraph.RESOURCE_GET_ALLOCATION,
             (resource.getResourceAllocation,))
@@ -15,7 +15,7 @@ from . import plangraph
 
 
 def generatePlans(update):
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     if update.updateType == "factoryreset":
         update.plans.addPlans(plangraph.STATE_CALL_STOP,
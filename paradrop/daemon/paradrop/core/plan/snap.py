@@ -13,7 +13,7 @@ from . import plangraph
 
 
 def generatePlans(update):
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     update.plans.addPlans(plangraph.SNAP_INSTALL,
                           (snap.updateSnap, ))
@@ -6,7 +6,7 @@
 from paradrop.base.output import out
 from paradrop.core.chute.chute import Chute
 from paradrop.core.config import state
-from paradrop.core.container import dockerapi
+from paradrop.core.container import dockerapi, rolling_update
 
 from . import plangraph
 
@@ -59,7 +59,7 @@ def generatePlans(update):
         Returns:
             True: abort the plan generation process
     """
-    out.verbose("%r\n" % (update))
+    out.verbose("%r\n", update)
 
     # Check for some error conditions that we can detect during the planning
     # stage, e.g. starting a chute that does not exist.
@@ -102,6 +102,18 @@ def generate_service_plans(update):
 
     This needs to happen after the chute configuration has been parsed.
     """
+    # With the rolling update strategy, the web service is replaced after
+    # the other services have been restarted instead of being stopped and
+    # started like the others.
+    replaced = None
+    if rolling_update.use_rolling_update(update):
+        _, replaced = update.new.get_web_port_and_service()
+        _, old_service = update.old.get_web_port_and_service()
+        update.plans.addPlans(plangraph.STATE_CALL_REPLACE,
+                              (rolling_update.replace_container, replaced),
+                              [(dockerapi.remove_container, replaced),
+                               (dockerapi.start_container, old_service)])
+
     for service in update.new.get_services():
         if update.updateType in ["create", "update"]:
             update.plans.addPlans(plangraph.STATE_BUILD_IMAGE,
@@ -111,7 +123,7 @@ def generate_service_plans(update):
             update.plans.addPlans(plangraph.STATE_CHECK_IMAGE,
                                   (dockerapi.check_image, service))
 
-        if update.new.isRunning():
+        if update.new.isRunning() and service is not replaced:
             update.plans.addPlans(plangraph.STATE_CALL_START,
                                   (dockerapi.start_container, service),
                                   (dockerapi.remove_container, service))
@@ -121,11 +133,17 @@ def generate_service_plans(update):
         old_services = update.old.get_services()
 
     for service in old_services:
+        if replaced is not None and service.name == replaced.name:
+            continue
+
         if update.old.isRunning():
             update.plans.addPlans(plangraph.STATE_CALL_STOP,
                                   (dockerapi.remove_container, service),
                                   (dockerapi.start_container, service))
 
-        if update.updateType in ["update", "delete"]:
+        # Images from the previous version are left in place after an
+        # update so that the chute can be rolled back.  The garbage
+        # collector removes older images when disk space runs low.
+        if update.updateType == "delete":
             update.plans.addPlans(plangraph.STATE_CALL_CLEANUP,
                                   (dockerapi.remove_image, service))
@@ -0,0 +1,67 @@
+'''
+Measure how long the reactor takes to run scheduled calls.
+
+Any blocking work on the reactor thread delays every other event, so the lag
+of a periodic timer is a direct measure of how responsive the daemon is.
+'''
+import time
+
+from twisted.internet.task import LoopingCall
+
+from paradrop.base import settings
+
+
+class ReactorLagMonitor(object):
+    """
+    Periodically record the delay of a timer callback.
+
+    The statistics are stored in a class variable so that they can be
+    included in telemetry reports.
+    """
+    statistics = {
+        'last': 0.0,
+        'mean': 0.0,
+        'max': 0.0,
+        'samples': 0,
+        'slow_samples': 0
+    }
+
+    # Weight of a new sample in the exponential moving average.
+    ALPHA = 0.1
+
+    # Lag in seconds that counts as a slow sample.
+    SLOW_THRESHOLD = 0.1
+
+    def __init__(self):
+        self.looping_call = None
+        self.expected = None
+
+    def start(self):
+        if settings.REACTOR_LAG_INTERVAL > 0:
+            self.looping_call = LoopingCall(self.check)
+            self.looping_call.start(settings.REACTOR_LAG_INTERVAL, now=False)
+            self.expected = time.time() + settings.REACTOR_LAG_INTERVAL
+
+    def stop(self):
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+
+    def check(self):
+        now = time.time()
+        if self.expected is not None:
+            self.add_sample(max(0.0, now - self.expected))
+        self.expected = now + settings.REACTOR_LAG_INTERVAL
+
+    @classmethod
+    def add_sample(cls, lag):
+        stats = cls.statistics
+        if stats['samples'] == 0:
+            stats['mean'] = lag
+        else:
+            stats['mean'] += cls.ALPHA * (lag - stats['mean'])
+        stats['last'] = lag
+        stats['max'] = max(stats['max'], lag)
+        stats['samples'] += 1
+        if lag >= cls.SLOW_THRESHOLD:
+            stats['slow_samples'] += 1
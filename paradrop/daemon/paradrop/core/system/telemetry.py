@@ -0,0 +1,144 @@
+"""
+Sample node and chute metrics into the local telemetry store.
+
+The sampler runs at a high rate (settings.TELEMETRY_SAMPLE_INTERVAL) and
+adds each sample to a TimeSeriesStore, which keeps averages at 1 second,
+1 minute and 15 minute resolution by default.  The store keeps a history
+of the metrics on the node, so that data collected while the controller
+is unreachable can be uploaded later.
+
+The sampler only runs while telemetry is enabled in the host configuration
+(see paradrop.core.config.services).  The store is closed when the sampler
+stops or the daemon shuts down, which writes the intervals that are still
+being accumulated.
+
+Series names:
+
+    node.cpu_percent, node.mem_percent, node.load_1m
+    node.disk_read_bps, node.disk_write_bps
+    net.<interface>.rx_bps, net.<interface>.tx_bps
+    chute.<container>.cpu_percent, chute.<container>.mem_bytes
+"""
+
+import time
+
+import psutil
+import six
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from paradrop.base import settings
+from paradrop.core.container.metrics import ContainerMetricsSampler
+from paradrop.lib.utils.timeseries import TimeSeriesStore, parseTiers
+
+
+# Interfaces that are not worth a series.
+EXCLUDED_INTERFACES = set(['lo', 'docker0'])
+
+
+def computeRate(current, previous, elapsed):
+    """
+    Get the rate of change of a counter, or None if it went backwards
+    (e.g. the interface was reset).
+    """
+    if previous is None or elapsed <= 0 or current < previous:
+        return None
+    return (current - previous) / elapsed
+
+
+class TelemetrySampler(object):
+    """
+    Periodically sample metrics into the telemetry store.
+
+    The store is kept in a class variable so that the reporting code can
+    read it without a reference to the running sampler.
+    """
+    store = None
+
+    def __init__(self):
+        self.looping_call = None
+        self.shutdown_trigger = None
+        self.previousTime = None
+        self.previousCounters = {}
+
+    def start(self):
+        if settings.TELEMETRY_SAMPLE_INTERVAL > 0:
+            TelemetrySampler.store = TimeSeriesStore(
+                    parseTiers(settings.TELEMETRY_TIERS),
+                    settings.TELEMETRY_MAX_SERIES,
+                    path=settings.TELEMETRY_STORE_FILE)
+
+            # The first call only starts the measurement.
+            psutil.cpu_percent(interval=None)
+
+            self.looping_call = LoopingCall(self.sample)
+            self.looping_call.start(settings.TELEMETRY_SAMPLE_INTERVAL)
+
+            self.shutdown_trigger = reactor.addSystemEventTrigger('before',
+                    'shutdown', self.onShutdown)
+
+    def onShutdown(self):
+        self.shutdown_trigger = None
+        self.stop()
+
+    def stop(self):
+        if self.shutdown_trigger is not None:
+            reactor.removeSystemEventTrigger(self.shutdown_trigger)
+            self.shutdown_trigger = None
+        if self.looping_call is not None:
+            self.looping_call.stop()
+            self.looping_call = None
+        if TelemetrySampler.store is not None:
+            TelemetrySampler.store.close()
+            TelemetrySampler.store = None
+
+    def readCounters(self):
+        """
+        Read the counters that are reported as rates.
+        """
+        counters = {}
+
+        disk = psutil.disk_io_counters()
+        if disk is not None:
+            counters['node.disk_read_bps'] = disk.read_bytes
+            counters['node.disk_write_bps'] = disk.write_bytes
+
+        for ifname, value in six.iteritems(psutil.net_io_counters(pernic=True)):
+            if ifname in EXCLUDED_INTERFACES or ifname.startswith('veth'):
+                continue
+            counters['net.{}.rx_bps'.format(ifname)] = value.bytes_recv
+            counters['net.{}.tx_bps'.format(ifname)] = value.bytes_sent
+
+        return counters
+
+    def sample(self):
+        now = time.time()
+
+        values = {
+            'node.cpu_percent': psutil.cpu_percent(interval=None),
+            'node.mem_percent': psutil.virtual_memory().percent
+        }
+
+        try:
+            values['node.load_1m'] = psutil.getloadavg()[0]
+        except (AttributeError, OSError):
+            # psutil < 5.6.2 or not supported on this system.
+            pass
+
+        counters = self.readCounters()
+        if self.previousTime is not None:
+            elapsed = now - self.previousTime
+            for name, current in six.iteritems(counters):
+                values[name] = computeRate(current,
+                        self.previousCounters.get(name), elapsed)
+        self.previousTime = now
+        self.previousCounters = counters
+
+        for name, buf in list(ContainerMetricsSampler.buffers.items()):
+            if not buf:
+                continue
+            latest = buf[-1]
+            values['chute.{}.cpu_percent'.format(name)] = latest.get('cpu_percent')
+            values['chute.{}.mem_bytes'.format(name)] = latest.get('memory_usage')
+
+        TelemetrySampler.store.add(now, values)
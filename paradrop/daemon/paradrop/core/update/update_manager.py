@@ -5,7 +5,7 @@
 
 import time
 import threading
-from twisted.internet import defer, threads
+from twisted.internet import defer
 
 from paradrop.base.output import out
 from paradrop.base.pdutils import timeint
@@ -190,10 +190,11 @@ class UpdateManager:
 
             # Apply a batch of updates and when the queue is empty, send a
             # state report.  We're not reacquiring the mutex here because the
-            # worst case is we send out an extra state update.
+            # worst case is we send out an extra state update.  The report
+            # goes through the outbound queue, so there is no need to wait
+            # for it, which could take until the queue's next retry.
             if len(self.active_changes) == 0 and nexus.core.provisioned():
-                threads.blockingCallFromThread(self.reactor,
-                        reporting.sendStateReport)
+                self.reactor.callFromThread(reporting.sendStateReport)
 
     def _perform_update(self, update):
         """
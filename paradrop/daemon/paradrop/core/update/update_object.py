@@ -14,7 +14,7 @@ from paradrop.core import plan
 from paradrop.core.chute.builder import build_chute, rebuild_chute
 from paradrop.core.chute.chute import Chute
 from paradrop.core.chute.chute_storage import ChuteStorage
-from paradrop.core.agent.http import PDServerRequest
+from paradrop.core.agent.outbox import getOutboundQueue
 
 from paradrop.core.plan import executionplan
 from paradrop.core.plan import hostconfig
@@ -123,8 +123,8 @@ class UpdateObject(object):
         # locally-initiated (sideloaded) updates.
         if not self.execute_called and hasattr(self, 'external'):
             update_id = self.external['update_id']
-            request = PDServerRequest('/api/routers/{router_id}/updates/' + str(update_id))
-            request.patch({'op': 'replace', 'path': '/started', 'value': True})
+            getOutboundQueue().put('update_started', {'update_id': update_id},
+                    key=update_id)
 
     def progress(self, message):
         if self.pkg is not None:
@@ -142,18 +142,15 @@ class UpdateObject(object):
             'message': message
         }
 
-        def handleError(error):
-            print("Error sending message: {}".format(error.getErrorMessage()))
-
         # The external field is set for updates from pdserver but not for
-        # locally-initiated (sideloaded) updates.
+        # locally-initiated (sideloaded) updates.  Messages are queued, so
+        # that they are sent in batches and not lost when the controller
+        # cannot be reached.
         update_id = None
         if hasattr(self, 'external'):
             update_id = self.external['update_id']
-            request = PDServerRequest('/api/routers/{}/updates/{}/messages'
-                    .format(nexus.core.info.pdid, update_id))
-            d = request.post(**data)
-            d.addErrback(handleError)
+            message = dict(data, update_id=update_id)
+            getOutboundQueue().put('update_message', message, key=update_id)
 
         session = getattr(nexus.core, 'session', None)
         if session is not None:
@@ -1,5 +1,5 @@
 """
-Utilities for reading from data structures.
+Utilities for reading and comparing data structures.
 """
 
 def getValue(struct, path, default=None):
@@ -26,3 +26,55 @@ def getValue(struct, path, default=None):
         return current
     except:
         return default
+
+
+def makeMergePatch(old, new):
+    """
+    Compute the changes from one dictionary to another as a merge patch.
+
+    The result follows JSON Merge Patch (RFC 7386): nested dictionaries are
+    compared recursively, changed values are replaced as a whole, and keys
+    that were removed are set to None.  Applying the patch to old with
+    applyMergePatch produces new.
+
+    Example:
+    makeMergePatch({'a': 1, 'b': {'c': 2, 'd': 3}}, {'b': {'c': 2, 'd': 4}})
+    -> {'a': None, 'b': {'d': 4}}
+    """
+    patch = {}
+
+    for key, value in new.items():
+        if key not in old:
+            patch[key] = value
+        elif isinstance(value, dict) and isinstance(old[key], dict):
+            changes = makeMergePatch(old[key], value)
+            if len(changes) > 0:
+                patch[key] = changes
+        elif old[key] != value:
+            patch[key] = value
+
+    for key in old:
+        if key not in new:
+            patch[key] = None
+
+    return patch
+
+
+def applyMergePatch(struct, patch):
+    """
+    Apply a merge patch from makeMergePatch and return the result.
+
+    The original data structure is not modified.
+    """
+    if not isinstance(patch, dict):
+        return patch
+    if not isinstance(struct, dict):
+        struct = {}
+
+    result = dict(struct)
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = applyMergePatch(result.get(key, None), value)
+    return result
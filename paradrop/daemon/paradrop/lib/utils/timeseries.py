@@ -0,0 +1,433 @@
+"""
+Fixed-size storage for numeric time series at several resolutions.
+
+A TimeSeriesStore has a fixed number of series slots and a list of tiers,
+for example 1 second, 1 minute and 15 minute resolution.  Every sample is
+added to all tiers.  Each tier averages the samples that fall into the same
+interval and writes one row per interval into a ring buffer, overwriting
+the oldest row when it is full.  A row holds the start of the interval and
+the mean and maximum of each series, with NaN for series that had no
+samples.
+
+When all slots are taken, the slots of series that have no samples left in
+any tier (their last sample has been overwritten even in the coarsest tier)
+are released and given to new series.
+
+The rows can be kept in memory or in a memory-mapped file, so that the
+history survives a restart of the daemon.  Series names and marks (small
+values that the user of the store wants to persist, such as how far the
+data have been uploaded) are kept in a JSON file next to it.
+
+The store is not thread-safe.  It is meant to be used from the reactor
+thread.
+"""
+
+import json
+import math
+import mmap
+import os
+import struct
+
+from paradrop.base.output import out
+
+
+MAGIC = b'PDTSDB01'
+
+# Magic, number of slots and number of tiers.
+HEADER_FORMAT = '<8sII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+# Resolution, capacity, head (next row to write) and number of rows.
+TIER_HEADER_FORMAT = '<dIII'
+TIER_HEADER_SIZE = struct.calcsize(TIER_HEADER_FORMAT)
+
+NAN = float('nan')
+
+
+def parseTiers(spec):
+    """
+    Parse tiers from a string such as "1:600,60:1440", meaning 600 rows at
+    1 second resolution and 1440 rows at 60 second resolution.
+
+    Returns a list of (resolution, capacity) tuples, finest first.
+    """
+    tiers = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        resolution, capacity = item.split(':', 1)
+        tiers.append((float(resolution), int(capacity)))
+    tiers.sort()
+    return tiers
+
+
+def toJSONValue(value):
+    if math.isnan(value):
+        return None
+    return value
+
+
+class Tier(object):
+    """
+    Ring buffer of rows at one resolution.
+    """
+    def __init__(self, buffer, headerOffset, rowsOffset, resolution, capacity, slots):
+        self.buffer = buffer
+        self.headerOffset = headerOffset
+        self.rowsOffset = rowsOffset
+        self.resolution = resolution
+        self.capacity = capacity
+        self.slots = slots
+
+        self.rowFormat = '<d' + 'f' * (2 * slots)
+        self.rowSize = struct.calcsize(self.rowFormat)
+
+        _, _, self.head, self.count = struct.unpack_from(TIER_HEADER_FORMAT,
+                buffer, headerOffset)
+
+        # Interval that is being accumulated.
+        self.bucket = None
+        self.resetAccumulators()
+
+    @staticmethod
+    def size(capacity, slots):
+        return TIER_HEADER_SIZE + capacity * struct.calcsize('<d' + 'f' * (2 * slots))
+
+    def resetAccumulators(self):
+        self.sums = [0.0] * self.slots
+        self.counts = [0] * self.slots
+        self.maxes = [NAN] * self.slots
+
+    def add(self, timestamp, values):
+        """
+        Add a sample given as a list of (slot, value) pairs.
+        """
+        bucket = int(timestamp // self.resolution)
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush()
+        self.bucket = bucket
+
+        for slot, value in values:
+            self.sums[slot] += value
+            self.counts[slot] += 1
+            # NaN comparisons are false, so the first value replaces NaN.
+            if not (value <= self.maxes[slot]):
+                self.maxes[slot] = value
+
+    def flush(self):
+        """
+        Write the interval that is being accumulated.
+        """
+        if self.bucket is None:
+            return
+
+        row = [self.bucket * self.resolution]
+        for slot in range(self.slots):
+            if self.counts[slot] > 0:
+                row.append(self.sums[slot] / self.counts[slot])
+            else:
+                row.append(NAN)
+        row.extend(self.maxes)
+
+        struct.pack_into(self.rowFormat, self.buffer,
+                self.rowsOffset + self.head * self.rowSize, *row)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        struct.pack_into(TIER_HEADER_FORMAT, self.buffer, self.headerOffset,
+                self.resolution, self.capacity, self.head, self.count)
+
+        self.bucket = None
+        self.resetAccumulators()
+
+    def rowOffset(self, index):
+        """
+        Get the offset of a row, where index 0 is the oldest row.
+        """
+        position = (self.head - self.count + index) % self.capacity
+        return self.rowsOffset + position * self.rowSize
+
+    def timestampAt(self, index):
+        return struct.unpack_from('<d', self.buffer, self.rowOffset(index))[0]
+
+    def oldest(self):
+        """
+        Get the timestamp of the oldest row or None if the tier is empty.
+        """
+        if self.count == 0:
+            return None
+        return self.timestampAt(0)
+
+    def emptySlots(self, candidates):
+        """
+        Get the subset of the candidate slots that have no values in this
+        tier, including the interval that is being accumulated.
+        """
+        empty = set(slot for slot in candidates if self.counts[slot] == 0)
+        for index in range(self.count):
+            if not empty:
+                break
+            row = struct.unpack_from(self.rowFormat, self.buffer, self.rowOffset(index))
+            empty = set(slot for slot in empty if math.isnan(row[slot + 1]))
+        return empty
+
+    def rows(self, since=None, until=None):
+        """
+        Generate (timestamp, means, maxes) for the rows with since <=
+        timestamp < until, oldest first.
+        """
+        # Rows are in time order, so binary search for the first one.
+        start = 0
+        if since is not None:
+            end = self.count
+            while start < end:
+                middle = (start + end) // 2
+                if self.timestampAt(middle) < since:
+                    start = middle + 1
+                else:
+                    end = middle
+
+        for index in range(start, self.count):
+            row = struct.unpack_from(self.rowFormat, self.buffer, self.rowOffset(index))
+            if until is not None and row[0] >= until:
+                break
+            yield row[0], row[1:self.slots + 1], row[self.slots + 1:]
+
+
+class TimeSeriesStore(object):
+    """
+    Fixed-size store of time series at several resolutions.
+
+    tiers: list of (resolution, capacity) tuples.
+    maxSeries: number of series slots.  Samples of series that do not fit
+    are dropped and counted in dropped.
+    path: file for the rows, or None to keep them in memory.
+    """
+    def __init__(self, tiers, maxSeries, path=None):
+        self.maxSeries = maxSeries
+        self.path = path
+        self.slots = {}
+        self.marks = {}
+        self.dropped = 0
+
+        # State of the coarsest tier when releasing slots last failed.
+        # Slots can only become free when that tier writes a row.
+        self.releaseState = None
+
+        tiers = sorted(tiers)
+        size = HEADER_SIZE + sum(Tier.size(c, maxSeries) for r, c in tiers)
+
+        self.file = None
+        self.buffer = None
+        if path is not None:
+            try:
+                self.openFile(path, size, tiers)
+            except (IOError, OSError, ValueError) as error:
+                out.warn("Cannot map time series file {}: {}".format(path, error))
+                self.file = None
+        if self.buffer is None:
+            self.buffer = bytearray(size)
+            self.initialize(tiers)
+
+        self.tiers = []
+        offset = HEADER_SIZE
+        for resolution, capacity in tiers:
+            self.tiers.append(Tier(self.buffer, offset, offset + TIER_HEADER_SIZE,
+                resolution, capacity, maxSeries))
+            offset += Tier.size(capacity, maxSeries)
+
+    def initialize(self, tiers):
+        struct.pack_into(HEADER_FORMAT, self.buffer, 0, MAGIC, self.maxSeries, len(tiers))
+        offset = HEADER_SIZE
+        for resolution, capacity in tiers:
+            struct.pack_into(TIER_HEADER_FORMAT, self.buffer, offset,
+                    resolution, capacity, 0, 0)
+            offset += Tier.size(capacity, self.maxSeries)
+
+    def isCompatible(self, tiers):
+        """
+        Check whether the mapped file has the same layout.
+        """
+        magic, slots, count = struct.unpack_from(HEADER_FORMAT, self.buffer, 0)
+        if magic != MAGIC or slots != self.maxSeries or count != len(tiers):
+            return False
+
+        offset = HEADER_SIZE
+        for resolution, capacity in tiers:
+            r, c, head, rows = struct.unpack_from(TIER_HEADER_FORMAT, self.buffer, offset)
+            if r != resolution or c != capacity or head >= capacity or rows > capacity:
+                return False
+            offset += Tier.size(capacity, self.maxSeries)
+
+        return True
+
+    def openFile(self, path, size, tiers):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        exists = os.path.isfile(path) and os.path.getsize(path) == size
+
+        self.file = open(path, 'a+b')
+        if not exists:
+            self.file.truncate(size)
+        self.buffer = mmap.mmap(self.file.fileno(), size)
+
+        if exists and self.isCompatible(tiers):
+            self.loadMetadata()
+        else:
+            self.buffer[:] = b'\0' * size
+            self.initialize(tiers)
+            self.saveMetadata()
+
+    def metadataPath(self):
+        return self.path + '.json'
+
+    def loadMetadata(self):
+        try:
+            with open(self.metadataPath(), 'r') as source:
+                data = json.load(source)
+            self.slots = data.get('slots', {})
+            self.marks = data.get('marks', {})
+        except (IOError, ValueError):
+            self.slots = {}
+            self.marks = {}
+
+    def saveMetadata(self):
+        if self.file is None:
+            return
+
+        data = {'slots': self.slots, 'marks': self.marks}
+        tmp = self.metadataPath() + '.tmp'
+        with open(tmp, 'w') as output:
+            json.dump(data, output)
+        os.rename(tmp, self.metadataPath())
+
+    def getSlot(self, name, keep=()):
+        """
+        Get the slot of a series, assigning a free one if needed.
+
+        keep: slots that must not be released, because they were assigned
+        for a sample that has not been added yet.
+        """
+        slot = self.slots.get(name)
+        if slot is not None:
+            return slot
+
+        if len(self.slots) >= self.maxSeries:
+            self.releaseSlots(keep)
+        if len(self.slots) >= self.maxSeries:
+            return None
+
+        used = set(self.slots.values())
+        slot = min(i for i in range(self.maxSeries) if i not in used)
+        self.slots[name] = slot
+        self.saveMetadata()
+        return slot
+
+    def releaseSlots(self, keep=()):
+        """
+        Release the slots of series that have no samples in any tier.
+
+        Returns the number of slots that were released.
+        """
+        coarsest = self.tiers[-1]
+        state = (coarsest.head, coarsest.count)
+        if state == self.releaseState:
+            return 0
+
+        empty = set(self.slots.values()).difference(keep)
+        for tier in self.tiers:
+            empty = tier.emptySlots(empty)
+
+        if not empty:
+            self.releaseState = state
+            return 0
+
+        for name, slot in list(self.slots.items()):
+            if slot in empty:
+                del self.slots[name]
+        self.saveMetadata()
+        return len(empty)
+
+    def add(self, timestamp, values):
+        """
+        Add a sample of several series, given as a dict of name: value.
+        """
+        pairs = []
+        assigned = set()
+        for name, value in values.items():
+            if value is None:
+                continue
+            slot = self.getSlot(name, keep=assigned)
+            if slot is None:
+                self.dropped += 1
+                continue
+            pairs.append((slot, float(value)))
+            assigned.add(slot)
+
+        for tier in self.tiers:
+            tier.add(timestamp, pairs)
+
+    def flush(self):
+        for tier in self.tiers:
+            tier.flush()
+
+    def getTier(self, resolution):
+        for tier in self.tiers:
+            if tier.resolution == resolution:
+                return tier
+        raise ValueError("No tier with resolution {}".format(resolution))
+
+    def query(self, resolution, since=None, until=None, names=None, limit=None):
+        """
+        Get the rows of a tier in columns:
+
+        {
+          "resolution": 60.0,
+          "time": [t0, t1, ...],
+          "series": {
+            name: {"mean": [...], "max": [...]},
+            ...
+          }
+        }
+
+        Rows are those with since <= time < until, at most limit of them.
+        Missing values are None.
+        """
+        tier = self.getTier(resolution)
+
+        if names is None:
+            names = list(self.slots.keys())
+        selected = [(name, self.slots[name]) for name in names if name in self.slots]
+
+        times = []
+        series = dict((name, {'mean': [], 'max': []}) for name, slot in selected)
+        for timestamp, means, maxes in tier.rows(since=since, until=until):
+            if limit is not None and len(times) >= limit:
+                break
+            times.append(timestamp)
+            for name, slot in selected:
+                series[name]['mean'].append(toJSONValue(means[slot]))
+                series[name]['max'].append(toJSONValue(maxes[slot]))
+
+        return {
+            'resolution': resolution,
+            'time': times,
+            'series': series
+        }
+
+    def getMark(self, name, default=None):
+        return self.marks.get(name, default)
+
+    def setMark(self, name, value):
+        self.marks[name] = value
+        self.saveMetadata()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.buffer.flush()
+            self.buffer.close()
+            self.file.close()
+            self.file = None
@@ -14,11 +14,16 @@ from paradrop.lib.misc.procmon import ProcessMonitor
 from paradrop.core.agent import provisioning
 from paradrop.core.agent.reporting import sendNodeIdentity, sendStateReport
 from paradrop.core.agent.wamp_session import WampSession
+from paradrop.core.container.garbage_collector import GarbageCollector
+from paradrop.core.container.metrics import ContainerMetricsSampler
+from paradrop.core.system.reactor_lag import ReactorLagMonitor
 from paradrop.core.update.update_fetcher import UpdateFetcher
 from paradrop.core.update.update_manager import UpdateManager
 from paradrop.airshark.airshark import AirsharkManager
 from paradrop.backend.http_server import HttpServer, setup_http_server
 from paradrop.backend.ssdp_responder import SsdpResponder
+from paradrop.backend.lease_index import LeaseIndex
+from paradrop.backend.station_table import StationTable
 from paradrop import confd
 
 
@@ -90,6 +95,21 @@ def main():
 
     airshark_manager = AirsharkManager()
 
+    garbage_collector = GarbageCollector(update_manager)
+    garbage_collector.start()
+
+    metrics_sampler = ContainerMetricsSampler()
+    metrics_sampler.start()
+
+    reactor_lag_monitor = ReactorLagMonitor()
+    reactor_lag_monitor.start()
+
+    station_table = StationTable()
+    station_table.start()
+
+    lease_index = LeaseIndex()
+    lease_index.start()
+
     # Globally assign the nexus object so anyone else can access it.
     nexus.core = Nexus(update_fetcher, update_manager)
     http_server = HttpServer(update_manager, update_fetcher, airshark_manager, args.portal)
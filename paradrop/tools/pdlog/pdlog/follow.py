@@ -0,0 +1,232 @@
+"""
+Follow a log file as it grows.
+
+LogFollower reads complete lines from a file and keeps reading when more
+data is written.  It notices when the file is rotated (the name now refers
+to a new file) or truncated, finishes the old file and starts over at the
+beginning of the new one.
+
+Changes are detected with inotify where it is available, and by polling the
+file otherwise.  Even with inotify the file is checked every poll interval,
+so a missed event only delays the output.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import io
+import os
+import select
+import time
+
+
+# Size of reads from the log file.
+READ_SIZE = 65536
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+              IN_MOVE_SELF)
+
+
+class PollWatcher(object):
+    """
+    Wait for changes by sleeping for the poll interval.
+    """
+    def wait(self, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """
+    Wait for changes to the files in a directory with inotify.
+
+    The directory is watched rather than the file, so that the watch
+    survives the file being renamed and replaced.
+    """
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        path = directory.encode('utf-8') if not isinstance(directory, bytes) else directory
+        if libc.inotify_add_watch(self.fd, path, WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except select.error:
+            return
+
+        if ready:
+            # The events themselves do not matter, only that something
+            # changed, so drain them all.
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except OSError as error:
+                if error.errno != errno.EAGAIN:
+                    raise
+
+    def close(self):
+        os.close(self.fd)
+
+
+def makeWatcher(directory, useInotify=True):
+    """
+    Get an inotify watcher for the directory, or a polling watcher if
+    inotify is not available.
+    """
+    if useInotify:
+        try:
+            return InotifyWatcher(directory)
+        except (AttributeError, OSError):
+            # AttributeError: libc has no inotify functions (not Linux).
+            pass
+    return PollWatcher()
+
+
+class LogFollower(object):
+    """
+    Read lines from a log file, following it across rotation and truncation.
+
+    Lines are returned as bytes including the trailing newline.  A partial
+    line at the end of the file is held back until it is complete.
+    """
+    def __init__(self, path, pollInterval=1.0, useInotify=True):
+        self.path = path
+        self.pollInterval = pollInterval
+        self.useInotify = useInotify
+
+        self.file = None
+        self.inode = None
+        self.position = 0
+        self.partial = b''
+
+        self.watcher = None
+
+    def open(self):
+        """
+        Open the file if it exists.  Returns True if it was opened.
+        """
+        try:
+            source = io.open(self.path, 'rb')
+        except IOError:
+            return False
+
+        self.file = source
+        self.inode = os.fstat(source.fileno()).st_ino
+        self.position = 0
+        self.partial = b''
+        return True
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+    def readLines(self):
+        """
+        Return the complete lines that have been written since the last
+        read, or an empty list if there are none.
+        """
+        if self.file is None and not self.open():
+            return []
+
+        data = self.partial
+        while True:
+            chunk = self.file.read(READ_SIZE)
+            if not chunk:
+                break
+            self.position += len(chunk)
+            data += chunk
+            # Stop at the first chunk that completes a line, so that large
+            # files are returned in pieces.
+            if b'\n' in chunk:
+                break
+
+        end = data.rfind(b'\n') + 1
+        self.partial = data[end:]
+        if end == 0:
+            return []
+
+        return data[:end].splitlines(True)
+
+    def checkFile(self):
+        """
+        Check for rotation and truncation.  Returns the lines that were left
+        in the old file when it was rotated, followed by the first lines of
+        the new file.
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            # Removed, and the new file has not been created yet.
+            return []
+
+        if self.file is None:
+            return []
+
+        if stat.st_ino != self.inode:
+            # Finish the rotated file, including an unterminated last line,
+            # before moving to the new one.
+            lines = []
+            while True:
+                more = self.readLines()
+                if not more:
+                    break
+                lines.extend(more)
+            if self.partial:
+                lines.append(self.partial + b'\n')
+            self.file.close()
+            self.file = None
+            return lines + self.readLines()
+
+        if stat.st_size < self.position:
+            self.file.seek(0)
+            self.position = 0
+            self.partial = b''
+            return self.readLines()
+
+        return []
+
+    def follow(self):
+        """
+        Generate lines forever, starting with what is already in the file.
+        """
+        if self.watcher is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            self.watcher = makeWatcher(directory, self.useInotify)
+
+        while True:
+            lines = self.readLines()
+            lines.extend(self.checkFile())
+            if lines:
+                for line in lines:
+                    yield line
+            else:
+                self.watcher.wait(self.pollInterval)
@@ -2,63 +2,346 @@ from __future__ import print_function
 from future import standard_library
 standard_library.install_aliases()
 import argparse
+import collections
+import errno
+import gzip
+import io
 import json
 import os
-import subprocess
+import re
 import sys
+import time
 import urllib.request, urllib.parse, urllib.error
-from time import sleep
 
-SNAP_COMMON = os.environ['SNAP_COMMON']
-LOG_FILE = os.path.join(SNAP_COMMON, "logs", "log")
+from .follow import LogFollower, READ_SIZE
 
-def parseLine(line):
+
+LOG_NAME = "log"
+
+# Log levels of paradrop.base.output, in order of their values.
+LEVELS = ['HEADER', 'VERBOSE', 'INFO', 'PERF', 'WARN', 'ERR', 'SECURITY',
+          'FATAL', 'USAGE']
+
+# Number of past messages shown in follow mode.
+DEFAULT_FOLLOW_LINES = 100
+
+SEGMENT_RE = re.compile(r'^(\d{4}_\d{2}_\d{2})(?:\.(\d+))?(\.gz)?$')
+RELATIVE_TIME_RE = re.compile(r'^(\d+(?:\.\d+)?)([smhd])$')
+TIME_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+TIME_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S',
+                '%Y-%m-%d %H:%M', '%Y-%m-%d %H:%M:%S']
+
+
+def getLogFile():
+    snap_common = os.environ.get('SNAP_COMMON', '/var/snap/paradrop-daemon/common')
+    return os.path.join(snap_common, "logs", LOG_NAME)
+
+
+def levelValue(name):
+    """
+    Convert a level name such as "warn" to its value.
+    """
     try:
-        data = json.loads(line)
-        msg = urllib.parse.unquote(data['message'])
-        print(msg)
-    except:
+        return LEVELS.index(name.upper()) + 1
+    except ValueError:
+        raise argparse.ArgumentTypeError("unknown level: {} (choose from {})".format(
+            name, ", ".join(l.lower() for l in LEVELS)))
+
+
+def levelName(value):
+    if isinstance(value, int) and 1 <= value <= len(LEVELS):
+        return LEVELS[value - 1]
+    return str(value)
+
+
+def parseTime(text, now=None):
+    """
+    Parse a time given as a timestamp, a date and time such as
+    "2018-01-02 15:04", or an age such as "10m" (s, m, h or d).
+    """
+    try:
+        return float(text)
+    except ValueError:
         pass
 
+    match = RELATIVE_TIME_RE.match(text)
+    if match is not None:
+        if now is None:
+            now = time.time()
+        return now - float(match.group(1)) * TIME_UNITS[match.group(2)]
 
-def runTail(logFile):
-    cmd = ['tail', '-n', '100', '-f', LOG_FILE]
-    while (True):
+    for fmt in TIME_FORMATS:
         try:
-            proc = subprocess.Popen(cmd, \
-                                    stdout=subprocess.PIPE, \
-                                    universal_newlines=True)
-
-            for line in iter(proc.stdout.readline, ''):
-                yield line
-
-            proc.stdout.close()
-            proc.wait()
-        except subprocess.CalledProcessError:
-            print('Failed to open the log file, will try again...')
-            sleep(1)
+            return time.mktime(time.strptime(text, fmt))
+        except ValueError:
             continue
 
-        sleep(2)
+    raise argparse.ArgumentTypeError("invalid time: {}".format(text))
+
+
+class RecordFilter(object):
+    """
+    Decide which log records to show.
+
+    Modules match by module name (e.g. "update_manager") or by package and
+    module prefix (e.g. "backend" or "core.update_manager").  Any one of
+    the given modules needs to match.
+    """
+    def __init__(self, level=None, modules=None, since=None, until=None,
+                 pattern=None):
+        self.level = level
+        self.modules = modules or []
+        self.since = since
+        self.until = until
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def matches(self, record):
+        if self.level is not None:
+            value = record.get('type', 0)
+            if not isinstance(value, int):
+                value = LEVELS.index(value) + 1 if value in LEVELS else 0
+            if value < self.level:
+                return False
+
+        if self.since is not None or self.until is not None:
+            timestamp = record.get('timestamp', 0)
+            if self.since is not None and timestamp < self.since:
+                return False
+            if self.until is not None and timestamp > self.until:
+                return False
+
+        if self.modules:
+            module = record.get('module')
+            name = "{}.{}".format(record.get('package'), module)
+            if not any(m == module or m == name or name.startswith(m + '.')
+                       for m in self.modules):
+                return False
+
+        if self.pattern is not None and \
+                self.pattern.search(getMessage(record)) is None:
+            return False
+
+        return True
+
+
+def getMessage(record):
+    return urllib.parse.unquote(record.get('message', ''))
+
+
+def formatText(record, line):
+    return getMessage(record).rstrip('\n')
+
+
+def formatCompact(record, line):
+    timestamp = record.get('timestamp')
+    if timestamp is None:
+        when = '-'
+    else:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+    return "{} {:<7} {}.{}: {}".format(when, levelName(record.get('type')),
+            record.get('package'), record.get('module'),
+            getMessage(record).rstrip('\n'))
+
+
+def formatJson(record, line):
+    return line.rstrip('\n')
+
+
+FORMATTERS = {
+    'text': formatText,
+    'compact': formatCompact,
+    'json': formatJson
+}
+
+
+class RecordReader(object):
+    """
+    Decode log lines and apply the filter.
 
-def main():
+    Lines that are not valid log records (for example, the tail of a line
+    cut off by truncation) are counted in malformed and skipped.
+    """
+    def __init__(self, recordFilter):
+        self.filter = recordFilter
+        self.malformed = 0
+
+    def read(self, lines):
+        matches = self.filter.matches
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if line.strip():
+                    self.malformed += 1
+                continue
+            if not isinstance(record, dict):
+                self.malformed += 1
+                continue
+            if matches(record):
+                yield record, line
+
+
+def listLogFiles(logFile, since=None, allSegments=False):
+    """
+    List the files to read for the history, oldest first.
+
+    Rotated segments are only read when since or allSegments is given.
+    Segments are named by the date they were started, so a segment can be
+    skipped when the one after it was started before the day of since.
+    """
+    if since is None and not allSegments:
+        return [logFile]
+
+    directory, name = os.path.split(logFile)
+    try:
+        filenames = os.listdir(directory)
+    except OSError:
+        return [logFile]
+
+    segments = []
+    for filename in filenames:
+        if not filename.startswith(name + '.'):
+            continue
+        match = SEGMENT_RE.match(filename[len(name) + 1:])
+        if match is not None:
+            segments.append((match.group(1), int(match.group(2) or 0), filename))
+    segments.sort()
+
+    if since is not None and not allSegments:
+        day = time.strftime('%Y_%m_%d', time.localtime(since))
+        while len(segments) > 1 and segments[1][0] < day:
+            segments.pop(0)
+
+    paths = [os.path.join(directory, s[2]) for s in segments]
+    return paths + [logFile]
+
+
+def readLines(path):
+    """
+    Generate the lines of a log file, which may be compressed.
+    """
+    try:
+        if path.endswith('.gz'):
+            source = io.BufferedReader(gzip.open(path, 'rb'), READ_SIZE)
+        else:
+            source = io.open(path, 'rb', buffering=READ_SIZE)
+    except IOError:
+        return
+
+    with source:
+        for line in source:
+            yield line
+
+
+def getArgs(argv=None):
     p = argparse.ArgumentParser(description='Paradrop log tool')
-    p.add_argument('-f',
+    p.add_argument('-f', '--follow',
                    help='Wait for additional data to be appended to the log file when end of file is reached',
                    action='store_true',
                    dest='f')
-    args = p.parse_args()
+    p.add_argument('-n', '--lines',
+                   help='Show only the last N matching messages (default: all, or {} with -f)'.format(
+                       DEFAULT_FOLLOW_LINES),
+                   type=int)
+    p.add_argument('-l', '--level',
+                   help='Show messages at this level and above, e.g. warn',
+                   type=levelValue)
+    p.add_argument('-m', '--module',
+                   help='Show messages from this module or package, e.g. restart or core.plan (repeatable)',
+                   action='append',
+                   dest='modules')
+    p.add_argument('-s', '--since',
+                   help='Show messages from this time on, as a timestamp, "YYYY-MM-DD[ HH:MM[:SS]]" or an age such as 30m or 2h; includes rotated logs',
+                   type=parseTime)
+    p.add_argument('-u', '--until',
+                   help='Show messages up to this time',
+                   type=parseTime)
+    p.add_argument('-g', '--grep',
+                   help='Show messages that match this regular expression',
+                   dest='pattern')
+    p.add_argument('-a', '--all',
+                   help='Include all rotated logs',
+                   action='store_true',
+                   dest='allSegments')
+    p.add_argument('-o', '--output',
+                   help='Output format',
+                   choices=sorted(FORMATTERS.keys()),
+                   default='text')
+    p.add_argument('--file',
+                   help='Log file to read (default: {})'.format(getLogFile()),
+                   default=None)
+    p.add_argument('--poll',
+                   help='Poll for changes instead of using inotify',
+                   action='store_true')
+
+    args = p.parse_args(argv)
+
+    if args.pattern is not None:
+        try:
+            re.compile(args.pattern)
+        except re.error as error:
+            p.error("invalid regular expression: {}".format(error))
+
+    return args
+
+
+def printRecords(records, formatter):
+    for record, line in records:
+        print(formatter(record, line))
+
+
+def main(argv=None):
+    args = getArgs(argv)
+    logFile = args.file or getLogFile()
+    formatter = FORMATTERS[args.output]
+
+    reader = RecordReader(RecordFilter(level=args.level, modules=args.modules,
+            since=args.since, until=args.until, pattern=args.pattern))
+
+    lines = args.lines
+    if lines is None and args.f:
+        lines = DEFAULT_FOLLOW_LINES
 
     try:
+        # The current file is read by the follower so that following picks
+        # up exactly where the history ends.
+        paths = listLogFiles(logFile, since=args.since, allSegments=args.allSegments)
+        follower = LogFollower(logFile, useInotify=not args.poll)
+
+        def history():
+            for path in paths[:-1]:
+                for line in readLines(path):
+                    yield line
+            while True:
+                batch = follower.readLines()
+                if not batch:
+                    break
+                for line in batch:
+                    yield line
+
+        records = reader.read(history())
+        if lines is not None:
+            records = collections.deque(records, maxlen=max(lines, 0))
+        printRecords(records, formatter)
+
         if args.f:
-            for line in runTail(LOG_FILE):
-                parseLine(line)
-        else:
-            with open(LOG_FILE, "r") as inputFile:
-                for line in inputFile:
-                    parseLine(line)
+            sys.stdout.flush()
+            for record, line in reader.read(follower.follow()):
+                print(formatter(record, line))
+                sys.stdout.flush()
+        elif reader.malformed > 0:
+            print("pdlog: skipped {} malformed lines".format(reader.malformed),
+                  file=sys.stderr)
     except KeyboardInterrupt:
         sys.exit(0)
+    except IOError as error:
+        # The reader of a pipe went away, e.g. pdlog | head.
+        if error.errno == errno.EPIPE:
+            sys.exit(0)
+        print("pdlog: {}".format(error), file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
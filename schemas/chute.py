@@ -31,6 +31,11 @@ class ChuteWebService(jsl.Document):
         minimum=1,
         maximum=65536
     )
+    update_strategy = jsl.StringField(
+        description="How to replace the web service when the chute is updated. With \"rolling\", the new version is started alongside the old one and receives traffic once it responds on the web port.",
+        enum=["recreate", "rolling"],
+        default="recreate"
+    )
 
 
 class Chute(jsl.Document):
@@ -35,6 +35,20 @@ class ChuteRequests(jsl.Document):
         description="Port bindings from host to service container.",
         items=jsl.DocumentField(PortBinding)
     )
+    memory = jsl.AnyOfField(
+        [jsl.StringField(), jsl.IntField(minimum=0)],
+        description="Memory limit in bytes or with a unit suffix, e.g. \"256m\"."
+    )
+    pids = jsl.IntField(
+        description="Maximum number of processes in the service container.",
+        minimum=1
+    )
+    blkio_weight = jsl.IntField(
+        name="blkio-weight",
+        description="Relative weight for block I/O.",
+        minimum=10,
+        maximum=1000
+    )
 
 
 class Service(jsl.Document):
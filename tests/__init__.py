@@ -4,4 +4,5 @@ import os
 sys.path.insert(0, os.path.abspath('pdinstall'))
 sys.path.insert(0, os.path.abspath('paradrop/daemon'))
 sys.path.insert(0, os.path.abspath('tools/pdtools'))
+sys.path.insert(0, os.path.abspath('paradrop/tools/pdlog'))
 sys.path.insert(0, os.path.abspath('tests/mocks'))
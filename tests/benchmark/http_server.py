@@ -0,0 +1,544 @@
+"""
+Load test and latency benchmark for the local HTTP API.
+
+The benchmark starts HttpServer in-process on a random local port, with
+UpdateManager, ChuteStorage and Docker replaced by the fixtures in
+tests/mocks/pdmock.py, and drives a weighted mix of requests from a number
+of concurrent clients.  Websocket log subscribers can be added to measure
+the delivery latency of log messages while the API is under load.
+
+Run from the root of the repository:
+
+    python -m tests.benchmark.http_server --concurrency 16 --duration 20
+
+Save the results of one commit and compare another commit against them:
+
+    python -m tests.benchmark.http_server --output before.json
+    python -m tests.benchmark.http_server --compare before.json
+
+In comparison mode, the exit status is 1 if the p50, p95 or p99 latency of
+any request type increased, or its throughput decreased, by more than the
+threshold (default 20%).
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import smokesignal
+from autobahn.twisted.websocket import (WebSocketClientFactory,
+        WebSocketClientProtocol, connectWS)
+from mock import MagicMock, patch
+from twisted.internet import defer, reactor, task
+from twisted.web.client import Agent, FileBodyProducer, HTTPConnectionPool, readBody
+from twisted.web.http_headers import Headers
+from twisted.web.server import Site
+
+from paradrop.base import nexus, settings
+from paradrop.backend.station_table import StationTable
+
+from pdmock import MockChute, MockChuteStorage
+
+
+DEFAULT_MIX = "auth=1,chutes=4,stations=3,leases=3,devices=1"
+
+
+class MockContainer(object):
+    """
+    Stand-in for ChuteContainer that simulates the latency of Docker.
+    """
+    latency = 0
+
+    def __init__(self, name):
+        self.name = name
+
+    def getStatus(self):
+        if MockContainer.latency > 0:
+            time.sleep(MockContainer.latency)
+        return "running"
+
+
+def make_lease_lines(chute_index, count):
+    lines = []
+    for i in range(count):
+        mac = "02:00:{:02x}:00:{:02x}:{:02x}".format(chute_index, i // 256, i % 256)
+        lines.append("{} {} 10.{}.{}.{} host-{} *".format(2000000000, mac,
+            chute_index, i // 250, i % 250 + 2, i))
+    return lines
+
+
+def make_stations(chute_index, count):
+    stations = []
+    for i in range(count):
+        stations.append({
+            'mac_addr': "02:00:{:02x}:00:{:02x}:{:02x}".format(chute_index,
+                i // 256, i % 256),
+            'authorized': True,
+            'signal': -random.randint(30, 90),
+            'rx_bytes': random.randint(0, 10**9),
+            'tx_bytes': random.randint(0, 10**9),
+            'inactive_time': random.randint(0, 10000)
+        })
+    return stations
+
+
+class Environment(object):
+    """
+    Temporary configuration, mocked subsystems and a running HttpServer.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.tempdir = tempfile.mkdtemp(prefix="pd-benchmark-")
+        self.patches = []
+        self.chutes = []
+        self.port = None
+        self.token = None
+
+    def setup(self):
+        settings.updatePaths(os.path.join(self.tempdir, "config"),
+                os.path.join(self.tempdir, "run"))
+        for path in [settings.CONFIG_HOME_DIR, settings.RUNTIME_HOME_DIR]:
+            os.makedirs(path)
+
+        if self.args.no_cache:
+            settings.RESPONSE_CACHE_TTL = 0
+
+        nexus.core = MagicMock()
+        nexus.core.getKey.return_value = None
+        nexus.core.info.pdid = "benchmark"
+
+        storage = MockChuteStorage()
+        for i in range(self.args.chutes):
+            chute = MockChute("chute{}".format(i))
+            ifname = "v{}.wlan0".format(i)
+            system_dir = os.path.join(settings.RUNTIME_HOME_DIR, "system",
+                    chute.name)
+            os.makedirs(system_dir)
+
+            with open(os.path.join(system_dir, "dnsmasq-wifi.leases"), "w") as output:
+                for line in make_lease_lines(i, self.args.leases):
+                    output.write(line + "\n")
+
+            chute.setCache('externalSystemDir', system_dir)
+            chute.setCache('networkInterfaces', [{
+                'name': 'wifi',
+                'type': 'wifi-ap',
+                'mode': 'ap',
+                'externalIntf': ifname
+            }])
+
+            StationTable.replace_interface(ifname, make_stations(i,
+                self.args.stations))
+
+            storage.chuteList.append(chute)
+            self.chutes.append(chute)
+
+        storage_class = MagicMock(return_value=storage)
+        storage_class.chuteList = dict((c.name, c) for c in self.chutes)
+        storage_class.get_chute.side_effect = storage_class.chuteList.get
+
+        MockContainer.latency = self.args.docker_latency
+
+        self.patches = [
+            patch("paradrop.backend.auth.ChuteStorage", storage_class),
+            patch("paradrop.backend.chute_api.ChuteStorage", storage_class),
+            patch("paradrop.backend.chute_api.ChuteContainer", MockContainer),
+            patch("paradrop.backend.chute_api.resource.computeResourceAllocation",
+                MagicMock(return_value={}))
+        ]
+        for p in self.patches:
+            p.start()
+
+        # Imported late so that the settings above are in effect.
+        from paradrop.backend.http_server import HttpServer
+
+        update_manager = MagicMock()
+        update_manager.active_changes = {}
+        update_manager.updateQueue = []
+
+        portal_dir = os.path.join(self.tempdir, "portal")
+        os.makedirs(portal_dir)
+        with open(os.path.join(portal_dir, "index.html"), "w") as output:
+            output.write("<html></html>")
+
+        server = HttpServer(update_manager, MagicMock(), MagicMock(), portal_dir)
+        self.token = server.token_manager.issue("paradrop", domain="localhost",
+                role="admin")
+
+        listener = reactor.listenTCP(0, Site(server.app.resource()),
+                interface="127.0.0.1")
+        self.port = listener.getHost().port
+
+    def teardown(self):
+        for p in self.patches:
+            p.stop()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+
+class Recorder(object):
+    """
+    Collect latency samples by request type.
+    """
+    def __init__(self):
+        self.start = None
+        self.end = None
+        self.samples = {}
+        self.errors = {}
+
+    def add(self, name, latency, error=False):
+        if self.start is None:
+            return
+        self.samples.setdefault(name, []).append(latency)
+        if error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a sorted list.
+    """
+    if len(values) == 0:
+        return 0.0
+    index = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(index, len(values) - 1))]
+
+
+def summarize(values, errors, elapsed):
+    values = sorted(values)
+    count = len(values)
+    return {
+        'count': count,
+        'errors': errors,
+        'rps': count / elapsed if elapsed > 0 else 0.0,
+        'mean': 1000.0 * sum(values) / count if count > 0 else 0.0,
+        'p50': 1000.0 * percentile(values, 50),
+        'p95': 1000.0 * percentile(values, 95),
+        'p99': 1000.0 * percentile(values, 99),
+        'max': 1000.0 * values[-1] if count > 0 else 0.0
+    }
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in REQUEST_TYPES:
+            raise ValueError("Unknown request type: {}".format(name))
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def choose(mix):
+    total = sum(weight for name, weight in mix)
+    value = random.uniform(0, total)
+    for name, weight in mix:
+        value -= weight
+        if value <= 0:
+            return name
+    return mix[-1][0]
+
+
+def auth_request(env):
+    body = json.dumps({'username': 'paradrop', 'password': ''})
+    return "POST", "/api/v1/auth/local", body
+
+
+def chutes_request(env):
+    return "GET", "/api/v1/chutes/", None
+
+
+def stations_request(env):
+    chute = random.choice(env.chutes)
+    return "GET", "/api/v1/chutes/{}/networks/wifi/stations".format(chute.name), None
+
+
+def leases_request(env):
+    chute = random.choice(env.chutes)
+    return "GET", "/api/v1/chutes/{}/networks/wifi/leases".format(chute.name), None
+
+
+def devices_request(env):
+    return "GET", "/api/v1/network/devices", None
+
+
+REQUEST_TYPES = {
+    'auth': auth_request,
+    'chutes': chutes_request,
+    'stations': stations_request,
+    'leases': leases_request,
+    'devices': devices_request
+}
+
+
+@defer.inlineCallbacks
+def run_client(env, agent, mix, recorder, deadline):
+    base = "http://127.0.0.1:{}".format(env.port)
+    headers = {
+        b"Authorization": [("Bearer " + env.token).encode("ascii")],
+        b"Content-Type": [b"application/json"]
+    }
+
+    while time.time() < deadline:
+        name = choose(mix)
+        method, path, body = REQUEST_TYPES[name](env)
+        producer = None
+        if body is not None:
+            producer = FileBodyProducer(BytesIO(body.encode("utf-8")))
+
+        start = time.time()
+        try:
+            response = yield agent.request(method.encode("ascii"),
+                    (base + path).encode("ascii"), Headers(headers), producer)
+            yield readBody(response)
+            error = response.code >= 400
+        except Exception as exc:
+            print("{} {} failed: {}".format(method, path, exc), file=sys.stderr)
+            error = True
+        recorder.add(name, time.time() - start, error)
+
+
+class LogSubscriberProtocol(WebSocketClientProtocol):
+    def onOpen(self):
+        self.factory.connected.callback(self)
+
+    def onMessage(self, payload, isBinary):
+        # Other daemon log messages and notices about dropped messages are
+        # also delivered.
+        try:
+            message = json.loads(payload.decode("utf-8"))
+            sent = message['sent']
+        except (ValueError, KeyError, TypeError):
+            return
+        self.factory.recorder.add("ws_logs", time.time() - sent)
+
+
+def start_log_subscriber(env, recorder):
+    url = "ws://127.0.0.1:{}/ws/paradrop_logs".format(env.port)
+    factory = WebSocketClientFactory(url, headers={
+        'Authorization': 'Bearer ' + env.token
+    })
+    factory.protocol = LogSubscriberProtocol
+    factory.recorder = recorder
+    factory.connected = defer.Deferred()
+    connectWS(factory)
+    return factory.connected
+
+
+def emit_log():
+    message = json.dumps({'sent': time.time(), 'message': 'benchmark'})
+    smokesignal.emit('logs', {'message': message.encode('utf-8')})
+
+
+@defer.inlineCallbacks
+def run_benchmark(env, args, recorder):
+    mix = parse_mix(args.mix)
+
+    subscribers = []
+    for i in range(args.log_subscribers):
+        protocol = yield start_log_subscriber(env, recorder)
+        subscribers.append(protocol)
+
+    log_loop = None
+    if args.log_subscribers > 0 and args.log_rate > 0:
+        log_loop = task.LoopingCall(emit_log)
+        log_loop.start(1.0 / args.log_rate)
+
+    pool = HTTPConnectionPool(reactor, persistent=True)
+    pool.maxPersistentPerHost = args.concurrency
+    agent = Agent(reactor, pool=pool)
+
+    def begin_recording():
+        recorder.start = time.time()
+
+    reactor.callLater(args.warmup, begin_recording)
+    deadline = time.time() + args.warmup + args.duration
+
+    clients = [run_client(env, agent, mix, recorder, deadline)
+            for i in range(args.concurrency)]
+    yield defer.DeferredList(clients)
+    recorder.end = time.time()
+
+    if log_loop is not None:
+        log_loop.stop()
+    for protocol in subscribers:
+        protocol.sendClose()
+    yield pool.closeCachedConnections()
+
+
+def get_commit():
+    try:
+        output = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                stderr=subprocess.STDOUT)
+        return output.decode("utf-8").strip()
+    except Exception:
+        return None
+
+
+def make_report(args, recorder):
+    elapsed = (recorder.end or time.time()) - (recorder.start or time.time())
+
+    results = {}
+    all_values = []
+    all_errors = 0
+    for name in sorted(recorder.samples.keys()):
+        values = recorder.samples[name]
+        errors = recorder.errors.get(name, 0)
+        results[name] = summarize(values, errors, elapsed)
+        if name != "ws_logs":
+            all_values.extend(values)
+            all_errors += errors
+    results['total'] = summarize(all_values, all_errors, elapsed)
+
+    return {
+        'commit': get_commit(),
+        'time': time.time(),
+        'elapsed': elapsed,
+        'config': {
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'mix': args.mix,
+            'chutes': args.chutes,
+            'stations': args.stations,
+            'leases': args.leases,
+            'log_subscribers': args.log_subscribers,
+            'log_rate': args.log_rate,
+            'docker_latency': args.docker_latency,
+            'no_cache': args.no_cache
+        },
+        'results': results
+    }
+
+
+def print_report(report):
+    print("commit: {}  elapsed: {:.1f} s".format(report['commit'],
+        report['elapsed']))
+    print("{:<10} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        "type", "count", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+    for name, stats in sorted(report['results'].items()):
+        print("{:<10} {:>8} {:>7} {:>9.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+            name, stats['count'], stats['errors'], stats['rps'], stats['p50'],
+            stats['p95'], stats['p99'], stats['max']))
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Print the change from a baseline report and return a list of regressions.
+    """
+    regressions = []
+
+    print("")
+    print("compared to commit {}".format(baseline.get('commit')))
+    if baseline.get('config') != current['config']:
+        print("warning: the baseline was run with different options")
+    print("{:<10} {:>9} {:>9} {:>9} {:>9}".format("type", "req/s", "p50",
+        "p95", "p99"))
+
+    for name, stats in sorted(current['results'].items()):
+        base = baseline['results'].get(name, None)
+        if base is None:
+            continue
+
+        changes = {}
+        for key in ['rps', 'p50', 'p95', 'p99']:
+            if base[key] > 0:
+                changes[key] = 100.0 * (stats[key] - base[key]) / base[key]
+            else:
+                changes[key] = 0.0
+
+        print("{:<10} {:>+8.1f}% {:>+8.1f}% {:>+8.1f}% {:>+8.1f}%".format(name,
+            changes['rps'], changes['p50'], changes['p95'], changes['p99']))
+
+        if changes['rps'] < -threshold:
+            regressions.append("{} throughput".format(name))
+        for key in ['p50', 'p95', 'p99']:
+            if changes[key] > threshold:
+                regressions.append("{} {}".format(name, key))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=8,
+            help="number of concurrent HTTP clients")
+    parser.add_argument("--duration", type=float, default=10,
+            help="measurement time in seconds")
+    parser.add_argument("--warmup", type=float, default=2,
+            help="time in seconds before measurement starts")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+            help="weighted request types, choose from: {}".format(
+                ", ".join(sorted(REQUEST_TYPES.keys()))))
+    parser.add_argument("--chutes", type=int, default=4,
+            help="number of installed chutes")
+    parser.add_argument("--stations", type=int, default=200,
+            help="number of connected stations per chute")
+    parser.add_argument("--leases", type=int, default=200,
+            help="number of DHCP leases per chute")
+    parser.add_argument("--log-subscribers", type=int, default=0,
+            help="number of websocket log subscribers")
+    parser.add_argument("--log-rate", type=float, default=50,
+            help="log messages per second sent to subscribers")
+    parser.add_argument("--docker-latency", type=float, default=0.005,
+            help="simulated time in seconds to inspect a container")
+    parser.add_argument("--no-cache", action="store_true",
+            help="disable the API response cache")
+    parser.add_argument("--output", help="write results to a JSON file")
+    parser.add_argument("--compare", help="compare with results from a JSON file")
+    parser.add_argument("--threshold", type=float, default=20,
+            help="percent change that counts as a regression")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    env = Environment(args)
+    recorder = Recorder()
+    failures = []
+
+    def run():
+        d = run_benchmark(env, args, recorder)
+        d.addErrback(failures.append)
+        d.addBoth(lambda ignored: reactor.stop())
+
+    try:
+        env.setup()
+        reactor.callWhenRunning(run)
+        reactor.run()
+    finally:
+        env.teardown()
+
+    if failures:
+        failures[0].printTraceback()
+        return 2
+
+    report = make_report(args, recorder)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, "r") as source:
+            baseline = json.load(source)
+        regressions = compare_reports(baseline, report, args.threshold)
+        if regressions:
+            print("")
+            print("Regressions: {}".format(", ".join(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
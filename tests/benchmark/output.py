@@ -0,0 +1,245 @@
+"""
+Benchmark of logging calls per second through paradrop.base.output.
+
+Each scenario makes the same out.verbose call with a lazily formatted
+argument in a loop and reports the number of calls per second:
+
+filtered
+  the message is below the global level
+module_filtered
+  the message is below the level of the calling module
+no_sinks
+  the message passes the thresholds, but console, file and websocket
+  logging are all off
+subscriber
+  one smokesignal subscriber receives the log dict
+console
+  the formatted message is written to /dev/null
+file
+  the log dict is queued for the file writer thread
+
+Run from the root of the repository:
+
+    python -m tests.benchmark.output --calls 200000
+
+Save the results of one commit and compare another commit against them:
+
+    python -m tests.benchmark.output --output before.json
+    python -m tests.benchmark.output --compare before.json
+
+In comparison mode, the exit status is 1 if the rate of any scenario
+decreased by more than the threshold (default 20%).
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import smokesignal
+
+from paradrop.base import output
+from paradrop.base.output import Level, out
+
+
+class Update(object):
+    """
+    Object with a repr that is about as expensive as that of an update.
+    """
+    def __init__(self):
+        self.data = dict(("key{}".format(i), list(range(10))) for i in range(20))
+
+    def __repr__(self):
+        return "<Update {}>".format(self.data)
+
+
+class LogState(object):
+    """
+    Configure the output singleton for one scenario and restore it afterwards.
+    """
+    def __init__(self, level=Level.HEADER, moduleLevels=None, console=False,
+            logdir=None, subscriber=False):
+        self.level = level
+        self.moduleLevels = moduleLevels or {}
+        self.console = console
+        self.logdir = logdir
+        self.subscriber = subscriber
+        self.devnull = None
+
+    def receive(self, logDict):
+        pass
+
+    def __enter__(self):
+        self.saved = dict((k, out.__dict__.get(k)) for k in
+                ['printLogs', 'queue', 'printer'])
+        self.savedTrueOut = out.redirectOut.trueOut
+
+        out.setLevel(self.level)
+        for module, level in self.moduleLevels.items():
+            out.setLevel(level, module=module)
+
+        out.logToConsole(self.console)
+        if self.console:
+            self.devnull = open(os.devnull, 'w')
+            out.redirectOut.trueOut = self.devnull
+
+        out.__dict__['queue'] = None
+        if self.logdir is not None:
+            out.__dict__['queue'] = output.queue.Queue()
+            out.__dict__['printer'] = output.PrintLogThread(self.logdir,
+                    out.queue, output.LOG_NAME)
+            out.printer.start()
+
+        if self.subscriber:
+            smokesignal.on(output.LOG_SIGNAL, self.receive)
+
+        return self
+
+    def __exit__(self, *exc):
+        if self.subscriber:
+            smokesignal.disconnect(self.receive)
+
+        if self.logdir is not None:
+            out.queue.join()
+            out.printer.writer.close()
+
+        out.redirectOut.trueOut = self.savedTrueOut
+        if self.devnull is not None:
+            self.devnull.close()
+
+        for module in self.moduleLevels:
+            out.setLevel(None, module=module)
+        out.setLevel(Level.HEADER)
+        out.__dict__.update(self.saved)
+
+
+def run_calls(calls, update):
+    start = time.time()
+    for i in range(calls):
+        out.verbose("%r\n", update)
+    return time.time() - start
+
+
+def run_scenario(state, calls):
+    update = Update()
+    with state:
+        # Warm up the module level cache and the writer thread.
+        run_calls(min(calls, 100), update)
+        elapsed = run_calls(calls, update)
+
+        # Include the time to drain the file queue, so that the writer
+        # thread cannot hide its cost.
+        if state.logdir is not None:
+            start = time.time()
+            out.queue.join()
+            elapsed += time.time() - start
+
+    rate = calls / elapsed if elapsed > 0 else float('inf')
+    return {
+        'calls': calls,
+        'seconds': elapsed,
+        'rate': rate
+    }
+
+
+def make_scenarios(logdir):
+    module = __name__
+    return [
+        ('filtered', LogState(level=Level.WARN)),
+        ('module_filtered', LogState(moduleLevels={module: Level.WARN})),
+        ('no_sinks', LogState()),
+        ('subscriber', LogState(subscriber=True)),
+        ('console', LogState(console=True)),
+        ('file', LogState(logdir=logdir))
+    ]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                stderr=subprocess.STDOUT).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+def print_report(report):
+    print("{:<16} {:>10} {:>14}".format("scenario", "calls", "calls/s"))
+    for name, result in report['scenarios']:
+        print("{:<16} {:>10} {:>14.0f}".format(name, result['calls'],
+            result['rate']))
+
+
+def compare_reports(baseline, current, threshold):
+    """
+    Print the change from a baseline report and return a list of regressions.
+    """
+    base = dict((name, result) for name, result in baseline['scenarios'])
+    regressions = []
+
+    print("")
+    print("Compared with {}:".format(baseline.get('commit') or 'baseline'))
+    for name, result in current['scenarios']:
+        if name not in base:
+            continue
+        old = base[name]['rate']
+        change = 100.0 * (result['rate'] - old) / old
+        print("{:<16} {:>+9.1f}%".format(name, change))
+        if change < -threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100000,
+            help="number of logging calls per scenario")
+    parser.add_argument("--scenarios",
+            help="comma-separated list of scenarios to run (default all)")
+    parser.add_argument("--output", help="write results to a JSON file")
+    parser.add_argument("--compare", help="compare with results from a JSON file")
+    parser.add_argument("--threshold", type=float, default=20,
+            help="percent change that counts as a regression")
+    args = parser.parse_args()
+
+    selected = None
+    if args.scenarios:
+        selected = set(args.scenarios.split(","))
+
+    logdir = tempfile.mkdtemp()
+    try:
+        scenarios = []
+        for name, state in make_scenarios(logdir):
+            if selected is None or name in selected:
+                scenarios.append((name, run_scenario(state, args.calls)))
+    finally:
+        shutil.rmtree(logdir)
+
+    report = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'scenarios': scenarios
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as input_file:
+            baseline = json.load(input_file)
+        regressions = compare_reports(baseline, report, args.threshold)
+        if regressions:
+            print("Regressions: {}".format(", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,29 @@ import os
 import tempfile
 
 
+class MockService(object):
+    def __init__(self, chute, name="main"):
+        self.chute = chute
+        self.name = name
+
+    def get_container_name(self):
+        return "{}-{}".format(self.chute.name, self.name)
+
+
 class MockChute(object):
     def __init__(self, name="mock"):
         self.name = name
+        self.state = "running"
+        self.version = 1
+        self.environment = dict()
+        self.resources = None
 
         self.cache = dict()
 
         self.IPs = list()
         self.SSIDs = list()
         self.staticIPs = list()
+        self.services = [MockService(self)]
 
     def getCache(self, key):
         return self.cache.get(key, None)
@@ -27,6 +41,12 @@ class MockChute(object):
     def getChuteStaticIPs(self):
         return self.staticIPs
 
+    def get_owner(self):
+        return "paradrop"
+
+    def get_services(self):
+        return self.services
+
     def isRunning(self):
         return True
 
@@ -0,0 +1,67 @@
+import smokesignal
+from mock import patch, MagicMock
+
+from paradrop.backend import auth
+from paradrop.backend.auth_cache import AuthCache
+
+
+def test_AuthCache_credentials():
+    cache = AuthCache(ttl=30)
+    assert not cache.check_credentials("paradrop", "password")
+
+    cache.add_credentials("paradrop", "password")
+    assert cache.check_credentials("paradrop", "password")
+    assert not cache.check_credentials("paradrop", "wrong")
+
+    smokesignal.emit('password_changed')
+    assert not cache.check_credentials("paradrop", "password")
+
+
+@patch("paradrop.backend.auth_cache.time")
+def test_AuthCache_tokens(time):
+    time.time.return_value = 100
+
+    cache = AuthCache(ttl=30)
+    cache.add_token("abc", {"sub": "paradrop", "exp": 110})
+    assert cache.get_token("abc")['sub'] == "paradrop"
+
+    # The entry should expire with the token.
+    time.time.return_value = 115
+    assert cache.get_token("abc") is None
+
+
+@patch("paradrop.backend.auth_cache.ChuteStorage")
+def test_AuthCache_get_allowed_bearer(ChuteStorage):
+    chute = MagicMock()
+    chute.getCache.return_value = "token1"
+
+    storage = MagicMock()
+    storage.getChuteList.return_value = [chute]
+    ChuteStorage.return_value = storage
+
+    cache = AuthCache()
+    assert cache.get_allowed_bearer() == set(["token1"])
+    assert cache.get_allowed_bearer() == set(["token1"])
+    assert storage.getChuteList.call_count == 1
+
+    chute.getCache.return_value = "token2"
+    smokesignal.emit('chute_saved', "test")
+    assert cache.get_allowed_bearer() == set(["token2"])
+
+
+@patch("paradrop.backend.auth_cache.ChuteStorage")
+def test_check_auth_cached(ChuteStorage):
+    ChuteStorage.return_value.getChuteList.return_value = []
+
+    password_manager = MagicMock()
+    token_manager = MagicMock()
+    token_manager.decode.return_value = {"sub": "paradrop", "role": "admin"}
+
+    request = MagicMock()
+    request.getHeader.return_value = "Bearer abc"
+
+    cache = AuthCache()
+    assert auth.check_auth(request, password_manager, token_manager, cache)
+    assert auth.check_auth(request, password_manager, token_manager, cache)
+    assert token_manager.decode.call_count == 1
+    assert request.user.role == "admin"
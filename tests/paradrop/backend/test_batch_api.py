@@ -0,0 +1,141 @@
+import json
+
+from klein import Klein
+from mock import MagicMock, patch
+from twisted.internet import defer
+from twisted.web import server
+from twisted.web.test.requesthelper import DummyChannel
+
+from paradrop.backend import batch_api
+
+
+class ExampleApi(object):
+    app = Klein()
+
+    def __init__(self):
+        self.events = []
+        self.pending = defer.Deferred()
+
+    @app.route('/api/v1/things', methods=['GET'])
+    def get_things(self, request):
+        self.events.append("get")
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps({
+            'authorized': request.getHeader(b'authorization') == b'Bearer abc',
+            'args': len(request.args)
+        })
+
+    @app.route('/api/v1/slow', methods=['GET'])
+    def get_slow(self, request):
+        self.events.append("slow")
+        return self.pending
+
+    @app.route('/api/v1/broken', methods=['GET'])
+    def get_broken(self, request):
+        raise Exception("broken")
+
+    @app.route('/api/v1/things', methods=['POST'])
+    def post_thing(self, request):
+        self.events.append("post")
+        body = json.loads(request.content.read())
+        request.setResponseCode(201)
+        request.setHeader('Content-Type', 'application/json')
+        return json.dumps(body)
+
+
+def make_parent():
+    request = server.Request(DummyChannel(), False)
+    request.requestHeaders.setRawHeaders(b"authorization", [b"Bearer abc"])
+    request.requestHeaders.setRawHeaders(b"if-none-match", [b"xyz"])
+    return request
+
+
+def get_result(d):
+    results = []
+    d.addCallback(results.append)
+    assert len(results) == 1
+    return results[0]
+
+
+def test_check_item():
+    assert batch_api.check_item("/api/v1/chutes") is not None
+    assert batch_api.check_item({'method': 'GET'}) is not None
+    assert batch_api.check_item({'path': '/ws/leases'}) is not None
+    assert batch_api.check_item({'path': '/api/v1/batch'}) is not None
+    assert batch_api.check_item({'path': '/api/v1/chutes'}) is None
+
+
+def test_run_batch():
+    api = ExampleApi()
+    resource = api.app.resource()
+    parent = make_parent()
+
+    items = [
+        {'path': '/api/v1/things?x=1'},
+        {'path': '/api/v1/slow'},
+        {'method': 'POST', 'path': '/api/v1/things', 'body': {'a': 1}},
+        {'path': '/api/v1/things'},
+        {'path': '/portal'},
+        {'path': '/api/v1/missing'},
+        {'path': '/api/v1/broken'}
+    ]
+
+    d = batch_api.run_batch(resource, parent, items)
+
+    # The POST request must wait for the slow request before it.
+    assert api.events == ["get", "slow"]
+    api.pending.callback("slow")
+
+    results = get_result(d)
+    assert api.events == ["get", "slow", "post", "get"]
+    assert len(results) == len(items)
+
+    assert results[0]['status'] == 200
+    assert results[0]['body']['authorized']
+    assert results[0]['body']['args'] == 1
+    assert results[1]['body'] == "slow"
+    assert results[2]['status'] == 201
+    assert results[2]['body'] == {'a': 1}
+    assert results[3]['status'] == 200
+    assert results[4]['status'] == 400
+    assert results[5]['status'] == 404
+    assert results[6]['status'] == 500
+
+
+def test_BatchSubRequest():
+    parent = make_parent()
+    request = batch_api.BatchSubRequest(parent, "get", "/api/v1/a%3Ab?x=1")
+    assert request.method == b"GET"
+    assert request.postpath == [b"api", b"v1", b"a:b"]
+    assert request.getHeader(b"authorization") == b"Bearer abc"
+    assert request.getHeader(b"if-none-match") is None
+
+    request.setHeader("Content-Type", "text/plain")
+    request.write("hello")
+    request.finish()
+    request.write("ignored")
+
+    result = request.get_result()
+    assert result['status'] == 200
+    assert result['body'] == "hello"
+
+
+@patch("paradrop.backend.batch_api.run_batch")
+def test_BatchApi(run_batch):
+    api = batch_api.BatchApi(MagicMock())
+    request = MagicMock()
+
+    request.content.read.return_value = "{}"
+    api.post_batch(request)
+    request.setResponseCode.assert_called_with(400)
+
+    request.reset_mock()
+    request.content.read.return_value = json.dumps([{}] * 100)
+    api.post_batch(request)
+    request.setResponseCode.assert_called_with(400)
+
+    request.reset_mock()
+    run_batch.return_value = defer.succeed([])
+    request.content.read.return_value = "[]"
+    assert get_result(api.post_batch(request)) == "[]"
+    assert not request.setResponseCode.called
@@ -0,0 +1,73 @@
+from mock import patch, MagicMock
+from twisted.internet import defer
+
+from paradrop.backend import blocking
+
+
+class FakeApi(object):
+    def __init__(self):
+        self.calls = 0
+
+    @blocking.blocking(limit=1, timeout=10)
+    def get_items(self, request):
+        self.calls += 1
+        return "[]"
+
+
+@patch("paradrop.backend.blocking.reactor")
+@patch("paradrop.backend.blocking.deferToThreadPool")
+def test_blocking(deferToThreadPool, reactor):
+    timer = MagicMock()
+    timer.active.return_value = True
+    reactor.callLater.return_value = timer
+
+    pending = defer.Deferred()
+    deferToThreadPool.side_effect = [pending, defer.succeed("[1]")]
+
+    api = FakeApi()
+    request = MagicMock()
+
+    results = []
+    api.get_items(request).addCallback(results.append)
+    assert results == []
+
+    stats = blocking.BlockingHandlers.statistics['test_blocking.get_items']
+    assert stats['active'] == 1
+
+    # The second call waits for the first one because of the limit.
+    api.get_items(request).addCallback(results.append)
+    assert deferToThreadPool.call_count == 1
+    assert stats['queued'] == 1
+
+    pending.callback("[]")
+    assert results == ["[]", "[1]"]
+    assert deferToThreadPool.call_count == 2
+    timer.cancel.assert_called()
+
+
+@patch("paradrop.backend.blocking.reactor")
+@patch("paradrop.backend.blocking.deferToThreadPool")
+def test_blocking_timeout(deferToThreadPool, reactor):
+    timer = MagicMock()
+    timer.active.return_value = True
+    reactor.callLater.return_value = timer
+
+    pending = defer.Deferred()
+    deferToThreadPool.return_value = pending
+
+    api = FakeApi()
+    request = MagicMock()
+
+    results = []
+    api.get_items(request).addCallback(results.append)
+
+    # Fire the timeout.
+    on_timeout = reactor.callLater.call_args[0][1]
+    timer.active.return_value = False
+    on_timeout()
+    request.setResponseCode.assert_called_with(503)
+    assert len(results) == 1
+
+    # The late result is discarded.
+    pending.callback("[]")
+    assert len(results) == 1
@@ -4,12 +4,23 @@ import tarfile
 
 from mock import MagicMock, patch
 from nose.tools import assert_raises
+from twisted.internet import defer
 
 from paradrop.backend import chute_api
 from paradrop.core.auth.user import User
 from paradrop.core.chute.chute import Chute
 
 
+def run_inline(reactor, pool, func, *args, **kwargs):
+    return defer.maybeDeferred(func, *args, **kwargs)
+
+
+def get_result(deferred):
+    results = []
+    deferred.addBoth(results.append)
+    return results[0]
+
+
 def test_ChuteCacheEncoder():
     obj = {
         'set': set(),
@@ -110,6 +121,7 @@ def test_extract_tarred_chute():
         assert_raises(Exception, chute_api.extract_tarred_chute, source)
 
 
+@patch("paradrop.backend.blocking.deferToThreadPool", run_inline)
 @patch("paradrop.backend.chute_api.ChuteContainer")
 @patch("paradrop.backend.chute_api.ChuteStorage")
 def test_ChuteApi_get_chutes(ChuteStorage, ChuteContainer):
@@ -135,7 +147,7 @@ def test_ChuteApi_get_chutes(ChuteStorage, ChuteContainer):
 
     storage.getChuteList.return_value = [chute]
 
-    data = api.get_chutes(request)
+    data = get_result(api.get_chutes(request))
     assert isinstance(data, basestring)
 
     result = json.loads(data)
@@ -143,6 +155,30 @@ def test_ChuteApi_get_chutes(ChuteStorage, ChuteContainer):
     assert result[0]['version'] == chute.version
 
 
+@patch("paradrop.backend.blocking.deferToThreadPool", run_inline)
+@patch("paradrop.backend.chute_api.ChuteContainer")
+@patch("paradrop.backend.chute_api.ChuteStorage")
+def test_ChuteApi_get_chutes_fields(ChuteStorage, ChuteContainer):
+    update_manager = MagicMock()
+    api = chute_api.ChuteApi(update_manager)
+
+    request = MagicMock()
+    request.args = {
+        'fields': ['name,state']
+    }
+
+    chute = MagicMock()
+    chute.name = "test"
+    chute.state = "running"
+    ChuteStorage.return_value.getChuteList.return_value = [chute]
+
+    result = json.loads(get_result(api.get_chutes(request)))
+    assert result == [{'name': 'test', 'state': 'running'}]
+
+    # Containers are not inspected unless services were requested.
+    assert not ChuteContainer.called
+
+
 def test_ChuteApi_create_chute():
     update_manager = MagicMock()
     update_manager.assign_change_id.return_value = 1
@@ -212,6 +248,7 @@ def test_ChuteApi_create_chute_tarfile(extract_tarred_chute):
     assert_raises(Exception, api.create_chute, request)
 
 
+@patch("paradrop.backend.blocking.deferToThreadPool", run_inline)
 @patch("paradrop.backend.chute_api.ChuteContainer")
 @patch("paradrop.backend.chute_api.ChuteStorage")
 def test_ChuteApi_get_chute(ChuteStorage, ChuteContainer):
@@ -236,7 +273,7 @@ def test_ChuteApi_get_chute(ChuteStorage, ChuteContainer):
         "test": chute
     }
 
-    data = api.get_chute(request, chute.name)
+    data = get_result(api.get_chute(request, chute.name))
     assert isinstance(data, basestring)
 
     result = json.loads(data)
@@ -343,6 +380,37 @@ def test_ChuteApi_get_chute_cache(ChuteStorage):
     assert result == "{}"
 
 
+@patch("paradrop.backend.chute_api.ContainerMetricsSampler")
+@patch("paradrop.backend.chute_api.ChuteStorage")
+def test_ChuteApi_get_chute_metrics(ChuteStorage, ContainerMetricsSampler):
+    update_manager = MagicMock()
+    api = chute_api.ChuteApi(update_manager)
+
+    service = MagicMock()
+    service.name = "main"
+    service.get_container_name.return_value = "test-main"
+
+    chute = MagicMock()
+    chute.get_services.return_value = [service]
+
+    ChuteStorage.chuteList = {
+        "test": chute
+    }
+
+    ContainerMetricsSampler.get_samples.return_value = [{"pids": 3}]
+
+    request = MagicMock()
+    request.user = User.get_internal_user()
+
+    result = json.loads(api.get_chute_metrics(request, "test"))
+    assert result == {"main": [{"pids": 3}]}
+    ContainerMetricsSampler.get_samples.assert_called_once_with("test-main")
+
+    result = api.get_chute_metrics(request, "missing")
+    assert result == "{}"
+    request.setResponseCode.assert_called_once_with(404)
+
+
 @patch("paradrop.backend.chute_api.ChuteStorage")
 def test_ChuteApi_get_networks(ChuteStorage):
     update_manager = MagicMock()
@@ -432,6 +500,7 @@ class TestChuteApi(object):
 
         self.chute = chute
 
+    @patch("paradrop.backend.blocking.deferToThreadPool", run_inline)
     @patch("paradrop.backend.chute_api.ChuteStorage")
     def test_get_leases(self, ChuteStorage):
         ChuteStorage.chuteList = {
@@ -503,57 +572,43 @@ class TestChuteApi(object):
                 self.interface['name'])
         assert result == "OK"
 
-    @patch("paradrop.backend.chute_api.subprocess.Popen")
+    @patch("paradrop.backend.chute_api.StationTable")
     @patch("paradrop.backend.chute_api.ChuteStorage")
-    def test_get_stations(self, ChuteStorage, Popen):
+    def test_get_stations(self, ChuteStorage, StationTable):
         ChuteStorage.chuteList = {
             self.chute.name: self.chute
         }
 
-        proc = MagicMock()
-        Popen.return_value = proc
-        proc.stdout = [
-            "Station 12:34:56:78:9a:bc (on wlan0)",
-            "	inactive time:  304 ms",
-            "	rx bytes:       18816",
-            "	rx packets:     75",
-            "	tx bytes:       5386",
-            "	tx packets:     21",
-            "	signal:         -29 dBm",
-            "	tx bitrate:     54.0 MBit/s"
-        ]
+        StationTable.get_stations.return_value = [{
+            'mac_addr': '12:34:56:78:9a:bc',
+            'rx_bytes': 18816,
+            'signal': -29
+        }]
 
         request = MagicMock()
         request.user = User.get_internal_user()
 
         result = self.api.get_stations(request, self.chute.name,
                 self.interface['name'])
+        StationTable.get_stations.assert_called_once_with('vwlan0')
         stations = json.loads(result)
         assert len(stations) == 1
         assert stations[0]['mac_addr'] == '12:34:56:78:9a:bc'
-        assert stations[0]['rx_bytes'] == '18816'
-        assert stations[0]['signal'] == '-29 dBm'
-        assert stations[0]['tx_bitrate'] == '54.0 MBit/s'
+        assert stations[0]['rx_bytes'] == 18816
+        assert stations[0]['signal'] == -29
 
-    @patch("paradrop.backend.chute_api.subprocess.Popen")
+    @patch("paradrop.backend.chute_api.StationTable")
     @patch("paradrop.backend.chute_api.ChuteStorage")
-    def test_get_station(self, ChuteStorage, Popen):
+    def test_get_station(self, ChuteStorage, StationTable):
         ChuteStorage.chuteList = {
             self.chute.name: self.chute
         }
 
-        proc = MagicMock()
-        Popen.return_value = proc
-        proc.stdout = [
-            "Station 12:34:56:78:9a:bc (on wlan0)",
-            "	inactive time:  304 ms",
-            "	rx bytes:       18816",
-            "	rx packets:     75",
-            "	tx bytes:       5386",
-            "	tx packets:     21",
-            "	signal:         -29 dBm",
-            "	tx bitrate:     54.0 MBit/s"
-        ]
+        StationTable.get_station.return_value = {
+            'mac_addr': '12:34:56:78:9a:bc',
+            'rx_bytes': 18816,
+            'signal': -29
+        }
 
         request = MagicMock()
         request.user = User.get_internal_user()
@@ -562,10 +617,15 @@ class TestChuteApi(object):
                 self.interface['name'], '12:34:56:78:9a:bc')
         station = json.loads(result)
         assert station['mac_addr'] == '12:34:56:78:9a:bc'
-        assert station['rx_bytes'] == '18816'
-        assert station['signal'] == '-29 dBm'
-        assert station['tx_bitrate'] == '54.0 MBit/s'
+        assert station['rx_bytes'] == 18816
+        assert station['signal'] == -29
+
+        StationTable.get_station.return_value = None
+        result = self.api.get_station(request, self.chute.name,
+                self.interface['name'], '12:34:56:78:9a:bc')
+        request.setResponseCode.assert_called_with(404)
 
+    @patch("paradrop.backend.blocking.deferToThreadPool", run_inline)
     @patch("paradrop.backend.chute_api.subprocess.Popen")
     @patch("paradrop.backend.chute_api.ChuteStorage")
     def test_delete_station(self, ChuteStorage, Popen):
@@ -582,8 +642,8 @@ class TestChuteApi(object):
         request = MagicMock()
         request.user = User.get_internal_user()
 
-        result = self.api.delete_station(request, self.chute.name,
-                self.interface['name'], '12:34:56:78:9a:bc')
+        result = get_result(self.api.delete_station(request, self.chute.name,
+                self.interface['name'], '12:34:56:78:9a:bc'))
         messages = json.loads(result)
         assert len(messages) == 1
         assert messages[0] == "OK"
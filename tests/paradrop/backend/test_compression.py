@@ -0,0 +1,57 @@
+import gzip
+import io
+import json
+
+from mock import MagicMock
+from twisted.web.test.requesthelper import DummyRequest
+
+from autobahn.websocket.compress import PerMessageDeflateOffer
+
+from paradrop.backend import compression
+
+
+def make_request(content_type=b"application/json"):
+    request = DummyRequest([b""])
+    request.requestHeaders.setRawHeaders(b"accept-encoding", [b"gzip, deflate"])
+    request.responseHeaders.setRawHeaders(b"content-type", [content_type])
+    return request
+
+
+def test_JsonGzipEncoderFactory():
+    factory = compression.JsonGzipEncoderFactory(threshold=100, level=6)
+
+    request = DummyRequest([b""])
+    assert factory.encoderForRequest(request) is None
+
+    body = json.dumps([{"name": "test", "state": "running"}] * 20).encode('ascii')
+
+    request = make_request()
+    encoder = factory.encoderForRequest(request)
+    data = encoder.encode(body) + encoder.finish()
+    assert request.responseHeaders.getRawHeaders(b"content-encoding") == [b"gzip"]
+    assert gzip.GzipFile(fileobj=io.BytesIO(data)).read() == body
+
+    # Small responses are sent as they are.
+    request = make_request()
+    encoder = factory.encoderForRequest(request)
+    assert encoder.encode(b"{}") + encoder.finish() == b"{}"
+    assert not request.responseHeaders.hasHeader(b"content-encoding")
+
+    # So are other content types.
+    request = make_request(content_type=b"text/html")
+    encoder = factory.encoderForRequest(request)
+    assert encoder.encode(body) + encoder.finish() == body
+
+
+def test_accept_deflate():
+    assert compression.accept_deflate([]) is None
+
+    offer = PerMessageDeflateOffer()
+    accept = compression.accept_deflate([offer])
+    assert accept.offer is offer
+    assert accept.no_context_takeover
+
+    factory = MagicMock()
+    compression.enable_deflate(factory)
+    factory.setProtocolOptions.assert_called_once_with(
+        perMessageCompressionAccept=compression.accept_deflate)
@@ -0,0 +1,52 @@
+import os
+
+from mock import MagicMock, patch
+
+from paradrop.backend import hostapd_control
+
+
+@patch("paradrop.backend.hostapd_control.reactor")
+def test_HostapdControlClient(reactor):
+    client = hostapd_control.connect("/var/run/hostapd/wlan0")
+    assert reactor.connectUNIXDatagram.call_args[1]['bindAddress'] == \
+            client.bindAddress()
+
+    # Commands wait until the socket is connected.
+    results = []
+    client.request("STA-FIRST").addCallback(results.append)
+    client.transport = MagicMock()
+    client.startProtocol()
+    client.transport.write.assert_called_once_with("STA-FIRST")
+
+    client.request("STA-NEXT 1").addCallback(results.append)
+    client.datagramReceived("first")
+    client.datagramReceived("second")
+    assert results == ["first", "second"]
+
+    # Cancelling a request closes the connection.
+    failures = []
+    d = client.request("STA-NEXT 2")
+    d.addErrback(failures.append)
+    d.cancel()
+    client.transport.loseConnection.assert_called_once_with()
+    assert len(failures) == 1
+
+
+def test_HostapdControlClient_socket_file():
+    client = hostapd_control.HostapdControlClient()
+    path = client.bindAddress()
+    with open(path, "w"):
+        pass
+
+    failures = []
+    client.request("PING").addErrback(failures.append)
+
+    # The socket file is removed when the connection stops, and waiting
+    # requests fail.
+    client.stopProtocol()
+    assert not os.path.exists(path)
+    assert len(failures) == 1
+    assert client.closed
+
+    client.request("PING").addErrback(failures.append)
+    assert len(failures) == 2
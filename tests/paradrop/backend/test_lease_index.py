@@ -0,0 +1,110 @@
+import os
+import shutil
+import tempfile
+
+from mock import patch
+
+from paradrop.backend import lease_index
+from paradrop.backend.lease_index import LeaseIndex
+
+
+def write_leases(path, lines, mtime):
+    with open(path, "w") as output:
+        for line in lines:
+            output.write(line + "\n")
+    os.utime(path, (mtime, mtime))
+
+
+def test_is_lease_file():
+    assert lease_index.is_lease_file("/run/dnsmasq-wlan0.leases")
+    assert not lease_index.is_lease_file("/run/dnsmasq-wlan0.conf")
+
+
+@patch.object(LeaseIndex, "leases", {})
+@patch.object(LeaseIndex, "files", {})
+@patch("paradrop.backend.lease_index.smokesignal")
+def test_LeaseIndex(smokesignal):
+    tempdir = tempfile.mkdtemp()
+    try:
+        path1 = os.path.join(tempdir, "dnsmasq-wlan0.leases")
+        path2 = os.path.join(tempdir, "dnsmasq-wlan1.leases")
+
+        write_leases(path1, [
+            "1480650200 00:11:22:33:44:55 192.168.128.130 android *"
+        ], 100)
+        write_leases(path2, [
+            "1480640500 00:11:22:33:44:55 192.168.129.130 android *",
+            "1480640500 00:22:44:66:88:aa 192.168.129.170 ipod *"
+        ], 200)
+
+        index = LeaseIndex(root=tempdir)
+        index.scan()
+
+        devices = {d['mac_addr']: d for d in LeaseIndex.get_devices()}
+        assert len(devices) == 2
+
+        # The entry from the more recent file takes precedence.
+        assert devices['00:11:22:33:44:55']['ip_addr'] == "192.168.129.130"
+        assert devices['00:11:22:33:44:55']['expires'] == 1480640500
+        actions = [c[0][1]['action'] for c in smokesignal.emit.call_args_list]
+        assert actions.count("added") == 2
+
+        # An unchanged file is not parsed again.
+        with patch("paradrop.backend.lease_index.read_leases") as read_leases:
+            leases = LeaseIndex.get_file_leases(path1)
+            assert len(leases) == 1
+            assert not read_leases.called
+
+        # Removing a file removes its leases and emits events.
+        smokesignal.reset_mock()
+        os.remove(path2)
+        index.scan()
+        devices = {d['mac_addr']: d for d in LeaseIndex.get_devices()}
+        assert len(devices) == 1
+        assert devices['00:11:22:33:44:55']['ip_addr'] == "192.168.128.130"
+        actions = [c[0][1]['action'] for c in smokesignal.emit.call_args_list]
+        assert sorted(actions) == ["removed", "updated"]
+
+        assert LeaseIndex.get_file_leases(path2) is None
+    finally:
+        shutil.rmtree(tempdir)
+
+
+@patch.object(LeaseIndex, "leases", {})
+@patch.object(LeaseIndex, "files", {})
+@patch("paradrop.backend.lease_index.reactor")
+@patch("paradrop.backend.lease_index.smokesignal")
+def test_LeaseIndex_modified_in_place(smokesignal, reactor):
+    from twisted.python.filepath import FilePath
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tempdir, "dnsmasq-wlan0.leases")
+        write_leases(path, [
+            "1480650200 00:11:22:33:44:55 192.168.128.130 android *"
+        ], 100)
+
+        index = LeaseIndex(root=tempdir)
+        index.scan()
+
+        # dnsmasq rewrites the open file, which only causes IN_MODIFY events,
+        # and the modification time may not change.
+        with open(path, "r+") as output:
+            output.seek(0)
+            output.write("1480650900 00:11:22:33:44:55 192.168.128.131 android *\n")
+        os.utime(path, (100, 100))
+
+        smokesignal.reset_mock()
+        for i in range(3):
+            index.on_notify(None, FilePath(path), lease_index.inotify.IN_MODIFY)
+
+        # The events are read once, after the delay.
+        assert reactor.callLater.call_count == 1
+        reactor.callLater.call_args[0][1]()
+
+        devices = LeaseIndex.get_devices()
+        assert devices[0]['ip_addr'] == "192.168.128.131"
+        smokesignal.emit.assert_called_once_with('lease_changed',
+                {'action': 'updated', 'lease': devices[0]})
+    finally:
+        shutil.rmtree(tempdir)
@@ -0,0 +1,84 @@
+from mock import MagicMock
+from nose.tools import assert_raises
+
+from paradrop.backend.list_query import ListQuery, decode_cursor
+
+
+ITEMS = [
+    {'mac_addr': '00:00:00:00:00:03', 'signal': -40, 'authorized': True},
+    {'mac_addr': '00:00:00:00:00:01', 'signal': -70, 'authorized': False},
+    {'mac_addr': '00:00:00:00:00:02', 'signal': -60, 'authorized': True},
+    {'mac_addr': '00:00:00:00:00:04', 'authorized': True}
+]
+
+
+def make_request(**args):
+    request = MagicMock()
+    request.args = dict((k, v if isinstance(v, list) else [v]) for k, v in args.items())
+    return request
+
+
+def test_ListQuery_defaults():
+    request = make_request()
+    query = ListQuery(request, 'mac_addr')
+    assert query.wants('signal')
+
+    # Without parameters, the list is returned unchanged.
+    assert query.apply(list(ITEMS), request) == ITEMS
+    request.setHeader.assert_called_once_with('X-Total-Count', '4')
+
+
+def test_ListQuery_pagination():
+    request = make_request(limit="2")
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['1', '2']
+
+    cursor = request.setHeader.call_args[0][1]
+    request = make_request(limit="2", cursor=cursor)
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['3', '4']
+    request.setHeader.assert_called_once_with('X-Total-Count', '4')
+
+    # Descending sort by signal, with missing values last.
+    request = make_request(sort="-signal", limit="3")
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['3', '2', '1']
+
+    cursor = request.setHeader.call_args[0][1]
+    request = make_request(sort="-signal", limit="3", cursor=cursor)
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['4']
+
+    # Ascending sort by signal, also with missing values last.
+    request = make_request(sort="signal", limit="3")
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['1', '2', '3']
+
+    cursor = request.setHeader.call_args[0][1]
+    request = make_request(sort="signal", limit="3", cursor=cursor)
+    query = ListQuery(request, 'mac_addr')
+    result = query.apply(list(ITEMS), request)
+    assert [x['mac_addr'][-1] for x in result] == ['4']
+
+
+def test_ListQuery_filter_and_fields():
+    request = make_request(authorized="true", fields="signal", ignored="x")
+    query = ListQuery(request, 'mac_addr', filters=['authorized'])
+    assert query.wants('signal')
+    assert query.wants('authorized')
+    assert not query.wants('rx_bytes')
+
+    result = query.apply(list(ITEMS), request)
+    assert result == [{'signal': -40}, {'signal': -60}, {}]
+
+
+def test_ListQuery_errors():
+    assert_raises(ValueError, ListQuery, make_request(limit="x"), 'id')
+    assert_raises(ValueError, ListQuery, make_request(limit="0"), 'id')
+    assert_raises(ValueError, ListQuery, make_request(cursor="!!"), 'id')
+    assert_raises(ValueError, decode_cursor, "e30=")
@@ -0,0 +1,73 @@
+from mock import MagicMock
+from nose.tools import assert_raises
+
+from paradrop.backend.log_api import LogQuery
+
+
+RECORDS = [
+    {'type': 3, 'package': 'backend', 'module': 'http_server', 'timestamp': 1.0},
+    {'type': 5, 'package': 'core', 'module': 'update_manager', 'timestamp': 2.0},
+    {'type': 6, 'package': 'backend', 'module': 'chute_api', 'timestamp': 2.0},
+    {'type': 5, 'package': 'backend', 'module': 'chute_api', 'timestamp': 2.0},
+    {'type': 2, 'package': 'core', 'module': 'restart', 'timestamp': 3.0},
+    {'type': 5, 'package': 'core', 'module': 'restart', 'timestamp': 4.0}
+]
+
+
+def make_request(**args):
+    request = MagicMock()
+    request.args = dict((k, [v]) for k, v in args.items())
+    return request
+
+
+def read_pages(**args):
+    """
+    Read all pages and return the timestamps and modules of each page.
+    """
+    pages = []
+    cursor = None
+    while True:
+        if cursor is not None:
+            args['cursor'] = cursor
+        query = LogQuery(make_request(**args))
+        records = [r for r in RECORDS if r['timestamp'] >= query.since]
+        page, cursor = query.read(records)
+        pages.append([(r['timestamp'], r['module']) for r in page])
+        if cursor is None:
+            return pages
+
+
+def test_LogQuery_pagination():
+    pages = read_pages(limit="2")
+    assert pages == [
+        [(1.0, 'http_server'), (2.0, 'update_manager')],
+        [(2.0, 'chute_api'), (2.0, 'chute_api')],
+        [(3.0, 'restart'), (4.0, 'restart')]
+    ]
+
+    # Records with the same timestamp are not repeated or skipped when they
+    # span several pages.
+    pages = read_pages(limit="1")
+    assert sum(pages, []) == [(r['timestamp'], r['module']) for r in RECORDS]
+
+
+def test_LogQuery_filters():
+    pages = read_pages(level="warn", limit="2")
+    assert [len(p) for p in pages] == [2, 2]
+    assert all(module != 'restart' or ts == 4.0 for ts, module in sum(pages, []))
+
+    pages = read_pages(module="backend")
+    assert [m for ts, m in pages[0]] == ['http_server', 'chute_api', 'chute_api']
+
+    pages = read_pages(module="core.restart")
+    assert [ts for ts, m in pages[0]] == [3.0, 4.0]
+
+    pages = read_pages(module="update_manager")
+    assert pages == [[(2.0, 'update_manager')]]
+
+
+def test_LogQuery_errors():
+    assert_raises(ValueError, LogQuery, make_request(since="yesterday"))
+    assert_raises(ValueError, LogQuery, make_request(limit="0"))
+    assert_raises(ValueError, LogQuery, make_request(level="chatty"))
+    assert_raises(ValueError, LogQuery, make_request(cursor="!!"))
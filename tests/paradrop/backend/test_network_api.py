@@ -5,7 +5,7 @@ import tarfile
 from mock import MagicMock, patch
 from nose.tools import assert_raises
 
-from paradrop.backend import network_api
+from paradrop.backend import lease_index, network_api
 
 
 @patch('__builtin__.open')
@@ -17,7 +17,7 @@ def test_read_leases(open):
     ]
     open.return_value = file_object
 
-    leases = network_api.read_leases("/")
+    leases = lease_index.read_leases("/")
     assert len(leases) == 2
     assert leases[0]['ip_addr'] == "192.168.128.130"
 
@@ -39,7 +39,7 @@ def test_update_lease():
         'as_of': 50,
         'mac_addr': '00:11:22:33:44:55'
     }
-    result = network_api.update_lease(leases, old_entry)
+    result = lease_index.update_lease(leases, old_entry)
     assert result['as_of'] == 100
     assert leases['00:11:22:33:44:55']['as_of'] == 100
 
@@ -48,7 +48,7 @@ def test_update_lease():
         'as_of': 200,
         'mac_addr': '00:11:22:33:44:55'
     }
-    result = network_api.update_lease(leases, old_entry)
+    result = lease_index.update_lease(leases, old_entry)
     assert result['as_of'] == 200
     assert leases['00:11:22:33:44:55']['as_of'] == 200
 
@@ -57,7 +57,7 @@ def test_update_lease():
         'as_of': 0,
         'mac_addr': '00:33:66:99:cc:ff'
     }
-    result = network_api.update_lease(leases, old_entry)
+    result = lease_index.update_lease(leases, old_entry)
     assert result['as_of'] == 0
     assert len(leases) == 3
 
@@ -67,5 +67,13 @@ def test_NetworkApi_get_devices():
 
     request = MagicMock()
 
-    data = api.get_devices(request)
-    assert data is not None
+    leases = {
+        '00:11:22:33:44:55': {
+            'as_of': 100,
+            'mac_addr': '00:11:22:33:44:55'
+        }
+    }
+    with patch.object(network_api.LeaseIndex, "leases", leases):
+        data = json.loads(api.get_devices(request))
+    assert len(data) == 1
+    assert data[0]['mac_addr'] == '00:11:22:33:44:55'
@@ -0,0 +1,126 @@
+import json
+
+from mock import MagicMock, patch
+
+from paradrop.backend.paradrop_log_ws import (ParadropLogPublisher,
+        ParadropLogWsFactory, ParadropLogWsProtocol)
+
+
+def make_client(publisher):
+    factory = ParadropLogWsFactory(publisher)
+    client = ParadropLogWsProtocol(factory)
+    client.sendMessage = MagicMock()
+    client.transport = MagicMock()
+    client.transport.producer = None
+    return client
+
+
+def make_record(message, type=3, package='backend', module='http_server'):
+    return {
+        'message': message,
+        'type': type,
+        'package': package,
+        'module': module
+    }
+
+
+def sent_messages(client):
+    return [c[0][0] for c in client.sendMessage.call_args_list]
+
+
+@patch('paradrop.backend.paradrop_log_ws.reactor')
+@patch('paradrop.backend.paradrop_log_ws.smokesignal')
+def test_ParadropLogPublisher(smokesignal, reactor):
+    reactor.callFromThread.side_effect = lambda func: func()
+
+    publisher = ParadropLogPublisher()
+    client1 = make_client(publisher)
+    client2 = make_client(publisher)
+
+    client1.onOpen()
+    client2.onOpen()
+    smokesignal.on.assert_called_once_with('logs', publisher.onParadropLog)
+    client1.transport.registerProducer.assert_called_once_with(client1, True)
+
+    client2.onMessage(json.dumps({
+        'level': 'warn',
+        'module': 'core',
+        'contains': 'chute'
+    }).encode('utf-8'), False)
+
+    publisher.onParadropLog(make_record('info from backend'))
+    publisher.onParadropLog(make_record('chute warning', type=5, package='core'))
+    publisher.onParadropLog(make_record('other warning', type=5, package='core'))
+
+    assert sent_messages(client1) == [b'info from backend', b'chute warning', b'other warning']
+    assert sent_messages(client2) == [b'chute warning']
+
+    # The message is encoded once for all clients.
+    assert sent_messages(client1)[1] is sent_messages(client2)[0]
+
+    # An empty filter receives everything again.
+    client2.onMessage(b'{}', False)
+    publisher.onParadropLog(make_record('info from backend'))
+    assert sent_messages(client2)[-1] == b'info from backend'
+
+    client1.onClose(True, 1000, None)
+    client2.onClose(True, 1000, None)
+    smokesignal.disconnect.assert_called_once_with(publisher.onParadropLog)
+
+
+@patch('paradrop.backend.paradrop_log_ws.settings.LOG_WS_QUEUE_SIZE', 3)
+@patch('paradrop.backend.paradrop_log_ws.reactor')
+@patch('paradrop.backend.paradrop_log_ws.smokesignal')
+def test_ParadropLogWsProtocol_backpressure(smokesignal, reactor):
+    publisher = ParadropLogPublisher()
+    client = make_client(publisher)
+    client.onOpen()
+
+    # Messages are not sent from the logging call.
+    publisher.onParadropLog(make_record('first'))
+    assert reactor.callFromThread.call_count == 1
+    assert not client.sendMessage.called
+
+    client.flush()
+    assert sent_messages(client) == [b'first']
+
+    # While the transport is paused, the oldest messages are dropped.
+    client.pauseProducing()
+    for i in range(5):
+        publisher.onParadropLog(make_record('message {}'.format(i)))
+    client.flush()
+    assert client.sendMessage.call_count == 1
+    assert client.dropped == 2
+
+    client.resumeProducing()
+    messages = sent_messages(client)
+    assert b'2 log messages were dropped' in messages[1]
+    assert messages[2:] == [b'message 2', b'message 3', b'message 4']
+
+    client.stopProducing()
+    publisher.onParadropLog(make_record('after stop'))
+    client.flush()
+    assert client.sendMessage.call_count == 5
+
+
+@patch('paradrop.backend.paradrop_log_ws.reactor')
+@patch('paradrop.backend.paradrop_log_ws.smokesignal')
+def test_ParadropLogWsProtocol_invalid_filter(smokesignal, reactor):
+    reactor.callFromThread.side_effect = lambda func: func()
+
+    publisher = ParadropLogPublisher()
+    client = make_client(publisher)
+    client.onOpen()
+
+    client.onMessage(b'{"module": "core"}', False)
+    for request in [{'module': 5}, {'contains': ['a']}, {'level': [1]},
+                    {'level': {}}, {'level': 'loud'}]:
+        client.onMessage(json.dumps(request).encode('utf-8'), False)
+
+        # The previous filter stays in place.
+        assert client.filters == {'module': 'core'}
+
+    # Errors from a client do not reach the logging call.
+    client.filters = {'module': 5}
+    publisher.onParadropLog(make_record('hello'))
+    assert sent_messages(client) == []
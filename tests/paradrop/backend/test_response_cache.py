@@ -0,0 +1,184 @@
+import json
+
+import smokesignal
+from mock import patch, MagicMock
+
+from twisted.web import http
+from twisted.web.http_headers import Headers
+
+from paradrop.backend import response_cache
+from paradrop.backend.list_query import ListQuery
+from paradrop.backend.response_cache import ResponseCache, cached_response
+from paradrop.core.auth.user import User
+
+
+def make_request(uri="/api/v1/chutes/", role="admin", headers={}, args={}):
+    request = MagicMock()
+    request.uri = uri
+    request.args = dict((k, [v]) for k, v in args.items())
+    request.code = http.OK
+    request.user = User("paradrop", "localhost", role=role)
+    request.getHeader.side_effect = headers.get
+    request.responseHeaders = Headers()
+
+    def setHeader(name, value):
+        request.responseHeaders.setRawHeaders(name, [str(value)])
+    request.setHeader.side_effect = setHeader
+
+    return request
+
+
+def get_header(request, name):
+    for call in request.setHeader.call_args_list:
+        if call[0][0] == name:
+            return call[0][1]
+    return None
+
+
+class FakeApi(object):
+    def __init__(self):
+        self.calls = 0
+
+    @cached_response
+    def get_items(self, request):
+        self.calls += 1
+        return "[1, 2, 3]"
+
+    @cached_response
+    def get_page(self, request):
+        self.calls += 1
+        request.setHeader('Content-Type', 'application/json')
+        query = ListQuery(request, 'id')
+        return json.dumps(query.apply([{'id': i} for i in range(5)], request))
+
+
+def test_ResponseCache_invalidate():
+    cache = ResponseCache(ttl=30)
+    entry = cache.put("key", "{}", "application/json")
+    assert entry['body'] == b"{}"
+    assert entry['etag'].startswith('"')
+    assert cache.get("key") is entry
+
+    smokesignal.emit('container_state_changed', 'test')
+    assert cache.get("key") is None
+
+
+@patch("paradrop.backend.response_cache.time")
+def test_ResponseCache_expires(time):
+    time.time.return_value = 100
+
+    cache = ResponseCache(ttl=30)
+    cache.put("key", "{}", "application/json")
+
+    time.time.return_value = 131
+    assert cache.get("key") is None
+
+
+@patch.object(response_cache, "response_cache", ResponseCache(ttl=30))
+def test_cached_response():
+    api = FakeApi()
+
+    request = make_request()
+    assert api.get_items(request) == b"[1, 2, 3]"
+    assert api.calls == 1
+    etag = get_header(request, 'ETag')
+
+    # Same role, cache hit.
+    request = make_request()
+    assert api.get_items(request) == b"[1, 2, 3]"
+    assert api.calls == 1
+    assert get_header(request, 'ETag') == etag
+
+    # Client already has the current version.
+    request = make_request(headers={'If-None-Match': etag})
+    assert api.get_items(request) == b""
+    assert api.calls == 1
+    request.setResponseCode.assert_called_once_with(http.NOT_MODIFIED)
+
+    # Different role, separate entry.
+    request = make_request(role="user")
+    api.get_items(request)
+    assert api.calls == 2
+
+    # Errors are not cached.
+    request = make_request(uri="/api/v1/chutes/missing")
+    request.code = 404
+    assert api.get_items(request) == "[1, 2, 3]"
+    api.get_items(request)
+    assert api.calls == 4
+
+    smokesignal.emit('chute_saved', 'test')
+    api.get_items(make_request())
+    assert api.calls == 5
+
+
+@patch("paradrop.backend.response_cache.time")
+def test_ResponseCache_last_modified(time):
+    time.time.return_value = 100
+
+    cache = ResponseCache(ttl=30, max_versions=2)
+    entry = cache.put("key", "{}", "application/json")
+    assert entry['last_modified'] == 100
+
+    # Same body after expiry or invalidation keeps its Last-Modified time.
+    time.time.return_value = 200
+    cache.invalidate()
+    entry = cache.put("key", "{}", "application/json")
+    assert entry['last_modified'] == 100
+
+    # A changed body after the TTL refresh advances it.
+    time.time.return_value = 300
+    entry = cache.put("key", "[]", "application/json")
+    assert entry['last_modified'] == 300
+
+    # Only the most recent versions are remembered.
+    cache.put("a", "{}", "application/json")
+    cache.put("b", "{}", "application/json")
+    assert list(cache.versions.keys()) == ["a", "b"]
+
+
+def test_send_cached_conditions():
+    entry = {
+        'body': b"{}",
+        'content_type': 'application/json',
+        'etag': '"abc"',
+        'last_modified': 1000000000,
+        'expires': 0
+    }
+    current = http.datetimeToString(1000000000)
+    older = http.datetimeToString(999999000)
+
+    def send(headers):
+        request = make_request(headers=headers)
+        return response_cache.send_cached(request, entry)
+
+    assert send({}) == b"{}"
+    assert send({'If-None-Match': '"abc"'}) == b""
+    assert send({'If-None-Match': '"xyz", W/"abc"'}) == b""
+    assert send({'If-None-Match': '*'}) == b""
+    assert send({'If-Modified-Since': current}) == b""
+    assert send({'If-Modified-Since': older}) == b"{}"
+    assert send({'If-Modified-Since': 'garbage'}) == b"{}"
+
+    # If-None-Match takes precedence over If-Modified-Since.
+    assert send({'If-None-Match': '"xyz"', 'If-Modified-Since': current}) == b"{}"
+
+
+@patch.object(response_cache, "response_cache", ResponseCache(ttl=30))
+def test_cached_response_pagination():
+    api = FakeApi()
+
+    # An identical request answered from the cache has the same pagination
+    # headers as the first one.
+    uri = "/api/v1/network/devices?limit=2"
+    for calls in [1, 1]:
+        request = make_request(uri=uri, args={'limit': '2'})
+        assert json.loads(api.get_page(request)) == [{'id': 0}, {'id': 1}]
+        assert api.calls == calls
+        assert get_header(request, 'X-Total-Count') == '5'
+        cursor = get_header(request, 'X-Next-Cursor')
+        assert cursor is not None
+
+    request = make_request(uri=uri + "&cursor=" + cursor,
+            args={'limit': '2', 'cursor': cursor})
+    assert json.loads(api.get_page(request)) == [{'id': 2}, {'id': 3}]
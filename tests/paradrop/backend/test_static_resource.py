@@ -0,0 +1,72 @@
+import gzip
+import io
+import os
+import tempfile
+
+from twisted.web.test.requesthelper import DummyRequest
+
+from paradrop.backend import static_resource
+from paradrop.backend.static_resource import PortalFile
+
+
+def make_portal():
+    portal_dir = tempfile.mkdtemp()
+    with open(os.path.join(portal_dir, "app-27896e7b8aabcfde5b72.js"), "w") as output:
+        output.write("var x = 1;\n" * 1000)
+    with open(os.path.join(portal_dir, "index.html"), "w") as output:
+        output.write("<html></html>")
+    return portal_dir
+
+
+def test_precompress_directory():
+    portal_dir = make_portal()
+    cache_dir = tempfile.mkdtemp()
+
+    variants = static_resource.precompress_directory(portal_dir, cache_dir)
+
+    # index.html is too small to be worth compressing.
+    path = os.path.join(portal_dir, "app-27896e7b8aabcfde5b72.js")
+    assert list(variants.keys()) == [path]
+
+    gz_path = variants[path]['gzip']
+    assert gz_path.startswith(cache_dir)
+    with gzip.GzipFile(gz_path) as source:
+        assert source.read() == b"var x = 1;\n" * 1000
+
+
+def test_select_encoding():
+    available = {"gzip": "app.js.gz"}
+    assert static_resource.select_encoding("gzip, deflate", available) == "gzip"
+    assert static_resource.select_encoding("gzip;q=0", available) is None
+    assert static_resource.select_encoding("*", available) == "gzip"
+    assert static_resource.select_encoding("identity", available) is None
+    assert static_resource.select_encoding(None, available) is None
+
+
+def test_get_cache_control():
+    assert "immutable" in static_resource.get_cache_control("vendor-27896e7b8aabcfde5b72.js")
+    assert static_resource.get_cache_control("index.html") == "no-cache"
+
+
+def test_PortalFile_render():
+    portal_dir = make_portal()
+    variants = static_resource.precompress_directory(portal_dir, tempfile.mkdtemp())
+
+    resource = PortalFile(portal_dir, variants=variants)
+    child = resource.getChild(b"app-27896e7b8aabcfde5b72.js", DummyRequest([b""]))
+
+    request = DummyRequest([b""])
+    request.requestHeaders.setRawHeaders(b"accept-encoding", [b"gzip"])
+    child.render(request)
+    headers = request.responseHeaders
+    assert headers.getRawHeaders(b"content-encoding") == [b"gzip"]
+    assert headers.getRawHeaders(b"vary") == [b"Accept-Encoding"]
+    assert b"immutable" in headers.getRawHeaders(b"cache-control")[0]
+
+    data = gzip.GzipFile(fileobj=io.BytesIO(b"".join(request.written))).read()
+    assert data == b"var x = 1;\n" * 1000
+
+    request = DummyRequest([b""])
+    child.render(request)
+    assert request.responseHeaders.getRawHeaders(b"content-encoding") is None
+    assert b"".join(request.written) == b"var x = 1;\n" * 1000
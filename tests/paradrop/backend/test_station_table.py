@@ -0,0 +1,97 @@
+from mock import patch, MagicMock
+from twisted.internet import defer
+
+from paradrop.backend import station_table
+from paradrop.backend.station_table import StationTable
+
+
+STA_REPLY = """02:00:00:00:01:00
+flags=[AUTH][ASSOC][AUTHORIZED]
+aid=1
+rx_packets=75
+tx_packets=21
+rx_bytes=18816
+tx_bytes=5386
+inactive_msec=304
+signal=-29
+rx_rate_info=650 mcs 7
+tx_rate_info=540
+connected_time=120
+supported_rates=82 84 8b 96
+"""
+
+
+def test_parse_station():
+    station = station_table.parse_station(STA_REPLY)
+    assert station['mac_addr'] == "02:00:00:00:01:00"
+    assert station['rx_bytes'] == 18816
+    assert station['inactive_time'] == 304
+    assert station['signal'] == -29
+    assert station['rx_bitrate'] == 65.0
+    assert station['tx_bitrate'] == 54.0
+    assert station['authorized']
+    assert station['supported_rates'] == "82 84 8b 96"
+
+    assert station_table.parse_station("") is None
+    assert station_table.parse_station("FAIL\n") is None
+
+
+@patch("paradrop.backend.station_table.with_timeout", lambda d, seconds: d)
+@patch("paradrop.backend.station_table.hostapd_control")
+def test_StationTable_refresh_interface(hostapd_control):
+    replies = {
+        "STA-FIRST": STA_REPLY,
+        "STA-NEXT 02:00:00:00:01:00": STA_REPLY.replace("01:00", "02:00"),
+        "STA-NEXT 02:00:00:00:02:00": ""
+    }
+    client = MagicMock()
+    client.closed = False
+    client.request.side_effect = lambda command: defer.succeed(replies[command])
+    hostapd_control.connect.return_value = client
+
+    StationTable.stations = {
+        ("vwlan0", "02:00:00:00:09:00"): {}
+    }
+
+    table = StationTable()
+    table.refresh_interface("vwlan0")
+
+    stations = StationTable.get_stations("vwlan0")
+    assert [s['mac_addr'] for s in stations] == ["02:00:00:00:01:00",
+                                                "02:00:00:00:02:00"]
+    assert StationTable.get_station("vwlan0", "02:00:00:00:02:00")['aid'] == 1
+    assert "vwlan0" in StationTable.updated
+
+    StationTable.remove_station("vwlan0", "02:00:00:00:01:00")
+    assert StationTable.get_station("vwlan0", "02:00:00:00:01:00") is None
+
+    # The control connection is kept for the next refresh.
+    table.refresh_interface("vwlan0")
+    assert hostapd_control.connect.call_count == 1
+    assert client.request.call_count == 6
+
+    # Stations beyond the limit are left out with a warning.
+    assert "vwlan0" not in StationTable.truncated
+    with patch.object(station_table.settings, "STATION_TABLE_MAX_STATIONS", 1):
+        table.refresh_interface("vwlan0")
+    assert len(StationTable.get_stations("vwlan0")) == 1
+    assert "vwlan0" in StationTable.truncated
+
+    table.refresh_interface("vwlan0")
+    assert "vwlan0" not in StationTable.truncated
+
+    table.stop()
+    assert client.close.called
+
+
+@patch("paradrop.backend.station_table.ChuteStorage")
+def test_get_access_points(ChuteStorage):
+    chute = MagicMock()
+    chute.getCache.return_value = [
+        {'type': 'wifi-ap', 'mode': 'ap', 'externalIntf': 'vwlan0'},
+        {'type': 'wifi-sta', 'mode': 'sta', 'externalIntf': 'vwlan1'},
+        {'type': 'lan', 'externalIntf': 'veth0'}
+    ]
+    ChuteStorage.return_value.getChuteList.return_value = [chute]
+
+    assert station_table.get_access_points() == ['vwlan0']
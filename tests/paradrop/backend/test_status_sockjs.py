@@ -0,0 +1,103 @@
+import json
+
+from mock import MagicMock, patch
+
+from paradrop.backend import status_sockjs
+
+
+class FakeClient(object):
+    def __init__(self, interval=2):
+        self.interval = interval
+        self.last_seq = None
+        self.last_push = 0
+        self.messages = []
+
+    def sendMessage(self, message):
+        self.messages.append(json.loads(message.decode('utf-8')))
+
+
+def make_system_status():
+    system_status = MagicMock()
+    system_status.timestamp = 0
+    system_status.getStatus.return_value = {
+        'cpu_load': [10, 20],
+        'mem': {'total': 100, 'free': 50}
+    }
+    return system_status
+
+
+@patch("paradrop.backend.status_sockjs.time")
+@patch("paradrop.backend.status_sockjs.LoopingCall")
+def test_StatusPublisher(LoopingCall, time):
+    system_status = make_system_status()
+    publisher = status_sockjs.StatusPublisher(system_status)
+
+    time.time.return_value = 100
+    client1 = FakeClient()
+    publisher.subscribe(client1)
+    assert LoopingCall.return_value.start.called
+
+    # The first frame contains the full status.
+    publisher.publish()
+    assert client1.messages[0]['seq'] == 1
+    assert client1.messages[0]['status']['mem']['free'] == 50
+
+    # Later frames contain only the changes.
+    system_status.getStatus.return_value['mem']['free'] = 40
+    time.time.return_value = 102
+    publisher.publish()
+    assert client1.messages[1] == {
+        'seq': 2,
+        'time': 0,
+        'delta': {'mem': {'free': 40}}
+    }
+
+    # A new subscriber receives the latest full status right away.
+    client2 = FakeClient(interval=10)
+    publisher.subscribe(client2)
+    assert client2.messages[0]['seq'] == 2
+    assert 'status' in client2.messages[0]
+
+    # The slow client is skipped until its interval has passed, and then
+    # receives the changes since the last frame it saw.
+    system_status.getStatus.return_value['cpu_load'] = [30, 40]
+    time.time.return_value = 104
+    publisher.publish()
+    assert len(client1.messages) == 3
+    assert len(client2.messages) == 1
+
+    system_status.getStatus.return_value['mem']['free'] = 30
+    time.time.return_value = 112
+    publisher.publish()
+    assert client2.messages[1]['delta'] == {
+        'cpu_load': [30, 40],
+        'mem': {'free': 30}
+    }
+
+    publisher.unsubscribe(client1)
+    assert not LoopingCall.return_value.stop.called
+    publisher.unsubscribe(client2)
+    assert LoopingCall.return_value.stop.called
+
+
+@patch("paradrop.backend.status_sockjs.time")
+def test_StatusSockJSProtocol(time):
+    system_status = make_system_status()
+    factory = status_sockjs.StatusSockJSFactory(system_status)
+    factory.publisher = MagicMock()
+
+    protocol = factory.buildProtocol(None)
+    protocol.sendMessage = MagicMock()
+
+    # Refresh requests are rate limited.
+    time.time.return_value = 100
+    protocol.onMessage(b"refresh", False)
+    protocol.onMessage(b"refresh", False)
+    assert protocol.sendMessage.call_count == 1
+
+    protocol.onMessage(b"subscribe 5", False)
+    assert protocol.interval == 5
+    factory.publisher.subscribe.assert_called_with(protocol)
+
+    protocol.onClose(True, None, None)
+    factory.publisher.unsubscribe.assert_called_with(protocol)
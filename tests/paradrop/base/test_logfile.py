@@ -0,0 +1,207 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import tempfile
+
+from mock import patch
+
+from paradrop.base import logfile, output
+
+
+def make_lines(count, size=100):
+    line = b'x' * (size - 1) + b'\n'
+    return [(None, line)] * count
+
+
+def make_records(start, count):
+    records = []
+    for i in range(start, start + count):
+        record = {'message': 'test', 'timestamp': float(i)}
+        records.append((record['timestamp'], json.dumps(record).encode('utf-8') + b'\n'))
+    return records
+
+
+def test_parseSegmentName():
+    assert logfile.parseSegmentName('log', 'log.2017_05_04') == ('2017_05_04', 0, False)
+    assert logfile.parseSegmentName('log', 'log.2017_05_04.3.gz') == ('2017_05_04', 3, True)
+    assert logfile.parseSegmentName('log', 'log') is None
+    assert logfile.parseSegmentName('log', 'log.2017_05_04.3.gz.tmp') is None
+    assert logfile.parseSegmentName('log', 'other.2017_05_04') is None
+    assert logfile.parseSegmentName('log', 'log.today') is None
+
+
+def test_LogFile_buffering():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        writer = logfile.LogFile('log', tmpdir, bufferSize=1000, flushInterval=60)
+        path = os.path.join(tmpdir, 'log')
+
+        writer.write(make_lines(5))
+        assert os.path.getsize(path) == 0
+        assert writer.flushIfDue() > 0
+
+        # Filling the buffer writes it out.
+        writer.write(make_lines(5))
+        assert os.path.getsize(path) == 1000
+
+        writer.write(make_lines(1))
+        with patch('paradrop.base.logfile.time.time', return_value=writer.bufferedSince + 61):
+            assert writer.flushIfDue() is None
+        assert os.path.getsize(path) == 1100
+
+        writer.write(make_lines(1))
+        writer.close()
+        assert os.path.getsize(path) == 1200
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_LogFile_rotation():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        writer = logfile.LogFile('log', tmpdir, bufferSize=1, maxFileSize=1000,
+                maxTotalSize=1000000)
+        for i in range(25):
+            writer.write(make_lines(1))
+        writer.close()
+        writer.compressor.queue.join()
+
+        segments = logfile.listSegments(tmpdir, 'log')
+        assert len(segments) == 2
+        assert [s[2] for s in segments] == [1, 2]
+        assert all(s[3] for s in segments)
+
+        path = os.path.join(tmpdir, segments[0][0])
+        with gzip.open(path, 'rb') as source:
+            assert source.read() == b''.join(line for ts, line in make_lines(10))
+        assert os.path.getsize(os.path.join(tmpdir, 'log')) == 500
+
+        # A new day starts a new segment even if the file is small.
+        writer = logfile.LogFile('log', tmpdir, bufferSize=1, maxFileSize=1000)
+        writer.date = '2000_01_01'
+        writer.write(make_lines(1))
+        writer.close()
+        writer.compressor.queue.join()
+
+        segments = logfile.listSegments(tmpdir, 'log')
+        assert segments[0][:3] == ('log.2000_01_01.1.gz', '2000_01_01', 1)
+        assert os.path.getsize(os.path.join(tmpdir, 'log')) == 100
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_Compressor_retention():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        names = ['log.2017_05_03', 'log.2017_05_04.1', 'log.2017_05_04.2', 'log.2017_05_05.1']
+        for name in names:
+            with open(os.path.join(tmpdir, name), 'wb') as output_file:
+                output_file.write(b'x' * 1000)
+
+        compressor = logfile.Compressor(tmpdir, 'log', 2500)
+        compressor.enforceRetention()
+
+        remaining = [s[0] for s in logfile.listSegments(tmpdir, 'log')]
+        assert remaining == names[2:]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_PrintLogThread():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        messages = queue.Queue()
+        printer = output.PrintLogThread(tmpdir, messages, 'log', batchSize=10,
+                flushInterval=0.01)
+        printer.start()
+
+        for i in range(50):
+            messages.put({'message': 'test', 'index': i})
+        messages.join()
+        printer.writer.close()
+
+        with open(os.path.join(tmpdir, 'log'), 'r') as source:
+            records = [json.loads(line) for line in source]
+        assert [r['index'] for r in records] == list(range(50))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_SegmentIndex():
+    index = logfile.SegmentIndex(interval=100)
+    for i in range(10):
+        index.add(float(i), 60)
+    index.add(None, 60)
+
+    assert index.first == 0.0
+    assert index.last == 9.0
+    assert index.size == 660
+    assert index.offsets == [[0.0, 0], [2.0, 120], [4.0, 240], [6.0, 360], [8.0, 480]]
+
+    assert index.seekOffset(0) == 0
+    assert index.seekOffset(5) == 240
+    assert index.seekOffset(100) == 480
+
+
+def test_readLogs():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        writer = logfile.LogFile('log', tmpdir, bufferSize=1, maxFileSize=1000,
+                indexInterval=200)
+        for i in range(0, 100, 10):
+            writer.write(make_records(i, 10))
+        writer.close()
+        writer.compressor.queue.join()
+
+        segments = logfile.listSegments(tmpdir, 'log')
+        assert len(segments) > 1
+        for segment in segments:
+            assert os.path.exists(logfile.indexPath(tmpdir, segment[0]))
+
+        records = list(logfile.readLogs(tmpdir, 'log', 0))
+        assert [r['timestamp'] for r in records] == [float(i) for i in range(100)]
+
+        records = list(logfile.readLogs(tmpdir, 'log', 75.0))
+        assert [r['timestamp'] for r in records] == [float(i) for i in range(75, 100)]
+
+        # Segments before the start time are not opened.
+        with patch('paradrop.base.logfile.readSegment', side_effect=logfile.readSegment) as readSegment:
+            list(logfile.readLogs(tmpdir, 'log', 95.0))
+            assert readSegment.call_count == 1
+
+        # Missing indexes are rebuilt.
+        os.remove(logfile.indexPath(tmpdir, segments[0][0]))
+        records = list(logfile.readLogs(tmpdir, 'log', 0, purge=True))
+        assert len(records) == 100
+        assert logfile.listSegments(tmpdir, 'log') == []
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_Output_getLogsSince():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        out = output.Output()
+        out.__dict__['logpath'] = tmpdir
+        out.__dict__['queue'] = queue.Queue()
+        out.__dict__['printer'] = output.PrintLogThread(tmpdir, out.queue, 'log',
+                flushInterval=60)
+        out.printer.start()
+
+        for i in range(10):
+            out.queue.put({'message': 'test', 'timestamp': float(i)})
+        out.queue.join()
+
+        # Buffered messages are written out before reading.
+        logs = out.getLogsSince(4.0)
+        assert [x['timestamp'] for x in logs] == [5.0, 6.0, 7.0, 8.0, 9.0]
+
+        logs = out.getLogsSince(4.0, inclusive=True)
+        assert next(logs)['timestamp'] == 4.0
+
+        out.printer.writer.close()
+    finally:
+        out.logToConsole(True)
+        shutil.rmtree(tmpdir)
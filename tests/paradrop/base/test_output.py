@@ -3,6 +3,9 @@ import time
 import shutil
 import json
 
+import smokesignal
+from mock import MagicMock
+
 from paradrop.base import output
 
 
@@ -71,6 +74,85 @@ def test_returnType():
         assert type(x) is dict
 
 
+def test_levelThresholds():
+    received = MagicMock()
+    smokesignal.on(output.LOG_SIGNAL, received)
+
+    try:
+        output.out.setLevel('warn')
+        assert output.out.info('dropped') is None
+        assert output.out.warn('kept')['message'] == 'kept'
+
+        # Module thresholds override the global level in both directions.
+        output.out.setLevel('verbose', module=__name__)
+        assert output.out.isEnabledFor('verbose', module=__name__)
+        assert not output.out.isEnabledFor('verbose', module='paradrop.backend')
+        assert output.out.verbose('kept')['message'] == 'kept'
+
+        output.out.setLevel('err', module=__name__.rpartition('.')[0])
+        assert output.out.verbose('kept') is not None
+
+        output.out.setLevel(None, module=__name__)
+        assert output.out.warn('dropped') is None
+        assert output.out.err('kept') is not None
+    finally:
+        smokesignal.disconnect(received)
+        output.out.setLevel(None, module=__name__.rpartition('.')[0])
+        output.out.setLevel(output.Level.HEADER)
+
+    assert received.call_count == 4
+
+
+def test_lazyFormatting():
+    arg = MagicMock()
+    arg.__str__ = MagicMock(return_value='value')
+
+    received = MagicMock()
+    smokesignal.on(output.LOG_SIGNAL, received)
+
+    try:
+        output.out.setLevel('info')
+        assert output.out.verbose('formatted %s', arg) is None
+        assert not arg.__str__.called
+
+        output.out.setLevel(output.Level.HEADER)
+        result = output.out.verbose('formatted %s\n', arg)
+        assert result['message'] == 'formatted value'
+    finally:
+        smokesignal.disconnect(received)
+        output.out.setLevel(output.Level.HEADER)
+
+
+def test_noSinks():
+    saved = output.out.queue, output.out.printLogs
+    output.out.__dict__['queue'] = None
+    output.out.logToConsole(False)
+
+    received = MagicMock()
+
+    try:
+        # With console, file and subscribers all off, no log dict is built.
+        assert output.out.info('dropped') is None
+
+        smokesignal.on(output.LOG_SIGNAL, received)
+        assert output.out.info('kept') is not None
+    finally:
+        smokesignal.disconnect(received)
+        output.out.__dict__['queue'] = saved[0]
+        output.out.logToConsole(saved[1])
+
+    assert received.call_count == 1
+
+
+def test_parseModuleLevels():
+    levels = output.parseModuleLevels('paradrop.core.plan:INFO, paradrop.backend:warn,')
+    assert levels == {
+        'paradrop.core.plan': output.Level.INFO.value,
+        'paradrop.backend': output.Level.WARN.value
+    }
+    assert output.parseModuleLevels('') == {}
+
+
 ###############################################################################
 # Random inline testing
 ###############################################################################
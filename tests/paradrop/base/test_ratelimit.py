@@ -0,0 +1,99 @@
+from mock import MagicMock, patch
+
+import smokesignal
+
+from paradrop.base import output, ratelimit
+
+
+def test_messageTemplate():
+    assert ratelimit.messageTemplate('retry 12 of 100') == 'retry # of #'
+    assert ratelimit.messageTemplate('retry %d', formatted=False) == 'retry %d'
+    assert ratelimit.messageTemplate({'message': 'event 1'}) == 'event #'
+    assert ratelimit.messageTemplate(ValueError('bad 1')) == 'bad #'
+
+
+def test_parseRateLimits():
+    limits = ratelimit.parseRateLimits('INFO:20/60, warn:5/10,', output.levelValue)
+    assert limits == {
+        output.Level.INFO.value: (20, 60.0),
+        output.Level.WARN.value: (5, 10.0)
+    }
+
+    assert ratelimit.parseRateLimits('', output.levelValue) == {}
+
+
+def test_RateLimiter():
+    limiter = ratelimit.RateLimiter()
+    limiter.setLimit(3, 2, 10)
+    key = ('paradrop.core.restart', 64, 'failed')
+
+    assert [limiter.allow(key, 3, 100 + i) for i in range(5)] == \
+            [True, True, False, False, False]
+
+    # Other keys and unlimited levels are counted separately.
+    assert limiter.allow(('paradrop.core.restart', 65, 'failed'), 3, 101)
+    assert all(limiter.allow(key, 5, 101) for i in range(5))
+
+    stats = limiter.getStats()
+    assert stats['suppressed'] == 3
+    assert len(stats['suppressing']) == 1
+    assert stats['suppressing'][0]['count'] == 5
+
+    assert limiter.expired(105) == []
+
+    # The window has ended, so the suppressed messages are summarized once.
+    entries = limiter.expired(111)
+    assert [(e.key, e.suppressed) for e in entries] == [(key, 3)]
+    assert limiter.expired(112) == []
+    assert limiter.allow(key, 3, 112)
+
+    # A message that starts a new window also reports the previous one.
+    for i in range(3):
+        limiter.allow(key, 3, 113)
+    assert limiter.allow(key, 3, 123)
+    assert [e.suppressed for e in limiter.expired(123)] == [2]
+
+    limiter.setLimit(3, None, None)
+    assert limiter.getStats()['limits'] == {}
+
+
+def test_Output_rateLimit():
+    out = output.Output(info=output.BaseOutput(output.LOG_TYPES[output.Level.INFO]))
+    out.logToConsole(False)
+    out.setRateLimit('info', 2, 60)
+
+    received = MagicMock()
+    smokesignal.on(output.LOG_SIGNAL, received)
+
+    try:
+        with patch('paradrop.base.output.time.time', return_value=1000.0):
+            for i in range(5):
+                out.info('attempt {} failed'.format(i))
+            for i in range(5):
+                out.info('attempt %d failed', i)
+
+        messages = [c[0][0]['message'] for c in received.call_args_list]
+        assert messages == ['attempt 0 failed', 'attempt 1 failed',
+                            'attempt 0 failed', 'attempt 1 failed']
+
+        stats = out.getRateLimitStats()
+        assert stats['limits'] == {'INFO': {'burst': 2, 'window': 60}}
+        assert stats['suppressed'] == 6
+        assert sorted(s['template'] for s in stats['suppressing']) == \
+                ['attempt # failed', 'attempt %d failed']
+        assert stats['suppressing'][0]['level'] == 'INFO'
+
+        # Summaries are logged ahead of the next message after the window.
+        with patch('paradrop.base.output.time.time', return_value=1061.0):
+            out.info('later')
+
+        records = [c[0][0] for c in received.call_args_list[4:]]
+        assert sorted(r['message'] for r in records[:2]) == [
+            'Message repeated 3 times in the last 60 seconds: attempt # failed',
+            'Message repeated 3 times in the last 60 seconds: attempt %d failed'
+        ]
+        assert records[0]['module'] == 'test_ratelimit'
+        assert records[0]['type'] == output.Level.INFO.value
+        assert records[2]['message'] == 'later'
+    finally:
+        smokesignal.disconnect(received)
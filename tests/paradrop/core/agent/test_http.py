@@ -79,3 +79,193 @@ def test_PDServerRequest_receiveResponse(nexus):
     request.receiveResponse(response)
     driver.setHeader.assert_called_with('Authorization', 'Bearer token2')
     driver.request.assert_called()
+
+
+@patch("paradrop.core.agent.http.nexus")
+def test_PDServerRequest_compress(nexus):
+    import gzip
+    import io
+    import json
+
+    driver = MagicMock()
+    driver_factory = MagicMock()
+    driver_factory.return_value = driver
+
+    request = http.PDServerRequest("test", driver=driver_factory, compress=True)
+    request.post(var=42)
+    driver.setHeader.assert_any_call('Content-Encoding', 'gzip')
+
+    body = driver.request.call_args[0][2]
+    with gzip.GzipFile(fileobj=io.BytesIO(body)) as source:
+        assert json.loads(source.read().decode('utf-8')) == {'var': 42}
+
+
+@patch("paradrop.core.agent.http.settings")
+@patch("paradrop.core.agent.http.nexus")
+def test_PDServerRequest_compress_auto(nexus, settings):
+    settings.PDSERVER_COMPRESS_REQUESTS = True
+    settings.PDSERVER_COMPRESS_MIN_SIZE = 100
+
+    driver = MagicMock()
+    driver_factory = MagicMock()
+    driver_factory.return_value = driver
+
+    request = http.PDServerRequest("test", driver=driver_factory)
+    request.post(var=42)
+    assert request.body == driver.request.call_args[0][2]
+
+    request = http.PDServerRequest("test", driver=driver_factory)
+    request.post(var="x" * 200)
+    driver.setHeader.assert_any_call('Content-Encoding', 'gzip')
+    assert len(driver.request.call_args[0][2]) < len(request.body)
+
+    settings.PDSERVER_COMPRESS_REQUESTS = False
+    request = http.PDServerRequest("test", driver=driver_factory)
+    request.post(var="x" * 200)
+    assert request.body == driver.request.call_args[0][2]
+
+
+@patch("paradrop.core.agent.http.nexus")
+def test_PDServerRequest_compression_rejected(nexus):
+    driver = MagicMock()
+    driver_factory = MagicMock()
+    driver_factory.return_value = driver
+
+    try:
+        request = http.PDServerRequest("test", driver=driver_factory, compress=True)
+        request.post(var=42)
+        assert request.compressed
+
+        # The controller does not take compressed bodies, so the request is
+        # sent again uncompressed, and so are later requests.
+        response = MagicMock()
+        response.code = 415
+        request.receiveResponse(response)
+        assert http.PDServerRequest.compressionRejected
+        assert not request.compressed
+        assert driver.request.call_args[0][2] == request.body
+
+        request = http.PDServerRequest("test", driver=driver_factory, compress=True)
+        request.post(var=42)
+        assert driver.request.call_args[0][2] == request.body
+
+        # Errors of uncompressed requests are passed on.
+        response.code = 400
+        assert request.receiveResponse(response) is response
+    finally:
+        http.PDServerRequest.compressionRejected = False
+
+
+def test_RequestMetrics():
+    http.RequestMetrics.endpoints = {}
+    http.RequestMetrics.recent = {}
+
+    name = http.RequestMetrics.endpointName('PATCH',
+            '/api/routers/{router_id}/updates/5a1c0f4e2b7d9a0012345678')
+    assert name == 'PATCH /api/routers/{router_id}/updates/{id}'
+    assert http.RequestMetrics.endpointName('GET', 'updates/12?x=1') == \
+            'GET /updates/{id}'
+
+    http.RequestMetrics.record(name, 0.5, code=200, sent=100, uncompressed=400)
+    http.RequestMetrics.record(name, 1.5, code=500, sent=100, uncompressed=400)
+    http.RequestMetrics.record(name, 1.0)
+    http.RequestMetrics.recordRetry(name)
+    http.RequestMetrics.recordRetry(name, auth=True)
+
+    stats = http.RequestMetrics.getStatistics()[name]
+    assert stats['requests'] == 3
+    assert stats['errors'] == 1
+    assert stats['failures'] == 1
+    assert stats['retries'] == 1
+    assert stats['auth_retries'] == 1
+    assert stats['bytes_sent'] == 200
+    assert stats['bytes_uncompressed'] == 800
+    assert stats['mean_time'] == 1.0
+    assert stats['max_time'] == 1.5
+    assert stats['p50_time'] == 1.0
+    assert stats['p95_time'] == 1.5
+    assert stats['last_code'] is None
+
+
+@patch("paradrop.core.agent.http.nexus")
+def test_PDServerRequest_metrics(nexus):
+    from twisted.internet.defer import Deferred
+
+    http.RequestMetrics.endpoints = {}
+    http.RequestMetrics.recent = {}
+
+    driver = MagicMock()
+    driver_factory = MagicMock()
+    driver_factory.return_value = driver
+
+    d = Deferred()
+    driver.request.return_value = d
+
+    request = http.PDServerRequest("/api/routers/{router_id}/states",
+            driver=driver_factory)
+    request.post(var=42)
+
+    response = MagicMock()
+    response.code = 200
+    d.callback(response)
+
+    request.recordRetry()
+
+    stats = http.RequestMetrics.getStatistics()
+    endpoint = stats['POST /api/routers/{router_id}/states']
+    assert endpoint['requests'] == 1
+    assert endpoint['retries'] == 1
+    assert endpoint['last_code'] == 200
+    assert endpoint['bytes_sent'] == len(request.body)
+
+
+@patch("paradrop.core.agent.http.reactor")
+@patch("paradrop.core.agent.http.pycurl.Curl")
+@patch("paradrop.core.agent.http.pycurl.CurlMulti")
+def test_CurlMultiClient(CurlMulti, Curl, reactor):
+    import pycurl
+
+    multi = MagicMock()
+    CurlMulti.return_value = multi
+    Curl.side_effect = lambda: MagicMock()
+
+    client = http.CurlMultiClient(2)
+
+    configure = MagicMock()
+    results = []
+    for i in range(3):
+        d = client.perform(configure)
+        d.addBoth(results.append)
+
+    # Only two handles, so the third transfer waits.
+    assert multi.add_handle.call_count == 2
+    assert len(client.waiting) == 1
+
+    first, second = list(client.active.keys())
+
+    # Sockets are passed to the reactor.
+    client.onSocket(pycurl.POLL_INOUT, 7, multi, None)
+    assert reactor.addReader.called
+    assert reactor.addWriter.called
+    client.onSocket(pycurl.POLL_REMOVE, 7, multi, None)
+    assert 7 not in client.sockets
+
+    # The first transfer completes and its handle goes to the third.
+    multi.socket_action.return_value = (0, 1)
+    multi.info_read.return_value = (0, [first], [])
+    client.socketAction(7, pycurl.CSELECT_IN)
+    assert results == [None]
+    assert multi.add_handle.call_count == 3
+    assert len(client.waiting) == 0
+    assert first in client.active
+
+    # The second transfer fails.
+    multi.info_read.return_value = (0, [], [(second, 7, "Connection refused")])
+    client.socketAction(7, pycurl.CSELECT_IN)
+    assert len(results) == 2
+    assert results[1].check(pycurl.error)
+    assert client.idle == [second]
+
+    # Timers go through the reactor.
+    client.onTimer(0)
+    reactor.callLater.assert_called_with(0, client.onTimeout)
@@ -0,0 +1,305 @@
+import json
+import os
+import shutil
+import tempfile
+
+from mock import MagicMock, patch
+from twisted.internet import defer
+
+from paradrop.core.agent import outbox
+from paradrop.core.agent.outbox import OutboundQueue, isPermanentFailure
+
+
+class FakeHandler(object):
+    """
+    Records deliveries and leaves them pending until finished.
+    """
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, messages):
+        d = defer.Deferred()
+        self.calls.append((messages, d))
+        return d
+
+
+def setup_kinds():
+    handlers = {
+        'report': FakeHandler(),
+        'message': FakeHandler()
+    }
+    outbox.kinds.clear()
+    outbox.registerKind('report', handlers['report'], coalesce=True)
+    outbox.registerKind('message', handlers['message'], batchSize=3)
+    return handlers
+
+
+def teardown_kinds():
+    outbox.kinds.clear()
+    outbox.registerKind('update_message', outbox.sendUpdateMessages,
+            batchSize=100, after=['update_started'])
+    outbox.registerKind('update_started', outbox.sendUpdateStarted,
+            coalesce=True)
+
+
+def test_isPermanentFailure():
+    assert isPermanentFailure(404)
+    assert isPermanentFailure(422)
+    assert not isPermanentFailure(401)
+    assert not isPermanentFailure(429)
+    assert not isPermanentFailure(500)
+    assert not isPermanentFailure(None)
+
+
+@patch("paradrop.core.agent.outbox.threadable")
+@patch("paradrop.core.agent.outbox.reactor")
+@patch("paradrop.core.agent.outbox.nexus")
+def test_OutboundQueue_coalesce_and_batch(nexus, reactor, threadable):
+    threadable.isInIOThread.return_value = True
+    nexus.core.provisioned.return_value = False
+    handlers = setup_kinds()
+    try:
+        queue = OutboundQueue(maxConcurrent=2)
+
+        # Nothing is sent while the node is not provisioned.
+        queue.put('report', {'n': 1}, key='state')
+        queue.put('report', {'n': 2}, key='state')
+        for i in range(4):
+            queue.put('message', {'i': i}, key='update1')
+        assert len(handlers['report'].calls) == 0
+
+        # Only the newest report is left.
+        assert [m['data'] for m in queue.messages if m['kind'] == 'report'] == [{'n': 2}]
+        assert queue.statistics['coalesced'] == 1
+
+        nexus.core.provisioned.return_value = True
+        done = queue.drain()
+
+        # Reports and messages are sent concurrently, messages in batches.
+        assert handlers['report'].calls[0][0] == [{'n': 2}]
+        assert handlers['message'].calls[0][0] == [{'i': 0}, {'i': 1}, {'i': 2}]
+
+        # A newer report waits for the one being sent.
+        queue.put('report', {'n': 3}, key='state')
+        assert len(handlers['report'].calls) == 1
+
+        handlers['message'].calls[0][1].callback(True)
+        assert handlers['message'].calls[1][0] == [{'i': 3}]
+        handlers['message'].calls[1][1].callback(True)
+
+        handlers['report'].calls[0][1].callback(True)
+        assert handlers['report'].calls[1][0] == [{'n': 3}]
+        assert not done.called
+        handlers['report'].calls[1][1].callback(True)
+
+        assert done.called
+        assert queue.messages == []
+        assert queue.statistics['delivered'] == 6
+        assert queue.statistics['requests'] == 4
+    finally:
+        teardown_kinds()
+
+
+@patch("paradrop.core.agent.outbox.threadable")
+@patch("paradrop.core.agent.outbox.reactor")
+@patch("paradrop.core.agent.outbox.nexus")
+def test_OutboundQueue_retry(nexus, reactor, threadable):
+    threadable.isInIOThread.return_value = True
+    nexus.core.provisioned.return_value = True
+    handlers = setup_kinds()
+    try:
+        queue = OutboundQueue(maxConcurrent=2, maxRetryDelay=4)
+
+        queue.put('report', {'n': 1}, key='state')
+        handlers['report'].calls[0][1].callback(False)
+
+        # The queue waits before trying again.
+        assert reactor.callLater.call_args[0] == (1, queue.drain)
+        assert queue.retryCall is not None
+
+        # Messages put in the meantime wait as well, and a waiting report
+        # is replaced by a newer one.
+        queue.put('message', {'i': 0}, key='update1')
+        queue.put('report', {'n': 2}, key='state')
+        assert len(handlers['report'].calls) == 1
+        assert len(handlers['message'].calls) == 0
+
+        # Waiting for delivery does not cut the delay short.
+        waiter = queue.waitForDrain()
+        assert not queue.retryCall.cancel.called
+        assert len(handlers['report'].calls) == 1
+
+        queue.retryCall.active.return_value = False
+        queue.drain()
+        assert handlers['report'].calls[1][0] == [{'n': 2}]
+        assert not waiter.called
+        handlers['message'].calls[0][1].callback(True)
+        handlers['report'].calls[1][1].errback(Exception("Connection refused"))
+        assert waiter.called
+
+        # The delay doubles with each failure, up to the maximum, but any
+        # delivery resets it.
+        assert reactor.callLater.call_args[0] == (1, queue.drain)
+        queue.drain()
+        handlers['report'].calls[2][1].callback(False)
+        assert reactor.callLater.call_args[0] == (2, queue.drain)
+        queue.drain()
+        handlers['report'].calls[3][1].callback(False)
+        assert reactor.callLater.call_args[0] == (4, queue.drain)
+        queue.drain()
+        handlers['report'].calls[4][1].callback(False)
+        assert reactor.callLater.call_args[0] == (4, queue.drain)
+
+        # Success resets the delay.
+        queue.drain()
+        handlers['report'].calls[5][1].callback(True)
+        assert queue.retryDelay == 1
+        assert queue.messages == []
+    finally:
+        teardown_kinds()
+
+
+@patch("paradrop.core.agent.outbox.threadable")
+@patch("paradrop.core.agent.outbox.reactor")
+@patch("paradrop.core.agent.outbox.nexus")
+def test_OutboundQueue_after(nexus, reactor, threadable):
+    threadable.isInIOThread.return_value = True
+    nexus.core.provisioned.return_value = True
+    handlers = setup_kinds()
+    outbox.registerKind('message', handlers['message'], batchSize=3,
+            after=['report'])
+    try:
+        queue = OutboundQueue(maxConcurrent=2)
+
+        # Messages wait for an earlier report with the same key.
+        queue.retryCall = MagicMock()
+        queue.put('report', {'n': 1}, key='update1')
+        queue.put('message', {'i': 0}, key='update1')
+        queue.put('message', {'i': 0}, key='update2')
+        queue.retryCall = None
+        queue.drain()
+        assert len(handlers['report'].calls) == 1
+        assert handlers['message'].calls[0][0] == [{'i': 0}]
+        handlers['message'].calls[0][1].callback(True)
+        assert len(handlers['message'].calls) == 1
+
+        handlers['report'].calls[0][1].callback(True)
+        assert handlers['message'].calls[1][0] == [{'i': 0}]
+        handlers['message'].calls[1][1].callback(True)
+
+        # A batch stops before a report that later messages depend on.
+        queue.retryCall = MagicMock()
+        queue.put('message', {'i': 1}, key='update1')
+        queue.put('report', {'n': 2}, key='update1')
+        queue.put('message', {'i': 2}, key='update1')
+        queue.retryCall = None
+        queue.drain()
+        assert handlers['message'].calls[2][0] == [{'i': 1}]
+        assert handlers['report'].calls[1][0] == [{'n': 2}]
+        handlers['message'].calls[2][1].callback(True)
+        assert len(handlers['message'].calls) == 3
+
+        handlers['report'].calls[1][1].callback(True)
+        assert handlers['message'].calls[3][0] == [{'i': 2}]
+        handlers['message'].calls[3][1].callback(True)
+        assert queue.messages == []
+
+        # Nothing to wait for.
+        assert queue.waitForDrain().called
+    finally:
+        teardown_kinds()
+
+
+@patch("paradrop.core.agent.outbox.threadable")
+@patch("paradrop.core.agent.outbox.reactor")
+@patch("paradrop.core.agent.outbox.nexus")
+def test_OutboundQueue_persistence(nexus, reactor, threadable):
+    threadable.isInIOThread.return_value = True
+    nexus.core.provisioned.return_value = False
+    handlers = setup_kinds()
+    tempdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tempdir, "outbox")
+
+        queue = OutboundQueue(path=path, maxMessages=3)
+        for i in range(5):
+            queue.put('message', {'i': i}, key='update1')
+        queue.save()
+
+        # The oldest messages were dropped.
+        assert queue.statistics['dropped'] == 2
+
+        with open(path, 'r') as source:
+            data = json.load(source)
+        assert [m['data']['i'] for m in data['messages']] == [2, 3, 4]
+
+        # A new queue picks up where the old one left off.
+        queue = OutboundQueue(path=path)
+        assert len(queue.messages) == 3
+        assert queue.nextId == 6
+
+        stats = queue.getStatistics()
+        assert stats['pending'] == 3
+        assert stats['pending_by_kind'] == {'message': 3}
+
+        # A damaged file is ignored.
+        with open(path, 'w') as output:
+            output.write("{")
+        queue = OutboundQueue(path=path)
+        assert queue.messages == []
+    finally:
+        shutil.rmtree(tempdir)
+        teardown_kinds()
+
+
+@patch("paradrop.core.agent.outbox.PDServerRequest")
+def test_sendUpdateMessages(PDServerRequest):
+    requests = []
+    codes = []
+
+    def make_request(path):
+        request = MagicMock()
+        request.path = path
+        response = MagicMock()
+        response.code = codes.pop(0) if codes else 200
+        response.success = (response.code == 200)
+        request.post.return_value = defer.succeed(response)
+        requests.append(request)
+        return request
+
+    PDServerRequest.side_effect = make_request
+
+    messages = [
+        {'update_id': 5, 'time': 1, 'message': 'a'},
+        {'update_id': 5, 'time': 2, 'message': 'b'}
+    ]
+
+    outbox.updateMessageBatches = True
+    try:
+        results = []
+        outbox.sendUpdateMessages(messages[:1]).addCallback(results.append)
+        assert requests[0].path == '/api/routers/{router_id}/updates/5/messages'
+        requests[0].post.assert_called_with(time=1, message='a')
+
+        outbox.sendUpdateMessages(messages).addCallback(results.append)
+        requests[1].post.assert_called_with(messages=[
+            {'time': 1, 'message': 'a'},
+            {'time': 2, 'message': 'b'}
+        ])
+
+        # Controllers that do not take batches get one message at a time.
+        codes[:] = [400]
+        outbox.sendUpdateMessages(messages).addCallback(results.append)
+        assert not outbox.updateMessageBatches
+        requests[3].post.assert_called_with(time=1, message='a')
+        requests[4].post.assert_called_with(time=2, message='b')
+
+        # A server error leaves the messages for a retry.
+        codes[:] = [500]
+        outbox.sendUpdateMessages(messages).addCallback(results.append)
+        assert len(requests) == 6
+        assert requests[5].recordRetry.called
+
+        assert results == [True, True, True, False]
+    finally:
+        outbox.updateMessageBatches = True
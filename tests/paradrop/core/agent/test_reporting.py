@@ -0,0 +1,209 @@
+import json
+
+from mock import MagicMock, patch
+from twisted.internet import defer
+
+from paradrop.core.agent.reporting import (StateReportSender,
+        StateReportTracker, TelemetryUploader)
+from paradrop.lib.utils.timeseries import TimeSeriesStore
+
+
+class FakeRequest(object):
+    """
+    Stands in for PDServerRequest and records the requests that were made.
+    """
+    requests = []
+    codes = []
+
+    def __init__(self, path, compress=False):
+        self.url = path
+        self.compress = compress
+        self.method = None
+        self.body = None
+        self.retries = 0
+        FakeRequest.requests.append(self)
+
+    def recordRetry(self):
+        self.retries += 1
+
+    def respond(self):
+        response = MagicMock()
+        response.code = FakeRequest.codes.pop(0) if FakeRequest.codes else 200
+        response.success = (response.code == 200)
+        return defer.succeed(response)
+
+    def post(self, **data):
+        self.method = 'POST'
+        self.body = json.dumps(data)
+        return self.respond()
+
+    def patch(self, *ops):
+        self.method = 'PATCH'
+        self.body = json.dumps(ops)
+        return self.respond()
+
+
+def make_report(**changes):
+    report = {
+        'name': 'node',
+        'chutes': [{'name': 'hello', 'state': 'running'}],
+        'dmi': {'vendor': 'PC Engines', 'board': 'APU2' * 100},
+        'status': {'cpu': 10}
+    }
+    report.update(changes)
+    return report
+
+
+def reset_tracker():
+    StateReportTracker.acknowledged = None
+    StateReportTracker.version = 0
+    StateReportTracker.lastFullReport = 0
+    StateReportTracker.deltasUnsupportedUntil = 0
+    for key in StateReportTracker.statistics:
+        if key == 'bytes_per_day':
+            StateReportTracker.statistics[key] = {}
+        else:
+            StateReportTracker.statistics[key] = 0
+    FakeRequest.requests = []
+    FakeRequest.codes = []
+
+
+@patch("paradrop.core.agent.reporting.nexus")
+@patch("paradrop.core.agent.reporting.PDServerRequest", FakeRequest)
+def test_StateReportSender(nexus):
+    reset_tracker()
+    try:
+        # The first report is sent in full.
+        StateReportSender().send(make_report())
+        request = FakeRequest.requests[-1]
+        assert request.method == 'POST'
+        assert json.loads(request.body)['version'] == 1
+        assert StateReportTracker.version == 1
+
+        # Later reports only contain the changes.
+        StateReportSender().send(make_report(status={'cpu': 20}))
+        request = FakeRequest.requests[-1]
+        assert request.method == 'PATCH'
+        assert json.loads(request.body) == [
+            {'op': 'test', 'path': '/version', 'value': 1},
+            {'op': 'replace', 'path': '/version', 'value': 2},
+            {'op': 'replace', 'path': '/status/cpu', 'value': 20}
+        ]
+        assert StateReportTracker.version == 2
+
+        # When the controller rejects the base version, the full report
+        # follows.
+        FakeRequest.codes = [409]
+        StateReportSender().send(make_report(status={'cpu': 30}))
+        assert [r.method for r in FakeRequest.requests[-2:]] == ['PATCH', 'POST']
+        assert json.loads(FakeRequest.requests[-1].body)['version'] == 3
+        assert StateReportTracker.acknowledged['status'] == {'cpu': 30}
+
+        # Other errors are left for the queue to retry without changing the
+        # acknowledged report.
+        FakeRequest.codes = [500]
+        results = []
+        d = StateReportSender().send(make_report(status={'cpu': 40}))
+        d.addCallback(results.append)
+        assert results == [False]
+        assert FakeRequest.requests[-1].retries == 1
+        assert StateReportTracker.version == 3
+
+        # A controller without patch support gets full reports until the
+        # next full report would be due.
+        FakeRequest.codes = [404]
+        StateReportSender().send(make_report(status={'cpu': 50}))
+        assert [r.method for r in FakeRequest.requests[-2:]] == ['PATCH', 'POST']
+        StateReportSender().send(make_report(status={'cpu': 60}))
+        assert FakeRequest.requests[-1].method == 'POST'
+        assert StateReportTracker.version == 5
+
+        StateReportTracker.deltasUnsupportedUntil = 0
+        StateReportSender().send(make_report(status={'cpu': 70}))
+        assert FakeRequest.requests[-1].method == 'PATCH'
+
+        stats = StateReportTracker.getStatistics()
+        assert stats['full_reports'] == 4
+        assert stats['delta_reports'] == 5
+        assert stats['rejected_deltas'] == 2
+        assert sum(stats['bytes_per_day'].values()) == \
+                sum(len(r.body) for r in FakeRequest.requests)
+
+        sizes = dict((r.method, len(r.body)) for r in FakeRequest.requests)
+        assert sizes['PATCH'] < sizes['POST'] / 2
+    finally:
+        reset_tracker()
+
+
+@patch("paradrop.core.agent.reporting.settings")
+def test_StateReportTracker_makeDelta(settings):
+    reset_tracker()
+    try:
+        settings.STATE_REPORT_DELTAS = True
+        settings.STATE_REPORT_FULL_INTERVAL = 3600
+        settings.STATE_REPORT_STATS_DAYS = 2
+
+        assert StateReportTracker.makeDelta(make_report()) is None
+
+        StateReportTracker.acknowledge(make_report(), 5, True)
+        ops = StateReportTracker.makeDelta(make_report(name='other'))
+        assert ops[0] == {'op': 'test', 'path': '/version', 'value': 5}
+        assert ops[2] == {'op': 'replace', 'path': '/name', 'value': 'other'}
+
+        # A full report is due.
+        StateReportTracker.lastFullReport -= 3600
+        assert StateReportTracker.makeDelta(make_report()) is None
+
+        settings.STATE_REPORT_DELTAS = False
+        StateReportTracker.acknowledge(make_report(), 6, True)
+        assert StateReportTracker.makeDelta(make_report()) is None
+
+        # Only the most recent days are kept.
+        days = StateReportTracker.statistics['bytes_per_day']
+        days['2000-01-01'] = 10
+        days['2000-01-02'] = 20
+        StateReportTracker.recordSent('full', 100)
+        assert len(days) == 2
+        assert days['2000-01-02'] == 20
+    finally:
+        reset_tracker()
+
+
+@patch("paradrop.core.agent.reporting.settings")
+@patch("paradrop.core.agent.reporting.PDServerRequest", FakeRequest)
+def test_TelemetryUploader(settings):
+    settings.TELEMETRY_UPLOAD_RESOLUTION = 60
+    settings.TELEMETRY_UPLOAD_MAX_ROWS = 3
+
+    store = TimeSeriesStore([(1, 10), (60, 5), (900, 10)], 4)
+    for i in range(0, 3600, 10):
+        store.add(3600 + i, {'cpu': 1.0, 'unused': None})
+    store.flush()
+
+    FakeRequest.requests = []
+    FakeRequest.codes = [200, 500]
+    uploader = TelemetryUploader(store)
+    uploader.upload()
+
+    # Nothing was sent yet, so the batches start with the oldest rows of the
+    # upload tier and continue until a request fails.
+    assert len(FakeRequest.requests) == 2
+    first = json.loads(FakeRequest.requests[0].body)
+    assert FakeRequest.requests[0].compress
+    assert first['resolution'] == 60
+    assert first['time'] == [6900, 6960, 7020]
+    assert list(first['series'].keys()) == ['cpu']
+    assert store.getMark('uploaded') == 7080
+    assert not TelemetryUploader.uploading
+
+    # After a long outage, the gap is filled in from the coarser tier.
+    store.setMark('uploaded', 3600.0)
+    FakeRequest.requests = []
+    FakeRequest.codes = []
+    uploader.upload()
+    batches = [json.loads(r.body) for r in FakeRequest.requests]
+    assert [(b['resolution'], b['time']) for b in batches] == [
+        (900, [3600, 4500, 5400]),
+        (900, [6300])
+    ]
+    assert store.getMark('uploaded') == 7200
@@ -38,3 +38,22 @@ def test_computeResourceAllocation():
 
     allocation = resource.computeResourceAllocation(chutes)
     assert len(allocation) == 2
+
+
+def test_computeResourceAllocation_limits():
+    service = MagicMock()
+    service.get_container_name.return_value = "service1"
+    service.requests = {
+        'memory': '256m',
+        'pids': 100,
+        'blkio-weight': 500
+    }
+
+    chute1 = MagicMock()
+    chute1.isRunning.return_value = True
+    chute1.get_services.return_value = [service]
+
+    allocation = resource.computeResourceAllocation([chute1])
+    assert allocation['service1']['memory'] == 256 * 1024 * 1024
+    assert allocation['service1']['pids'] == 100
+    assert allocation['service1']['blkio_weight'] == 500
@@ -0,0 +1,32 @@
+from mock import MagicMock, patch
+
+from paradrop.core.config import services
+
+
+@patch("paradrop.core.config.services.TelemetrySampler")
+@patch("paradrop.core.config.services.LoopingCall")
+@patch("paradrop.core.config.services.settings")
+def test_configure_telemetry(settings, LoopingCall, TelemetrySampler):
+    settings.TELEMETRY_UPLOAD_INTERVAL = 300
+    update = MagicMock()
+
+    try:
+        # The sampler only runs while telemetry is enabled.
+        update.cache_get.return_value = {'telemetry': {'enabled': False}}
+        services.configure_telemetry(update)
+        TelemetrySampler.assert_not_called()
+
+        update.cache_get.return_value = {'telemetry': {'enabled': True}}
+        services.configure_telemetry(update)
+        services.configure_telemetry(update)
+        TelemetrySampler.assert_called_once_with()
+        TelemetrySampler.return_value.start.assert_called_once_with()
+
+        update.cache_get.return_value = {'telemetry': {'enabled': False}}
+        services.configure_telemetry(update)
+        TelemetrySampler.return_value.stop.assert_called_once_with()
+        assert services.telemetry_sampler is None
+    finally:
+        services.telemetry_sampler = None
+        services.telemetry_looping_call = None
+        services.telemetry_batch_looping_call = None
@@ -0,0 +1,121 @@
+import os
+import tempfile
+
+from mock import patch, MagicMock
+
+from paradrop.core.chute.chute import Chute
+from paradrop.core.chute.service import Service
+from paradrop.core.container import garbage_collector
+
+
+def make_chute(name, version):
+    chute = Chute(name=name, version=version)
+    chute.add_service(Service(chute=chute, name="main", type="light"))
+    return chute
+
+
+def test_get_eviction_candidates():
+    chute = make_chute("test", 3)
+
+    usage = {
+        "test-main:1": {"chute": "test", "service": "main", "version": 1, "last_used": 100},
+        "test-main:2": {"chute": "test", "service": "main", "version": 2, "last_used": 200},
+        "test-main:3": {"chute": "test", "service": "main", "version": 3, "last_used": 300},
+        "gone-main:1": {"chute": "gone", "service": "main", "version": 1, "last_used": 150}
+    }
+
+    protected = garbage_collector.get_protected_images([chute], usage)
+    assert protected == set(["test-main:2", "test-main:3"])
+
+    candidates = garbage_collector.get_eviction_candidates([chute], usage)
+    assert candidates == ["test-main:1", "gone-main:1"]
+
+    # Images of a chute that is being installed are kept.
+    candidates = garbage_collector.get_eviction_candidates([chute], usage,
+            busy=set(["gone"]))
+    assert candidates == ["test-main:1"]
+
+
+@patch("paradrop.core.container.garbage_collector.ChuteStorage")
+@patch("paradrop.core.container.garbage_collector.settings")
+def test_remove_orphaned_volumes(settings, ChuteStorage):
+    parent = tempfile.mkdtemp()
+    settings.EXTERNAL_DATA_DIR = os.path.join(parent, "{chute}/")
+
+    for name in ["installed", "orphan"]:
+        os.makedirs(os.path.join(parent, name))
+        with open(os.path.join(parent, name, "data"), "w") as output:
+            output.write("x" * 100)
+
+    storage = MagicMock()
+    storage.getChuteList.return_value = [make_chute("installed", 1)]
+    ChuteStorage.return_value = storage
+
+    # The data of a chute whose installation started during the collection
+    # is kept.
+    update_manager = MagicMock()
+    update_manager.updateQueue = []
+    update_manager.active_changes = {1: MagicMock()}
+    update_manager.active_changes[1].name = "orphan"
+    collector = garbage_collector.GarbageCollector(update_manager)
+    assert collector.remove_orphaned_volumes() == 0
+    assert os.path.isdir(os.path.join(parent, "orphan"))
+
+    update_manager.active_changes = {}
+    assert collector.remove_orphaned_volumes() == 100
+    assert os.path.isdir(os.path.join(parent, "installed"))
+    assert not os.path.exists(os.path.join(parent, "orphan"))
+
+
+@patch("paradrop.core.container.garbage_collector.deferToThread")
+def test_GarbageCollector_run(deferToThread):
+    update_manager = MagicMock()
+    update_manager.active_changes = {1: MagicMock()}
+    update_manager.updateQueue = []
+
+    collector = garbage_collector.GarbageCollector(update_manager)
+    assert collector.get_busy_chutes() == set([update_manager.active_changes[1].name])
+    assert collector.run() is None
+    deferToThread.assert_not_called()
+
+    update_manager.active_changes = {}
+    collector.run()
+    deferToThread.assert_called_once_with(collector.collect)
+
+
+@patch("paradrop.core.container.garbage_collector.ImageUsageStorage")
+@patch("paradrop.core.container.garbage_collector.ChuteStorage")
+@patch("paradrop.core.container.garbage_collector.docker")
+def test_GarbageCollector_collect(docker, ChuteStorage, ImageUsageStorage):
+    client = MagicMock()
+    client.images.prune.return_value = {}
+    client.volumes.prune.return_value = {}
+    docker.DockerClient.return_value = client
+
+    ChuteStorage.return_value.getChuteList.return_value = []
+    ImageUsageStorage.return_value.getAttr.return_value = {
+        "old-main:1": {"chute": "old", "service": "main", "version": 1, "last_used": 100}
+    }
+
+    update_manager = MagicMock()
+    update_manager.updateQueue = []
+    update_manager.active_changes = {}
+
+    collector = garbage_collector.GarbageCollector(update_manager)
+    collector.get_disk_usage = MagicMock(return_value=0.9)
+    collector.remove_orphaned_volumes = MagicMock(return_value=0)
+    collector.remove_image = MagicMock(return_value=0)
+
+    # Only Paradrop's volumes are pruned.
+    collector.collect(force=True)
+    client.volumes.prune.assert_called_once_with(
+            filters={'label': garbage_collector.VOLUME_LABEL})
+    assert collector.remove_image.call_count == 1
+
+    # An update for the chute started during the collection.
+    busy = MagicMock()
+    busy.name = "old"
+    update_manager.updateQueue = [busy]
+    collector.remove_image.reset_mock()
+    collector.collect(force=True)
+    collector.remove_image.assert_not_called()
@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+from mock import patch, MagicMock
+
+from paradrop.core.container import metrics
+
+
+def write_file(directory, name, content):
+    with open(os.path.join(directory, name), "w") as output:
+        output.write(content)
+
+
+@patch("paradrop.core.container.metrics.read_network_counters")
+@patch("paradrop.core.container.metrics.find_cgroup_dir")
+def test_read_container_sample_unified(find_cgroup_dir, read_network_counters):
+    cgroup_dir = tempfile.mkdtemp()
+    write_file(cgroup_dir, "cpu.stat", "usage_usec 2000\nuser_usec 1500\n")
+    write_file(cgroup_dir, "memory.current", "4096\n")
+    write_file(cgroup_dir, "memory.max", "max\n")
+    write_file(cgroup_dir, "pids.current", "3\n")
+    write_file(cgroup_dir, "io.stat", "8:0 rbytes=100 wbytes=50 rios=1 wios=1\n")
+    write_file(cgroup_dir, "cgroup.procs", "1234\n")
+
+    find_cgroup_dir.return_value = cgroup_dir
+    read_network_counters.return_value = {}
+
+    sample = metrics.read_container_sample("abc")
+    assert sample['cpu_usage_ns'] == 2000000
+    assert sample['memory_usage'] == 4096
+    assert sample['memory_limit'] is None
+    assert sample['pids'] == 3
+    assert sample['blkio_read_bytes'] == 100
+    assert sample['blkio_write_bytes'] == 50
+    read_network_counters.assert_called_once_with(1234)
+
+
+@patch("paradrop.core.container.metrics.settings")
+def test_ContainerMetricsSampler_add_sample(settings):
+    settings.CONTAINER_METRICS_BUFFER_SIZE = 2
+    metrics.ContainerMetricsSampler.buffers = {}
+
+    sampler = metrics.ContainerMetricsSampler()
+    sampler.add_sample("test", {'time': 10, 'cpu_usage_ns': 0})
+    sampler.add_sample("test", {'time': 20, 'cpu_usage_ns': 5000000000})
+    sampler.add_sample("test", {'time': 30, 'cpu_usage_ns': 5000000000})
+
+    samples = metrics.ContainerMetricsSampler.get_samples("test")
+    assert len(samples) == 2
+    assert samples[0]['cpu_percent'] == 50.0
+    assert samples[1]['cpu_percent'] == 0.0
+
+    assert metrics.ContainerMetricsSampler.get_latest("test") == samples[1]
+    assert metrics.ContainerMetricsSampler.get_latest("other") is None
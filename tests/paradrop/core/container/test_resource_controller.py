@@ -0,0 +1,97 @@
+from mock import patch, MagicMock
+
+from paradrop.core.container import resource_controller
+
+
+@patch("paradrop.core.container.resource_controller.read_cgroup_file")
+@patch("paradrop.core.container.resource_controller.write_cgroup_file")
+@patch("docker.DockerClient")
+def test_apply_allocation(DockerClient, write_cgroup_file, read_cgroup_file):
+    read_cgroup_file.return_value = "max"
+
+    container = MagicMock()
+    container.id = "abc"
+    container.attrs = {
+        'HostConfig': {
+            'CpuShares': 1024,
+            'Memory': 0,
+            'BlkioWeight': 0,
+            'PidsLimit': None
+        }
+    }
+
+    client = MagicMock()
+    client.containers.get.return_value = container
+    DockerClient.return_value = client
+
+    allocation = {
+        'test-main': {
+            'cpu_shares': 1024,
+            'memory': 268435456,
+            'pids': 100
+        }
+    }
+
+    changes = resource_controller.apply_allocation(allocation)
+    container.update.assert_called_once_with(mem_limit=268435456,
+                                             memswap_limit=268435456)
+    write_cgroup_file.assert_any_call("pids", "abc", "pids.max", 100)
+
+    assert changes['test-main']['before'] == {'memory': None, 'pids': None}
+    assert changes['test-main']['after'] == {'memory': 268435456, 'pids': 100}
+
+    # Nothing should be changed if the container already matches.  The pids
+    # limit comes from the cgroup, since the HostConfig never changes.
+    container.update.reset_mock()
+    write_cgroup_file.reset_mock()
+    container.attrs['HostConfig'].update(Memory=268435456)
+    read_cgroup_file.return_value = "100"
+    changes = resource_controller.apply_allocation(allocation)
+    container.update.assert_not_called()
+    assert changes == {}
+    for call in write_cgroup_file.call_args_list:
+        assert call[0][2] != "pids.max"
+
+    # A new limit is compared against the value in the cgroup.
+    allocation['test-main']['pids'] = 200
+    changes = resource_controller.apply_allocation(allocation)
+    write_cgroup_file.assert_any_call("pids", "abc", "pids.max", 200)
+    assert changes['test-main']['before'] == {'pids': 100}
+
+    # Limits that are no longer requested are lifted.
+    container.update.reset_mock()
+    read_cgroup_file.return_value = "200"
+    allocation['test-main'] = {'cpu_shares': 1024}
+    changes = resource_controller.apply_allocation(allocation)
+    container.update.assert_called_once_with(mem_limit=-1, memswap_limit=-1)
+    write_cgroup_file.assert_any_call("pids", "abc", "pids.max", "max")
+    assert changes['test-main']['before'] == {'memory': 268435456, 'pids': 200}
+    assert changes['test-main']['after'] == {'memory': None, 'pids': None}
+
+
+def test_get_pids_limit():
+    container = MagicMock()
+    container.id = "abc"
+    container.attrs = {'HostConfig': {'PidsLimit': 50}}
+
+    with patch.object(resource_controller, "read_cgroup_file") as read:
+        read.return_value = "max"
+        assert resource_controller.get_pids_limit(container) is None
+
+        read.return_value = "75"
+        assert resource_controller.get_pids_limit(container) == 75
+
+        # Fall back to the HostConfig if the cgroup cannot be read.
+        read.side_effect = Exception("cgroup not found")
+        assert resource_controller.get_pids_limit(container) == 50
+
+
+@patch("paradrop.core.container.resource_controller.os.path.isdir")
+def test_find_cgroup_dir(isdir):
+    isdir.side_effect = lambda path: path.endswith("docker-abc.scope")
+    path = resource_controller.find_cgroup_dir("memory", "abc")
+    assert path == "/sys/fs/cgroup/system.slice/docker-abc.scope"
+
+    isdir.side_effect = None
+    isdir.return_value = False
+    assert resource_controller.find_cgroup_dir("memory", "abc") is None
@@ -0,0 +1,79 @@
+from mock import patch, MagicMock
+
+from paradrop.core.chute.chute import Chute
+from paradrop.core.chute.service import Service
+from paradrop.core.container import rolling_update
+
+
+def make_chute(version, strategy="rolling"):
+    chute = Chute(name="test", version=version, state="running")
+    chute.add_service(Service(chute=chute, name="main"))
+    chute.web = {"service": "main", "port": 80, "update_strategy": strategy}
+    return chute
+
+
+def test_use_rolling_update():
+    update = MagicMock()
+    update.updateType = "update"
+    update.old = make_chute(1)
+    update.new = make_chute(2)
+    assert rolling_update.use_rolling_update(update)
+
+    update.new = make_chute(2, strategy="recreate")
+    assert not rolling_update.use_rolling_update(update)
+
+    update.new = make_chute(2)
+    update.new.get_service("main").requests['port-bindings'] = {"80/tcp": 8000}
+    assert not rolling_update.use_rolling_update(update)
+
+    update.new = make_chute(2)
+    update.updateType = "restart"
+    assert not rolling_update.use_rolling_update(update)
+
+
+@patch("paradrop.core.container.rolling_update.time")
+@patch("paradrop.core.container.rolling_update.requests")
+def test_wait_until_ready(requests, time):
+    time.time.side_effect = [0, 1, 2]
+
+    response = MagicMock()
+    response.status_code = 200
+    requests.get.return_value = response
+    assert rolling_update.wait_until_ready("10.0.0.2", 80, timeout=5)
+
+    time.time.side_effect = [0, 1, 10]
+    response.status_code = 503
+    assert not rolling_update.wait_until_ready("10.0.0.2", 80, timeout=5)
+
+
+@patch("paradrop.core.container.rolling_update.ImageUsageStorage")
+@patch("paradrop.core.container.rolling_update.time")
+@patch("paradrop.core.container.rolling_update.haproxy")
+@patch("paradrop.core.container.rolling_update.dockerapi")
+@patch("paradrop.core.container.rolling_update.wait_until_ready")
+@patch("paradrop.core.container.rolling_update._start_staging_container")
+@patch("docker.DockerClient")
+def test_replace_container(DockerClient, _start_staging_container,
+        wait_until_ready, dockerapi, haproxy, time, ImageUsageStorage):
+    update = MagicMock()
+    update.new = make_chute(2)
+    service = update.new.get_service("main")
+
+    staging = MagicMock()
+    staging.attrs = {'NetworkSettings': {'IPAddress': '172.17.0.5'}}
+    _start_staging_container.return_value = staging
+
+    wait_until_ready.return_value = True
+    rolling_update.replace_container(update, service)
+    haproxy.reloadProxy.assert_called_once_with({"test": "172.17.0.5:80"})
+    dockerapi.remove_container.assert_called_once_with(update, service)
+    staging.rename.assert_called_once_with("test-main")
+    dockerapi.start_container.assert_not_called()
+
+    # Readiness failure should fall back to stopping the old container and
+    # starting the new one.
+    haproxy.reset_mock()
+    wait_until_ready.return_value = False
+    rolling_update.replace_container(update, service)
+    haproxy.reloadProxy.assert_not_called()
+    dockerapi.start_container.assert_called_once_with(update, service)
@@ -0,0 +1,26 @@
+from mock import patch
+
+from paradrop.core.system.reactor_lag import ReactorLagMonitor
+
+
+@patch("paradrop.core.system.reactor_lag.settings")
+@patch("paradrop.core.system.reactor_lag.time")
+def test_ReactorLagMonitor(time, settings):
+    settings.REACTOR_LAG_INTERVAL = 1
+
+    ReactorLagMonitor.statistics['samples'] = 0
+    ReactorLagMonitor.statistics['max'] = 0.0
+
+    monitor = ReactorLagMonitor()
+    monitor.expected = 101
+
+    time.time.return_value = 101.5
+    monitor.check()
+    assert ReactorLagMonitor.statistics['last'] == 0.5
+    assert ReactorLagMonitor.statistics['mean'] == 0.5
+
+    time.time.return_value = 102.5
+    monitor.check()
+    assert ReactorLagMonitor.statistics['last'] == 0.0
+    assert ReactorLagMonitor.statistics['max'] == 0.5
+    assert ReactorLagMonitor.statistics['samples'] == 2
@@ -0,0 +1,77 @@
+from mock import MagicMock, patch
+
+from paradrop.core.system.telemetry import TelemetrySampler, computeRate
+from paradrop.lib.utils.timeseries import TimeSeriesStore
+
+
+def test_computeRate():
+    assert computeRate(300, 100, 2.0) == 100.0
+    assert computeRate(100, 300, 2.0) is None
+    assert computeRate(100, None, 2.0) is None
+
+
+@patch("paradrop.core.system.telemetry.ContainerMetricsSampler")
+@patch("paradrop.core.system.telemetry.time")
+@patch("paradrop.core.system.telemetry.psutil")
+def test_TelemetrySampler(psutil, time, ContainerMetricsSampler):
+    psutil.cpu_percent.return_value = 25.0
+    psutil.virtual_memory.return_value.percent = 50.0
+    psutil.getloadavg.return_value = (0.5, 0.4, 0.3)
+    psutil.disk_io_counters.return_value = MagicMock(read_bytes=1000, write_bytes=0)
+
+    eth0 = MagicMock(bytes_recv=1000, bytes_sent=100)
+    psutil.net_io_counters.return_value = {'eth0': eth0, 'lo': eth0, 'veth1': eth0}
+
+    ContainerMetricsSampler.buffers = {
+        'hello': [{'cpu_percent': 3.0, 'memory_usage': 4096}]
+    }
+
+    store = TimeSeriesStore([(1, 10)], 16)
+    TelemetrySampler.store = store
+    try:
+        sampler = TelemetrySampler()
+
+        time.time.return_value = 1000.0
+        sampler.sample()
+
+        time.time.return_value = 1002.0
+        eth0.bytes_recv = 3000
+        sampler.sample()
+        store.flush()
+
+        series = store.query(1)['series']
+        assert series['node.cpu_percent']['mean'] == [25.0, 25.0]
+        assert series['node.load_1m']['mean'][0] == 0.5
+        assert series['net.eth0.rx_bps']['mean'] == [None, 1000.0]
+        assert series['net.eth0.tx_bps']['mean'] == [None, 0.0]
+        assert series['chute.hello.mem_bytes']['mean'] == [4096, 4096]
+        assert 'net.lo.rx_bps' not in series
+        assert 'net.veth1.rx_bps' not in series
+    finally:
+        TelemetrySampler.store = None
+
+
+@patch("paradrop.core.system.telemetry.LoopingCall")
+@patch("paradrop.core.system.telemetry.reactor")
+@patch("paradrop.core.system.telemetry.psutil")
+@patch("paradrop.core.system.telemetry.settings")
+def test_TelemetrySampler_start_stop(settings, psutil, reactor, LoopingCall):
+    settings.TELEMETRY_SAMPLE_INTERVAL = 0.5
+    settings.TELEMETRY_TIERS = "1:10"
+    settings.TELEMETRY_MAX_SERIES = 4
+    settings.TELEMETRY_STORE_FILE = None
+
+    sampler = TelemetrySampler()
+    sampler.start()
+    store = TelemetrySampler.store
+    store.add(1000, {'a': 1})
+
+    # The store is closed at shutdown, which writes the partial interval.
+    args = reactor.addSystemEventTrigger.call_args[0]
+    assert args[:2] == ('before', 'shutdown')
+    args[2]()
+    assert TelemetrySampler.store is None
+    assert store.query(1)['series']['a']['mean'] == [1]
+    LoopingCall.return_value.stop.assert_called_once_with()
+    reactor.removeSystemEventTrigger.assert_not_called()
+
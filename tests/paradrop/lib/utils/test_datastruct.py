@@ -5,3 +5,15 @@ def test_getValue():
     assert datastruct.getValue(data, "a.1") == 2
     assert datastruct.getValue(data, "a.3") is None
     assert datastruct.getValue(data, "a.1.b") is None
+
+
+def test_makeMergePatch():
+    old = {"a": 1, "b": {"c": 2, "d": 3}, "e": [1, 2]}
+    new = {"b": {"c": 2, "d": 4}, "e": [1, 3], "f": "x"}
+
+    patch = datastruct.makeMergePatch(old, new)
+    assert patch == {"a": None, "b": {"d": 4}, "e": [1, 3], "f": "x"}
+    assert datastruct.makeMergePatch(new, new) == {}
+
+    assert datastruct.applyMergePatch(old, patch) == new
+    assert old["a"] == 1
@@ -0,0 +1,92 @@
+import math
+import os
+import shutil
+import tempfile
+
+from paradrop.lib.utils.timeseries import TimeSeriesStore, parseTiers
+
+
+def test_parseTiers():
+    assert parseTiers("60:1440, 1:600,") == [(1.0, 600), (60.0, 1440)]
+
+
+def test_TimeSeriesStore_downsampling():
+    store = TimeSeriesStore([(1, 10), (10, 5)], 4)
+
+    # Two samples per second for 30 seconds.
+    for i in range(60):
+        store.add(1000 + i * 0.5, {'a': i, 'b': None if i < 40 else 1})
+    store.flush()
+
+    fine = store.query(1)
+    assert len(fine['time']) == 10
+    assert fine['time'][-1] == 1029.0
+    assert fine['series']['a']['mean'][-1] == 58.5
+    assert fine['series']['a']['max'][-1] == 59
+
+    coarse = store.query(10)
+    assert coarse['time'] == [1000.0, 1010.0, 1020.0]
+    assert coarse['series']['a']['mean'] == [9.5, 29.5, 49.5]
+    assert coarse['series']['a']['max'] == [19, 39, 59]
+    assert coarse['series']['b']['mean'] == [None, None, 1]
+
+    # since is inclusive, until is exclusive.
+    assert store.query(10, since=1010, until=1020)['time'] == [1010.0]
+    assert store.query(1, since=1025, limit=2)['time'] == [1025.0, 1026.0]
+    assert store.query(1, names=['b'])['series'].keys() == set(['b'])
+
+    assert store.getTier(10).oldest() == 1000.0
+
+
+def test_TimeSeriesStore_full():
+    store = TimeSeriesStore([(1, 10)], 2)
+    store.add(1000, {'a': 1, 'b': 2, 'c': 3})
+    assert store.dropped == 1
+    assert sorted(store.slots.keys()) in (['a', 'b'], ['a', 'c'], ['b', 'c'])
+
+
+def test_TimeSeriesStore_release():
+    store = TimeSeriesStore([(1, 4), (10, 2)], 2)
+    store.add(1000, {'a': 1, 'b': 2})
+    slot_a = store.slots['a']
+
+    # Both series still have samples, so there is no room for c.
+    store.add(1001, {'b': 2, 'c': 3})
+    assert 'c' not in store.slots
+    assert store.dropped == 1
+
+    # Once the last sample of a has left the coarsest tier, its slot is
+    # given to c.
+    for i in range(2, 40):
+        store.add(1000 + i, {'b': 2})
+    store.add(1040, {'b': 2, 'c': 3})
+    assert 'a' not in store.slots
+    assert store.slots['c'] == slot_a
+
+    store.flush()
+    assert store.query(10)['series']['c']['mean'] == [None, 3]
+
+
+def test_TimeSeriesStore_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'telemetry')
+        store = TimeSeriesStore([(1, 10), (60, 10)], 4, path=path)
+        for i in range(5):
+            store.add(1000 + i, {'a': i})
+        store.setMark('uploaded', 1002.0)
+        store.close()
+
+        # The rows, series and marks survive a restart.
+        store = TimeSeriesStore([(1, 10), (60, 10)], 4, path=path)
+        assert store.query(1)['series']['a']['mean'] == [0, 1, 2, 3, 4]
+        assert store.getMark('uploaded') == 1002.0
+        store.close()
+
+        # A different layout starts over.
+        store = TimeSeriesStore([(1, 20), (60, 10)], 4, path=path)
+        assert store.query(1)['time'] == []
+        assert store.getMark('uploaded') is None
+        store.close()
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+
+from pdlog.follow import LogFollower, PollWatcher, makeWatcher
+
+
+def append(path, data):
+    with open(path, 'ab') as output:
+        output.write(data)
+
+
+def test_LogFollower():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'log')
+        follower = LogFollower(path, useInotify=False)
+
+        # The file does not exist yet.
+        assert follower.readLines() == []
+        assert follower.checkFile() == []
+
+        append(path, b'one\ntw')
+        assert follower.readLines() == [b'one\n']
+
+        # Partial lines are held until they are complete.
+        assert follower.readLines() == []
+        append(path, b'o\n')
+        assert follower.readLines() == [b'two\n']
+
+        # Rotation: the rest of the old file comes before the new file.
+        append(path, b'three')
+        os.rename(path, path + '.1')
+        append(path, b'four\n')
+        assert follower.checkFile() == [b'three\n', b'four\n']
+
+        # Truncation starts over at the beginning.
+        append(path, b'five\n')
+        assert follower.readLines() == [b'five\n']
+        with open(path, 'wb') as output:
+            output.write(b'six\n')
+        assert follower.readLines() == []
+        assert follower.checkFile() == [b'six\n']
+
+        follower.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_LogFollower_follow():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'log')
+        append(path, b'one\n')
+
+        follower = LogFollower(path, pollInterval=0.01)
+        lines = follower.follow()
+        assert next(lines) == b'one\n'
+
+        append(path, b'two\n')
+        assert next(lines) == b'two\n'
+
+        follower.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_makeWatcher():
+    assert isinstance(makeWatcher('/nonexistent'), PollWatcher)
+    assert isinstance(makeWatcher('/tmp', useInotify=False), PollWatcher)
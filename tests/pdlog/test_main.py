@@ -0,0 +1,95 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from pdlog.main import (RecordFilter, RecordReader, levelValue,
+        listLogFiles, main, parseTime)
+
+
+def make_line(message, timestamp, type=3, package='core', module='restart'):
+    return json.dumps({
+        'message': message,
+        'type': type,
+        'package': package,
+        'module': module,
+        'timestamp': timestamp
+    }) + '\n'
+
+
+def test_parseTime():
+    assert parseTime('1514329200') == 1514329200.0
+    assert parseTime('10m', now=1000.0) == 400.0
+    assert parseTime('2h', now=10000.0) == 2800.0
+    assert parseTime('2018-01-02 03:04') == parseTime('2018-01-02T03:04:00')
+
+
+def test_RecordFilter():
+    record = json.loads(make_line('Chute hello is not running\n', 100.0, type=5))
+
+    assert RecordFilter().matches(record)
+    assert RecordFilter(level=levelValue('warn')).matches(record)
+    assert not RecordFilter(level=levelValue('err')).matches(record)
+
+    assert RecordFilter(modules=['restart']).matches(record)
+    assert RecordFilter(modules=['core']).matches(record)
+    assert RecordFilter(modules=['backend', 'core.restart']).matches(record)
+    assert not RecordFilter(modules=['cor']).matches(record)
+
+    assert RecordFilter(since=100.0, until=100.0).matches(record)
+    assert not RecordFilter(since=101.0).matches(record)
+    assert not RecordFilter(until=99.0).matches(record)
+
+    assert RecordFilter(pattern='hello.*running').matches(record)
+    assert not RecordFilter(pattern='^running').matches(record)
+
+
+def test_RecordReader():
+    reader = RecordReader(RecordFilter(level=3))
+    lines = [make_line('a', 1.0).encode('utf-8'), b'garbage\n', b'\n',
+             make_line('b', 2.0, type=2).encode('utf-8'), b'[1, 2]\n']
+
+    records = list(reader.read(lines))
+    assert [r['message'] for r, line in records] == ['a']
+    assert reader.malformed == 2
+
+
+def test_main(capsys):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'log')
+        with gzip.open(path + '.2017_05_03.1.gz', 'wb') as output:
+            output.write(make_line('old\n', 1493800000.0).encode('utf-8'))
+        with open(path + '.2017_05_04.1', 'w') as output:
+            output.write(make_line('older\n', 1493900000.0, type=5))
+        with open(path, 'w') as output:
+            for i in range(5):
+                output.write(make_line('message {}\n'.format(i), 1494000000.0 + i,
+                    type=3 + (i % 3)))
+
+        main(['--file', path])
+        assert capsys.readouterr()[0].splitlines() == \
+                ['message {}'.format(i) for i in range(5)]
+
+        main(['--file', path, '-n', '2', '-o', 'compact'])
+        lines = capsys.readouterr()[0].splitlines()
+        assert len(lines) == 2
+        assert lines[0].endswith('INFO    core.restart: message 3')
+
+        main(['--file', path, '--all', '--level', 'warn', '-o', 'json'])
+        lines = capsys.readouterr()[0].splitlines()
+        assert [json.loads(l)['message'] for l in lines] == ['older\n', 'message 2\n']
+
+        main(['--file', path, '--all', '--grep', 'ol+d'])
+        assert capsys.readouterr()[0].splitlines() == ['old', 'older']
+
+        # Segments started on days before the one that contains since are
+        # not read.
+        assert listLogFiles(path, since=1494000000.0) == [path + '.2017_05_04.1', path]
+        assert listLogFiles(path) == [path]
+
+        main(['--file', path, '--since', '1493900000', '--until', '1494000001'])
+        assert capsys.readouterr()[0].splitlines() == ['older', 'message 0', 'message 1']
+    finally:
+        shutil.rmtree(tmpdir)
@@ -56,6 +56,30 @@ class ParadropClient(AuthenticatedClient):
         }
         return self.request("POST", url, json=data)
 
+    def batch(self, requests):
+        """
+        Make several API requests in one round trip.
+
+        Each request is either a path relative to the API root (e.g.
+        "/chutes/hello-world"), which is sent as a GET request, or a
+        dictionary with the fields method, path, and optionally body and
+        headers.  Returns a list with a dictionary containing the status,
+        headers and body of each response in the same order.
+        """
+        items = []
+        for item in requests:
+            if not isinstance(item, dict):
+                item = {"path": item}
+            else:
+                item = dict(item)
+            item.setdefault("method", "GET")
+            if not item['path'].startswith("/api/"):
+                item['path'] = "/api/v1" + item['path']
+            items.append(item)
+
+        url = self.base_url + "/batch"
+        return self.request("POST", url, json=items)
+
     def connect_snap_interface(self, slots=[], plugs=[]):
         """
         Connect an interface for an installed snap.